@@ -18,7 +18,7 @@ class DashboardAdmin(admin.ModelAdmin):
 
 @admin.register(models.Report)
 class ReportAdmin(admin.ModelAdmin):
-	list_display = ("name", "organization", "schedule_cron", "last_run_status")
+	list_display = ("name", "organization", "schedule_cron", "next_run_at", "last_run_at", "last_run_status")
 
 
 @admin.register(models.Insight)
@@ -43,9 +43,39 @@ class ModelTrainingRunAdmin(admin.ModelAdmin):
 
 @admin.register(models.DataSource)
 class DataSourceAdmin(admin.ModelAdmin):
-	list_display = ("name", "organization", "source_type", "is_active")
+	list_display = ("name", "organization", "source_type", "is_active", "last_synced_at")
 
 
 @admin.register(models.DataSyncLog)
 class DataSyncLogAdmin(admin.ModelAdmin):
 	list_display = ("data_source", "status", "started_at", "completed_at")
+
+
+@admin.register(models.SyncedRecord)
+class SyncedRecordAdmin(admin.ModelAdmin):
+	list_display = ("external_id", "data_source", "organization", "source_updated_at", "synced_at")
+	list_filter = ("data_source",)
+	search_fields = ("external_id",)
+
+
+@admin.register(models.AnalyticsSettings)
+class AnalyticsSettingsAdmin(admin.ModelAdmin):
+	list_display = ("organization", "updated_at")
+
+
+@admin.register(models.MetricBaseline)
+class MetricBaselineAdmin(admin.ModelAdmin):
+	list_display = ("metric", "organization", "mean", "observations", "last_day")
+	list_filter = ("organization",)
+
+
+@admin.register(models.ContactChurnScore)
+class ContactChurnScoreAdmin(admin.ModelAdmin):
+	list_display = ("contact", "organization", "churn_probability", "value_at_risk", "computed_at")
+	list_filter = ("organization",)
+
+
+@admin.register(models.PipelineForecastSnapshot)
+class PipelineForecastSnapshotAdmin(admin.ModelAdmin):
+	list_display = ("week_start", "close_month", "organization", "pipeline", "owner", "category", "weighted_amount")
+	list_filter = ("organization", "week_start", "category")
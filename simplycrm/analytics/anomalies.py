@@ -0,0 +1,285 @@
+"""Streaming anomaly detection over daily sales metrics.
+
+Each organization keeps an exponentially weighted mean/variance per metric
+(revenue, order count, average order value and revenue per channel) together
+with per-weekday means in :class:`MetricBaseline`. Closing a day scores the
+day's values against that state, writes :class:`Insight` rows for deviations
+and folds the values into the state, so the cost of a new day does not depend
+on how much history has been seen.
+"""
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.sales.models import Order
+
+
+SETTINGS_SECTION = "anomalies"
+SOURCE = "anomaly_detector"
+DEFAULT_CONFIGURATION: dict[str, float] = {
+	"alpha": 0.1,
+	"seasonal_alpha": 0.2,
+	"threshold": 3.0,
+	"warmup_days": 14,
+	"seasonal_warmup_weeks": 3,
+	"min_relative_std": 0.05,
+	"backfill_days": 120,
+}
+
+REVENUE = "revenue"
+ORDERS = "orders"
+AOV = "average_order_value"
+CHANNEL_PREFIX = "channel_revenue:"
+
+STATE_FIELDS = [
+	"mean",
+	"variance",
+	"observations",
+	"weekday_means",
+	"weekday_observations",
+	"last_day",
+	"last_value",
+	"updated_at",
+]
+LOCK_TIMEOUT = 10 * 60
+
+METRIC_LABELS = {
+	REVENUE: "Revenue",
+	ORDERS: "Order count",
+	AOV: "Average order value",
+}
+
+
+def get_configuration(organization_id: int) -> dict[str, float]:
+	configuration = dict(DEFAULT_CONFIGURATION)
+	settings_obj = models.AnalyticsSettings.objects.filter(organization_id=organization_id).first()
+	if settings_obj is not None:
+		for key, value in settings_obj.section(SETTINGS_SECTION).items():
+			if key in configuration and isinstance(value, (int, float)) and not isinstance(value, bool):
+				configuration[key] = value
+	return configuration
+
+
+def _day_bounds(start: date, end: date) -> tuple[datetime, datetime]:
+	return (
+		timezone.make_aware(datetime.combine(start, datetime.min.time())),
+		timezone.make_aware(datetime.combine(end + timedelta(days=1), datetime.min.time())),
+	)
+
+
+def daily_channel_totals(organization_id: int, start: date, end: date) -> dict[date, dict[str, tuple[float, int]]]:
+	"""Return ``{day: {channel: (revenue, orders)}}`` for the inclusive range in one query."""
+
+	line_value = ExpressionWrapper(
+		F("lines__unit_price") * F("lines__quantity") - F("lines__discount_amount"),
+		output_field=DecimalField(max_digits=14, decimal_places=2),
+	)
+	range_start, range_end = _day_bounds(start, end)
+	rows = (
+		Order.objects.filter(organization_id=organization_id, ordered_at__gte=range_start, ordered_at__lt=range_end)
+		.annotate(day=TruncDate("ordered_at"), channel=Coalesce(F("opportunity__pipeline__name"), F("status")))
+		.values("day", "channel")
+		.annotate(revenue=Sum(line_value), orders=Count("id", distinct=True))
+		.values_list("day", "channel", "revenue", "orders")
+	)
+	totals: dict[date, dict[str, tuple[float, int]]] = defaultdict(dict)
+	for day, channel, revenue, orders in rows:
+		totals[day][channel or "Direct"] = (float(revenue or 0), orders)
+	return totals
+
+
+def metric_values(channels: dict[str, tuple[float, int]], known_channels: set[str]) -> dict[str, float]:
+	"""Turn per-channel totals of one day into metric values."""
+
+	revenue = sum(value for value, _ in channels.values())
+	orders = sum(count for _, count in channels.values())
+	values = {REVENUE: revenue, ORDERS: float(orders)}
+	if orders:
+		values[AOV] = revenue / orders
+	for channel in known_channels | set(channels):
+		values[f"{CHANNEL_PREFIX}{channel}"] = channels.get(channel, (0.0, 0))[0]
+	return values
+
+
+def _new_baseline(organization_id: int, metric: str) -> models.MetricBaseline:
+	return models.MetricBaseline(
+		organization_id=organization_id,
+		metric=metric,
+		weekday_means=[0.0] * 7,
+		weekday_observations=[0] * 7,
+	)
+
+
+def score(baseline: models.MetricBaseline, value: float, day: date, configuration: dict[str, float]) -> dict | None:
+	"""Score ``value`` against the baseline state; return a finding or ``None``."""
+
+	if baseline.observations < configuration["warmup_days"]:
+		return None
+	std = max(
+		math.sqrt(max(baseline.variance, 0.0)),
+		abs(baseline.mean) * configuration["min_relative_std"],
+		1e-6,
+	)
+	z_score = (value - baseline.mean) / std
+	weekday = day.weekday()
+	seasonal_z = None
+	expected = baseline.mean
+	if baseline.weekday_observations[weekday] >= configuration["seasonal_warmup_weeks"]:
+		expected = baseline.weekday_means[weekday]
+		seasonal_z = (value - expected) / std
+	effective = seasonal_z if seasonal_z is not None else z_score
+	if abs(effective) < configuration["threshold"]:
+		return None
+	return {
+		"value": round(value, 2),
+		"expected": round(expected, 2),
+		"z_score": round(z_score, 2),
+		"seasonal_z_score": round(seasonal_z, 2) if seasonal_z is not None else None,
+		"direction": "spike" if effective > 0 else "drop",
+		"severity": "critical" if abs(effective) >= configuration["threshold"] * 1.5 else "warning",
+	}
+
+
+def update(baseline: models.MetricBaseline, value: float, day: date, configuration: dict[str, float]) -> None:
+	"""Fold ``value`` into the exponentially weighted state."""
+
+	alpha = configuration["alpha"]
+	if baseline.observations == 0:
+		baseline.mean = value
+		baseline.variance = 0.0
+	else:
+		diff = value - baseline.mean
+		increment = alpha * diff
+		baseline.mean += increment
+		baseline.variance = (1 - alpha) * (baseline.variance + diff * increment)
+	weekday = day.weekday()
+	if baseline.weekday_observations[weekday] == 0:
+		baseline.weekday_means[weekday] = value
+	else:
+		seasonal_alpha = configuration["seasonal_alpha"]
+		baseline.weekday_means[weekday] += seasonal_alpha * (value - baseline.weekday_means[weekday])
+	baseline.weekday_observations[weekday] += 1
+	baseline.observations += 1
+	baseline.last_day = day
+	baseline.last_value = value
+
+
+def _describe(metric: str, day: date, finding: dict) -> tuple[str, str]:
+	if metric.startswith(CHANNEL_PREFIX):
+		label = f"Revenue in channel '{metric[len(CHANNEL_PREFIX):]}'"
+	else:
+		label = METRIC_LABELS.get(metric, metric)
+	title = f"{label} {finding['direction']} on {day.isoformat()}"
+	description = f"{label} was {finding['value']} against an expected {finding['expected']} (z={finding['z_score']})."
+	return title, description
+
+
+def close_days(
+	organization_id: int,
+	*,
+	until: date | None = None,
+	configuration: dict[str, float] | None = None,
+) -> list[models.Insight]:
+	"""Close every day after the last processed one up to ``until`` (yesterday by default)."""
+
+	lock_key = f"simplycrm:analytics:anomalies:lock:{organization_id}"
+	if not cache.add(lock_key, True, timeout=LOCK_TIMEOUT):
+		# Another worker is closing days for this organization.
+		return []
+	try:
+		return _close_days(organization_id, until=until, configuration=configuration)
+	finally:
+		cache.delete(lock_key)
+
+
+def _close_days(
+	organization_id: int,
+	*,
+	until: date | None,
+	configuration: dict[str, float] | None,
+) -> list[models.Insight]:
+	until = until or timezone.localdate() - timedelta(days=1)
+	configuration = configuration or get_configuration(organization_id)
+	baselines = {
+		baseline.metric: baseline
+		for baseline in models.MetricBaseline.objects.filter(organization_id=organization_id)
+	}
+	last_closed = max((baseline.last_day for baseline in baselines.values() if baseline.last_day), default=None)
+	if last_closed is None:
+		first_order = Order.objects.filter(organization_id=organization_id).aggregate(first=Min("ordered_at"))["first"]
+		if first_order is None:
+			return []
+		start = max(timezone.localdate(first_order), until - timedelta(days=int(configuration["backfill_days"]) - 1))
+	else:
+		start = last_closed + timedelta(days=1)
+	if start > until:
+		return []
+
+	totals = daily_channel_totals(organization_id, start, until)
+	known_channels = {metric[len(CHANNEL_PREFIX):] for metric in baselines if metric.startswith(CHANNEL_PREFIX)}
+	created: dict[str, models.MetricBaseline] = {}
+	insights: list[models.Insight] = []
+	day = start
+	while day <= until:
+		channels = totals.get(day, {})
+		for metric, value in metric_values(channels, known_channels).items():
+			baseline = baselines.get(metric)
+			if baseline is None:
+				baseline = created[metric] = baselines[metric] = _new_baseline(organization_id, metric)
+			finding = score(baseline, value, day, configuration)
+			if finding is not None:
+				title, description = _describe(metric, day, finding)
+				insights.append(
+					models.Insight(
+						organization_id=organization_id,
+						title=title,
+						description=description,
+						severity=finding.pop("severity"),
+						data={"source": SOURCE, "metric": metric, "day": day.isoformat(), **finding},
+					)
+				)
+			update(baseline, value, day, configuration)
+		known_channels.update(channels)
+		day += timedelta(days=1)
+
+	now = timezone.now()
+	existing = [baseline for metric, baseline in baselines.items() if metric not in created]
+	for baseline in existing:
+		baseline.updated_at = now
+	with transaction.atomic():
+		if existing:
+			models.MetricBaseline.objects.bulk_update(existing, STATE_FIELDS)
+		models.MetricBaseline.objects.bulk_create(created.values())
+		models.Insight.objects.bulk_create(insights)
+	return insights
+
+
+def recent_anomalies(organization_id: int, *, days: int = 7) -> list[dict[str, object]]:
+	"""Return detector findings for the last ``days`` closed days, newest first."""
+
+	since = (timezone.localdate() - timedelta(days=days)).isoformat()
+	insights = models.Insight.objects.filter(organization_id=organization_id, data__source=SOURCE).order_by("-id")
+	anomalies = []
+	for insight in insights[:200]:
+		if insight.data.get("day", "") < since:
+			continue
+		anomalies.append(
+			{
+				"type": f"{insight.data['metric']}_{insight.data['direction']}",
+				"message": insight.description,
+				"metric": insight.data["metric"],
+				"day": insight.data["day"],
+				"severity": insight.severity,
+				"z_score": insight.data.get("z_score"),
+			}
+		)
+	return sorted(anomalies, key=lambda anomaly: anomaly["day"], reverse=True)
@@ -7,3 +7,8 @@ class AnalyticsConfig(AppConfig):
 	default_auto_field = "django.db.models.BigAutoField"
 	name = "simplycrm.analytics"
 	verbose_name = "SimplyCRM Analytics"
+	
+	def ready(self) -> None:
+		from simplycrm.analytics import signals
+		
+		signals.connect()
@@ -0,0 +1,228 @@
+"""Versioned result cache with stale-while-revalidate for analytics services.
+
+Results are stored per function, organization and parameters together with
+the data version (see :mod:`simplycrm.core.versioning`) they were computed
+from. A result is fresh while its version is current and it is younger than
+``TIMEOUT`` seconds. Once it goes stale it keeps being served for up to
+``STALE_TIMEOUT`` seconds while exactly one background refresh, guarded by a
+cache lock, recomputes it; only callers that find no entry at all compute
+synchronously. Hits, stale hits, misses and recompute times are counted per
+function and exposed through :func:`stats`.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from simplycrm.core import versioning
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "simplycrm:analytics:result"
+DEFAULTS: dict[str, int] = {
+	"TIMEOUT": 15 * 60,
+	"STALE_TIMEOUT": 24 * 60 * 60,
+	"LOCK_SECONDS": 5 * 60,
+	"REFRESH_WORKERS": 2,
+}
+
+
+def get_config() -> dict[str, int]:
+	return {**DEFAULTS, **getattr(settings, "ANALYTICS_RESULT_CACHE", {})}
+
+
+class CacheStats:
+	"""Thread-safe per-function counters."""
+
+	COUNTERS = ("hits", "stale_hits", "misses", "refreshes", "errors")
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._data: dict[str, dict[str, float]] = {}
+
+	def _entry(self, name: str) -> dict[str, float]:
+		entry = self._data.get(name)
+		if entry is None:
+			entry = self._data[name] = {
+				**{counter: 0 for counter in self.COUNTERS},
+				"compute_seconds": 0.0,
+				"compute_seconds_max": 0.0,
+			}
+		return entry
+
+	def incr(self, name: str, counter: str) -> None:
+		with self._lock:
+			self._entry(name)[counter] += 1
+
+	def timing(self, name: str, seconds: float) -> None:
+		with self._lock:
+			entry = self._entry(name)
+			entry["compute_seconds"] += seconds
+			entry["compute_seconds_max"] = max(entry["compute_seconds_max"], seconds)
+
+	def snapshot(self) -> dict[str, dict[str, float]]:
+		with self._lock:
+			result = {}
+			for name, entry in self._data.items():
+				computations = entry["misses"] + entry["refreshes"]
+				result[name] = {
+					**entry,
+					"compute_seconds_avg": entry["compute_seconds"] / computations if computations else 0.0,
+				}
+			return result
+
+	def reset(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+
+_stats = CacheStats()
+
+
+def stats() -> dict[str, dict[str, float]]:
+	"""Return hit/miss/refresh counters and compute times per cached function."""
+
+	return _stats.snapshot()
+
+
+def reset_stats() -> None:
+	_stats.reset()
+
+
+def _release_connections(function: Callable, *args, **kwargs):
+	try:
+		return function(*args, **kwargs)
+	finally:
+		connections.close_all()
+
+
+class RefreshExecutor(ThreadPoolExecutor):
+	"""Thread pool whose workers close their database connections after every refresh."""
+
+	def submit(self, fn, /, *args, **kwargs):
+		return super().submit(_release_connections, fn, *args, **kwargs)
+
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = RefreshExecutor(
+				max_workers=get_config()["REFRESH_WORKERS"], thread_name_prefix="analytics-cache"
+			)
+		return _executor
+
+
+def set_executor(executor: Executor | None) -> Executor | None:
+	"""Replace the executor running background refreshes; return the previous one."""
+
+	global _executor
+	with _executor_lock:
+		previous, _executor = _executor, executor
+	return previous
+
+
+def _digest(args: tuple, kwargs: dict) -> str:
+	payload = json.dumps([list(args), kwargs], sort_keys=True, default=str)
+	return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+class VersionedResult:
+	"""Callable wrapper caching ``function(organization_id, ...)`` by data version."""
+
+	def __init__(self, name: str, function: Callable[..., Any], scopes: tuple[str, ...], *, daily: bool = False):
+		self.name = name
+		self.function = function
+		self.scopes = scopes
+		self.daily = daily
+		functools.update_wrapper(self, function)
+
+	def key(self, organization_id: int, args: tuple, kwargs: dict) -> str:
+		if self.daily:
+			# Results relative to "today" must not outlive the day they were computed on.
+			kwargs = {**kwargs, "_day": timezone.localdate()}
+		return f"{KEY_PREFIX}:{self.name}:{organization_id}:{_digest(args, kwargs)}"
+
+	def version(self, organization_id: int) -> str:
+		return versioning.get_data_version(organization_id, *self.scopes)
+
+	def __call__(self, organization_id: int, *args, **kwargs):
+		config = get_config()
+		key = self.key(organization_id, args, kwargs)
+		version = self.version(organization_id)
+		entry = cache.get(key)
+		if entry is None:
+			_stats.incr(self.name, "misses")
+			return self._compute(key, version, organization_id, args, kwargs, config)
+
+		entry_version, computed_at, value = entry
+		if entry_version == version and time.time() - computed_at < config["TIMEOUT"]:
+			_stats.incr(self.name, "hits")
+			return value
+
+		_stats.incr(self.name, "stale_hits")
+		if cache.add(f"{key}:refresh", True, timeout=config["LOCK_SECONDS"]):
+			get_executor().submit(self._refresh, key, version, organization_id, args, kwargs, config)
+		return value
+
+	def fresh(self, organization_id: int, *args, **kwargs):
+		"""Return a result of the current data version, computing it synchronously instead of serving stale."""
+
+		config = get_config()
+		key = self.key(organization_id, args, kwargs)
+		version = self.version(organization_id)
+		entry = cache.get(key)
+		if entry is not None and entry[0] == version and time.time() - entry[1] < config["TIMEOUT"]:
+			_stats.incr(self.name, "hits")
+			return entry[2]
+		_stats.incr(self.name, "misses")
+		return self._compute(key, version, organization_id, args, kwargs, config)
+
+	def _compute(self, key, version, organization_id, args, kwargs, config):
+		started = time.perf_counter()
+		value = self.function(organization_id, *args, **kwargs)
+		elapsed = time.perf_counter() - started
+		_stats.timing(self.name, elapsed)
+		# The version read before computing is stored, so writes racing with the
+		# computation make the entry stale instead of being silently absorbed.
+		cache.set(key, (version, time.time(), value), timeout=config["STALE_TIMEOUT"])
+		logger.debug("Computed %s for organization %s in %.3fs", self.name, organization_id, elapsed)
+		return value
+
+	def _refresh(self, key, version, organization_id, args, kwargs, config) -> None:
+		try:
+			self._compute(key, version, organization_id, args, kwargs, config)
+			_stats.incr(self.name, "refreshes")
+		except Exception:  # noqa: BLE001 - keep serving the stale value
+			_stats.incr(self.name, "errors")
+			logger.exception("Background refresh of %s failed for organization %s", self.name, organization_id)
+		finally:
+			cache.delete(f"{key}:refresh")
+
+	def invalidate(self, organization_id: int, *args, **kwargs) -> None:
+		cache.delete(self.key(organization_id, args, kwargs))
+
+
+def versioned(name: str, *scopes: str, daily: bool = False) -> Callable[[Callable[..., Any]], VersionedResult]:
+	"""Cache an analytics function whose first argument is the organization id."""
+
+	def decorator(function: Callable[..., Any]) -> VersionedResult:
+		return VersionedResult(name, function, scopes, daily=daily)
+
+	return decorator
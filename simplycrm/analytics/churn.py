@@ -0,0 +1,213 @@
+"""Churn risk scoring from order cadence.
+
+Inter-purchase gaps come from one windowed query (``LAG(ordered_at)`` per
+contact). Each contact's purchase rate is the rate observed in its own gaps,
+shrunk towards the organization-wide rate so that contacts with few orders
+borrow strength from everybody else. Under an exponential inter-purchase
+model, ``1 - exp(-rate * days_since_last_order)`` is the probability that an
+active customer would already have ordered again; the longer a customer stays
+past its usual cadence, the closer its churn probability gets to one.
+Scores are upserted into :class:`ContactChurnScore` for fast filtering, and
+contacts whose probability crossed a threshold used by a segment are touched
+for incremental segment refreshes.
+"""
+from __future__ import annotations
+
+import operator
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
+from django.db.models.functions import Coalesce, Lag
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.sales.models import Contact, Order
+
+
+DEFAULT_INTERVAL_DAYS = 90.0
+PRIOR_WEIGHT = 2.0
+UPSERT_BATCH_SIZE = 1000
+# Contacts touched per UPDATE, below the bound-parameter limit of SQLite.
+TOUCH_CHUNK_SIZE = 500
+THRESHOLD_CHECKS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+SCORE_FIELDS = [
+	"organization",
+	"orders_count",
+	"mean_interval_days",
+	"last_order_at",
+	"days_since_last_order",
+	"average_order_value",
+	"churn_probability",
+	"value_at_risk",
+	"computed_at",
+]
+SECONDS_PER_DAY = 86400.0
+
+
+def order_gaps(organization_id: int) -> pd.DataFrame:
+	"""One row per order with its revenue and the gap to the contact's previous order."""
+
+	money = DecimalField(max_digits=14, decimal_places=2)
+	rows = (
+		Order.objects.filter(organization_id=organization_id, contact__isnull=False)
+		.annotate(
+			revenue=Coalesce(
+				Sum(
+					ExpressionWrapper(
+						F("lines__unit_price") * F("lines__quantity") - F("lines__discount_amount"), output_field=money
+					)
+				),
+				Decimal("0.00"),
+				output_field=money,
+			),
+			previous_order_at=Window(Lag("ordered_at"), partition_by=[F("contact_id")], order_by=F("ordered_at").asc()),
+		)
+		.values_list("contact_id", "ordered_at", "previous_order_at", "revenue")
+	)
+	frame = pd.DataFrame.from_records(
+		list(rows.iterator()), columns=["contact_id", "ordered_at", "previous_order_at", "revenue"]
+	)
+	if frame.empty:
+		return frame
+	frame["ordered_at"] = pd.to_datetime(frame["ordered_at"], utc=True)
+	frame["previous_order_at"] = pd.to_datetime(frame["previous_order_at"], utc=True)
+	frame["gap_days"] = (frame["ordered_at"] - frame["previous_order_at"]).dt.total_seconds() / SECONDS_PER_DAY
+	frame["revenue"] = frame["revenue"].astype(float)
+	return frame
+
+
+def churn_frame(frame: pd.DataFrame, now: datetime) -> pd.DataFrame:
+	"""Vectorized per-contact cadence statistics and churn estimates."""
+
+	grouped = frame.groupby("contact_id")
+	stats = pd.DataFrame(
+		{
+			"orders_count": grouped["ordered_at"].size(),
+			"last_order_at": grouped["ordered_at"].max(),
+			"gap_sum": grouped["gap_days"].sum(min_count=1).fillna(0.0),
+			"gap_count": grouped["gap_days"].count(),
+			"revenue": grouped["revenue"].sum(),
+		}
+	)
+	total_gaps = stats["gap_count"].sum()
+	pooled_interval = stats["gap_sum"].sum() / total_gaps if total_gaps else DEFAULT_INTERVAL_DAYS
+	pooled_interval = max(pooled_interval, 1.0)
+
+	rate = (stats["gap_count"] + PRIOR_WEIGHT) / (stats["gap_sum"] + PRIOR_WEIGHT * pooled_interval)
+	days_since = (pd.Timestamp(now).tz_convert("UTC") - stats["last_order_at"]).dt.total_seconds() / SECONDS_PER_DAY
+	days_since = days_since.clip(lower=0.0)
+	probability = 1.0 - np.exp(-rate * days_since)
+	average_order_value = stats["revenue"] / stats["orders_count"]
+
+	stats["mean_interval_days"] = (stats["gap_sum"] / stats["gap_count"]).where(stats["gap_count"] > 0)
+	stats["days_since_last_order"] = days_since.round(2)
+	stats["average_order_value"] = average_order_value.round(2)
+	stats["churn_probability"] = probability.round(4)
+	# Expected yearly revenue of the customer that is lost if it has churned.
+	stats["value_at_risk"] = (probability * average_order_value * rate * 365.0).round(2)
+	return stats
+
+
+def score_contacts(organization_id: int, *, now: datetime | None = None) -> int:
+	"""Recompute churn scores for the organization; return how many contacts were scored."""
+
+	now = now or timezone.now()
+	previous = dict(
+		models.ContactChurnScore.objects.filter(organization_id=organization_id).values_list(
+			"contact_id", "churn_probability"
+		)
+	)
+	frame = order_gaps(organization_id)
+	if frame.empty:
+		models.ContactChurnScore.objects.filter(organization_id=organization_id).delete()
+		_touch_rescored(organization_id, previous, {})
+		return 0
+	stats = churn_frame(frame, now)
+	scores = [
+		models.ContactChurnScore(
+			organization_id=organization_id,
+			contact_id=int(contact_id),
+			orders_count=int(row.orders_count),
+			mean_interval_days=None if pd.isna(row.mean_interval_days) else round(float(row.mean_interval_days), 2),
+			last_order_at=row.last_order_at.to_pydatetime(),
+			days_since_last_order=float(row.days_since_last_order),
+			average_order_value=Decimal(str(row.average_order_value)),
+			churn_probability=float(row.churn_probability),
+			value_at_risk=Decimal(str(row.value_at_risk)),
+			computed_at=now,
+		)
+		for contact_id, row in stats.iterrows()
+	]
+	models.ContactChurnScore.objects.bulk_create(
+		scores,
+		batch_size=UPSERT_BATCH_SIZE,
+		update_conflicts=True,
+		unique_fields=["contact"],
+		update_fields=SCORE_FIELDS,
+	)
+	# Contacts whose orders were all removed or reassigned keep no stale score.
+	models.ContactChurnScore.objects.filter(organization_id=organization_id, computed_at__lt=now).delete()
+	_touch_rescored(organization_id, previous, {score.contact_id: score.churn_probability for score in scores})
+	return len(scores)
+
+
+def _segment_thresholds(definition: object) -> Iterator[tuple[str, float]]:
+	"""Yield the ``(op, value)`` conditions a segment definition puts on ``churn_probability``."""
+
+	if isinstance(definition, list):
+		for child in definition:
+			yield from _segment_thresholds(child)
+	elif isinstance(definition, dict):
+		if definition.get("field") == "churn_probability" and definition.get("op") in THRESHOLD_CHECKS:
+			yield definition["op"], float(definition["value"])
+		for key in ("all", "any", "not"):
+			if key in definition:
+				yield from _segment_thresholds(definition[key])
+
+
+def _touch_rescored(organization_id: int, previous: dict[int, float], current: dict[int, float]) -> None:
+	"""Touch contacts that moved across a churn threshold used by one of the organization's segments.
+
+	Probabilities drift a little on every run because they depend on the time
+	since the last order, so touching every changed contact would turn each
+	incremental segment refresh into a full one. Only a move across a segment
+	condition can change a membership, and contacts that gain or lose their
+	score altogether fall out of (or into) every churn condition.
+	"""
+
+	thresholds = {
+		condition
+		for definition in models.CustomerSegment.objects.filter(organization_id=organization_id).values_list(
+			"filter_definition", flat=True
+		)
+		for condition in _segment_thresholds(definition)
+	}
+	if not thresholds:
+		return
+
+	def matches(probability: float | None, op: str, value: float) -> bool:
+		return probability is not None and THRESHOLD_CHECKS[op](probability, value)
+
+	crossed = [
+		contact_id
+		for contact_id in previous.keys() | current.keys()
+		if any(
+			matches(previous.get(contact_id), op, value) != matches(current.get(contact_id), op, value)
+			for op, value in thresholds
+		)
+	]
+	now = timezone.now()
+	for start in range(0, len(crossed), TOUCH_CHUNK_SIZE):
+		Contact.objects.filter(id__in=crossed[start : start + TOUCH_CHUNK_SIZE]).update(updated_at=now)
+
+
+def at_risk_contacts(organization_id: int, *, min_probability: float = 0.5):
+	return (
+		models.ContactChurnScore.objects.filter(organization_id=organization_id, churn_probability__gte=min_probability)
+		.select_related("contact")
+		.order_by("-value_at_risk", "contact_id")
+	)
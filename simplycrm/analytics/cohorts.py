@@ -0,0 +1,164 @@
+"""Cohort retention and revenue matrices.
+
+Orders are read once, with each contact's first order taken from a window
+function, and pivoted with NumPy into ``cohort x months since first order``
+matrices of active customers, retention and revenue. Cohorts group customers
+by the month of their first order, by the source of their earliest lead or by
+their company's industry. Results are cached per organization and data
+version, so they are rebuilt only after relevant writes.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import DecimalField, ExpressionWrapper, F, Min, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from simplycrm.core import versioning
+from simplycrm.sales.models import Lead, Order
+
+
+FIRST_ORDER = "first_order"
+LEAD_SOURCE = "lead_source"
+INDUSTRY = "industry"
+COHORT_TYPES = (FIRST_ORDER, LEAD_SOURCE, INDUSTRY)
+# Data each cohort type reads: orders of contacts (deleting a contact detaches its
+# orders), plus the contact's earliest lead or its company's industry.
+COHORT_SCOPES = {
+	FIRST_ORDER: (versioning.SALES, versioning.CONTACTS),
+	LEAD_SOURCE: (versioning.SALES, versioning.CONTACTS, versioning.PIPELINE),
+	INDUSTRY: (versioning.SALES, versioning.CONTACTS),
+}
+DEFAULT_PERIODS = 12
+MAX_PERIODS = 60
+CACHE_TIMEOUT = 60 * 60
+UNKNOWN = "unknown"
+
+
+def _cohort_rows(organization_id: int, cohort_by: str) -> list[tuple]:
+	"""``(contact_id, first_order_at, ordered_at, revenue, label)`` for every order, in one query."""
+
+	money = DecimalField(max_digits=14, decimal_places=2)
+	orders = Order.objects.filter(organization_id=organization_id, contact__isnull=False).annotate(
+		revenue=Coalesce(
+			Sum(
+				ExpressionWrapper(
+					F("lines__unit_price") * F("lines__quantity") - F("lines__discount_amount"), output_field=money
+				)
+			),
+			Decimal("0.00"),
+			output_field=money,
+		),
+		first_order_at=Window(Min("ordered_at"), partition_by=[F("contact_id")]),
+	)
+	if cohort_by == LEAD_SOURCE:
+		earliest_lead = Lead.objects.filter(contact_id=OuterRef("contact_id")).order_by("created_at", "id")
+		orders = orders.annotate(label=Subquery(earliest_lead.values("source")[:1]))
+	elif cohort_by == INDUSTRY:
+		orders = orders.annotate(label=F("contact__company__industry"))
+	columns = ["contact_id", "first_order_at", "ordered_at", "revenue"]
+	if cohort_by != FIRST_ORDER:
+		columns.append("label")
+	return list(orders.values_list(*columns).iterator())
+
+
+def _month_index(moments: list[datetime]) -> np.ndarray:
+	local = [timezone.localtime(moment) for moment in moments]
+	return np.array([moment.year * 12 + moment.month - 1 for moment in local], dtype=np.int64)
+
+
+def _month_label(index: int) -> str:
+	return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def build_cohorts(
+	organization_id: int,
+	*,
+	cohort_by: str = FIRST_ORDER,
+	periods: int = DEFAULT_PERIODS,
+	start: date | None = None,
+	end: date | None = None,
+) -> dict[str, object]:
+	"""Return retention and revenue matrices; ``start``/``end`` bound first-order months."""
+
+	rows = _cohort_rows(organization_id, cohort_by)
+	result: dict[str, object] = {"cohort_by": cohort_by, "periods": list(range(periods)), "cohorts": []}
+	if not rows:
+		return result
+
+	contacts = np.array([row[0] for row in rows], dtype=np.int64)
+	first_month = _month_index([row[1] for row in rows])
+	order_month = _month_index([row[2] for row in rows])
+	revenue = np.array([float(row[3]) for row in rows])
+	offsets = order_month - first_month
+
+	keep = offsets < periods
+	if start is not None:
+		keep &= first_month >= start.year * 12 + start.month - 1
+	if end is not None:
+		keep &= first_month <= end.year * 12 + end.month - 1
+	if cohort_by == FIRST_ORDER:
+		labels = np.array([_month_label(month) for month in first_month], dtype=object)
+	else:
+		labels = np.array([row[4] or UNKNOWN for row in rows], dtype=object)
+	contacts, offsets, revenue, labels = contacts[keep], offsets[keep], revenue[keep], labels[keep]
+	if not contacts.size:
+		return result
+
+	cohort_names, cohort_index = np.unique(labels.astype(str), return_inverse=True)
+	shape = (len(cohort_names), periods)
+	revenue_matrix = np.zeros(shape)
+	np.add.at(revenue_matrix, (cohort_index, offsets), revenue)
+	# A customer counts once per month however many orders it placed.
+	active = np.unique(np.stack([cohort_index, offsets, contacts]), axis=1)
+	customers = np.zeros(shape, dtype=np.int64)
+	np.add.at(customers, (active[0], active[1]), 1)
+	sizes = customers[:, 0]
+	retention = np.divide(customers, sizes[:, None], out=np.zeros(shape), where=sizes[:, None] > 0)
+
+	result["cohorts"] = [
+		{
+			"cohort": str(name),
+			"size": int(sizes[index]),
+			"customers": customers[index].tolist(),
+			"retention": np.round(retention[index], 4).tolist(),
+			"revenue": np.round(revenue_matrix[index], 2).tolist(),
+		}
+		for index, name in enumerate(cohort_names)
+	]
+	return result
+
+
+def cohort_matrix(
+	organization_id: int,
+	*,
+	cohort_by: str = FIRST_ORDER,
+	periods: int = DEFAULT_PERIODS,
+	start: date | None = None,
+	end: date | None = None,
+	use_cache: bool = True,
+) -> dict[str, object]:
+	scopes = COHORT_SCOPES.get(cohort_by, COHORT_SCOPES[FIRST_ORDER])
+	cache_key = ":".join(
+		[
+			"simplycrm:analytics:cohorts",
+			str(organization_id),
+			cohort_by,
+			str(periods),
+			str(start),
+			str(end),
+			versioning.get_data_version(organization_id, *scopes),
+		]
+	)
+	if use_cache:
+		cached = cache.get(cache_key)
+		if cached is not None:
+			return cached
+	result = build_cohorts(organization_id, cohort_by=cohort_by, periods=periods, start=start, end=end)
+	if use_cache:
+		cache.set(cache_key, result, timeout=CACHE_TIMEOUT)
+	return result
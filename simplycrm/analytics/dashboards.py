@@ -0,0 +1,243 @@
+"""Render every widget of a :class:`Dashboard` in one pass.
+
+``Dashboard.layout["widgets"]`` lists the widgets; each one has an ``id`` and
+either a saved metric ``code`` or an inline DSL ``definition`` (see
+:mod:`simplycrm.analytics.metric_dsl`). Any other keys (title, chart type,
+position ...) belong to the frontend and are ignored here. The period comes
+from the request, falling back to ``Dashboard.filters`` ``start``/``end`` and
+then to each definition's own time range.
+
+Rendering looks up all saved codes with one query and every widget's cached
+result with one ``get_many``. Widget results are keyed by definition, period
+and the data version of the widget's source, so they stay valid until that
+data changes. Missing widgets are deduplicated (identical definitions are
+computed once) and grouped by shared base query. Independent groups run
+concurrently on a thread pool whose workers release their connections. A
+group that fails reports an ``error`` on its own widgets and is not cached;
+the other widgets still render.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from datetime import date
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_date
+
+from simplycrm.analytics import metric_dsl, models
+from simplycrm.analytics.cache import RefreshExecutor
+from simplycrm.core import versioning
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "simplycrm:analytics:widget"
+FAILED_MESSAGE = "Не удалось вычислить виджет."
+DEFAULTS: dict[str, int] = {
+	"WIDGET_TIMEOUT": 60 * 60,
+	"MAX_WORKERS": 4,
+	"MAX_WIDGETS": 50,
+}
+
+
+def get_config() -> dict[str, int]:
+	return {**DEFAULTS, **getattr(settings, "DASHBOARD_RENDER", {})}
+
+
+@dataclass(frozen=True)
+class Widget:
+	id: str
+	code: str | None = None
+	definition: dict[str, Any] | None = None
+
+
+def parse_widgets(layout: Any) -> list[Widget]:
+	"""Validate the widget list of a layout; layouts without ``widgets`` have none."""
+
+	if not isinstance(layout, dict) or "widgets" not in layout:
+		return []
+	items = layout["widgets"]
+	if not isinstance(items, list):
+		raise ValidationError("Виджеты дашборда задаются списком.")
+	limit = get_config()["MAX_WIDGETS"]
+	if len(items) > limit:
+		raise ValidationError(f"Дашборд может содержать не более {limit} виджетов.")
+	widgets: list[Widget] = []
+	seen: set[str] = set()
+	for item in items:
+		if not isinstance(item, dict) or not item.get("id"):
+			raise ValidationError("У каждого виджета должен быть id.")
+		widget_id = str(item["id"])
+		if widget_id in seen:
+			raise ValidationError(f"Повторяющийся id виджета: {widget_id}.")
+		seen.add(widget_id)
+		code, definition = item.get("code"), item.get("definition")
+		if (code is None) == (definition is None):
+			raise ValidationError(f"Виджет {widget_id}: укажите либо code, либо definition.")
+		widgets.append(Widget(widget_id, str(code) if code is not None else None, definition))
+	return widgets
+
+
+def validate_layout(layout: Any) -> None:
+	"""Check the widget list and compile inline definitions before a layout is saved."""
+
+	for widget in parse_widgets(layout):
+		if widget.definition is not None:
+			try:
+				metric_dsl.compile_metric(widget.definition)
+			except ValidationError as exc:
+				raise ValidationError(f"Виджет {widget.id}: {' '.join(exc.messages)}") from None
+
+
+def _period(dashboard: models.Dashboard, start: date | None, end: date | None) -> tuple[date | None, date | None] | None:
+	if start or end:
+		return start, end
+	filters = dashboard.filters if isinstance(dashboard.filters, dict) else {}
+	start = parse_date(str(filters["start"])) if filters.get("start") else None
+	end = parse_date(str(filters["end"])) if filters.get("end") else None
+	return (start, end) if start or end else None
+
+
+def _cache_key(organization_id: int, definition: dict[str, Any], bounds: tuple, version: str) -> str:
+	digest = metric_dsl.definition_hash({"definition": definition, "bounds": bounds, "version": version})
+	return f"{KEY_PREFIX}:{organization_id}:{digest[:32]}"
+
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = RefreshExecutor(max_workers=get_config()["MAX_WORKERS"], thread_name_prefix="dashboard-render")
+		return _executor
+
+
+def set_executor(executor: Executor | None) -> Executor | None:
+	"""Replace the executor running widget queries; return the previous one."""
+
+	global _executor
+	with _executor_lock:
+		previous, _executor = _executor, executor
+	return previous
+
+
+def _group(to_compute: dict[str, tuple[metric_dsl.MetricPlan, tuple]]) -> tuple[dict, dict[str, dict]]:
+	"""Group plans by shared base; plans that cannot be grouped are returned as errors."""
+
+	groups: dict[tuple, list[tuple[str, metric_dsl.MetricPlan]]] = OrderedDict()
+	failed: dict[str, dict] = {}
+	for key, (plan, bounds) in to_compute.items():
+		try:
+			for group_key, members in metric_dsl.group_plans([(key, plan, bounds)]).items():
+				groups.setdefault(group_key, []).extend(members)
+		except TypeError:
+			logger.warning("Dashboard widget %s has an ungroupable definition", key, exc_info=True)
+			failed[key] = {"error": FAILED_MESSAGE}
+	return groups, failed
+
+
+def _evaluate_group(
+	organization_id: int, members: list[tuple[str, metric_dsl.MetricPlan]], bounds: tuple
+) -> dict[str, dict]:
+	"""Evaluate one group; a failure is reported on the widgets of that group only."""
+
+	try:
+		return metric_dsl.evaluate_group(organization_id, members, bounds)
+	except (ValidationError, TypeError, ValueError) as exc:
+		logger.warning("Dashboard widget group %s failed", [key for key, _ in members], exc_info=True)
+		message = " ".join(exc.messages) if isinstance(exc, ValidationError) else FAILED_MESSAGE
+		return {key: {"error": message} for key, _ in members}
+
+
+def _execute(organization_id: int, groups: dict[tuple, list[tuple[str, metric_dsl.MetricPlan]]]) -> dict[str, dict]:
+	items = list(groups.items())
+	if len(items) == 1 or get_config()["MAX_WORKERS"] <= 1:
+		results: dict[str, dict] = {}
+		for key, members in items:
+			results.update(_evaluate_group(organization_id, members, key[-1]))
+		return results
+	executor = get_executor()
+	futures = [executor.submit(_evaluate_group, organization_id, members, key[-1]) for key, members in items]
+	results = {}
+	for future in futures:
+		results.update(future.result())
+	return results
+
+
+def render_dashboard(
+	dashboard: models.Dashboard,
+	*,
+	start: date | None = None,
+	end: date | None = None,
+) -> dict[str, Any]:
+	"""Return the data of every widget, computing only what is not cached."""
+
+	organization_id = dashboard.organization_id
+	widgets = parse_widgets(dashboard.layout)
+	override = _period(dashboard, start, end)
+	codes = {widget.code for widget in widgets if widget.code is not None}
+	saved = dict(
+		models.MetricDefinition.objects.filter(organization_id=organization_id, code__in=codes, is_active=True)
+		.values_list("code", "query")
+	) if codes else {}
+
+	versions: dict[str, str] = {}
+	results: dict[str, dict[str, Any]] = {}
+	pending: dict[str, tuple[str, dict[str, Any], metric_dsl.MetricPlan, tuple]] = {}
+	for widget in widgets:
+		if widget.code is not None and widget.code not in saved:
+			results[widget.id] = {"error": "Метрика не найдена."}
+			continue
+		try:
+			definition = metric_dsl.parse_definition(saved[widget.code] if widget.code is not None else widget.definition)
+			plan = metric_dsl.compile_metric(definition)
+		except ValidationError as exc:
+			results[widget.id] = {"error": " ".join(exc.messages)}
+			continue
+		scope = metric_dsl.SOURCES[plan.source].scope
+		if scope not in versions:
+			versions[scope] = versioning.get_data_version(organization_id, scope)
+		bounds = metric_dsl.time_bounds(plan, override)
+		key = _cache_key(organization_id, definition, bounds, versions[scope])
+		pending[widget.id] = (key, definition, plan, bounds)
+
+	cached = cache.get_many([key for key, *_ in pending.values()])
+	# Widgets showing the same definition over the same period share one computation.
+	to_compute: OrderedDict[str, tuple[metric_dsl.MetricPlan, tuple]] = OrderedDict()
+	for widget_id, (key, definition, plan, bounds) in pending.items():
+		if key in cached:
+			results[widget_id] = {**cached[key], "cached": True}
+		else:
+			to_compute.setdefault(key, (plan, bounds))
+
+	groups, computed = _group(to_compute)
+	if groups:
+		computed.update(_execute(organization_id, groups))
+	valid = {key: value for key, value in computed.items() if "error" not in value}
+	if valid:
+		cache.set_many(valid, timeout=get_config()["WIDGET_TIMEOUT"])
+	for widget_id, (key, *_rest) in pending.items():
+		if key in computed:
+			results[widget_id] = computed[key] if "error" in computed[key] else {**computed[key], "cached": False}
+
+	return {
+		"dashboard": dashboard.pk,
+		"name": dashboard.name,
+		"widgets": [{"id": widget.id, **results[widget.id]} for widget in widgets],
+		"stats": {
+			"widgets": len(widgets),
+			"cached": len(pending) - sum(1 for key, *_ in pending.values() if key in computed),
+			"computed": len(to_compute),
+			"queries": len(groups),
+		},
+	}
@@ -0,0 +1,367 @@
+"""Statistical demand forecasting persisted to :class:`Forecast`.
+
+Weekly unit sales of every variant are loaded into a dense ``variant x week``
+matrix with one aggregate query. Smooth series are fitted with additive
+Holt-Winters (damped Holt when there is less than two seasons of history) and
+intermittent series with Croston's method using the Syntetos-Boylan
+correction. All recursions run column by column over the whole matrix, so the
+cost grows with the number of weeks rather than the number of variants.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.catalog.models import ProductVariant
+from simplycrm.sales.models import OrderLine
+
+
+TARGET = "product_demand"
+# Seasonality needs two full seasons of history, so ``history_weeks`` must be
+# at least ``2 * season_length`` for Holt-Winters to be used at all.
+DEFAULT_CONFIGURATION: dict[str, float] = {
+	"history_weeks": 104,
+	"season_length": 52,
+	"alpha": 0.3,
+	"beta": 0.1,
+	"gamma": 0.2,
+	"phi": 0.95,
+	"croston_alpha": 0.1,
+	"intermittency_threshold": 1.32,
+	"interval": 0.8,
+	"high_demand_velocity": 10,
+	"low_velocity": 2,
+}
+
+RETAINED_RUNS = 5
+
+HOLT = "holt"
+HOLT_WINTERS = "holt_winters"
+CROSTON_SBA = "croston_sba"
+
+
+@dataclass
+class DemandMatrix:
+	"""Weekly demand per variant; column ``0`` is the oldest week."""
+
+	variant_ids: np.ndarray
+	week_starts: list[date]
+	values: np.ndarray
+
+	@property
+	def shape(self) -> tuple[int, int]:
+		return self.values.shape
+
+
+@dataclass
+class ForecastResult:
+	methods: np.ndarray
+	weekly: np.ndarray
+	lower: np.ndarray
+	upper: np.ndarray
+	sigma: np.ndarray
+
+
+def _week_start(value: date) -> date:
+	return value - timedelta(days=value.weekday())
+
+
+def build_demand_matrix(organization_id: int, *, history_weeks: int, now: datetime | None = None) -> DemandMatrix:
+	"""Return a dense matrix of units sold per variant and complete ISO week before ``now``."""
+
+	now = now or timezone.now()
+	# The current week is still running; a partial week would read as a drop in demand.
+	last_week = _week_start(timezone.localdate(now)) - timedelta(weeks=1)
+	first_week = last_week - timedelta(weeks=history_weeks - 1)
+	start = timezone.make_aware(datetime.combine(first_week, datetime.min.time()))
+	end = timezone.make_aware(datetime.combine(last_week + timedelta(weeks=1), datetime.min.time()))
+	rows = list(
+		OrderLine.objects.filter(
+			order__organization_id=organization_id, order__ordered_at__gte=start, order__ordered_at__lt=end
+		)
+		.annotate(week=TruncWeek("order__ordered_at"))
+		.values("product_variant", "week")
+		.annotate(units=Sum("quantity"))
+		.values_list("product_variant", "week", "units")
+	)
+	variant_ids = np.array(sorted({row[0] for row in rows}), dtype=np.int64)
+	values = np.zeros((len(variant_ids), history_weeks), dtype=np.float64)
+	if rows:
+		row_index = np.searchsorted(variant_ids, np.fromiter((row[0] for row in rows), dtype=np.int64))
+		week_index = np.fromiter(
+			((_as_date(row[1]) - first_week).days // 7 for row in rows), dtype=np.int64, count=len(rows)
+		)
+		inside = (week_index >= 0) & (week_index < history_weeks)
+		np.add.at(
+			values,
+			(row_index[inside], week_index[inside]),
+			np.fromiter((row[2] or 0 for row in rows), dtype=np.float64, count=len(rows))[inside],
+		)
+	week_starts = [first_week + timedelta(weeks=index) for index in range(history_weeks)]
+	return DemandMatrix(variant_ids=variant_ids, week_starts=week_starts, values=values)
+
+
+def _as_date(value) -> date:
+	if isinstance(value, datetime):
+		return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+	return value
+
+
+def _first_demand(values: np.ndarray) -> np.ndarray:
+	nonzero = values > 0
+	first = np.argmax(nonzero, axis=1)
+	first[~nonzero.any(axis=1)] = values.shape[1]
+	return first
+
+
+def classify(values: np.ndarray, first: np.ndarray, threshold: float) -> np.ndarray:
+	"""Flag series whose average demand interval exceeds ``threshold``."""
+
+	active_weeks = np.maximum(values.shape[1] - first, 1)
+	demand_weeks = np.maximum((values > 0).sum(axis=1), 1)
+	return active_weeks / demand_weeks > threshold
+
+
+def fit_holt_winters(
+	values: np.ndarray,
+	first: np.ndarray,
+	horizon: int,
+	*,
+	alpha: float,
+	beta: float,
+	gamma: float,
+	phi: float,
+	season_length: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""Fit damped additive Holt-Winters to every row and forecast ``horizon`` weeks.
+
+	Rows with less than two full seasons of history get no seasonal component.
+	Returns ``(forecast, residual_sigma, seasonal_mask)``.
+	"""
+
+	rows, weeks = values.shape
+	seasonal = np.zeros(rows, dtype=bool)
+	season = np.zeros((rows, max(season_length, 1)), dtype=np.float64)
+	if season_length > 1 and weeks >= 2 * season_length:
+		seasonal = first == 0
+		if seasonal.any():
+			full = values[seasonal, : (weeks // season_length) * season_length]
+			cycles = full.reshape(full.shape[0], -1, season_length)
+			season[seasonal] = (cycles - cycles.mean(axis=2, keepdims=True)).mean(axis=1)
+	gammas = np.where(seasonal, gamma, 0.0)
+
+	level = np.zeros(rows, dtype=np.float64)
+	trend = np.zeros(rows, dtype=np.float64)
+	squared_error = np.zeros(rows, dtype=np.float64)
+	observations = np.zeros(rows, dtype=np.float64)
+	for week in range(weeks):
+		y = values[:, week]
+		slot = week % season.shape[1]
+		season_now = season[:, slot]
+		starting = first == week
+		active = first < week
+		predicted = level + phi * trend + season_now
+		error = np.where(active, y - predicted, 0.0)
+		squared_error += error**2
+		observations += active
+
+		new_level = alpha * (y - season_now) + (1 - alpha) * (level + phi * trend)
+		new_trend = beta * (new_level - level) + (1 - beta) * phi * trend
+		new_season = gammas * (y - new_level) + (1 - gammas) * season_now
+		level = np.where(active, new_level, np.where(starting, y - season_now, level))
+		trend = np.where(active, new_trend, trend)
+		season[:, slot] = np.where(active, new_season, season_now)
+
+	steps = np.arange(1, horizon + 1)
+	damping = np.cumsum(phi**steps)
+	slots = (weeks - 1 + steps) % season.shape[1]
+	forecast = level[:, None] + trend[:, None] * damping[None, :] + season[:, slots]
+	sigma = np.sqrt(squared_error / np.maximum(observations, 1))
+	return np.clip(forecast, 0, None), sigma, seasonal
+
+
+def fit_croston_sba(
+	values: np.ndarray, first: np.ndarray, horizon: int, *, alpha: float
+) -> tuple[np.ndarray, np.ndarray]:
+	"""Croston's method with the Syntetos-Boylan bias correction for every row."""
+
+	rows, weeks = values.shape
+	size = np.zeros(rows, dtype=np.float64)
+	interval = np.ones(rows, dtype=np.float64)
+	since_last = np.zeros(rows, dtype=np.float64)
+	started = np.zeros(rows, dtype=bool)
+	squared_error = np.zeros(rows, dtype=np.float64)
+	observations = np.zeros(rows, dtype=np.float64)
+	correction = 1 - alpha / 2
+	for week in range(weeks):
+		y = values[:, week]
+		since_last += 1
+		predicted = correction * size / interval
+		error = np.where(started, y - predicted, 0.0)
+		squared_error += error**2
+		observations += started
+
+		demand = y > 0
+		initial = demand & ~started
+		update = demand & started
+		size = np.where(update, alpha * y + (1 - alpha) * size, np.where(initial, y, size))
+		interval = np.where(
+			update,
+			alpha * since_last + (1 - alpha) * interval,
+			np.where(initial, week + 1.0, interval),
+		)
+		since_last = np.where(demand, 0.0, since_last)
+		started |= demand
+
+	rate = np.where(started, correction * size / interval, 0.0)
+	forecast = np.repeat(rate[:, None], horizon, axis=1)
+	sigma = np.sqrt(squared_error / np.maximum(observations, 1))
+	return forecast, sigma
+
+
+def forecast_matrix(matrix: DemandMatrix, horizon_weeks: int, configuration: dict[str, float]) -> ForecastResult:
+	"""Fit the appropriate model per row and return point and interval forecasts."""
+
+	values = matrix.values
+	rows = values.shape[0]
+	if rows == 0:
+		empty = np.zeros((0, horizon_weeks))
+		return ForecastResult(np.array([], dtype=object), empty, empty, empty, np.zeros(0))
+
+	first = _first_demand(values)
+	intermittent = classify(values, first, configuration["intermittency_threshold"])
+	holt, holt_sigma, seasonal = fit_holt_winters(
+		values,
+		first,
+		horizon_weeks,
+		alpha=configuration["alpha"],
+		beta=configuration["beta"],
+		gamma=configuration["gamma"],
+		phi=configuration["phi"],
+		season_length=int(configuration["season_length"]),
+	)
+	croston, croston_sigma = fit_croston_sba(values, first, horizon_weeks, alpha=configuration["croston_alpha"])
+
+	weekly = np.where(intermittent[:, None], croston, holt)
+	sigma = np.where(intermittent, croston_sigma, holt_sigma)
+	z_score = NormalDist().inv_cdf(0.5 + configuration["interval"] / 2)
+	spread = z_score * sigma[:, None] * np.sqrt(np.arange(1, horizon_weeks + 1))[None, :]
+	methods = np.where(intermittent, CROSTON_SBA, np.where(seasonal, HOLT_WINTERS, HOLT))
+	return ForecastResult(
+		methods=methods,
+		weekly=weekly,
+		lower=np.clip(weekly - spread, 0, None),
+		upper=weekly + spread,
+		sigma=sigma,
+	)
+
+
+def configuration_overrides(configuration: dict | None) -> dict[str, float]:
+	"""Return the valid entries of ``configuration`` that override the defaults."""
+
+	return {
+		key: value
+		for key, value in (configuration or {}).items()
+		if key in DEFAULT_CONFIGURATION and isinstance(value, (int, float)) and not isinstance(value, bool)
+	}
+
+
+def get_configuration(overrides: dict | None = None) -> dict[str, float]:
+	return {**DEFAULT_CONFIGURATION, **configuration_overrides(overrides)}
+
+
+def generate_demand_forecast(
+	organization_id: int,
+	*,
+	horizon_days: int = 28,
+	configuration: dict | None = None,
+	now: datetime | None = None,
+) -> models.Forecast:
+	"""Fit demand models for all variants of an organization and store the result.
+
+	Only the overrides are stored with the forecast, so a later run that
+	reuses them still picks up changed defaults.
+	"""
+
+	now = now or timezone.now()
+	overrides = configuration_overrides(configuration)
+	configuration = get_configuration(overrides)
+	horizon_weeks = max(math.ceil(horizon_days / 7), 1)
+	matrix = build_demand_matrix(organization_id, history_weeks=int(configuration["history_weeks"]), now=now)
+	result = forecast_matrix(matrix, horizon_weeks, configuration)
+
+	names = {
+		variant_id: f"{product_name} / {name}"
+		for variant_id, product_name, name in ProductVariant.objects.filter(
+			product__organization_id=organization_id
+		).values_list("id", "product__name", "name")
+	}
+	# Scale the last (partial) week of the horizon down to the requested number of days.
+	day_weights = np.ones(horizon_weeks)
+	day_weights[-1] = (horizon_days - 7 * (horizon_weeks - 1)) / 7 if horizon_days else 1
+	totals = result.weekly @ day_weights
+	z_score = NormalDist().inv_cdf(0.5 + configuration["interval"] / 2)
+	total_spread = z_score * result.sigma * math.sqrt(horizon_days / 7 or 1)
+	future_weeks = [matrix.week_starts[-1] + timedelta(weeks=step) for step in range(1, horizon_weeks + 1)]
+
+	variants = []
+	for index, variant_id in enumerate(matrix.variant_ids.tolist()):
+		if variant_id not in names:
+			continue
+		variants.append(
+			{
+				"variant_id": variant_id,
+				"variant_name": names[variant_id],
+				"method": str(result.methods[index]),
+				"velocity": round(float(result.weekly[index].mean()), 2),
+				"total": round(float(totals[index]), 2),
+				"lower": round(max(float(totals[index] - total_spread[index]), 0.0), 2),
+				"upper": round(float(totals[index] + total_spread[index]), 2),
+				"weekly": [round(float(value), 2) for value in result.weekly[index]],
+				"weekly_lower": [round(float(value), 2) for value in result.lower[index]],
+				"weekly_upper": [round(float(value), 2) for value in result.upper[index]],
+			}
+		)
+
+	return models.Forecast.objects.create(
+		organization_id=organization_id,
+		name="Прогноз спроса по товарам",
+		target=TARGET,
+		horizon_days=horizon_days,
+		configuration=overrides,
+		result={
+			"generated_at": now.isoformat(),
+			"weeks": [week.isoformat() for week in future_weeks],
+			"variants": variants,
+		},
+	)
+
+
+def latest_demand_forecast(organization_id: int) -> models.Forecast | None:
+	return (
+		models.Forecast.objects.filter(organization_id=organization_id, target=TARGET)
+		.order_by("-generated_at", "-id")
+		.first()
+	)
+
+
+def prune_demand_forecasts(organization_id: int, *, keep: int = RETAINED_RUNS) -> int:
+	"""Delete all but the ``keep`` most recent demand forecasts."""
+	
+	stale = list(
+		models.Forecast.objects.filter(organization_id=organization_id, target=TARGET)
+		.order_by("-generated_at", "-id")
+		.values_list("id", flat=True)[keep:]
+	)
+	if not stale:
+		return 0
+	deleted, _ = models.Forecast.objects.filter(id__in=stale).delete()
+	return deleted
@@ -0,0 +1,182 @@
+"""Pipeline funnel analytics from opportunity stage history.
+
+Every row of :class:`~simplycrm.sales.models.OpportunityStageChange` is a
+stint of an opportunity in a stage. One windowed query pairs each stint with
+the moment the opportunity left the stage (``LEAD(changed_at)``) and with its
+first entry into the pipeline; the funnel is then aggregated with pandas:
+
+* ``reached`` - opportunities that got at least as far as the stage, which
+  gives the stage-to-stage conversion rate;
+* median days spent in the stage over completed stints;
+* pipeline velocity, ``open deals * win rate * average won amount / average
+  sales cycle``, i.e. expected revenue per day.
+
+Won stages are those with a 100% win probability, or the last stage of a
+pipeline that has none.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+from django.db.models import F, Min, Window
+from django.db.models.functions import Lead
+
+from simplycrm.sales.models import DealStage, OpportunityStageChange
+
+
+SECONDS_PER_DAY = 86400.0
+WON_PROBABILITY = Decimal("100")
+STINT_COLUMNS = [
+	"opportunity_id",
+	"pipeline_id",
+	"from_stage_id",
+	"to_stage_id",
+	"changed_at",
+	"left_at",
+	"first_at",
+	"amount",
+	"current_stage_id",
+]
+
+
+def stage_stints(organization_id: int, pipeline_id: int | None = None) -> pd.DataFrame:
+	"""One row per stage stint with its end and the opportunity's first entry, in one query."""
+
+	changes = OpportunityStageChange.objects.filter(organization_id=organization_id)
+	if pipeline_id is not None:
+		changes = changes.filter(pipeline_id=pipeline_id)
+	partition = {"partition_by": [F("opportunity_id")]}
+	rows = changes.annotate(
+		left_at=Window(Lead("changed_at"), order_by=[F("changed_at").asc(), F("id").asc()], **partition),
+		first_at=Window(Min("changed_at"), **partition),
+	).values_list(
+		"opportunity_id",
+		"pipeline_id",
+		"from_stage_id",
+		"to_stage_id",
+		"changed_at",
+		"left_at",
+		"first_at",
+		"opportunity__amount",
+		"opportunity__stage_id",
+	)
+	frame = pd.DataFrame.from_records(list(rows.iterator()), columns=STINT_COLUMNS)
+	if frame.empty:
+		return frame
+	for column in ("changed_at", "left_at", "first_at"):
+		frame[column] = pd.to_datetime(frame[column], utc=True)
+	frame["amount"] = frame["amount"].astype(float)
+	frame["days_in_stage"] = (frame["left_at"] - frame["changed_at"]).dt.total_seconds() / SECONDS_PER_DAY
+	return frame
+
+
+def _round(value: float | None, digits: int = 4) -> float | None:
+	return None if value is None or pd.isna(value) else round(float(value), digits)
+
+
+def _pipeline_funnel(pipeline: dict, stages: pd.DataFrame, stints: pd.DataFrame) -> dict[str, object]:
+	stages = stages.sort_values(["position", "id"])
+	won_stage_ids = set(stages.loc[stages["win_probability"] >= WON_PROBABILITY, "id"])
+	if not won_stage_ids and not stages.empty:
+		won_stage_ids = {int(stages.iloc[-1]["id"])}
+
+	position = dict(zip(stages["id"], stages["position"]))
+	stints = stints.assign(position=stints["to_stage_id"].map(position))
+	furthest = stints.groupby("opportunity_id")["position"].max()
+	entered = stints.groupby("to_stage_id")["opportunity_id"].nunique()
+	current = stints.drop_duplicates("opportunity_id").groupby("current_stage_id").size()
+	median_days = stints.dropna(subset=["days_in_stage"]).groupby("to_stage_id")["days_in_stage"].median()
+
+	rows = []
+	reached_counts = [int((furthest >= stage_position).sum()) for stage_position in stages["position"]]
+	for index, stage in enumerate(stages.itertuples(index=False)):
+		reached = reached_counts[index]
+		following = reached_counts[index + 1] if index + 1 < len(reached_counts) else None
+		rows.append(
+			{
+				"stage_id": int(stage.id),
+				"name": stage.name,
+				"position": int(stage.position),
+				"is_won": int(stage.id) in won_stage_ids,
+				"entered": int(entered.get(stage.id, 0)),
+				"reached": reached,
+				"current": int(current.get(stage.id, 0)),
+				"conversion_to_next": _round(following / reached) if following is not None and reached else None,
+				"median_days_in_stage": _round(median_days.get(stage.id), 2),
+			}
+		)
+
+	opportunities = stints.drop_duplicates("opportunity_id").set_index("opportunity_id")
+	won_entries = stints[stints["to_stage_id"].isin(won_stage_ids)].groupby("opportunity_id")["changed_at"].min()
+	total = len(opportunities)
+	won = len(won_entries)
+	win_rate = won / total if total else None
+	average_won_amount = opportunities.loc[won_entries.index, "amount"].mean() if won else None
+	cycle_days = (
+		(won_entries - opportunities.loc[won_entries.index, "first_at"]).dt.total_seconds() / SECONDS_PER_DAY
+	).mean() if won else None
+	open_count = int((~opportunities["current_stage_id"].isin(won_stage_ids)).sum()) if total else 0
+	velocity = (
+		open_count * win_rate * average_won_amount / cycle_days
+		if won and cycle_days and cycle_days > 0
+		else None
+	)
+
+	transitions = (
+		stints.dropna(subset=["from_stage_id"])
+		.groupby(["from_stage_id", "to_stage_id"])
+		.size()
+		.reset_index(name="count")
+	)
+	return {
+		"pipeline_id": pipeline["id"],
+		"pipeline_name": pipeline["name"],
+		"opportunities": total,
+		"open": open_count,
+		"won": won,
+		"win_rate": _round(win_rate),
+		"average_won_amount": _round(average_won_amount, 2),
+		"average_cycle_days": _round(cycle_days, 2),
+		"velocity_per_day": _round(velocity, 2),
+		"stages": rows,
+		"transitions": [
+			{"from_stage_id": int(row.from_stage_id), "to_stage_id": int(row.to_stage_id), "count": int(row.count)}
+			for row in transitions.itertuples(index=False)
+		],
+	}
+
+
+def pipeline_funnels(
+	organization_id: int,
+	*,
+	pipeline_id: int | None = None,
+	since: date | None = None,
+) -> list[dict[str, object]]:
+	"""Funnel of every pipeline; ``since`` limits it to opportunities that entered on or after that day."""
+
+	stage_rows = DealStage.objects.filter(pipeline__organization_id=organization_id)
+	if pipeline_id is not None:
+		stage_rows = stage_rows.filter(pipeline_id=pipeline_id)
+	stages = pd.DataFrame.from_records(
+		list(stage_rows.values("id", "pipeline_id", "pipeline__name", "name", "position", "win_probability"))
+	)
+	if stages.empty:
+		return []
+	stints = stage_stints(organization_id, pipeline_id)
+	if stints.empty:
+		stints = pd.DataFrame(columns=[*STINT_COLUMNS, "days_in_stage"])
+	elif since is not None:
+		stints = stints[stints["first_at"] >= pd.Timestamp(since).tz_localize("UTC")]
+
+	funnels = []
+	for (pipeline, name), pipeline_stages in stages.groupby(["pipeline_id", "pipeline__name"], sort=True):
+		funnels.append(
+			_pipeline_funnel(
+				{"id": int(pipeline), "name": name},
+				pipeline_stages,
+				stints[stints["pipeline_id"] == pipeline],
+			)
+		)
+	return funnels
@@ -0,0 +1,318 @@
+"""Lead scoring: feature extraction, per-organization training and batch scoring.
+
+Lead features (source, metadata, activity counts, contact and company
+attributes) are extracted with one annotated query and turned into a sparse
+matrix by a :class:`~sklearn.feature_extraction.DictVectorizer`. Models are
+fitted in a process pool, one organization per task, while database access
+stays in the parent process. Fitted models are stored with joblib under
+``settings.MODEL_ARTIFACT_ROOT`` and every training is recorded as a
+:class:`ModelTrainingRun`. Scoring walks leads in id-ordered chunks and writes
+changed scores with ``bulk_update``.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Q, QuerySet
+from django.utils import timezone
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import average_precision_score, log_loss, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from simplycrm.analytics import models
+from simplycrm.core import versioning
+from simplycrm.sales.models import Lead
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_TYPE = "lead_scoring"
+CONVERTED_STATUSES = frozenset({"converted", "won", "qualified"})
+LOST_STATUSES = frozenset({"lost", "disqualified", "unqualified", "rejected"})
+MIN_TRAINING_SAMPLES = 20
+MIN_CLASS_SAMPLES = 5
+HOLDOUT_FRACTION = 0.25
+SCORE_CHUNK_SIZE = 1000
+DEFAULT_PARAMETERS: dict[str, Any] = {"C": 1.0, "max_iter": 1000}
+
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class LeadFeatures:
+	ids: list[int] = field(default_factory=list)
+	rows: list[dict[str, float]] = field(default_factory=list)
+	statuses: list[str] = field(default_factory=list)
+	scores: list[int] = field(default_factory=list)
+
+
+def _annotated(queryset: QuerySet) -> QuerySet:
+	return queryset.annotate(
+		activity_count=Count("opportunities__activities", distinct=True),
+		completed_activity_count=Count(
+			"opportunities__activities",
+			filter=Q(opportunities__activities__completed_at__isnull=False),
+			distinct=True,
+		),
+	).values_list(
+		"id",
+		"status",
+		"source",
+		"metadata",
+		"created_at",
+		"activity_count",
+		"completed_activity_count",
+		"contact__email",
+		"contact__phone_number",
+		"contact__tags",
+		"contact__company__industry",
+		"score",
+	)
+
+
+def _feature_row(values: tuple, now: datetime) -> dict[str, float]:
+	(
+		_,
+		_,
+		source,
+		metadata,
+		created_at,
+		activity_count,
+		completed_activity_count,
+		email,
+		phone_number,
+		tags,
+		industry,
+		_,
+	) = values
+	row: dict[str, float] = {
+		f"source={(source or 'unknown').lower()}": 1.0,
+		"activities": math.log1p(activity_count),
+		"completed_activities": math.log1p(completed_activity_count),
+		"age_days": math.log1p(max((now - created_at).days, 0)),
+		"has_email": float(bool(email)),
+		"has_phone": float(bool(phone_number)),
+	}
+	if industry:
+		row[f"industry={industry.lower()}"] = 1.0
+	if email and "@" in email:
+		row[f"email_domain={email.rsplit('@', 1)[1].lower()}"] = 1.0
+	for tag in tags or []:
+		if isinstance(tag, str):
+			row[f"tag={tag.lower()}"] = 1.0
+	for key, value in (metadata or {}).items():
+		if isinstance(value, bool):
+			row[f"meta:{key}"] = float(value)
+		elif isinstance(value, (int, float)):
+			row[f"meta:{key}"] = math.copysign(math.log1p(abs(value)), value)
+		elif isinstance(value, str) and len(value) <= 64:
+			row[f"meta:{key}={value.lower()}"] = 1.0
+		elif value is not None:
+			row[f"meta:{key}"] = 1.0
+	return row
+
+
+def extract_features(queryset: QuerySet, *, now: datetime | None = None) -> LeadFeatures:
+	now = now or timezone.now()
+	features = LeadFeatures()
+	for values in _annotated(queryset).iterator(chunk_size=SCORE_CHUNK_SIZE):
+		features.ids.append(values[0])
+		features.statuses.append((values[1] or "").lower())
+		features.scores.append(values[-1])
+		features.rows.append(_feature_row(values, now))
+	return features
+
+
+def fit_model(matrix, labels: np.ndarray, parameters: dict[str, Any]) -> tuple[LogisticRegression, dict[str, Any]]:
+	"""Fit a model and evaluate it; runs inside pool workers, so it never touches the database."""
+
+	def build() -> LogisticRegression:
+		return LogisticRegression(
+			C=float(parameters["C"]),
+			max_iter=int(parameters["max_iter"]),
+			class_weight="balanced",
+		)
+
+	metrics: dict[str, Any] = {
+		"samples": int(labels.size),
+		"positives": int(labels.sum()),
+		"features": int(matrix.shape[1]),
+	}
+	smallest_class = int(min(labels.sum(), labels.size - labels.sum()))
+	if smallest_class >= MIN_CLASS_SAMPLES * 2:
+		train_x, test_x, train_y, test_y = train_test_split(
+			matrix, labels, test_size=HOLDOUT_FRACTION, stratify=labels, random_state=0
+		)
+		metrics["evaluation"] = "holdout"
+		holdout = build().fit(train_x, train_y)
+	else:
+		test_x, test_y = matrix, labels
+		metrics["evaluation"] = "training"
+		holdout = None
+	model = build().fit(matrix, labels)
+	probabilities = (holdout or model).predict_proba(test_x)[:, 1]
+	metrics.update(
+		{
+			"roc_auc": round(float(roc_auc_score(test_y, probabilities)), 4),
+			"average_precision": round(float(average_precision_score(test_y, probabilities)), 4),
+			"log_loss": round(float(log_loss(test_y, probabilities, labels=[0, 1])), 4),
+		}
+	)
+	return model, metrics
+
+
+def artifact_path(organization_id: int) -> Path:
+	return Path(settings.MODEL_ARTIFACT_ROOT) / MODEL_TYPE / f"{organization_id}.joblib"
+
+
+_loaded: dict[Path, tuple[float, dict[str, Any]]] = {}
+
+
+def load_artifact(organization_id: int) -> dict[str, Any] | None:
+	"""Return the stored model, reloading it only when the file changed."""
+
+	path = artifact_path(organization_id)
+	try:
+		modified = path.stat().st_mtime
+	except FileNotFoundError:
+		return None
+	cached = _loaded.get(path)
+	if cached is None or cached[0] != modified:
+		cached = _loaded[path] = (modified, joblib.load(path))
+	return cached[1]
+
+
+def _save_artifact(organization_id: int, artifact: dict[str, Any]) -> Path:
+	path = artifact_path(organization_id)
+	path.parent.mkdir(parents=True, exist_ok=True)
+	temporary = path.with_suffix(".tmp")
+	joblib.dump(artifact, temporary)
+	temporary.replace(path)
+	return path
+
+
+@dataclass
+class _Prepared:
+	run: models.ModelTrainingRun
+	vectorizer: DictVectorizer | None = None
+	matrix: Any = None
+	labels: np.ndarray | None = None
+
+
+def _prepare(organization_id: int, parameters: dict[str, Any]) -> _Prepared:
+	run = models.ModelTrainingRun.objects.create(
+		organization_id=organization_id,
+		model_type=MODEL_TYPE,
+		status=STATUS_RUNNING,
+		parameters=parameters,
+	)
+	labelled = Lead.objects.filter(organization_id=organization_id, status__in=CONVERTED_STATUSES | LOST_STATUSES)
+	features = extract_features(labelled)
+	labels = np.array([status in CONVERTED_STATUSES for status in features.statuses], dtype=np.int8)
+	smallest_class = int(min(labels.sum(), labels.size - labels.sum())) if labels.size else 0
+	if labels.size < MIN_TRAINING_SAMPLES or smallest_class < MIN_CLASS_SAMPLES:
+		_finish(
+			run,
+			STATUS_SKIPPED,
+			{"samples": int(labels.size), "positives": int(labels.sum()), "reason": "insufficient_labelled_leads"},
+		)
+		return _Prepared(run)
+	vectorizer = DictVectorizer(sparse=True)
+	return _Prepared(run, vectorizer, vectorizer.fit_transform(features.rows), labels)
+
+
+def _finish(run: models.ModelTrainingRun, status: str, metrics: dict[str, Any]) -> None:
+	run.status = status
+	run.metrics = metrics
+	run.completed_at = timezone.now()
+	run.save(update_fields=["status", "metrics", "completed_at"])
+
+
+def _store(prepared: _Prepared, model: LogisticRegression, metrics: dict[str, Any]) -> None:
+	run = prepared.run
+	path = _save_artifact(
+		run.organization_id,
+		{"vectorizer": prepared.vectorizer, "model": model, "run_id": run.pk, "trained_at": timezone.now()},
+	)
+	_finish(run, STATUS_SUCCEEDED, {**metrics, "artifact": str(path)})
+
+
+def train_organizations(
+	organization_ids: Iterable[int],
+	*,
+	max_workers: int = 0,
+	parameters: dict[str, Any] | None = None,
+) -> list[models.ModelTrainingRun]:
+	"""Train one model per organization; ``max_workers=0`` fits in-process."""
+
+	parameters = {**DEFAULT_PARAMETERS, **(parameters or {})}
+	prepared = [_prepare(organization_id, parameters) for organization_id in organization_ids]
+	trainable = [item for item in prepared if item.matrix is not None]
+	if max_workers and len(trainable) > 1:
+		with ProcessPoolExecutor(max_workers=max_workers) as pool:
+			futures = [(item, pool.submit(fit_model, item.matrix, item.labels, parameters)) for item in trainable]
+			outcomes = []
+			for item, future in futures:
+				try:
+					outcomes.append((item, future.result(), None))
+				except Exception as exc:  # noqa: BLE001 - one organization must not fail the batch
+					outcomes.append((item, None, exc))
+	else:
+		outcomes = []
+		for item in trainable:
+			try:
+				outcomes.append((item, fit_model(item.matrix, item.labels, parameters), None))
+			except Exception as exc:  # noqa: BLE001
+				outcomes.append((item, None, exc))
+	for item, result, error in outcomes:
+		if error is not None:
+			logger.exception("Lead scoring training failed for organization %s", item.run.organization_id, exc_info=error)
+			_finish(item.run, STATUS_FAILED, {"error": str(error)[:2000]})
+		else:
+			_store(item, *result)
+	return [item.run for item in prepared]
+
+
+def score_leads(organization_id: int, *, chunk_size: int = SCORE_CHUNK_SIZE) -> int:
+	"""Rescore every lead of the organization; return the number of changed scores."""
+
+	artifact = load_artifact(organization_id)
+	if artifact is None:
+		return 0
+	vectorizer: DictVectorizer = artifact["vectorizer"]
+	model: LogisticRegression = artifact["model"]
+	now = timezone.now()
+	leads = Lead.objects.filter(organization_id=organization_id).order_by("id")
+	changed_total = 0
+	last_id = 0
+	while True:
+		# Keyset pagination keeps every chunk query cheap regardless of its position.
+		features = extract_features(leads.filter(id__gt=last_id)[:chunk_size], now=now)
+		if not features.ids:
+			break
+		last_id = features.ids[-1]
+		probabilities = model.predict_proba(vectorizer.transform(features.rows))[:, 1]
+		scores = np.rint(probabilities * 100).astype(int).tolist()
+		changed = [
+			Lead(id=lead_id, score=score)
+			for lead_id, score, current in zip(features.ids, scores, features.scores)
+			if score != current
+		]
+		Lead.objects.bulk_update(changed, ["score"], batch_size=chunk_size)
+		changed_total += len(changed)
+	if changed_total:
+		versioning.bump_data_version(organization_id, versioning.PIPELINE)
+	return changed_total
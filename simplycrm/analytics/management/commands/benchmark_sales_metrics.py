@@ -0,0 +1,111 @@
+"""Benchmark the single-pass sales KPI aggregation on synthetic data."""
+from __future__ import annotations
+
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from simplycrm.analytics import metrics
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.models import Organization
+from simplycrm.sales import models as sales_models
+
+
+class Command(BaseCommand):
+	help = "Generate a synthetic organization and time sales KPI aggregation over it."
+	
+	def add_arguments(self, parser):
+		parser.add_argument("--lines", type=int, default=100_000, help="Number of order lines to generate.")
+		parser.add_argument("--lines-per-order", type=int, default=4)
+		parser.add_argument("--variants", type=int, default=200)
+		parser.add_argument("--days", type=int, default=730, help="Spread orders over this many days.")
+		parser.add_argument("--batch-size", type=int, default=5_000)
+		parser.add_argument("--seed", type=int, default=42)
+		parser.add_argument("--keep", action="store_true", help="Keep the generated organization.")
+	
+	def handle(self, *args, **options):
+		rng = random.Random(options["seed"])
+		organization = Organization.objects.create(
+			name=f"Benchmark {timezone.now():%Y%m%d%H%M%S}",
+			slug=f"benchmark-{timezone.now():%Y%m%d%H%M%S%f}",
+		)
+		try:
+			started = time.perf_counter()
+			self._generate(organization, rng, options)
+			self.stdout.write(f"Generated {options['lines']} lines in {time.perf_counter() - started:.1f}s")
+			self._measure(organization.id, options["days"])
+		finally:
+			if not options["keep"]:
+				# Order lines protect variants, so remove sales before the catalog.
+				sales_models.Order.objects.filter(organization=organization).delete()
+				catalog_models.Product.objects.filter(organization=organization).delete()
+				organization.delete()
+	
+	def _generate(self, organization, rng, options):
+		product = catalog_models.Product.objects.create(organization=organization, name="Benchmark", sku="BENCH")
+		variants = catalog_models.ProductVariant.objects.bulk_create(
+			[
+				catalog_models.ProductVariant(
+					product=product,
+					name=f"Variant {index}",
+					sku=f"BENCH-{index}",
+					price=rng.randint(5, 500),
+					cost=rng.randint(1, 5),
+				)
+				for index in range(options["variants"])
+			]
+		)
+		now = timezone.now()
+		remaining = options["lines"]
+		per_order = max(options["lines_per_order"], 1)
+		batch_orders = max(options["batch_size"] // per_order, 1)
+		while remaining > 0:
+			count = min(batch_orders, -(-remaining // per_order))
+			orders = sales_models.Order.objects.bulk_create(
+				[sales_models.Order(organization=organization, status="paid") for _ in range(count)]
+			)
+			for order in orders:
+				order.ordered_at = now - timedelta(days=rng.randrange(options["days"]), seconds=rng.randrange(86400))
+			sales_models.Order.objects.bulk_update(orders, ["ordered_at"])
+			lines = []
+			for order in orders:
+				for _ in range(min(per_order, remaining - len(lines))):
+					variant = rng.choice(variants)
+					lines.append(
+						sales_models.OrderLine(
+							order=order,
+							product_variant=variant,
+							quantity=rng.randint(1, 5),
+							unit_price=variant.price,
+							discount_amount=rng.choice((0, 0, 0, 1)),
+						)
+					)
+			sales_models.OrderLine.objects.bulk_create(lines, batch_size=options["batch_size"])
+			remaining -= len(lines)
+	
+	def _measure(self, organization_id, days):
+		today = date.today()
+		scenarios = [
+			("all time", metrics.Period(), None),
+			("last 30 days vs previous", metrics.Period(today - timedelta(days=29), today), metrics.PREVIOUS_PERIOD),
+			("last 90 days vs last year", metrics.Period(today - timedelta(days=89), today), metrics.PREVIOUS_YEAR),
+		]
+		for label, period, compare in scenarios:
+			reset_queries()
+			with CaptureQueriesContext(connection) as captured:
+				started = time.perf_counter()
+				result = metrics.sales_kpis(organization_id, period, compare=compare, use_cache=False)
+				cold = time.perf_counter() - started
+			metrics.sales_kpis(organization_id, period, compare=compare)
+			started = time.perf_counter()
+			metrics.sales_kpis(organization_id, period, compare=compare)
+			warm = time.perf_counter() - started
+			self.stdout.write(
+				f"{label}: {cold * 1000:.1f} ms cold ({len(captured)} queries), {warm * 1000:.2f} ms cached; "
+				f"orders={result['orders_count']} revenue={result['total_revenue']}"
+			)
@@ -0,0 +1,28 @@
+"""Close finished days in the streaming anomaly detector."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import anomalies
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Fold closed days into per-organization metric baselines and record anomalies as insights."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		for organization in organizations:
+			insights = anomalies.close_days(organization.id)
+			self.stdout.write(f"{organization.slug}: {len(insights)} anomalies")
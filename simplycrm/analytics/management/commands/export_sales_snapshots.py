@@ -0,0 +1,33 @@
+"""Export per-organization Parquet snapshots of order lines."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import snapshots
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Write changed order days and dimensions of each organization to Parquet snapshots."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+		parser.add_argument("--full", action="store_true", help="Rewrite every partition instead of changed days only.")
+	
+	def handle(self, *args, **options):
+		snapshots.require_pyarrow()
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		for organization in organizations:
+			result = snapshots.export_organization(organization.id, full=options["full"])
+			self.stdout.write(
+				f"{organization.slug}: {result.days_written} days written ({result.rows_written} rows), "
+				f"{result.days_removed} removed, {result.days_unchanged} unchanged"
+			)
@@ -0,0 +1,49 @@
+"""Precompute product demand forecasts for organizations."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simplycrm.analytics import forecasting
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Fit demand models for every variant and store the result in analytics.Forecast."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+		parser.add_argument(
+			"--horizon-days",
+			type=int,
+			default=None,
+			help="Forecast horizon; defaults to the previous run or 28 days.",
+		)
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+			missing = set(options["organizations"]) - set(organizations.values_list("id", flat=True))
+			if missing:
+				raise CommandError(f"Unknown organizations: {sorted(missing)}")
+		
+		for organization in organizations:
+			previous = forecasting.latest_demand_forecast(organization.id)
+			horizon_days = options["horizon_days"] or (previous.horizon_days if previous else 28)
+			forecast = forecasting.generate_demand_forecast(
+				organization.id,
+				horizon_days=horizon_days,
+				# Stored overrides are merged over the current defaults.
+				configuration=previous.configuration if previous else None,
+			)
+			forecasting.prune_demand_forecasts(organization.id)
+			self.stdout.write(
+				f"{organization.slug}: {len(forecast.result['variants'])} variants, "
+				f"{horizon_days} days (forecast #{forecast.pk})"
+			)
@@ -0,0 +1,29 @@
+"""Refresh customer segment memberships."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import segments
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Re-evaluate customer segments for contacts changed since the last refresh."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+		parser.add_argument("--full", action="store_true", help="Re-evaluate every contact, not only changed ones.")
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		for organization in organizations:
+			count = segments.refresh_segments(organization.id, full=options["full"])
+			self.stdout.write(f"{organization.slug}: {count} segments refreshed")
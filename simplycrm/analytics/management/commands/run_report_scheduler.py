@@ -0,0 +1,45 @@
+"""Run scheduled analytics reports."""
+from __future__ import annotations
+
+import signal
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import scheduler
+
+
+class Command(BaseCommand):
+	help = "Execute reports according to their schedule_cron and store rendered outputs."
+	
+	def add_arguments(self, parser):
+		parser.add_argument("--workers", type=int, default=scheduler.DEFAULT_WORKERS, help="Worker pool size.")
+		parser.add_argument(
+			"--per-organization",
+			type=int,
+			default=scheduler.DEFAULT_PER_ORGANIZATION,
+			help="Maximum concurrent reports per organization.",
+		)
+		parser.add_argument(
+			"--refresh-interval",
+			type=int,
+			default=scheduler.REFRESH_INTERVAL,
+			help="Seconds between checks for created or edited reports.",
+		)
+		parser.add_argument("--once", action="store_true", help="Dispatch due reports once and exit.")
+	
+	def handle(self, *args, **options):
+		report_scheduler = scheduler.ReportScheduler(
+			max_workers=options["workers"],
+			per_organization=options["per_organization"],
+			refresh_interval=options["refresh_interval"],
+		)
+		if options["once"]:
+			due = report_scheduler.run_pending()
+			report_scheduler.executor.shutdown(wait=True)
+			self.stdout.write(f"Dispatched {len(due)} reports")
+			return
+		for signum in (signal.SIGINT, signal.SIGTERM):
+			signal.signal(signum, lambda *_: report_scheduler.stop_event.set())
+		report_scheduler.refresh()
+		self.stdout.write(f"Scheduling {len(report_scheduler)} reports")
+		report_scheduler.run_forever()
@@ -0,0 +1,28 @@
+"""Recompute contact churn scores."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import churn
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Estimate per-contact churn probability and value at risk from order cadence."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		for organization in organizations:
+			scored = churn.score_contacts(organization.id)
+			self.stdout.write(f"{organization.slug}: {scored} contacts scored")
@@ -0,0 +1,28 @@
+"""Capture the weekly pipeline forecast snapshot."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import pipeline_forecast
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Store this week's weighted pipeline forecast so forecast drift can be charted. Run weekly."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		for organization in organizations:
+			rows = pipeline_forecast.snapshot_forecast(organization.id)
+			self.stdout.write(f"{organization.slug}: {rows} forecast rows captured")
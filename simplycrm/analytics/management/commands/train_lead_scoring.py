@@ -0,0 +1,35 @@
+"""Train lead scoring models and rescore leads."""
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from simplycrm.analytics import lead_scoring
+from simplycrm.core.models import Organization
+
+
+class Command(BaseCommand):
+	help = "Train a lead scoring model per organization in a process pool and rescore its leads."
+	
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--organization",
+			type=int,
+			action="append",
+			dest="organizations",
+			help="Organization id; may be repeated. Defaults to all organizations.",
+		)
+		parser.add_argument("--workers", type=int, default=4, help="Training processes; 0 trains in-process.")
+		parser.add_argument("--score-only", action="store_true", help="Rescore leads with the stored models.")
+		parser.add_argument("--chunk-size", type=int, default=lead_scoring.SCORE_CHUNK_SIZE)
+	
+	def handle(self, *args, **options):
+		organizations = Organization.objects.order_by("id")
+		if options["organizations"]:
+			organizations = organizations.filter(id__in=options["organizations"])
+		organization_ids = list(organizations.values_list("id", flat=True))
+		if not options["score_only"]:
+			for run in lead_scoring.train_organizations(organization_ids, max_workers=options["workers"]):
+				self.stdout.write(f"organization {run.organization_id}: {run.status} {run.metrics}")
+		for organization_id in organization_ids:
+			changed = lead_scoring.score_leads(organization_id, chunk_size=options["chunk_size"])
+			self.stdout.write(f"organization {organization_id}: {changed} lead scores updated")
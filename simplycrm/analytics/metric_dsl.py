@@ -0,0 +1,459 @@
+"""Tenant-scoped JSON DSL for :class:`MetricDefinition` queries.
+
+A definition names a whitelisted source, one measure, optional dimensions,
+filters, a time grain and a time range::
+
+	{
+		"source": "order_lines",
+		"measure": {"aggregate": "sum", "field": "revenue"},
+		"dimensions": ["channel"],
+		"filters": [{"field": "status", "op": "in", "value": ["paid", "shipped"]}],
+		"time_grain": "week",
+		"time_range": {"last_days": 90}
+	}
+
+Definitions compile to ORM expressions only, so no user input reaches SQL.
+Compiled plans are cached by a hash of the canonical definition, and metrics
+that share a base (source, dimensions, filters, grain and range) are evaluated
+together with one grouped query.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Iterable
+
+from django.core.exceptions import ValidationError
+from django.db.models import (
+	Avg,
+	Count,
+	DecimalField,
+	ExpressionWrapper,
+	F,
+	Max,
+	Min,
+	Q,
+	Sum,
+)
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from simplycrm.core import versioning
+from simplycrm.sales.models import Lead, Opportunity, Order, OrderLine
+
+
+@dataclass(frozen=True)
+class Source:
+	model: type
+	organization_field: str
+	time_field: str
+	fields: dict[str, Callable[[], Any]]
+	time_is_date: bool = False
+	# Data version scope whose writes change the source's metrics.
+	scope: str = versioning.SALES
+
+
+def _field(path: str) -> Callable[[], Any]:
+	return lambda: F(path)
+
+
+SOURCES: dict[str, Source] = {
+	"orders": Source(
+		model=Order,
+		organization_field="organization_id",
+		time_field="ordered_at",
+		fields={
+			"id": _field("id"),
+			"status": _field("status"),
+			"currency": _field("currency"),
+			"contact": _field("contact_id"),
+			"channel": lambda: Coalesce(F("opportunity__pipeline__name"), F("status")),
+		},
+	),
+	"order_lines": Source(
+		model=OrderLine,
+		organization_field="order__organization_id",
+		time_field="order__ordered_at",
+		fields={
+			"id": _field("id"),
+			"order": _field("order_id"),
+			"status": _field("order__status"),
+			"channel": lambda: Coalesce(F("order__opportunity__pipeline__name"), F("order__status")),
+			"variant": _field("product_variant_id"),
+			"product": _field("product_variant__product__name"),
+			"quantity": _field("quantity"),
+			"unit_price": _field("unit_price"),
+			"discount": _field("discount_amount"),
+			"revenue": lambda: ExpressionWrapper(
+				F("unit_price") * F("quantity") - F("discount_amount"),
+				output_field=DecimalField(max_digits=14, decimal_places=2),
+			),
+		},
+	),
+	"opportunities": Source(
+		model=Opportunity,
+		organization_field="organization_id",
+		time_field="close_date",
+		fields={
+			"id": _field("id"),
+			"amount": _field("amount"),
+			"probability": _field("probability"),
+			"stage": _field("stage__name"),
+			"pipeline": _field("pipeline__name"),
+			"owner": _field("owner_id"),
+		},
+		time_is_date=True,
+		scope=versioning.PIPELINE,
+	),
+	"leads": Source(
+		model=Lead,
+		organization_field="organization_id",
+		time_field="created_at",
+		fields={
+			"id": _field("id"),
+			"source": _field("source"),
+			"status": _field("status"),
+			"score": _field("score"),
+		},
+		scope=versioning.PIPELINE,
+	),
+}
+
+AGGREGATES: dict[str, Callable[[Any], Any]] = {
+	"sum": Sum,
+	"avg": Avg,
+	"min": Min,
+	"max": Max,
+	"count": Count,
+	"count_distinct": lambda expression: Count(expression, distinct=True),
+}
+
+OPERATORS = {
+	"eq": "exact",
+	"ne": "exact",
+	"in": "in",
+	"gt": "gt",
+	"gte": "gte",
+	"lt": "lt",
+	"lte": "lte",
+	"contains": "icontains",
+}
+
+TIME_GRAINS = {
+	"day": TruncDay,
+	"week": TruncWeek,
+	"month": TruncMonth,
+	"quarter": TruncQuarter,
+	"year": TruncYear,
+}
+
+PERIOD_ALIAS = "period"
+MAX_LAST_DAYS = 3660
+PLAN_CACHE_SIZE = 512
+
+
+@dataclass(frozen=True)
+class MetricPlan:
+	"""Validated, organization-independent form of a metric definition."""
+
+	source: str
+	aggregate: str
+	measure_field: str
+	dimensions: tuple[str, ...]
+	filters: tuple[tuple[str, str, Any], ...]
+	time_grain: str | None
+	time_range: tuple[tuple[str, Any], ...]
+
+	@property
+	def base_key(self) -> tuple:
+		return (self.source, self.dimensions, self.filters, self.time_grain, self.time_range)
+
+	def aggregate_expression(self):
+		return AGGREGATES[self.aggregate](SOURCES[self.source].fields[self.measure_field]())
+
+
+def definition_hash(definition: dict[str, Any]) -> str:
+	canonical = json.dumps(definition, sort_keys=True, separators=(",", ":"), default=str)
+	return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _is_name(value: Any, names: Iterable[str]) -> bool:
+	return isinstance(value, str) and value in names
+
+
+@functools.lru_cache(maxsize=None)
+def _output_field(source_name: str, field: str):
+	"""Model field describing the values of a source field, resolved without a query."""
+
+	source = SOURCES[source_name]
+	query = source.model.objects.annotate(_value=source.fields[field]()).query
+	return query.annotations["_value"].output_field
+
+
+def _filter_value(source_name: str, field: str, op: str, value: Any) -> Any:
+	"""Check a filter value and convert it to the Python type of its field."""
+
+	values = value if op == "in" else [value]
+	if op == "in" and not isinstance(value, list):
+		raise ValidationError("Оператор «in» требует список значений.")
+	if any(item is not None and not isinstance(item, (str, int, float, bool)) for item in values):
+		raise ValidationError("Значения фильтра должны быть скалярами.")
+	if op == "contains":
+		if not isinstance(value, str):
+			raise ValidationError("Оператор «contains» требует строку.")
+		return value
+	model_field = _output_field(source_name, field)
+	try:
+		converted = [model_field.to_python(item) for item in values]
+	except (ValidationError, TypeError, ValueError):
+		raise ValidationError(f"Некорректное значение фильтра «{field}»: {value}.") from None
+	return tuple(converted) if op == "in" else converted[0]
+
+
+def _validate(definition: Any) -> MetricPlan:
+	if not isinstance(definition, dict):
+		raise ValidationError("Определение метрики должно быть JSON-объектом.")
+	unknown = set(definition) - {"source", "measure", "dimensions", "filters", "time_grain", "time_range"}
+	if unknown:
+		raise ValidationError(f"Неизвестные ключи определения метрики: {', '.join(sorted(unknown))}.")
+
+	source_name = definition.get("source")
+	if not _is_name(source_name, SOURCES):
+		raise ValidationError(f"Допустимые источники метрик: {', '.join(sorted(SOURCES))}.")
+	source = SOURCES[source_name]
+
+	measure = definition.get("measure")
+	if not isinstance(measure, dict):
+		raise ValidationError("Укажите меру метрики: {\"aggregate\": ..., \"field\": ...}.")
+	aggregate = measure.get("aggregate")
+	if not _is_name(aggregate, AGGREGATES):
+		raise ValidationError(f"Допустимые агрегаты: {', '.join(sorted(AGGREGATES))}.")
+	measure_field = measure.get("field", "id")
+	if not _is_name(measure_field, source.fields):
+		raise ValidationError(f"Поле «{measure_field}» недоступно в источнике «{source_name}».")
+
+	dimensions = definition.get("dimensions", [])
+	if not isinstance(dimensions, list) or len(dimensions) > 3:
+		raise ValidationError("Измерения задаются списком не более чем из трёх полей.")
+	for dimension in dimensions:
+		if not _is_name(dimension, source.fields) or dimension == PERIOD_ALIAS:
+			raise ValidationError(f"Поле «{dimension}» недоступно в источнике «{source_name}».")
+
+	filters = []
+	raw_filters = definition.get("filters", [])
+	if not isinstance(raw_filters, list):
+		raise ValidationError("Фильтры задаются списком.")
+	for item in raw_filters:
+		if not isinstance(item, dict) or not _is_name(item.get("field"), source.fields):
+			raise ValidationError("Фильтр должен ссылаться на поле источника.")
+		op = item.get("op", "eq")
+		if not _is_name(op, OPERATORS):
+			raise ValidationError(f"Допустимые операторы фильтра: {', '.join(sorted(OPERATORS))}.")
+		filters.append((item["field"], op, _filter_value(source_name, item["field"], op, item.get("value"))))
+
+	time_grain = definition.get("time_grain")
+	if time_grain is not None and not _is_name(time_grain, TIME_GRAINS):
+		raise ValidationError(f"Допустимые временные шаги: {', '.join(TIME_GRAINS)}.")
+
+	time_range = definition.get("time_range") or {}
+	if not isinstance(time_range, dict) or set(time_range) - {"last_days", "start", "end"}:
+		raise ValidationError("Период задаётся ключами last_days или start/end.")
+	if "last_days" in time_range:
+		last_days = time_range["last_days"]
+		if isinstance(last_days, bool) or not isinstance(last_days, int) or not 0 < last_days <= MAX_LAST_DAYS:
+			raise ValidationError(f"last_days должен быть целым числом от 1 до {MAX_LAST_DAYS}.")
+	for key in ("start", "end"):
+		if key in time_range and parse_date(str(time_range[key])) is None:
+			raise ValidationError(f"Некорректная дата {key}: {time_range[key]}.")
+
+	return MetricPlan(
+		source=source_name,
+		aggregate=aggregate,
+		measure_field=measure_field,
+		dimensions=tuple(dimensions),
+		filters=tuple(sorted(filters, key=repr)),
+		time_grain=time_grain,
+		time_range=tuple(sorted((key, str(value)) for key, value in time_range.items())),
+	)
+
+
+class PlanCache:
+	"""Thread-safe LRU cache of compiled plans keyed by definition hash."""
+
+	def __init__(self, size: int = PLAN_CACHE_SIZE) -> None:
+		self.size = size
+		self._plans: OrderedDict[str, MetricPlan] = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get_or_compile(self, definition: dict[str, Any]) -> MetricPlan:
+		key = definition_hash(definition)
+		with self._lock:
+			plan = self._plans.get(key)
+			if plan is not None:
+				self._plans.move_to_end(key)
+				self.hits += 1
+				return plan
+		plan = _validate(definition)
+		with self._lock:
+			self.misses += 1
+			self._plans[key] = plan
+			if len(self._plans) > self.size:
+				self._plans.popitem(last=False)
+		return plan
+
+	def clear(self) -> None:
+		with self._lock:
+			self._plans.clear()
+			self.hits = self.misses = 0
+
+
+plan_cache = PlanCache()
+
+
+def parse_definition(query: str | dict) -> dict[str, Any]:
+	if isinstance(query, dict):
+		return query
+	try:
+		return json.loads(query)
+	except (TypeError, ValueError):
+		raise ValidationError("Определение метрики не является корректным JSON.") from None
+
+
+def compile_metric(query: str | dict) -> MetricPlan:
+	"""Validate a definition and return its (cached) plan."""
+
+	return plan_cache.get_or_compile(parse_definition(query))
+
+
+def time_bounds(plan: MetricPlan, override: tuple[date | None, date | None] | None) -> tuple[date | None, date | None]:
+	if override and any(override):
+		return override
+	time_range = dict(plan.time_range)
+	if "last_days" in time_range:
+		today = timezone.localdate()
+		return today - timedelta(days=int(time_range["last_days"]) - 1), today
+	start = parse_date(time_range["start"]) if "start" in time_range else None
+	end = parse_date(time_range["end"]) if "end" in time_range else None
+	return start, end
+
+
+def _base_queryset(plan: MetricPlan, organization_id: int, bounds: tuple[date | None, date | None]):
+	source = SOURCES[plan.source]
+	queryset = source.model.objects.filter(**{source.organization_field: organization_id})
+	start, end = bounds
+	if start is not None:
+		lower = start if source.time_is_date else timezone.make_aware(datetime.combine(start, datetime.min.time()))
+		queryset = queryset.filter(**{f"{source.time_field}__gte": lower})
+	if end is not None:
+		upper = end + timedelta(days=1)
+		upper = upper if source.time_is_date else timezone.make_aware(datetime.combine(upper, datetime.min.time()))
+		queryset = queryset.filter(**{f"{source.time_field}__lt": upper})
+
+	annotations = {}
+	for field, op, value in plan.filters:
+		alias = f"_filter_{field}"
+		annotations.setdefault(alias, source.fields[field]())
+	for dimension in plan.dimensions:
+		# Aliased so that dimensions may share a name with a model field.
+		annotations[f"_dim_{dimension}"] = source.fields[dimension]()
+	if plan.time_grain:
+		annotations[PERIOD_ALIAS] = TIME_GRAINS[plan.time_grain](source.time_field)
+	if annotations:
+		queryset = queryset.annotate(**annotations)
+
+	for field, op, value in plan.filters:
+		condition = Q(**{f"_filter_{field}__{OPERATORS[op]}": list(value) if op == "in" else value})
+		queryset = queryset.exclude(condition) if op == "ne" else queryset.filter(condition)
+	return queryset
+
+
+def _serialize(value: Any) -> Any:
+	if isinstance(value, Decimal):
+		return float(value)
+	if isinstance(value, datetime):
+		return timezone.localtime(value).date().isoformat() if timezone.is_aware(value) else value.date().isoformat()
+	if isinstance(value, date):
+		return value.isoformat()
+	return value
+
+
+def group_plans(
+	plans: Iterable[tuple[str, MetricPlan, tuple[date | None, date | None]]],
+) -> dict[tuple, list[tuple[str, MetricPlan]]]:
+	"""Group ``(code, plan, bounds)`` by shared base so each group needs one query."""
+
+	groups: dict[tuple, list[tuple[str, MetricPlan]]] = OrderedDict()
+	for code, plan, bounds in plans:
+		groups.setdefault((*plan.base_key, bounds), []).append((code, plan))
+	return groups
+
+
+def evaluate_group(
+	organization_id: int,
+	members: list[tuple[str, MetricPlan]],
+	bounds: tuple[date | None, date | None],
+) -> dict[str, dict[str, Any]]:
+	"""Evaluate metrics sharing a base with one (grouped) aggregate query."""
+
+	plan = members[0][1]
+	queryset = _base_queryset(plan, organization_id, bounds)
+	aggregates = {f"_m{index}": member.aggregate_expression() for index, (_, member) in enumerate(members)}
+	columns = {f"_dim_{dimension}": dimension for dimension in plan.dimensions}
+	if plan.time_grain:
+		columns[PERIOD_ALIAS] = PERIOD_ALIAS
+	group_by = list(columns)
+	if not group_by:
+		row = queryset.aggregate(**aggregates)
+		return {code: {"value": _serialize(row[f"_m{index}"])} for index, (code, _) in enumerate(members)}
+	rows = list(queryset.values(*group_by).annotate(**aggregates).order_by(*group_by))
+	return {
+		code: {
+			"rows": [
+				{
+					**{name: _serialize(row[alias]) for alias, name in columns.items()},
+					"value": _serialize(row[f"_m{index}"]),
+				}
+				for row in rows
+			]
+		}
+		for index, (code, _) in enumerate(members)
+	}
+
+
+def evaluate_metrics(
+	organization_id: int,
+	metrics: Iterable[tuple[str, str | dict]],
+	*,
+	start: date | None = None,
+	end: date | None = None,
+) -> dict[str, dict[str, Any]]:
+	"""Evaluate ``(code, definition)`` pairs, batching metrics that share a base.
+
+	Returns ``{code: {"value": ...}}`` for scalar metrics and
+	``{code: {"rows": [...]}}`` when dimensions or a time grain are used.
+	Invalid definitions are reported as ``{code: {"error": ...}}``.
+	"""
+
+	override = (start, end) if start or end else None
+	results: dict[str, dict[str, Any]] = {}
+	plans = []
+	for code, query in metrics:
+		try:
+			plan = compile_metric(query)
+		except ValidationError as exc:
+			results[code] = {"error": " ".join(exc.messages)}
+			continue
+		plans.append((code, plan, time_bounds(plan, override)))
+
+	for key, members in group_plans(plans).items():
+		results.update(evaluate_group(organization_id, members, key[-1]))
+	return results
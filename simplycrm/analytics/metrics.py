@@ -0,0 +1,189 @@
+"""Sales KPI aggregation for arbitrary periods.
+
+All KPIs of the requested period and of its comparison window are produced by
+one grouped query: orders are labelled with the window they fall into and
+aggregated per label. Results are memoized per organization, period and sales
+data version.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from simplycrm.core import versioning
+from simplycrm.sales.models import Order
+
+
+CURRENT = "current"
+COMPARISON = "comparison"
+PREVIOUS_PERIOD = "previous_period"
+PREVIOUS_YEAR = "previous_year"
+COMPARISONS = (PREVIOUS_PERIOD, PREVIOUS_YEAR)
+CACHE_TIMEOUT = 15 * 60
+
+ZERO = Decimal("0.00")
+KPI_FIELDS = (
+	"total_revenue",
+	"net_revenue",
+	"discounts",
+	"average_order_value",
+	"orders_count",
+	"units_sold",
+	"line_count",
+	"customers",
+)
+
+
+@dataclass(frozen=True)
+class Period:
+	"""Inclusive date range; ``None`` bounds are open."""
+
+	start: date | None = None
+	end: date | None = None
+
+	@property
+	def is_bounded(self) -> bool:
+		return self.start is not None and self.end is not None
+
+	def as_q(self, field: str = "ordered_at") -> Q:
+		condition = Q()
+		if self.start is not None:
+			condition &= Q(**{f"{field}__gte": _start_of(self.start)})
+		if self.end is not None:
+			condition &= Q(**{f"{field}__lt": _start_of(self.end + timedelta(days=1))})
+		return condition
+
+	def comparison(self, kind: str) -> "Period":
+		if not self.is_bounded:
+			raise ValueError("Comparison windows require a bounded period.")
+		if kind == PREVIOUS_PERIOD:
+			length = self.end - self.start + timedelta(days=1)
+			return Period(self.start - length, self.start - timedelta(days=1))
+		if kind == PREVIOUS_YEAR:
+			return Period(_shift_year(self.start), _shift_year(self.end))
+		raise ValueError(f"Unknown comparison: {kind}")
+
+
+def _start_of(day: date) -> datetime:
+	return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _shift_year(day: date) -> date:
+	try:
+		return day.replace(year=day.year - 1)
+	except ValueError:  # 29 February
+		return day.replace(year=day.year - 1, day=28)
+
+
+def _empty_kpis() -> dict[str, Decimal | int]:
+	return {
+		"total_revenue": ZERO,
+		"net_revenue": ZERO,
+		"discounts": ZERO,
+		"average_order_value": ZERO,
+		"orders_count": 0,
+		"units_sold": 0,
+		"line_count": 0,
+		"customers": 0,
+	}
+
+
+def _aggregate(organization_id: int, windows: dict[str, Period]) -> dict[str, dict[str, Decimal | int]]:
+	money = DecimalField(max_digits=18, decimal_places=2)
+	gross = ExpressionWrapper(F("lines__unit_price") * F("lines__quantity"), output_field=money)
+	label = Case(
+		# An unbounded period matches every order; When() rejects an empty Q.
+		*(When(period.as_q() or Q(pk__isnull=False), then=Value(name)) for name, period in windows.items()),
+		default=Value(None),
+		output_field=CharField(),
+	)
+	combined = Q()
+	for period in windows.values():
+		combined |= period.as_q()
+	rows = (
+		Order.objects.filter(organization_id=organization_id)
+		.filter(combined)
+		.annotate(window=label)
+		.values("window")
+		.annotate(
+			total_revenue=Coalesce(Sum(gross), ZERO, output_field=money),
+			discounts=Coalesce(Sum("lines__discount_amount"), ZERO, output_field=money),
+			orders_count=Count("id", distinct=True),
+			units_sold=Coalesce(Sum("lines__quantity"), 0),
+			line_count=Count("lines"),
+			customers=Count("contact", distinct=True),
+		)
+	)
+	results = {name: _empty_kpis() for name in windows}
+	for row in rows:
+		if row["window"] not in results:
+			continue
+		kpis = results[row["window"]]
+		for key in ("total_revenue", "discounts", "orders_count", "units_sold", "line_count", "customers"):
+			kpis[key] = row[key]
+		kpis["net_revenue"] = kpis["total_revenue"] - kpis["discounts"]
+		if kpis["orders_count"]:
+			kpis["average_order_value"] = (kpis["total_revenue"] / kpis["orders_count"]).quantize(ZERO)
+	return results
+
+
+def _change(current: Decimal | int, previous: Decimal | int) -> float | None:
+	if not previous:
+		return None
+	return round(float((Decimal(current) - Decimal(previous)) / Decimal(previous) * 100), 2)
+
+
+def sales_kpis(
+	organization_id: int,
+	period: Period | None = None,
+	*,
+	compare: str | None = None,
+	use_cache: bool = True,
+) -> dict[str, object]:
+	"""Return sales KPIs for ``period`` and, optionally, its comparison window."""
+
+	period = period or Period()
+	windows = {CURRENT: period}
+	if compare:
+		windows[COMPARISON] = period.comparison(compare)
+
+	cache_key = ":".join(
+		[
+			"simplycrm:analytics:sales-kpis",
+			str(organization_id),
+			str(period.start),
+			str(period.end),
+			compare or "-",
+			versioning.get_data_version(organization_id, versioning.SALES),
+		]
+	)
+	if use_cache:
+		cached = cache.get(cache_key)
+		if cached is not None:
+			return cached
+
+	aggregated = _aggregate(organization_id, windows)
+	result: dict[str, object] = {
+		**aggregated[CURRENT],
+		"period_start": period.start,
+		"period_end": period.end,
+	}
+	if compare:
+		comparison_period = windows[COMPARISON]
+		result["comparison"] = {
+			**aggregated[COMPARISON],
+			"period_start": comparison_period.start,
+			"period_end": comparison_period.end,
+		}
+		result["change"] = {
+			key: _change(aggregated[CURRENT][key], aggregated[COMPARISON][key]) for key in KPI_FIELDS
+		}
+	if use_cache:
+		cache.set(cache_key, result, timeout=CACHE_TIMEOUT)
+	return result
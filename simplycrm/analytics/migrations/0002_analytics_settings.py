@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('config', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_settings', to='core.organization')),
+            ],
+            options={
+                'verbose_name_plural': 'analytics settings',
+            },
+        ),
+    ]
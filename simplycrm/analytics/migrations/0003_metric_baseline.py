@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0002_analytics_settings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricBaseline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=191)),
+                ('mean', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('observations', models.PositiveIntegerField(default=0)),
+                ('weekday_means', models.JSONField(blank=True, default=list)),
+                ('weekday_observations', models.JSONField(blank=True, default=list)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('last_value', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_baselines', to='core.organization')),
+            ],
+            options={
+                'ordering': ['metric'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metricbaseline',
+            constraint=models.UniqueConstraint(fields=('organization', 'metric'), name='analytics_baseline_unique_metric'),
+        ),
+    ]
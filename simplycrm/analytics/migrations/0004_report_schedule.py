@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_metric_baseline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='last_output',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='last_run_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_report_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customersegment',
+            name='membership',
+            field=models.BinaryField(blank=True, default=bytes, help_text='zlib-compressed contact id bitset'),
+        ),
+        migrations.AddField(
+            model_name='customersegment',
+            name='refreshed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
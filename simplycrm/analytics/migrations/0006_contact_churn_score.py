@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_contact_updated_at'),
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0005_segment_membership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactChurnScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders_count', models.PositiveIntegerField(default=0)),
+                ('mean_interval_days', models.FloatField(blank=True, null=True)),
+                ('last_order_at', models.DateTimeField()),
+                ('days_since_last_order', models.FloatField(default=0)),
+                ('average_order_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('churn_probability', models.FloatField(default=0)),
+                ('value_at_risk', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('computed_at', models.DateTimeField()),
+                ('contact', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='churn_score', to='sales.contact')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='churn_scores', to='core.organization')),
+            ],
+            options={
+                'ordering': ['-value_at_risk'],
+                'indexes': [models.Index(fields=['organization', '-value_at_risk'], name='analytics_churn_value_idx'), models.Index(fields=['organization', 'churn_probability'], name='analytics_churn_prob_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0006_contact_churn_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='watermark',
+            field=models.JSONField(blank=True, default=dict, help_text='Reader position of the last synced batch'),
+        ),
+        migrations.CreateModel(
+            name='SyncedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('source_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField()),
+                ('data_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='analytics.datasource')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='synced_records', to='core.organization')),
+            ],
+            options={
+                'ordering': ['data_source', 'external_id'],
+                'indexes': [models.Index(fields=['organization', 'source_updated_at'], name='analytics_synced_updated_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='syncedrecord',
+            constraint=models.UniqueConstraint(fields=('data_source', 'external_id'), name='analytics_synced_record_unique'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sales', '0005_opportunity_stage_change'),
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0007_data_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineForecastSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('close_month', models.DateField(blank=True, null=True)),
+                ('category', models.CharField(max_length=16)),
+                ('deals', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('weighted_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('captured_at', models.DateTimeField()),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_forecast_snapshots', to='core.organization')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('pipeline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_snapshots', to='sales.pipeline')),
+            ],
+            options={
+                'ordering': ['week_start', 'close_month', 'id'],
+                'indexes': [models.Index(fields=['organization', 'week_start'], name='analytics_forecast_week_idx')],
+            },
+        ),
+    ]
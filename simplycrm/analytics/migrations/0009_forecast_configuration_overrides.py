@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from django.db import migrations
+
+
+# Defaults of the demand forecast before forecasts stored only their overrides.
+LEGACY_DEFAULTS = {
+    'history_weeks': 52,
+    'season_length': 52,
+    'alpha': 0.3,
+    'beta': 0.1,
+    'gamma': 0.2,
+    'phi': 0.95,
+    'croston_alpha': 0.1,
+    'intermittency_threshold': 1.32,
+    'interval': 0.8,
+    'high_demand_velocity': 10,
+    'low_velocity': 2,
+}
+
+
+def keep_overrides_only(apps, schema_editor):
+    Forecast = apps.get_model('analytics', 'Forecast')
+    for forecast in Forecast.objects.filter(target='product_demand').only('id', 'configuration').iterator():
+        configuration = forecast.configuration or {}
+        overrides = {key: value for key, value in configuration.items() if LEGACY_DEFAULTS.get(key, object()) != value}
+        if overrides != configuration:
+            Forecast.objects.filter(pk=forecast.pk).update(configuration=overrides)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_pipeline_forecast_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_overrides_only, migrations.RunPython.noop),
+    ]
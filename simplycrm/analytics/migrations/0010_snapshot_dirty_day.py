@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('analytics', '0009_forecast_configuration_overrides'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('marked_at', models.DateTimeField()),
+                ('organization', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshot_dirty_days', to='core.organization')),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='snapshotdirtyday',
+            constraint=models.UniqueConstraint(fields=('organization', 'day'), name='analytics_snapshot_dirty_day_uniq'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 """Analytics domain models for SimplyCRM."""
 from __future__ import annotations
 
+from django.conf import settings
 from django.db import models
 
 
@@ -32,6 +33,10 @@ class Report(models.Model):
 	schedule_cron = models.CharField(max_length=64, blank=True)
 	last_run_at = models.DateTimeField(null=True, blank=True)
 	last_run_status = models.CharField(max_length=32, default="never")
+	last_run_error = models.TextField(blank=True)
+	last_output = models.CharField(max_length=512, blank=True)
+	next_run_at = models.DateTimeField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
 class Insight(models.Model):
@@ -61,6 +66,8 @@ class CustomerSegment(models.Model):
 	size = models.PositiveIntegerField(default=0)
 	ltv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 	churn_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+	membership = models.BinaryField(default=bytes, blank=True, help_text="zlib-compressed contact id bitset")
+	refreshed_at = models.DateTimeField(null=True, blank=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 
@@ -80,6 +87,8 @@ class DataSource(models.Model):
 	source_type = models.CharField(max_length=64)
 	config = models.JSONField(default=dict, blank=True)
 	is_active = models.BooleanField(default=True)
+	watermark = models.JSONField(default=dict, blank=True, help_text="Reader position of the last synced batch")
+	last_synced_at = models.DateTimeField(null=True, blank=True)
 
 
 class DataSyncLog(models.Model):
@@ -88,3 +97,151 @@ class DataSyncLog(models.Model):
 	started_at = models.DateTimeField(auto_now_add=True)
 	completed_at = models.DateTimeField(null=True, blank=True)
 	stats = models.JSONField(default=dict, blank=True)
+
+
+class SyncedRecord(models.Model):
+	"""Latest copy of an external record pulled from a :class:`DataSource`."""
+	
+	organization = models.ForeignKey("core.Organization", on_delete=models.CASCADE, related_name="synced_records")
+	data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name="records")
+	external_id = models.CharField(max_length=255)
+	data = models.JSONField(default=dict, blank=True)
+	source_updated_at = models.DateTimeField(null=True, blank=True)
+	synced_at = models.DateTimeField()
+	
+	
+	class Meta:
+		ordering = ["data_source", "external_id"]
+		constraints = [
+			models.UniqueConstraint(fields=["data_source", "external_id"], name="analytics_synced_record_unique"),
+		]
+		indexes = [
+			models.Index(fields=["organization", "source_updated_at"], name="analytics_synced_updated_idx"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.data_source_id}:{self.external_id}"
+
+
+class AnalyticsSettings(models.Model):
+	"""Per-organization overrides for analytics rule thresholds."""
+	
+	organization = models.OneToOneField(
+		"core.Organization", on_delete=models.CASCADE, related_name="analytics_settings"
+	)
+	config = models.JSONField(default=dict, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	
+	class Meta:
+		verbose_name_plural = "analytics settings"
+	
+	
+	def section(self, name: str) -> dict:
+		value = self.config.get(name) if isinstance(self.config, dict) else None
+		return value if isinstance(value, dict) else {}
+
+
+class MetricBaseline(models.Model):
+	"""Exponentially weighted state of a daily metric used for anomaly detection."""
+	
+	organization = models.ForeignKey("core.Organization", on_delete=models.CASCADE, related_name="metric_baselines")
+	metric = models.CharField(max_length=191)
+	mean = models.FloatField(default=0)
+	variance = models.FloatField(default=0)
+	observations = models.PositiveIntegerField(default=0)
+	weekday_means = models.JSONField(default=list, blank=True)
+	weekday_observations = models.JSONField(default=list, blank=True)
+	last_day = models.DateField(null=True, blank=True)
+	last_value = models.FloatField(null=True, blank=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	
+	class Meta:
+		ordering = ["metric"]
+		constraints = [
+			models.UniqueConstraint(fields=["organization", "metric"], name="analytics_baseline_unique_metric"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.organization_id}:{self.metric}"
+
+
+class ContactChurnScore(models.Model):
+	"""Latest churn estimate for a contact derived from its order cadence."""
+	
+	organization = models.ForeignKey("core.Organization", on_delete=models.CASCADE, related_name="churn_scores")
+	contact = models.OneToOneField("sales.Contact", on_delete=models.CASCADE, related_name="churn_score")
+	orders_count = models.PositiveIntegerField(default=0)
+	mean_interval_days = models.FloatField(null=True, blank=True)
+	last_order_at = models.DateTimeField()
+	days_since_last_order = models.FloatField(default=0)
+	average_order_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	churn_probability = models.FloatField(default=0)
+	value_at_risk = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	computed_at = models.DateTimeField()
+	
+	
+	class Meta:
+		ordering = ["-value_at_risk"]
+		indexes = [
+			models.Index(fields=["organization", "-value_at_risk"], name="analytics_churn_value_idx"),
+			models.Index(fields=["organization", "churn_probability"], name="analytics_churn_prob_idx"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.contact_id}:{self.churn_probability:.2f}"
+
+
+class PipelineForecastSnapshot(models.Model):
+	"""Weekly copy of the weighted pipeline forecast, one row per aggregation group."""
+	
+	organization = models.ForeignKey(
+		"core.Organization", on_delete=models.CASCADE, related_name="pipeline_forecast_snapshots"
+	)
+	week_start = models.DateField()
+	close_month = models.DateField(null=True, blank=True)
+	pipeline = models.ForeignKey("sales.Pipeline", on_delete=models.CASCADE, related_name="forecast_snapshots")
+	owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+	category = models.CharField(max_length=16)
+	deals = models.PositiveIntegerField(default=0)
+	amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	weighted_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	captured_at = models.DateTimeField()
+	
+	
+	class Meta:
+		ordering = ["week_start", "close_month", "id"]
+		indexes = [
+			models.Index(fields=["organization", "week_start"], name="analytics_forecast_week_idx"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.week_start}:{self.close_month}:{self.category}"
+
+
+class SnapshotDirtyDay(models.Model):
+	"""Order day whose exported sales rows changed since the last Parquet snapshot export."""
+	
+	# Deleting an organization deletes its orders, whose receivers mark days while
+	# the cascade runs; without a database constraint those rows cannot fail it.
+	organization = models.ForeignKey(
+		"core.Organization", on_delete=models.CASCADE, db_constraint=False, related_name="snapshot_dirty_days"
+	)
+	day = models.DateField()
+	marked_at = models.DateTimeField()
+	
+	
+	class Meta:
+		ordering = ["day"]
+		constraints = [
+			models.UniqueConstraint(fields=["organization", "day"], name="analytics_snapshot_dirty_day_uniq"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.organization_id}:{self.day}"
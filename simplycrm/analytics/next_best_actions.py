@@ -0,0 +1,163 @@
+"""Rules engine that proposes next best actions for opportunities.
+
+Activity signals are attached to opportunities with ``Exists``/``Subquery``
+annotations, so a page of opportunities is evaluated with a single query no
+matter how many rules are enabled. Rules are registered in :data:`RULES` and
+organizations choose which ones run, and in which order, through
+``AnalyticsSettings.config["next_best_actions"]``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from django.db.models import Exists, F, OuterRef, QuerySet, Subquery
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.sales.models import DealActivity, Opportunity
+
+
+SETTINGS_SECTION = "next_best_actions"
+DEFAULT_CONFIGURATION: dict[str, object] = {
+	"rules": ["no_upcoming_activity", "overdue_activity", "no_recent_activity"],
+	"recent_activity_days": 5,
+	"overdue_tasks_limit": 20,
+}
+DEFAULT_PAGE_SIZE = 50
+
+
+@dataclass(frozen=True)
+class RuleContext:
+	now: datetime
+	recent_activity_days: int
+
+
+@dataclass(frozen=True)
+class Rule:
+	"""A rule matches an annotated opportunity and describes the action to take."""
+
+	code: str
+	matches: Callable[[Opportunity, RuleContext], bool]
+	summary: Callable[[Opportunity], str]
+	reason: Callable[[Opportunity, RuleContext], str]
+
+
+RULES: dict[str, Rule] = {}
+
+
+def register_rule(rule: Rule) -> Rule:
+	RULES[rule.code] = rule
+	return rule
+
+
+register_rule(
+	Rule(
+		code="no_upcoming_activity",
+		matches=lambda opp, context: opp.next_due_id is None,
+		summary=lambda opp: f"Schedule follow-up for {opp.name}",
+		reason=lambda opp, context: "No upcoming activity is scheduled.",
+	)
+)
+register_rule(
+	Rule(
+		code="overdue_activity",
+		matches=lambda opp, context: opp.next_due_at is not None and opp.next_due_at < context.now,
+		summary=lambda opp: f"Complete overdue task '{opp.next_due_subject}'",
+		reason=lambda opp, context: "Next best action is overdue; completing it keeps pipeline velocity healthy.",
+	)
+)
+register_rule(
+	Rule(
+		code="no_recent_activity",
+		matches=lambda opp, context: not opp.has_recent_activity,
+		summary=lambda opp: f"Engage {opp.name} with a touchpoint",
+		reason=lambda opp, context: f"No recent activity in the past {context.recent_activity_days} days.",
+	)
+)
+
+
+def get_configuration(organization_id: int) -> dict[str, object]:
+	"""Return the rule configuration with organization overrides applied."""
+
+	configuration = dict(DEFAULT_CONFIGURATION)
+	settings_obj = models.AnalyticsSettings.objects.filter(organization_id=organization_id).first()
+	if settings_obj is not None:
+		configuration.update(
+			{key: value for key, value in settings_obj.section(SETTINGS_SECTION).items() if key in configuration}
+		)
+	return configuration
+
+
+def annotated_opportunities(organization_id: int, context: RuleContext) -> QuerySet:
+	"""Opportunities ordered by amount with the activity signals used by rules."""
+
+	activities = DealActivity.objects.filter(opportunity=OuterRef("pk"))
+	next_due = activities.filter(completed_at__isnull=True).order_by(F("due_at").asc(nulls_last=True), "id")
+	cutoff = context.now - timedelta(days=context.recent_activity_days)
+	return (
+		Opportunity.objects.filter(organization_id=organization_id)
+		.annotate(
+			has_recent_activity=Exists(activities.filter(completed_at__gte=cutoff)),
+			next_due_id=Subquery(next_due.values("id")[:1]),
+			next_due_at=Subquery(next_due.values("due_at")[:1]),
+			next_due_subject=Subquery(next_due.values("subject")[:1]),
+		)
+		.only("id", "name", "amount")
+		.order_by("-amount", "id")
+	)
+
+
+def suggest_next_best_actions(
+	organization_id: int,
+	*,
+	offset: int = 0,
+	limit: int = DEFAULT_PAGE_SIZE,
+	configuration: dict[str, object] | None = None,
+) -> list[dict[str, object]]:
+	"""Evaluate enabled rules for one page of opportunities.
+
+	Overdue tasks across the whole pipeline are appended to the first page only.
+	"""
+
+	configuration = configuration or get_configuration(organization_id)
+	context = RuleContext(now=timezone.now(), recent_activity_days=int(configuration["recent_activity_days"]))
+	rules = [RULES[code] for code in configuration["rules"] if code in RULES]
+
+	actions: list[dict[str, object]] = []
+	if rules:
+		for opportunity in annotated_opportunities(organization_id, context)[offset : offset + limit]:
+			rule = next((rule for rule in rules if rule.matches(opportunity, context)), None)
+			if rule is None:
+				continue
+			actions.append(
+				{
+					"opportunity_id": opportunity.id,
+					"rule": rule.code,
+					"summary": rule.summary(opportunity),
+					"reason": rule.reason(opportunity, context),
+				}
+			)
+
+	overdue_limit = int(configuration["overdue_tasks_limit"])
+	if offset == 0 and overdue_limit > 0:
+		overdue = (
+			DealActivity.objects.filter(
+				opportunity__organization_id=organization_id,
+				completed_at__isnull=True,
+				due_at__lt=context.now,
+			)
+			.order_by("due_at")
+			.values_list("opportunity_id", "subject")[:overdue_limit]
+		)
+		for opportunity_id, subject in overdue:
+			actions.append(
+				{
+					"opportunity_id": opportunity_id,
+					"rule": "overdue_task",
+					"summary": f"Re-engage on '{subject}'",
+					"reason": "Task is overdue and may jeopardize the deal.",
+				}
+			)
+	return actions
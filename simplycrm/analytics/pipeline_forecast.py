@@ -0,0 +1,278 @@
+"""Probability-weighted pipeline revenue forecast.
+
+Each opportunity is weighted by its own ``probability`` or, when that is not
+set, by the ``win_probability`` of its stage; deals in a won stage count in
+full. Deals are classified into forecast categories by that probability:
+
+* ``closed_won`` - the deal sits in a stage with a 100% win probability;
+* ``commit`` - probability at or above ``commit_probability``;
+* ``best_case`` - probability at or above ``best_case_probability``;
+* ``pipeline`` - everything else.
+
+The forecast is a single grouped query by close month, pipeline, owner and
+category. Month totals roll categories up the usual way: commit includes
+closed-won deals and best case includes commit. :func:`snapshot_forecast`
+stores the grouped rows once a week, so :func:`forecast_drift` charts how
+the forecast of a month moved with one aggregation over the snapshots instead
+of re-aggregating opportunity history. Thresholds are configured through
+``AnalyticsSettings.config["pipeline_forecast"]``.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.core import versioning
+from simplycrm.sales.models import Opportunity
+
+
+SETTINGS_SECTION = "pipeline_forecast"
+DEFAULT_CONFIGURATION: dict[str, object] = {
+	"commit_probability": 70,
+	"best_case_probability": 40,
+}
+
+CLOSED_WON = "closed_won"
+COMMIT = "commit"
+BEST_CASE = "best_case"
+PIPELINE = "pipeline"
+CATEGORIES = (CLOSED_WON, COMMIT, BEST_CASE, PIPELINE)
+# Category totals are cumulative: each one includes the categories listed for it.
+ROLLUPS = {
+	CLOSED_WON: (CLOSED_WON,),
+	COMMIT: (CLOSED_WON, COMMIT),
+	BEST_CASE: (CLOSED_WON, COMMIT, BEST_CASE),
+}
+WON_PROBABILITY = Decimal("100")
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+DEFAULT_DRIFT_WEEKS = 8
+
+
+def get_configuration(organization_id: int) -> dict[str, object]:
+	"""Return the category thresholds with organization overrides applied."""
+
+	configuration = dict(DEFAULT_CONFIGURATION)
+	settings_obj = models.AnalyticsSettings.objects.filter(organization_id=organization_id).first()
+	if settings_obj is not None:
+		configuration.update(
+			{key: value for key, value in settings_obj.section(SETTINGS_SECTION).items() if key in configuration}
+		)
+	return configuration
+
+
+def week_start(day: date) -> date:
+	return day - timedelta(days=day.weekday())
+
+
+def _money() -> DecimalField:
+	return DecimalField(max_digits=14, decimal_places=2)
+
+
+def effective_probability() -> Case:
+	"""Won stages count in full; otherwise the deal's own probability, falling back to its stage's."""
+
+	return Case(
+		When(stage__win_probability__gte=WON_PROBABILITY, then=Value(WON_PROBABILITY)),
+		When(probability__gt=0, then=F("probability")),
+		default=F("stage__win_probability"),
+		output_field=DecimalField(max_digits=5, decimal_places=2),
+	)
+
+
+def forecast_rows(
+	organization_id: int,
+	*,
+	start: date | None = None,
+	end: date | None = None,
+	pipeline_id: int | None = None,
+	owner_id: int | None = None,
+) -> list[dict[str, object]]:
+	"""Deals, amount and weighted amount per close month, pipeline, owner and category in one query."""
+
+	configuration = get_configuration(organization_id)
+	opportunities = Opportunity.objects.filter(organization_id=organization_id)
+	if start is not None:
+		opportunities = opportunities.filter(close_date__gte=start)
+	if end is not None:
+		opportunities = opportunities.filter(close_date__lte=end)
+	if pipeline_id is not None:
+		opportunities = opportunities.filter(pipeline_id=pipeline_id)
+	if owner_id is not None:
+		opportunities = opportunities.filter(owner_id=owner_id)
+
+	rows = (
+		opportunities.annotate(effective_probability=effective_probability())
+		.annotate(
+			close_month=TruncMonth("close_date"),
+			category=Case(
+				When(stage__win_probability__gte=WON_PROBABILITY, then=Value(CLOSED_WON)),
+				When(effective_probability__gte=configuration["commit_probability"], then=Value(COMMIT)),
+				When(effective_probability__gte=configuration["best_case_probability"], then=Value(BEST_CASE)),
+				default=Value(PIPELINE),
+				output_field=CharField(),
+			),
+		)
+		.values("close_month", "pipeline_id", "pipeline__name", "owner_id", "owner__username", "category")
+		.annotate(
+			deals=Count("id"),
+			total_amount=Coalesce(Sum("amount"), ZERO, output_field=_money()),
+			weighted_amount=Coalesce(
+				Sum(ExpressionWrapper(F("amount") * F("effective_probability") / 100, output_field=_money())),
+				ZERO,
+				output_field=_money(),
+			),
+		)
+		.order_by(F("close_month").asc(nulls_last=True), "pipeline_id", "owner_id", "category")
+	)
+	return [
+		{
+			"close_month": row["close_month"],
+			"pipeline_id": row["pipeline_id"],
+			"pipeline_name": row["pipeline__name"],
+			"owner_id": row["owner_id"],
+			"owner": row["owner__username"],
+			"category": row["category"],
+			"deals": row["deals"],
+			"amount": Decimal(row["total_amount"]).quantize(CENT),
+			"weighted_amount": Decimal(row["weighted_amount"]).quantize(CENT),
+		}
+		for row in rows
+	]
+
+
+def _empty_total() -> dict[str, object]:
+	return {"deals": 0, "amount": ZERO, "weighted_amount": ZERO, **{category: ZERO for category in CATEGORIES}}
+
+
+def _add(total: dict[str, object], row: dict[str, object]) -> None:
+	total["deals"] += row["deals"]
+	total["amount"] += row["amount"]
+	total["weighted_amount"] += row["weighted_amount"]
+	total[row["category"]] += row["amount"]
+
+
+def _rolled_up(total: dict[str, object]) -> dict[str, object]:
+	result = {key: total[key] for key in ("deals", "amount", "weighted_amount")}
+	result.update({name: sum((total[category] for category in members), ZERO) for name, members in ROLLUPS.items()})
+	return result
+
+
+def summarize(rows: Iterable[dict[str, object]]) -> dict[str, object]:
+	"""Roll grouped forecast rows up into month and overall totals."""
+
+	rows = list(rows)
+	months: dict[date | None, dict[str, object]] = defaultdict(_empty_total)
+	overall = _empty_total()
+	for row in rows:
+		_add(months[row["close_month"]], row)
+		_add(overall, row)
+	return {
+		"rows": rows,
+		"months": [{"close_month": month, **_rolled_up(total)} for month, total in months.items()],
+		"totals": _rolled_up(overall),
+	}
+
+
+def pipeline_forecast(organization_id: int, **filters) -> dict[str, object]:
+	"""Weighted forecast rows with month and overall category totals."""
+
+	return summarize(forecast_rows(organization_id, **filters))
+
+
+def snapshot_forecast(organization_id: int, *, now: datetime | None = None) -> int:
+	"""Store this week's forecast rows, replacing an earlier snapshot of the same week."""
+
+	now = now or timezone.now()
+	week = week_start(timezone.localdate(now))
+	rows = forecast_rows(organization_id)
+	with transaction.atomic():
+		models.PipelineForecastSnapshot.objects.filter(organization_id=organization_id, week_start=week).delete()
+		models.PipelineForecastSnapshot.objects.bulk_create(
+			[
+				models.PipelineForecastSnapshot(
+					organization_id=organization_id,
+					week_start=week,
+					close_month=row["close_month"],
+					pipeline_id=row["pipeline_id"],
+					owner_id=row["owner_id"],
+					category=row["category"],
+					deals=row["deals"],
+					amount=row["amount"],
+					weighted_amount=row["weighted_amount"],
+					captured_at=now,
+				)
+				for row in rows
+			]
+		)
+	versioning.bump_data_version(organization_id, versioning.FORECASTS)
+	return len(rows)
+
+
+def forecast_drift(
+	organization_id: int,
+	*,
+	weeks: int = DEFAULT_DRIFT_WEEKS,
+	pipeline_id: int | None = None,
+	owner_id: int | None = None,
+	today: date | None = None,
+) -> list[dict[str, object]]:
+	"""Weekly forecast of every close month over the last ``weeks`` snapshots, in one query."""
+
+	today = today or timezone.localdate()
+	snapshots = models.PipelineForecastSnapshot.objects.filter(
+		organization_id=organization_id,
+		week_start__gte=week_start(today) - timedelta(weeks=weeks - 1),
+	)
+	if pipeline_id is not None:
+		snapshots = snapshots.filter(pipeline_id=pipeline_id)
+	if owner_id is not None:
+		snapshots = snapshots.filter(owner_id=owner_id)
+	rollups = {
+		name: Coalesce(Sum("amount", filter=Q(category__in=members)), ZERO, output_field=_money())
+		for name, members in ROLLUPS.items()
+	}
+	rows = (
+		snapshots.values("close_month", "week_start")
+		.annotate(
+			total_deals=Sum("deals"),
+			total_amount=Coalesce(Sum("amount"), ZERO, output_field=_money()),
+			total_weighted_amount=Coalesce(Sum("weighted_amount"), ZERO, output_field=_money()),
+			**rollups,
+		)
+		.order_by(F("close_month").asc(nulls_last=True), "week_start")
+	)
+
+	series: dict[date | None, list[dict[str, object]]] = defaultdict(list)
+	for row in rows:
+		series[row["close_month"]].append(
+			{
+				"week_start": row["week_start"],
+				"deals": row["total_deals"],
+				"amount": row["total_amount"],
+				"weighted_amount": row["total_weighted_amount"],
+				**{name: row[name] for name in ROLLUPS},
+			}
+		)
+	result = []
+	for month, points in series.items():
+		first, last = points[0], points[-1]
+		result.append(
+			{
+				"close_month": month,
+				"points": points,
+				"change": {
+					key: Decimal(last[key]) - Decimal(first[key])
+					for key in ("amount", "weighted_amount", *ROLLUPS)
+				},
+			}
+		)
+	return result
@@ -0,0 +1,212 @@
+"""Vectorized price recommendation engine.
+
+Sales, stock, cost and price-history signals of every variant are loaded into
+NumPy columns with a fixed number of queries and the rule set is evaluated for
+the whole catalog at once. Results are cached per organization and keyed by the
+sales/catalog/settings data versions, so repeated calls are free until the
+underlying data or the thresholds change.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.catalog import inventory
+from simplycrm.catalog.models import PriceHistory, ProductVariant
+from simplycrm.core import versioning
+from simplycrm.sales.models import OrderLine
+
+
+SETTINGS_SECTION = "price_recommendations"
+DEFAULT_THRESHOLDS: dict[str, float] = {
+	"window_days": 30,
+	"raise_coverage_weeks": 2.0,
+	"min_margin": 1.0,
+	"reprice_cooldown_days": 0,
+}
+CACHE_TIMEOUT = 60 * 60
+
+ACTIONS = (
+	(
+		"consider_discount",
+		"Inventory is not moving over the last month.",
+	),
+	(
+		"raise_price",
+		"Demand is outpacing supply; margin headroom available.",
+	),
+	(
+		"review_costs",
+		"Margin is extremely low; verify vendor pricing or adjust list price.",
+	),
+	(
+		"monitor",
+		"Price changed recently; waiting for demand to settle before the next adjustment.",
+	),
+)
+DEFAULT_ACTION = ("monitor", "Performance is within healthy thresholds.")
+
+
+@dataclass
+class PriceFrame:
+	"""Column-oriented snapshot of the signals used by the rule set."""
+
+	variant_ids: np.ndarray
+	names: list[str]
+	units_sold: np.ndarray
+	revenue: np.ndarray
+	stock: np.ndarray
+	price: np.ndarray
+	cost: np.ndarray
+	days_since_price_change: np.ndarray
+
+	def __len__(self) -> int:
+		return len(self.variant_ids)
+
+
+def get_thresholds(organization_id: int) -> dict[str, float]:
+	"""Return rule thresholds with organization overrides applied."""
+
+	thresholds = dict(DEFAULT_THRESHOLDS)
+	settings_obj = models.AnalyticsSettings.objects.filter(organization_id=organization_id).first()
+	if settings_obj is not None:
+		for key, value in settings_obj.section(SETTINGS_SECTION).items():
+			if key in thresholds and isinstance(value, (int, float)) and not isinstance(value, bool):
+				thresholds[key] = value
+	return thresholds
+
+
+def build_price_frame(organization_id: int, *, window_days: int, now=None) -> PriceFrame:
+	"""Load the per-variant signal columns for an organization."""
+
+	now = now or timezone.now()
+	window_start = now - timedelta(days=window_days)
+	sales = {
+		variant_id: (units or 0, revenue or 0)
+		for variant_id, units, revenue in OrderLine.objects.filter(
+			order__organization_id=organization_id,
+			order__ordered_at__gte=window_start,
+		)
+		.values("product_variant")
+		.annotate(units=Sum("quantity"), revenue=Sum(F("unit_price") * F("quantity")))
+		.values_list("product_variant", "units", "revenue")
+	}
+	stock_map = inventory.stock_by_variant(organization_id)
+	candidates = set(sales) | {variant_id for variant_id, quantity in stock_map.items() if quantity > 0}
+
+	# Filter candidates in Python: large catalogs would exceed the bound-parameter limit of ``IN``.
+	rows = [
+		row
+		for row in ProductVariant.objects.filter(product__organization_id=organization_id)
+		.order_by("id")
+		.values_list("id", "product__name", "name", "price", "cost")
+		if row[0] in candidates
+	]
+	last_changes = dict(
+		PriceHistory.objects.filter(variant__product__organization_id=organization_id)
+		.values("variant_id")
+		.annotate(last=Max("recorded_at"))
+		.values_list("variant_id", "last")
+	)
+
+	count = len(rows)
+	variant_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+	units = np.fromiter((sales.get(row[0], (0, 0))[0] for row in rows), dtype=np.float64, count=count)
+	revenue = np.fromiter((float(sales.get(row[0], (0, 0))[1]) for row in rows), dtype=np.float64, count=count)
+	stock = np.fromiter((stock_map.get(row[0], 0) for row in rows), dtype=np.float64, count=count)
+	price = np.fromiter((float(row[3]) for row in rows), dtype=np.float64, count=count)
+	cost = np.fromiter((float(row[4]) for row in rows), dtype=np.float64, count=count)
+	days_since_change = np.fromiter(
+		(
+			(now - last_changes[row[0]]).total_seconds() / 86400 if row[0] in last_changes else np.inf
+			for row in rows
+		),
+		dtype=np.float64,
+		count=count,
+	)
+	return PriceFrame(
+		variant_ids=variant_ids,
+		names=[f"{row[1]} / {row[2]}" for row in rows],
+		units_sold=units,
+		revenue=revenue,
+		stock=stock,
+		price=price,
+		cost=cost,
+		days_since_price_change=days_since_change,
+	)
+
+
+def evaluate_rules(frame: PriceFrame, thresholds: dict[str, float], *, window_days: int) -> dict[str, np.ndarray]:
+	"""Evaluate the rule set for every variant of ``frame`` at once."""
+
+	units = frame.units_sold
+	selling = units > 0
+	with np.errstate(divide="ignore", invalid="ignore"):
+		avg_price = np.where(selling, frame.revenue / np.where(selling, units, 1), frame.price)
+		weeks = window_days / 7
+		coverage = np.where(selling, frame.stock / np.where(selling, units, 1) * weeks, np.inf)
+	margin = avg_price - frame.cost
+	cooling_down = frame.days_since_price_change < thresholds["reprice_cooldown_days"]
+
+	stale = ~selling & (frame.stock > 0)
+	short = coverage < thresholds["raise_coverage_weeks"]
+	conditions = [
+		stale & ~cooling_down,
+		short & ~cooling_down,
+		margin < thresholds["min_margin"],
+		cooling_down & (stale | short),
+	]
+	choice = np.select(conditions, np.arange(len(ACTIONS)), default=len(ACTIONS))
+	trend = np.select([short, ~selling], [0, 1], default=2)
+	return {"choice": choice, "coverage": coverage, "margin": margin, "trend": trend}
+
+
+def recommend_price_actions(organization_id: int, *, use_cache: bool = True) -> dict[str, object]:
+	"""Return price recommendations for every active variant of an organization."""
+
+	version = versioning.get_data_version(
+		organization_id, versioning.SALES, versioning.CATALOG, versioning.SETTINGS
+	)
+	cache_key = f"simplycrm:analytics:price-recommendations:{organization_id}:{timezone.now().date()}:{version}"
+	if use_cache:
+		cached = cache.get(cache_key)
+		if cached is not None:
+			return cached
+
+	thresholds = get_thresholds(organization_id)
+	window_days = int(thresholds["window_days"]) or DEFAULT_THRESHOLDS["window_days"]
+	frame = build_price_frame(organization_id, window_days=window_days)
+	evaluated = evaluate_rules(frame, thresholds, window_days=window_days)
+
+	labels = [*ACTIONS, DEFAULT_ACTION]
+	trend_labels = ("high", "low", "steady")
+	coverage = np.round(evaluated["coverage"], 2)
+	margin = np.round(evaluated["margin"], 2)
+	recommendations = [
+		{
+			"variant_id": int(frame.variant_ids[index]),
+			"variant_name": frame.names[index],
+			"units_sold": int(frame.units_sold[index]),
+			"stock_on_hand": int(frame.stock[index]),
+			"coverage_weeks": float(coverage[index]) if np.isfinite(coverage[index]) else None,
+			"margin": float(margin[index]),
+			"action": labels[evaluated["choice"][index]][0],
+			"reason": labels[evaluated["choice"][index]][1],
+			"trend_label": trend_labels[evaluated["trend"][index]],
+		}
+		for index in range(len(frame))
+	]
+	result = {
+		"generated_at": timezone.now().isoformat(),
+		"thresholds": thresholds,
+		"recommendations": recommendations,
+	}
+	if use_cache:
+		cache.set(cache_key, result, timeout=CACHE_TIMEOUT)
+	return result
@@ -0,0 +1,347 @@
+"""Cron-driven execution of :class:`Report` definitions.
+
+The scheduler keeps one heap of ``(next_run_at, report_id)`` entries across
+all organizations. It sleeps until the earliest entry is due, so the reports
+table is only read on start-up and by a cheap periodic query for reports
+changed since the last refresh (``updated_at`` watermark). Due reports are
+dispatched to a bounded thread pool; each organization may only occupy a
+limited number of workers at a time, further runs wait in a per-organization
+queue. Rendered outputs are written to ``default_storage``.
+"""
+from __future__ import annotations
+
+import csv
+import heapq
+import io
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+
+from simplycrm.analytics import metric_dsl, models
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_SCHEDULED = "scheduled"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_ORGANIZATION = 2
+REFRESH_INTERVAL = 60
+MAX_SLEEP = 60
+OUTPUT_ROOT = "reports"
+
+MACROS = {
+	"@yearly": "0 0 1 1 *",
+	"@annually": "0 0 1 1 *",
+	"@monthly": "0 0 1 * *",
+	"@weekly": "0 0 * * 0",
+	"@daily": "0 0 * * *",
+	"@midnight": "0 0 * * *",
+	"@hourly": "0 * * * *",
+}
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+FIELD_NAMES = ("минуты", "часы", "день месяца", "месяц", "день недели")
+SEARCH_LIMIT = timedelta(days=366 * 5)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+	"""Parsed five-field cron expression (minute hour day month weekday)."""
+
+	minutes: frozenset[int]
+	hours: frozenset[int]
+	days: frozenset[int]
+	months: frozenset[int]
+	weekdays: frozenset[int]
+	day_restricted: bool
+	weekday_restricted: bool
+
+	def _day_matches(self, moment: datetime) -> bool:
+		day_ok = moment.day in self.days
+		# Cron weekdays count from Sunday (0 and 7), Python from Monday.
+		weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+		if self.day_restricted and self.weekday_restricted:
+			return day_ok or weekday_ok
+		return day_ok and weekday_ok
+
+	def next_after(self, moment: datetime) -> datetime:
+		"""Return the first matching minute strictly after ``moment``.
+
+		Whole months, days and hours that cannot match are skipped, so the
+		search takes at most a few hundred steps.
+		"""
+
+		tz = moment.tzinfo
+		candidate = timezone.localtime(moment).replace(second=0, microsecond=0, tzinfo=None) + timedelta(minutes=1)
+		limit = candidate + SEARCH_LIMIT
+		while candidate < limit:
+			if candidate.month not in self.months:
+				year, month = (candidate.year + 1, 1) if candidate.month == 12 else (candidate.year, candidate.month + 1)
+				candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+				continue
+			if not self._day_matches(candidate):
+				candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+				continue
+			if candidate.hour not in self.hours:
+				candidate = candidate.replace(minute=0) + timedelta(hours=1)
+				continue
+			if candidate.minute not in self.minutes:
+				candidate += timedelta(minutes=1)
+				continue
+			aware = timezone.make_aware(candidate, timezone.get_current_timezone())
+			return aware.astimezone(tz) if tz else aware
+		raise ValidationError("Расписание никогда не срабатывает.")
+
+
+def _parse_field(expression: str, index: int) -> tuple[frozenset[int], bool]:
+	low, high = FIELD_RANGES[index]
+	values: set[int] = set()
+	for part in expression.split(","):
+		base, _, step_text = part.partition("/")
+		try:
+			step = int(step_text) if step_text else 1
+			if base == "*":
+				start, end = low, high
+			elif "-" in base:
+				start_text, end_text = base.split("-", 1)
+				start, end = int(start_text), int(end_text)
+			else:
+				start = int(base)
+				end = high if step_text else start
+		except ValueError:
+			raise ValidationError(f"Некорректное поле расписания ({FIELD_NAMES[index]}): {part}.") from None
+		if step < 1 or not low <= start <= end <= high:
+			raise ValidationError(f"Поле расписания ({FIELD_NAMES[index]}) вне диапазона {low}-{high}: {part}.")
+		values.update(range(start, end + 1, step))
+	if index == 4 and 7 in values:
+		values.discard(7)
+		values.add(0)
+	return frozenset(values), expression != "*"
+
+
+def parse_cron(expression: str) -> CronSchedule:
+	"""Parse a cron expression or one of the ``@daily``-style macros."""
+
+	expression = MACROS.get(expression.strip().lower(), expression.strip())
+	fields = expression.split()
+	if len(fields) != 5:
+		raise ValidationError("Расписание должно состоять из пяти полей: минуты, часы, день, месяц, день недели.")
+	parsed = [_parse_field(field, index) for index, field in enumerate(fields)]
+	return CronSchedule(
+		minutes=parsed[0][0],
+		hours=parsed[1][0],
+		days=parsed[2][0],
+		months=parsed[3][0],
+		weekdays=parsed[4][0],
+		day_restricted=parsed[2][1],
+		weekday_restricted=parsed[4][1],
+	)
+
+
+def render_report(report: models.Report) -> tuple[str, bytes]:
+	"""Evaluate the report's metrics and return ``(extension, content)``.
+
+	``definition`` accepts ``codes`` (saved metric codes), ``metrics`` (inline
+	DSL definitions) and ``format`` (``json`` or ``csv``).
+	"""
+
+	definition = report.definition or {}
+	codes = definition.get("codes", [])
+	queries = dict(
+		models.MetricDefinition.objects.filter(
+			organization_id=report.organization_id, code__in=codes, is_active=True
+		).values_list("code", "query")
+	)
+	queries.update(definition.get("metrics", {}))
+	results = metric_dsl.evaluate_metrics(report.organization_id, queries.items())
+	for code in codes:
+		results.setdefault(code, {"error": "Метрика не найдена."})
+
+	if definition.get("format") == "csv":
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+		writer.writerow(["metric", "dimensions", "value", "error"])
+		for code, result in results.items():
+			if "rows" in result:
+				for row in result["rows"]:
+					dimensions = {key: value for key, value in row.items() if key != "value"}
+					writer.writerow([code, json.dumps(dimensions, sort_keys=True), row["value"], ""])
+			else:
+				writer.writerow([code, "", result.get("value", ""), result.get("error", "")])
+		return "csv", buffer.getvalue().encode()
+	payload = {"report": report.name, "generated_at": timezone.now().isoformat(), "metrics": results}
+	return "json", json.dumps(payload, default=str).encode()
+
+
+def run_report(report_id: int, *, now: datetime | None = None) -> str:
+	"""Render one report, store the output and record the run; return the status."""
+
+	now = now or timezone.now()
+	report = models.Report.objects.filter(pk=report_id).first()
+	if report is None:
+		return STATUS_FAILED
+	models.Report.objects.filter(pk=report_id).update(last_run_status=STATUS_RUNNING)
+	try:
+		extension, content = render_report(report)
+		path = default_storage.save(
+			f"{OUTPUT_ROOT}/{report.organization_id}/{report.pk}/{now:%Y%m%dT%H%M%S}.{extension}",
+			ContentFile(content),
+		)
+	except Exception as exc:  # noqa: BLE001 - a failing report must not stop the scheduler
+		logger.exception("Report %s failed", report_id)
+		models.Report.objects.filter(pk=report_id).update(
+			last_run_at=now, last_run_status=STATUS_FAILED, last_run_error=str(exc)[:2000]
+		)
+		return STATUS_FAILED
+	# ``update()`` leaves ``updated_at`` untouched, so runs do not look like edits.
+	models.Report.objects.filter(pk=report_id).update(
+		last_run_at=now, last_run_status=STATUS_SUCCEEDED, last_run_error="", last_output=path
+	)
+	return STATUS_SUCCEEDED
+
+
+class ReportScheduler:
+	"""Heap-based scheduler for all organizations' reports."""
+
+	def __init__(
+		self,
+		*,
+		max_workers: int = DEFAULT_WORKERS,
+		per_organization: int = DEFAULT_PER_ORGANIZATION,
+		refresh_interval: int = REFRESH_INTERVAL,
+		executor: Executor | None = None,
+	) -> None:
+		self.per_organization = per_organization
+		self.refresh_interval = refresh_interval
+		self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+		self._heap: list[tuple[datetime, int]] = []
+		# report id -> (organization id, schedule, scheduled time); heap entries
+		# whose time no longer matches are stale and skipped when popped.
+		self._reports: dict[int, tuple[int, CronSchedule, datetime]] = {}
+		self._running: dict[int, int] = defaultdict(int)
+		self._waiting: dict[int, deque[int]] = defaultdict(deque)
+		self._lock = threading.Lock()
+		self._watermark: datetime | None = None
+		self._last_refresh: datetime | None = None
+		self.stop_event = threading.Event()
+
+	def __len__(self) -> int:
+		return len(self._reports)
+
+	def _schedule(self, report_id: int, organization_id: int, cron: str, next_run_at: datetime | None, now: datetime) -> None:
+		try:
+			schedule = parse_cron(cron)
+			due = next_run_at or schedule.next_after(now)
+		except ValidationError:
+			logger.warning("Report %s has an invalid schedule %r", report_id, cron)
+			self._reports.pop(report_id, None)
+			return
+		self._reports[report_id] = (organization_id, schedule, due)
+		heapq.heappush(self._heap, (due, report_id))
+		if next_run_at is None:
+			models.Report.objects.filter(pk=report_id).update(next_run_at=due, last_run_status=STATUS_SCHEDULED)
+
+	def refresh(self, now: datetime | None = None) -> int:
+		"""Load reports changed since the last refresh; return how many were (re)scheduled."""
+
+		now = now or timezone.now()
+		reports = models.Report.objects.all()
+		if self._watermark is not None:
+			reports = reports.filter(updated_at__gt=self._watermark)
+		changed = 0
+		rows = reports.order_by("updated_at").values_list("id", "organization_id", "schedule_cron", "next_run_at", "updated_at")
+		for report_id, organization_id, cron, next_run_at, updated_at in rows.iterator():
+			self._watermark = max(self._watermark or updated_at, updated_at)
+			changed += 1
+			current = self._reports.pop(report_id, None)
+			if not cron:
+				continue
+			# Reports seen for the first time keep their stored next run, so runs
+			# missed while the scheduler was down happen once; edited reports are
+			# rescheduled from their new expression.
+			self._schedule(report_id, organization_id, cron, next_run_at if current is None else None, now)
+		if self._last_refresh is not None:
+			# Deleted reports never show up as changed; their heap entries go stale.
+			existing = set(models.Report.objects.exclude(schedule_cron="").values_list("id", flat=True))
+			for report_id in set(self._reports) - existing:
+				del self._reports[report_id]
+		self._last_refresh = now
+		return changed
+
+	def _pop_due(self, now: datetime) -> list[int]:
+		due = []
+		while self._heap and self._heap[0][0] <= now:
+			scheduled, report_id = heapq.heappop(self._heap)
+			entry = self._reports.get(report_id)
+			if entry is None or entry[2] != scheduled:
+				continue
+			organization_id, schedule, _ = entry
+			next_run = schedule.next_after(max(scheduled, now))
+			self._reports[report_id] = (organization_id, schedule, next_run)
+			heapq.heappush(self._heap, (next_run, report_id))
+			models.Report.objects.filter(pk=report_id).update(next_run_at=next_run)
+			due.append(report_id)
+		return due
+
+	def _dispatch(self, organization_id: int, report_id: int) -> None:
+		with self._lock:
+			if self._running[organization_id] >= self.per_organization:
+				self._waiting[organization_id].append(report_id)
+				return
+			self._running[organization_id] += 1
+		future = self.executor.submit(self._execute, report_id)
+		future.add_done_callback(lambda _: self._release(organization_id))
+
+	def _release(self, organization_id: int) -> None:
+		with self._lock:
+			self._running[organization_id] -= 1
+			waiting = self._waiting[organization_id]
+			next_report = waiting.popleft() if waiting else None
+		if next_report is not None:
+			self._dispatch(organization_id, next_report)
+
+	def _execute(self, report_id: int) -> str:
+		close_old_connections()
+		try:
+			return run_report(report_id)
+		finally:
+			close_old_connections()
+
+	def run_pending(self, now: datetime | None = None) -> list[int]:
+		"""Refresh if due, dispatch every due report and return their ids."""
+
+		now = now or timezone.now()
+		if self._last_refresh is None or now - self._last_refresh >= timedelta(seconds=self.refresh_interval):
+			self.refresh(now)
+		due = self._pop_due(now)
+		for report_id in due:
+			self._dispatch(self._reports[report_id][0], report_id)
+		return due
+
+	def seconds_until_next(self, now: datetime | None = None) -> float:
+		now = now or timezone.now()
+		wake = [MAX_SLEEP]
+		if self._heap:
+			wake.append((self._heap[0][0] - now).total_seconds())
+		if self._last_refresh is not None:
+			wake.append((self._last_refresh + timedelta(seconds=self.refresh_interval) - now).total_seconds())
+		return max(0.0, min(wake))
+
+	def run_forever(self) -> None:
+		while not self.stop_event.is_set():
+			self.run_pending()
+			self.stop_event.wait(self.seconds_until_next())
+		self.executor.shutdown(wait=True)
@@ -0,0 +1,383 @@
+"""Customer segment engine backed by contact-id bitmaps.
+
+``CustomerSegment.filter_definition`` is a tree of conditions::
+
+	{"all": [
+		{"field": "total_spent", "op": "gte", "value": 500},
+		{"not": {"field": "tag", "op": "has", "value": "churned"}},
+		{"any": [{"field": "industry", "op": "eq", "value": "Retail"},
+		         {"field": "lead_source", "op": "in", "value": ["ads", "web"]}]}
+	]}
+
+Every leaf is evaluated by one query into a :class:`Bitmap` of contact ids and
+the tree is combined with bitwise operations. Membership is stored compressed
+on the segment, so size, overlap and campaign audiences are answered from the
+bitmaps without touching contacts or orders again. Refreshes are incremental:
+only contacts whose ``updated_at`` moved past the last refresh (contacts are
+touched when their orders or leads change) are re-evaluated, and the contact
+table is only scanned for removed members after a contact was deleted.
+"""
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import reduce
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Q, QuerySet, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.core import versioning
+from simplycrm.sales.models import Contact, Order
+
+
+CHURN_DAYS = 90
+ZERO = Decimal("0.00")
+# Member ids per statistics query, below the bound-parameter limit of SQLite.
+MEMBER_CHUNK_SIZE = 500
+_SEEN_DELETIONS_KEY = "simplycrm:segment-contact-deletions:{segment_id}"
+
+
+class Bitmap:
+	"""Immutable set of non-negative ids stored as the bits of an integer."""
+
+	__slots__ = ("bits",)
+
+	def __init__(self, bits: int = 0) -> None:
+		self.bits = bits
+
+	@classmethod
+	def from_ids(cls, ids: Iterable[int]) -> "Bitmap":
+		array = np.fromiter(ids, dtype=np.int64)
+		if not array.size:
+			return cls()
+		flags = np.zeros(int(array.max()) + 1, dtype=bool)
+		flags[array] = True
+		return cls(int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little"))
+
+	@classmethod
+	def from_bytes(cls, payload: bytes | memoryview | None) -> "Bitmap":
+		if not payload:
+			return cls()
+		return cls(int.from_bytes(zlib.decompress(bytes(payload)), "little"))
+
+	def to_bytes(self) -> bytes:
+		if not self.bits:
+			return b""
+		return zlib.compress(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little"))
+
+	def ids(self) -> np.ndarray:
+		if not self.bits:
+			return np.empty(0, dtype=np.int64)
+		raw = np.frombuffer(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+		return np.flatnonzero(np.unpackbits(raw, bitorder="little"))
+
+	def __iter__(self) -> Iterator[int]:
+		return iter(self.ids().tolist())
+
+	def __len__(self) -> int:
+		return self.bits.bit_count()
+
+	def __bool__(self) -> bool:
+		return bool(self.bits)
+
+	def __contains__(self, contact_id: int) -> bool:
+		return contact_id >= 0 and bool(self.bits >> contact_id & 1)
+
+	def __and__(self, other: "Bitmap") -> "Bitmap":
+		return Bitmap(self.bits & other.bits)
+
+	def __or__(self, other: "Bitmap") -> "Bitmap":
+		return Bitmap(self.bits | other.bits)
+
+	def __sub__(self, other: "Bitmap") -> "Bitmap":
+		return Bitmap(self.bits & ~other.bits)
+
+	def __eq__(self, other: object) -> bool:
+		return isinstance(other, Bitmap) and self.bits == other.bits
+
+	def __hash__(self) -> int:
+		return hash(self.bits)
+
+
+@dataclass(frozen=True)
+class Field:
+	lookup: str
+	annotation: Any = None
+	operators: frozenset[str] = frozenset({"eq", "ne", "in", "contains"})
+	relative_days: bool = False
+
+
+_NUMERIC = frozenset({"eq", "ne", "gt", "gte", "lt", "lte"})
+FIELDS: dict[str, Field] = {
+	"email": Field("email"),
+	"first_name": Field("first_name"),
+	"last_name": Field("last_name"),
+	"company": Field("company__name"),
+	"industry": Field("company__industry"),
+	"tag": Field("tags", operators=frozenset({"has"})),
+	"lead_status": Field("leads__status"),
+	"lead_source": Field("leads__source"),
+	"orders_count": Field("_orders_count", Count("orders", distinct=True), _NUMERIC),
+	"total_spent": Field(
+		"_total_spent",
+		Coalesce(
+			Sum(
+				ExpressionWrapper(
+					F("orders__lines__unit_price") * F("orders__lines__quantity") - F("orders__lines__discount_amount"),
+					output_field=DecimalField(max_digits=14, decimal_places=2),
+				)
+			),
+			ZERO,
+			output_field=DecimalField(max_digits=14, decimal_places=2),
+		),
+		_NUMERIC,
+	),
+	"churn_probability": Field("churn_score__churn_probability", operators=frozenset({"gt", "gte", "lt", "lte"})),
+	"last_order_days": Field(
+		"_last_order_at",
+		Max("orders__ordered_at"),
+		frozenset({"gt", "gte", "lt", "lte"}),
+		relative_days=True,
+	),
+}
+LOOKUPS = {"eq": "exact", "in": "in", "contains": "icontains", "gt": "gt", "gte": "gte", "lt": "lt", "lte": "lte"}
+
+
+def validate_definition(definition: Any, *, depth: int = 0) -> None:
+	"""Raise :class:`ValidationError` unless ``definition`` is a valid filter tree."""
+
+	if depth > 8:
+		raise ValidationError("Слишком глубокая вложенность условий сегмента.")
+	if not isinstance(definition, dict):
+		raise ValidationError("Условие сегмента должно быть JSON-объектом.")
+	if not definition:
+		return
+	if "all" in definition or "any" in definition:
+		children = definition.get("all", definition.get("any"))
+		if len(definition) != 1 or not isinstance(children, list) or not children:
+			raise ValidationError("Ключи all/any требуют непустого списка условий.")
+		for child in children:
+			validate_definition(child, depth=depth + 1)
+		return
+	if "not" in definition:
+		if len(definition) != 1:
+			raise ValidationError("Ключ not принимает одно условие.")
+		validate_definition(definition["not"], depth=depth + 1)
+		return
+	field = FIELDS.get(definition.get("field"))
+	if field is None:
+		raise ValidationError(f"Допустимые поля сегмента: {', '.join(sorted(FIELDS))}.")
+	op = definition.get("op", "eq")
+	if op not in field.operators:
+		raise ValidationError(
+			f"Поле «{definition['field']}» поддерживает операторы: {', '.join(sorted(field.operators))}."
+		)
+	value = definition.get("value")
+	if op == "in" and not isinstance(value, list):
+		raise ValidationError("Оператор «in» требует список значений.")
+	if op != "in" and isinstance(value, (list, dict)):
+		raise ValidationError("Значение условия должно быть скаляром.")
+	if field.operators <= _NUMERIC and not isinstance(value, (int, float)):
+		raise ValidationError(f"Поле «{definition['field']}» сравнивается с числом.")
+
+
+def uses_relative_dates(definition: dict) -> bool:
+	if "field" in definition:
+		return FIELDS[definition["field"]].relative_days
+	children = definition.get("all") or definition.get("any") or ([definition["not"]] if "not" in definition else [])
+	return any(uses_relative_dates(child) for child in children)
+
+
+@dataclass
+class _Context:
+	contacts: QuerySet
+	universe: Bitmap
+	today_start: datetime
+
+
+def _ids(queryset: QuerySet) -> Bitmap:
+	return Bitmap.from_ids(queryset.values_list("id", flat=True).distinct().iterator())
+
+
+def _evaluate_leaf(condition: dict, context: _Context) -> Bitmap:
+	field = FIELDS[condition["field"]]
+	op = condition.get("op", "eq")
+	value = condition.get("value")
+	if op == "has":
+		return Bitmap.from_ids(
+			contact_id
+			for contact_id, tags in context.contacts.values_list("id", "tags").iterator()
+			if isinstance(tags, list) and value in tags
+		)
+	if op == "ne":
+		return context.universe - _evaluate_leaf({**condition, "op": "eq"}, context)
+
+	queryset = context.contacts
+	if field.annotation is not None:
+		queryset = queryset.annotate(**{field.lookup: field.annotation})
+	if field.relative_days:
+		# Days are counted between calendar dates: an order placed today is 0 days old.
+		days = int(value) if op in ("lte", "gt") else int(value) - 1
+		threshold = context.today_start - timedelta(days=days)
+		if op in ("lt", "lte"):
+			return _ids(queryset.filter(**{f"{field.lookup}__gte": threshold}))
+		# Contacts who never ordered are infinitely far from their last order.
+		return _ids(queryset.filter(Q(**{f"{field.lookup}__lt": threshold}) | Q(**{f"{field.lookup}__isnull": True})))
+	return _ids(queryset.filter(**{f"{field.lookup}__{LOOKUPS[op]}": value}))
+
+
+def evaluate(definition: dict, context: _Context) -> Bitmap:
+	if not definition:
+		return context.universe
+	if "all" in definition:
+		return reduce(lambda left, right: left & right, (evaluate(child, context) for child in definition["all"]))
+	if "any" in definition:
+		return reduce(lambda left, right: left | right, (evaluate(child, context) for child in definition["any"]))
+	if "not" in definition:
+		return context.universe - evaluate(definition["not"], context)
+	return _evaluate_leaf(definition, context)
+
+
+def membership(segment: models.CustomerSegment) -> Bitmap:
+	return Bitmap.from_bytes(segment.membership)
+
+
+def _segment_statistics(organization_id: int, members: Bitmap, now: datetime) -> tuple[Decimal, Decimal]:
+	"""Return ``(ltv, churn_rate)`` for the members, aggregating only their orders."""
+
+	if not members:
+		return ZERO, ZERO
+	money = DecimalField(max_digits=14, decimal_places=2)
+	ids = members.ids().tolist()
+	cutoff = now - timedelta(days=CHURN_DAYS)
+	revenue = ZERO
+	churned = 0
+	for start in range(0, len(ids), MEMBER_CHUNK_SIZE):
+		rows = (
+			Order.objects.filter(organization_id=organization_id, contact_id__in=ids[start : start + MEMBER_CHUNK_SIZE])
+			.values("contact_id")
+			.annotate(
+				total=Coalesce(
+					Sum(
+						ExpressionWrapper(
+							F("lines__unit_price") * F("lines__quantity") - F("lines__discount_amount"), output_field=money
+						)
+					),
+					ZERO,
+					output_field=money,
+				),
+				last_order_at=Max("ordered_at"),
+			)
+			.values_list("total", "last_order_at")
+		)
+		for total, last_order_at in rows:
+			revenue += total
+			if last_order_at < cutoff:
+				churned += 1
+	size = len(members)
+	return (revenue / size).quantize(ZERO), (Decimal(churned * 100) / size).quantize(ZERO)
+
+
+def refresh_segment(segment: models.CustomerSegment, *, full: bool = False, now: datetime | None = None) -> Bitmap:
+	"""Re-evaluate the segment and store its membership and statistics.
+
+	Unless ``full`` is set, only contacts changed since the previous refresh
+	are evaluated; a full pass is forced for the first refresh and once a day
+	for definitions with relative dates.
+	"""
+
+	now = now or timezone.now()
+	definition = segment.filter_definition or {}
+	today_start = timezone.make_aware(datetime.combine(timezone.localdate(now), datetime.min.time()))
+	contacts = Contact.objects.filter(organization_id=segment.organization_id)
+	if segment.refreshed_at is None or (uses_relative_dates(definition) and segment.refreshed_at < today_start):
+		full = True
+
+	# Read before evaluating, so a deletion committed meanwhile is seen by the next refresh.
+	deletions = versioning.get_data_version(segment.organization_id, versioning.CONTACT_DELETIONS)
+	seen_deletions_key = _SEEN_DELETIONS_KEY.format(segment_id=segment.pk)
+	if full:
+		members = evaluate(definition, _Context(contacts, _ids(contacts), today_start))
+	else:
+		changed_contacts = contacts.filter(updated_at__gte=segment.refreshed_at)
+		changed = _ids(changed_contacts)
+		previous = membership(segment)
+		if cache.get(seen_deletions_key) != deletions:
+			# Contacts were deleted since the last refresh (or the marker was evicted).
+			previous = previous & _ids(contacts)
+		members = (previous - changed) | evaluate(definition, _Context(changed_contacts, changed, today_start))
+
+	segment.membership = members.to_bytes()
+	segment.size = len(members)
+	segment.ltv, segment.churn_rate = _segment_statistics(segment.organization_id, members, now)
+	segment.refreshed_at = now
+	segment.save(update_fields=["membership", "size", "ltv", "churn_rate", "refreshed_at", "updated_at"])
+	cache.set(seen_deletions_key, deletions, timeout=None)
+	return members
+
+
+def refresh_segments(organization_id: int, *, full: bool = False) -> int:
+	segments = models.CustomerSegment.objects.filter(organization_id=organization_id)
+	count = 0
+	for segment in segments:
+		refresh_segment(segment, full=full)
+		count += 1
+	return count
+
+
+def overlap(segments: Iterable[models.CustomerSegment]) -> dict[str, object]:
+	"""Sizes, pairwise intersections and the overall intersection/union of segments."""
+
+	bitmaps = {segment.id: membership(segment) for segment in segments}
+	ids = list(bitmaps)
+	pairs = []
+	for index, left in enumerate(ids):
+		for right in ids[index + 1 :]:
+			intersection = len(bitmaps[left] & bitmaps[right])
+			union = len(bitmaps[left] | bitmaps[right])
+			pairs.append(
+				{
+					"segments": [left, right],
+					"intersection": intersection,
+					"union": union,
+					"jaccard": round(intersection / union, 4) if union else 0.0,
+				}
+			)
+	values = list(bitmaps.values())
+	return {
+		"sizes": {segment_id: len(bitmap) for segment_id, bitmap in bitmaps.items()},
+		"pairs": pairs,
+		"intersection": len(reduce(lambda left, right: left & right, values)) if values else 0,
+		"union": len(reduce(lambda left, right: left | right, values)) if values else 0,
+	}
+
+
+def resolve_audience(organization_id: int, audience_definition: dict) -> Bitmap:
+	"""Resolve ``{"include_segments": [...], "exclude_segments": [...], "match": "any"|"all"}``."""
+
+	include = audience_definition.get("include_segments") or []
+	exclude = audience_definition.get("exclude_segments") or []
+	if not include:
+		return Bitmap()
+	bitmaps = {
+		segment.id: membership(segment)
+		for segment in models.CustomerSegment.objects.filter(organization_id=organization_id, id__in=[*include, *exclude])
+	}
+	missing = sorted((set(include) | set(exclude)) - set(bitmaps))
+	if missing:
+		raise ValidationError(f"Сегменты не найдены: {', '.join(map(str, missing))}.")
+	combine = (lambda left, right: left & right) if audience_definition.get("match") == "all" else (
+		lambda left, right: left | right
+	)
+	audience = reduce(combine, (bitmaps[segment_id] for segment_id in include))
+	for segment_id in exclude:
+		audience = audience - bitmaps[segment_id]
+	return audience
@@ -1,8 +1,23 @@
 """Serializers for analytics models."""
 from __future__ import annotations
 
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from simplycrm.analytics import models
+from simplycrm.analytics import (
+	anomalies,
+	cohorts,
+	dashboards,
+	lead_scoring,
+	metric_dsl,
+	metrics,
+	models,
+	next_best_actions,
+	pipeline_forecast,
+	pricing,
+	scheduler,
+	segments,
+	sync,
+)
 
 
 class MetricDefinitionSerializer(serializers.ModelSerializer):
@@ -10,6 +25,41 @@ class MetricDefinitionSerializer(serializers.ModelSerializer):
 		model = models.MetricDefinition
 		fields = ["id", "organization", "code", "name", "description", "query", "is_active"]
 		read_only_fields = ["id"]
+	
+	def validate_query(self, value):
+		try:
+			metric_dsl.compile_metric(value)
+		except DjangoValidationError as exc:
+			raise serializers.ValidationError(exc.messages) from None
+		return value
+
+
+class MetricPeriodSerializer(serializers.Serializer):
+	start = serializers.DateField(required=False)
+	end = serializers.DateField(required=False)
+	
+	def validate(self, attrs):
+		start, end = attrs.get("start"), attrs.get("end")
+		if start and end and start > end:
+			raise serializers.ValidationError("Дата начала периода не может быть позже даты окончания.")
+		return attrs
+
+
+class MetricEvaluationQuerySerializer(MetricPeriodSerializer):
+	codes = serializers.ListField(child=serializers.CharField(max_length=64), required=False)
+	metrics = serializers.DictField(child=serializers.JSONField(), required=False)
+	
+	def validate(self, attrs):
+		attrs = super().validate(attrs)
+		if len(attrs.get("codes", [])) + len(attrs.get("metrics", {})) > 50:
+			raise serializers.ValidationError("За один запрос можно вычислить не более 50 метрик.")
+		return attrs
+
+
+class MetricEvaluationSerializer(serializers.Serializer):
+	value = serializers.JSONField(required=False)
+	rows = serializers.ListField(child=serializers.DictField(), required=False)
+	error = serializers.CharField(required=False)
 
 
 class DashboardSerializer(serializers.ModelSerializer):
@@ -17,13 +67,57 @@ class DashboardSerializer(serializers.ModelSerializer):
 		model = models.Dashboard
 		fields = ["id", "organization", "name", "layout", "filters"]
 		read_only_fields = ["id"]
+	
+	def validate_layout(self, value):
+		try:
+			dashboards.validate_layout(value)
+		except DjangoValidationError as exc:
+			raise serializers.ValidationError(exc.messages) from None
+		return value
+
+
+class DashboardWidgetSerializer(MetricEvaluationSerializer):
+	id = serializers.CharField()
+	cached = serializers.BooleanField(required=False)
+
+
+class DashboardRenderSerializer(serializers.Serializer):
+	dashboard = serializers.IntegerField()
+	name = serializers.CharField()
+	widgets = DashboardWidgetSerializer(many=True)
+	stats = serializers.DictField(child=serializers.IntegerField())
 
 
 class ReportSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = models.Report
-		fields = ["id", "organization", "name", "definition", "schedule_cron", "last_run_at", "last_run_status"]
-		read_only_fields = ["id", "last_run_at", "last_run_status"]
+		fields = [
+			"id",
+			"organization",
+			"name",
+			"definition",
+			"schedule_cron",
+			"last_run_at",
+			"last_run_status",
+			"last_run_error",
+			"last_output",
+			"next_run_at",
+		]
+		read_only_fields = ["id", "last_run_at", "last_run_status", "last_run_error", "last_output", "next_run_at"]
+	
+	def validate_schedule_cron(self, value):
+		if value:
+			try:
+				scheduler.parse_cron(value)
+			except DjangoValidationError as exc:
+				raise serializers.ValidationError(exc.messages) from None
+		return value
+	
+	def update(self, instance, validated_data):
+		if validated_data.get("schedule_cron", instance.schedule_cron) != instance.schedule_cron:
+			# The scheduler recomputes the next run from the new expression.
+			validated_data["next_run_at"] = None
+		return super().update(instance, validated_data)
 
 
 class InsightSerializer(serializers.ModelSerializer):
@@ -61,9 +155,55 @@ class CustomerSegmentSerializer(serializers.ModelSerializer):
 			"size",
 			"ltv",
 			"churn_rate",
+			"refreshed_at",
 			"updated_at",
 		]
-		read_only_fields = ["id", "updated_at"]
+		read_only_fields = ["id", "size", "ltv", "churn_rate", "refreshed_at", "updated_at"]
+	
+	def validate_filter_definition(self, value):
+		try:
+			segments.validate_definition(value)
+		except DjangoValidationError as exc:
+			raise serializers.ValidationError(exc.messages) from None
+		return value
+	
+	def update(self, instance, validated_data):
+		if validated_data.get("filter_definition", instance.filter_definition) != instance.filter_definition:
+			# Stored membership belongs to the old definition; the next refresh is a full one.
+			validated_data["refreshed_at"] = None
+		return super().update(instance, validated_data)
+
+
+class SegmentRefreshSerializer(serializers.Serializer):
+	full = serializers.BooleanField(default=False)
+
+
+class SegmentMembersQuerySerializer(serializers.Serializer):
+	offset = serializers.IntegerField(min_value=0, default=0)
+	limit = serializers.IntegerField(min_value=1, max_value=5000, default=500)
+
+
+class SegmentMembersSerializer(serializers.Serializer):
+	size = serializers.IntegerField()
+	contact_ids = serializers.ListField(child=serializers.IntegerField())
+
+
+class SegmentOverlapQuerySerializer(serializers.Serializer):
+	segments = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=20)
+
+
+class SegmentOverlapPairSerializer(serializers.Serializer):
+	segments = serializers.ListField(child=serializers.IntegerField())
+	intersection = serializers.IntegerField()
+	union = serializers.IntegerField()
+	jaccard = serializers.FloatField()
+
+
+class SegmentOverlapSerializer(serializers.Serializer):
+	sizes = serializers.DictField(child=serializers.IntegerField())
+	pairs = SegmentOverlapPairSerializer(many=True)
+	intersection = serializers.IntegerField()
+	union = serializers.IntegerField()
 
 
 class ModelTrainingRunSerializer(serializers.ModelSerializer):
@@ -82,11 +222,37 @@ class ModelTrainingRunSerializer(serializers.ModelSerializer):
 		read_only_fields = ["id", "started_at", "completed_at"]
 
 
+class LeadScoringTrainingSerializer(serializers.Serializer):
+	C = serializers.FloatField(min_value=0.0001, default=lead_scoring.DEFAULT_PARAMETERS["C"])
+	max_iter = serializers.IntegerField(min_value=10, max_value=10000, default=lead_scoring.DEFAULT_PARAMETERS["max_iter"])
+	score = serializers.BooleanField(default=True)
+
+
+class LeadScoringResultSerializer(serializers.Serializer):
+	run = ModelTrainingRunSerializer()
+	scored_leads = serializers.IntegerField()
+
+
 class DataSourceSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = models.DataSource
-		fields = ["id", "organization", "name", "source_type", "config", "is_active"]
-		read_only_fields = ["id"]
+		fields = ["id", "organization", "name", "source_type", "config", "is_active", "watermark", "last_synced_at"]
+		read_only_fields = ["id", "watermark", "last_synced_at"]
+	
+	def validate(self, attrs):
+		source_type = attrs.get("source_type", getattr(self.instance, "source_type", ""))
+		config = attrs.get("config", getattr(self.instance, "config", {}))
+		try:
+			sync.validate_config(source_type, config)
+		except DjangoValidationError as exc:
+			raise serializers.ValidationError({"config": exc.messages}) from exc
+		return attrs
+
+
+class DataSyncRequestSerializer(serializers.Serializer):
+	full = serializers.BooleanField(default=False, help_text="Discard the watermark and re-read the whole source")
+	batch_size = serializers.IntegerField(min_value=1, max_value=10000, default=sync.DEFAULT_BATCH_SIZE)
+	max_batches = serializers.IntegerField(min_value=1, required=False)
 
 
 class DataSyncLogSerializer(serializers.ModelSerializer):
@@ -96,6 +262,43 @@ class DataSyncLogSerializer(serializers.ModelSerializer):
 		read_only_fields = ["id", "started_at"]
 
 
+class AnalyticsSettingsSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = models.AnalyticsSettings
+		fields = ["id", "organization", "config", "updated_at"]
+		read_only_fields = ["id", "organization", "updated_at"]
+	
+	def validate_config(self, value):
+		if not isinstance(value, dict):
+			raise serializers.ValidationError("Конфигурация должна быть объектом.")
+		self._validate_thresholds(value.get(pricing.SETTINGS_SECTION, {}), pricing.DEFAULT_THRESHOLDS)
+		self._validate_thresholds(value.get(anomalies.SETTINGS_SECTION, {}), anomalies.DEFAULT_CONFIGURATION)
+		self._validate_next_best_actions(value.get(next_best_actions.SETTINGS_SECTION, {}))
+		return value
+	
+	def _validate_thresholds(self, section, defaults):
+		if not isinstance(section, dict):
+			raise serializers.ValidationError("Пороги аналитики должны быть объектом.")
+		for key, threshold in section.items():
+			if key not in defaults:
+				raise serializers.ValidationError(f"Неизвестный порог аналитики: {key}.")
+			if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or threshold < 0:
+				raise serializers.ValidationError(f"Порог {key} должен быть неотрицательным числом.")
+	
+	def _validate_next_best_actions(self, section):
+		if not isinstance(section, dict):
+			raise serializers.ValidationError("Настройки следующих действий должны быть объектом.")
+		for key, option in section.items():
+			if key not in next_best_actions.DEFAULT_CONFIGURATION:
+				raise serializers.ValidationError(f"Неизвестный параметр следующих действий: {key}.")
+			if key == "rules":
+				if not isinstance(option, list) or any(code not in next_best_actions.RULES for code in option):
+					known = ", ".join(sorted(next_best_actions.RULES))
+					raise serializers.ValidationError(f"Допустимые правила следующих действий: {known}.")
+			elif isinstance(option, bool) or not isinstance(option, int) or option < 0:
+				raise serializers.ValidationError(f"Параметр {key} должен быть неотрицательным целым числом.")
+
+
 class RfmScoreSerializer(serializers.Serializer):
 	customer_id = serializers.IntegerField()
 	recency = serializers.IntegerField(allow_null=True)
@@ -103,15 +306,188 @@ class RfmScoreSerializer(serializers.Serializer):
 	monetary = serializers.FloatField()
 
 
-class SalesMetricsSerializer(serializers.Serializer):
+class ChurnRiskQuerySerializer(serializers.Serializer):
+	min_probability = serializers.FloatField(min_value=0, max_value=1, default=0.5)
+	offset = serializers.IntegerField(min_value=0, default=0)
+	limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
+
+class ChurnRiskSerializer(serializers.Serializer):
+	contact_id = serializers.IntegerField()
+	name = serializers.CharField()
+	email = serializers.CharField(allow_blank=True)
+	churn_probability = serializers.FloatField()
+	value_at_risk = serializers.DecimalField(max_digits=14, decimal_places=2)
+	average_order_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+	orders_count = serializers.IntegerField()
+	mean_interval_days = serializers.FloatField(allow_null=True)
+	days_since_last_order = serializers.FloatField()
+	last_order_at = serializers.DateTimeField()
+
+
+class CohortQuerySerializer(serializers.Serializer):
+	cohort_by = serializers.ChoiceField(choices=cohorts.COHORT_TYPES, default=cohorts.FIRST_ORDER)
+	periods = serializers.IntegerField(min_value=1, max_value=cohorts.MAX_PERIODS, default=cohorts.DEFAULT_PERIODS)
+	start = serializers.DateField(required=False)
+	end = serializers.DateField(required=False)
+	
+	def validate(self, attrs):
+		start, end = attrs.get("start"), attrs.get("end")
+		if start and end and start > end:
+			raise serializers.ValidationError("Дата начала периода не может быть позже даты окончания.")
+		return attrs
+
+
+class CohortRowSerializer(serializers.Serializer):
+	cohort = serializers.CharField()
+	size = serializers.IntegerField()
+	customers = serializers.ListField(child=serializers.IntegerField())
+	retention = serializers.ListField(child=serializers.FloatField())
+	revenue = serializers.ListField(child=serializers.FloatField())
+
+
+class CohortMatrixSerializer(serializers.Serializer):
+	cohort_by = serializers.CharField()
+	periods = serializers.ListField(child=serializers.IntegerField())
+	cohorts = CohortRowSerializer(many=True)
+
+
+class FunnelQuerySerializer(serializers.Serializer):
+	pipeline_id = serializers.IntegerField(min_value=1, required=False)
+	since = serializers.DateField(required=False, help_text="Only opportunities that entered the pipeline on or after this day")
+
+
+class FunnelStageSerializer(serializers.Serializer):
+	stage_id = serializers.IntegerField()
+	name = serializers.CharField()
+	position = serializers.IntegerField()
+	is_won = serializers.BooleanField()
+	entered = serializers.IntegerField()
+	reached = serializers.IntegerField()
+	current = serializers.IntegerField()
+	conversion_to_next = serializers.FloatField(allow_null=True)
+	median_days_in_stage = serializers.FloatField(allow_null=True)
+
+
+class FunnelTransitionSerializer(serializers.Serializer):
+	from_stage_id = serializers.IntegerField()
+	to_stage_id = serializers.IntegerField()
+	count = serializers.IntegerField()
+
+
+class PipelineFunnelSerializer(serializers.Serializer):
+	pipeline_id = serializers.IntegerField()
+	pipeline_name = serializers.CharField()
+	opportunities = serializers.IntegerField()
+	open = serializers.IntegerField()
+	won = serializers.IntegerField()
+	win_rate = serializers.FloatField(allow_null=True)
+	average_won_amount = serializers.FloatField(allow_null=True)
+	average_cycle_days = serializers.FloatField(allow_null=True)
+	velocity_per_day = serializers.FloatField(allow_null=True)
+	stages = FunnelStageSerializer(many=True)
+	transitions = FunnelTransitionSerializer(many=True)
+
+
+class PipelineForecastQuerySerializer(serializers.Serializer):
+	start = serializers.DateField(required=False, help_text="Earliest close date")
+	end = serializers.DateField(required=False, help_text="Latest close date")
+	pipeline_id = serializers.IntegerField(min_value=1, required=False)
+	owner_id = serializers.IntegerField(min_value=1, required=False)
+	
+	def validate(self, attrs):
+		start, end = attrs.get("start"), attrs.get("end")
+		if start and end and start > end:
+			raise serializers.ValidationError("Дата начала периода не может быть позже даты окончания.")
+		return attrs
+
+
+class PipelineForecastRowSerializer(serializers.Serializer):
+	close_month = serializers.DateField(allow_null=True)
+	pipeline_id = serializers.IntegerField()
+	pipeline_name = serializers.CharField()
+	owner_id = serializers.IntegerField(allow_null=True)
+	owner = serializers.CharField(allow_null=True)
+	category = serializers.ChoiceField(choices=pipeline_forecast.CATEGORIES)
+	deals = serializers.IntegerField()
+	amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+	weighted_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+
+
+class PipelineForecastTotalSerializer(serializers.Serializer):
+	deals = serializers.IntegerField()
+	amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+	weighted_amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+	closed_won = serializers.DecimalField(max_digits=18, decimal_places=2)
+	commit = serializers.DecimalField(max_digits=18, decimal_places=2, help_text="Closed won plus commit deals")
+	best_case = serializers.DecimalField(max_digits=18, decimal_places=2, help_text="Commit plus best case deals")
+
+
+class PipelineForecastMonthSerializer(PipelineForecastTotalSerializer):
+	close_month = serializers.DateField(allow_null=True)
+
+
+class PipelineForecastSerializer(serializers.Serializer):
+	rows = PipelineForecastRowSerializer(many=True)
+	months = PipelineForecastMonthSerializer(many=True)
+	totals = PipelineForecastTotalSerializer()
+
+
+class ForecastDriftQuerySerializer(serializers.Serializer):
+	weeks = serializers.IntegerField(min_value=2, max_value=104, default=pipeline_forecast.DEFAULT_DRIFT_WEEKS)
+	pipeline_id = serializers.IntegerField(min_value=1, required=False)
+	owner_id = serializers.IntegerField(min_value=1, required=False)
+
+
+class ForecastDriftPointSerializer(PipelineForecastTotalSerializer):
+	week_start = serializers.DateField()
+
+
+class ForecastDriftSerializer(serializers.Serializer):
+	close_month = serializers.DateField(allow_null=True)
+	points = ForecastDriftPointSerializer(many=True)
+	change = serializers.DictField(child=serializers.DecimalField(max_digits=18, decimal_places=2))
+
+
+class SalesMetricsQuerySerializer(serializers.Serializer):
+	start = serializers.DateField(required=False)
+	end = serializers.DateField(required=False)
+	compare = serializers.ChoiceField(choices=metrics.COMPARISONS, required=False)
+	
+	def validate(self, attrs):
+		start, end = attrs.get("start"), attrs.get("end")
+		if start and end and start > end:
+			raise serializers.ValidationError("Дата начала периода не может быть позже даты окончания.")
+		if attrs.get("compare") and not (start and end):
+			raise serializers.ValidationError("Для сравнения укажите начало и конец периода.")
+		return attrs
+
+
+class SalesKpiSerializer(serializers.Serializer):
 	total_revenue = serializers.DecimalField(max_digits=18, decimal_places=2)
+	net_revenue = serializers.DecimalField(max_digits=18, decimal_places=2)
+	discounts = serializers.DecimalField(max_digits=18, decimal_places=2)
 	average_order_value = serializers.DecimalField(max_digits=18, decimal_places=2)
 	orders_count = serializers.IntegerField()
+	units_sold = serializers.IntegerField()
+	line_count = serializers.IntegerField()
+	customers = serializers.IntegerField()
+	period_start = serializers.DateField(allow_null=True)
+	period_end = serializers.DateField(allow_null=True)
+
+
+class SalesMetricsSerializer(SalesKpiSerializer):
+	comparison = SalesKpiSerializer(required=False)
+	change = serializers.DictField(child=serializers.FloatField(allow_null=True), required=False)
 
 
 class AnalyticsAnomalySerializer(serializers.Serializer):
 	type = serializers.CharField()
 	message = serializers.CharField()
+	metric = serializers.CharField()
+	day = serializers.DateField()
+	severity = serializers.CharField()
+	z_score = serializers.FloatField(allow_null=True)
 
 
 class PriceRecommendationSerializer(serializers.Serializer):
@@ -128,6 +504,7 @@ class PriceRecommendationSerializer(serializers.Serializer):
 
 class PriceRecommendationResultSerializer(serializers.Serializer):
 	generated_at = serializers.DateTimeField()
+	thresholds = serializers.DictField(child=serializers.FloatField(), required=False)
 	recommendations = PriceRecommendationSerializer(many=True)
 
 
@@ -137,12 +514,32 @@ class ProductDemandEntrySerializer(serializers.Serializer):
 	velocity = serializers.FloatField()
 
 
+class ProductDemandVariantForecastSerializer(ProductDemandEntrySerializer):
+	method = serializers.CharField()
+	total = serializers.FloatField()
+	lower = serializers.FloatField()
+	upper = serializers.FloatField()
+	weekly = serializers.ListField(child=serializers.FloatField())
+	weekly_lower = serializers.ListField(child=serializers.FloatField())
+	weekly_upper = serializers.ListField(child=serializers.FloatField())
+
+
 class ProductDemandForecastSerializer(serializers.Serializer):
+	forecast_id = serializers.IntegerField()
+	generated_at = serializers.DateTimeField()
+	horizon_days = serializers.IntegerField()
 	high_demand = ProductDemandEntrySerializer(many=True)
 	low_velocity = ProductDemandEntrySerializer(many=True)
+	forecasts = ProductDemandVariantForecastSerializer(many=True)
+
+
+class NextBestActionPageSerializer(serializers.Serializer):
+	offset = serializers.IntegerField(min_value=0, default=0)
+	limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
 
 
 class NextBestActionSerializer(serializers.Serializer):
 	opportunity_id = serializers.IntegerField()
+	rule = serializers.CharField()
 	summary = serializers.CharField()
 	reason = serializers.CharField()
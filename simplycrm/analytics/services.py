@@ -1,15 +1,26 @@
 """High-level analytics services and predictive helpers."""
 from __future__ import annotations
 
-from datetime import date, timedelta
-from decimal import Decimal
+from datetime import date
 from typing import Iterable
 
-from django.db.models import Avg, F, Sum
+from django.db.models import Count, OuterRef, Subquery
 from django.db.models.functions import Coalesce
-from django.utils import timezone
-from simplycrm.catalog.models import InventoryLot, ProductVariant
-from simplycrm.sales.models import DealActivity, Opportunity, Order, OrderLine
+
+from simplycrm.analytics import (
+	anomalies,
+	churn,
+	cohorts,
+	forecasting,
+	funnel,
+	metrics,
+	next_best_actions,
+	pipeline_forecast,
+	pricing,
+)
+from simplycrm.analytics.cache import versioned
+from simplycrm.core import versioning
+from simplycrm.sales.models import Order
 
 
 def calculate_rfm_scores(orders: Iterable[Order]) -> list[dict[str, object]]:
@@ -28,190 +39,143 @@ def calculate_rfm_scores(orders: Iterable[Order]) -> list[dict[str, object]]:
 	return results
 
 
-def aggregate_sales_metrics(organization_id: int) -> dict[str, Decimal | int]:
-	"""Aggregate key sales metrics for dashboards."""
-	lines = OrderLine.objects.filter(order__organization_id=organization_id)
-	total_revenue = lines.aggregate(total=Sum(F("unit_price") * F("quantity")))
-	average_order_value = lines.aggregate(avg=Avg(F("unit_price") * F("quantity")))
-	orders_count = Order.objects.filter(organization_id=organization_id).count()
-	return {
-		"total_revenue": total_revenue["total"] or Decimal("0.00"),
-		"average_order_value": average_order_value["avg"] or Decimal("0.00"),
-		"orders_count": orders_count,
-	}
+@versioned("rfm", versioning.SALES, daily=True)
+def customer_rfm_scores(organization_id: int) -> list[dict[str, object]]:
+	"""RFM scores of every order of the organization without per-order count queries."""
+	
+	contact_orders = (
+		Order.objects.filter(contact_id=OuterRef("contact_id"))
+		.order_by()
+		.values("contact_id")
+		.annotate(total=Count("id"))
+		.values("total")
+	)
+	orders = (
+		Order.objects.filter(organization_id=organization_id)
+		.annotate(contact_orders=Coalesce(Subquery(contact_orders), 1))
+		.prefetch_related("lines")
+	)
+	today = date.today()
+	return [
+		{
+			"customer_id": order.contact_id or order.organization_id,
+			"recency": (today - order.ordered_at.date()).days if order.ordered_at else None,
+			"frequency": order.contact_orders,
+			"monetary": float(order.total_amount()),
+		}
+		for order in orders
+	]
 
 
-def detect_sales_anomalies(organization_id: int) -> list[dict[str, object]]:
-	"""Placeholder anomaly detection using simple heuristics."""
-	metrics = aggregate_sales_metrics(organization_id)
-	anomalies: list[dict[str, object]] = []
-	if metrics["orders_count"] > 0 and metrics["average_order_value"] == Decimal("0.00"):
-		anomalies.append({"type": "low_aov", "message": "Average order value is zero despite orders."})
-	return anomalies
+@versioned("sales-metrics", versioning.SALES, daily=True)
+def aggregate_sales_metrics(
+	organization_id: int,
+	period: metrics.Period | None = None,
+	*,
+	compare: str | None = None,
+) -> dict[str, object]:
+	"""Aggregate key sales metrics for dashboards."""
+	return metrics.sales_kpis(organization_id, period, compare=compare, use_cache=False)
 
 
-def _order_lines_for_org(organization_id: int):
-	return OrderLine.objects.filter(order__organization_id=organization_id)
+@versioned("anomalies", versioning.SALES, daily=True)
+def detect_sales_anomalies(organization_id: int) -> list[dict[str, object]]:
+	"""Close pending days in the streaming detector and return recent anomalies."""
+	anomalies.close_days(organization_id)
+	return anomalies.recent_anomalies(organization_id)
 
 
+@versioned("price-recommendations", versioning.SALES, versioning.CATALOG, versioning.SETTINGS, daily=True)
 def recommend_price_actions(organization_id: int) -> dict[str, object]:
 	"""Suggest price adjustments based on velocity and margin signals."""
 	
-	window_start = timezone.now() - timedelta(days=30)
-	lines_qs = (
-		_order_lines_for_org(organization_id)
-		.filter(order__ordered_at__gte=window_start)
-		.values("product_variant")
-		.annotate(
-			units_sold=Coalesce(Sum("quantity"), 0),
-			revenue=Coalesce(Sum(F("unit_price") * F("quantity")), Decimal("0.00")),
-			avg_discount=Coalesce(Avg("discount_amount"), Decimal("0.00")),
-		)
-	)
-	lines = list(lines_qs)
-	inventory = (
-		InventoryLot.objects.filter(variant__product__organization_id=organization_id)
-		.values("variant")
-		.annotate(total_stock=Coalesce(Sum("quantity"), 0))
-	)
-	inventory_map = {item["variant"]: item["total_stock"] for item in inventory}
-	variant_ids = [row["product_variant"] for row in lines]
-	variants = ProductVariant.objects.select_related("product").in_bulk(variant_ids)
-	
-	recommendations: list[dict[str, object]] = []
-	for row in lines:
-		variant_id = row["product_variant"]
-		variant = variants.get(variant_id)
-		if not variant:
-			continue
-		stock = inventory_map.get(variant_id, 0)
-		units_sold = row["units_sold"] or 0
-		revenue = row["revenue"] or Decimal("0.00")
-		avg_price = (revenue / units_sold) if units_sold else variant.price
-		margin = float(avg_price - variant.cost)
-		coverage_weeks = (stock / units_sold * 4) if units_sold else float("inf")
-		
-		if units_sold == 0 and stock > 0:
-			action = "consider_discount"
-			reason = "Inventory is not moving over the last month."
-		elif coverage_weeks < 2:
-			action = "raise_price"
-			reason = "Demand is outpacing supply; margin headroom available."
-		elif margin < 1:
-			action = "review_costs"
-			reason = "Margin is extremely low; verify vendor pricing or adjust list price."
-		else:
-			action = "monitor"
-			reason = "Performance is within healthy thresholds."
-		
-		recommendations.append(
-			{
-				"variant_id": variant_id,
-				"variant_name": f"{variant.product.name} / {variant.name}",
-				"units_sold": units_sold,
-				"stock_on_hand": stock,
-				"coverage_weeks": round(coverage_weeks, 2) if coverage_weeks != float("inf") else None,
-				"margin": round(margin, 2),
-				"action": action,
-				"reason": reason,
-				"trend_label": "high" if coverage_weeks < 2 else "low" if units_sold == 0 else "steady",
-			}
-		)
-	
-	return {"generated_at": timezone.now().isoformat(), "recommendations": recommendations}
+	return pricing.recommend_price_actions(organization_id, use_cache=False)
 
 
-def forecast_product_demand(organization_id: int) -> dict[str, list[dict[str, object]]]:
-	"""Estimate demand velocity for each variant using a trailing window."""
+@versioned("demand-forecast", versioning.FORECASTS)
+def forecast_product_demand(organization_id: int) -> dict[str, object]:
+	"""Return the latest precomputed demand forecast, generating one if none exists."""
 	
-	window_start = timezone.now() - timedelta(days=56)
-	lines_qs = (
-		_order_lines_for_org(organization_id)
-		.filter(order__ordered_at__gte=window_start)
-		.values("product_variant")
-		.annotate(units=Coalesce(Sum("quantity"), 0))
-	)
-	lines = list(lines_qs)
-	variant_ids = [row["product_variant"] for row in lines]
-	variants = ProductVariant.objects.select_related("product").in_bulk(variant_ids)
-	weeks = max((timezone.now() - window_start).days / 7, 1)
+	forecast = forecasting.latest_demand_forecast(organization_id)
+	if forecast is None:
+		forecast = forecasting.generate_demand_forecast(organization_id)
+	configuration = forecasting.get_configuration(forecast.configuration)
+	entries = forecast.result.get("variants", [])
 	
 	high_demand: list[dict[str, object]] = []
 	low_velocity: list[dict[str, object]] = []
+	for entry in entries:
+		summary = {key: entry[key] for key in ("variant_id", "variant_name", "velocity")}
+		if entry["velocity"] >= configuration["high_demand_velocity"]:
+			high_demand.append(summary)
+		elif entry["velocity"] < configuration["low_velocity"]:
+			low_velocity.append(summary)
 	
-	for row in lines:
-		variant = variants.get(row["product_variant"])
-		if not variant:
-			continue
-		velocity = float(row["units"]) / weeks
-		entry = {
-			"variant_id": variant.id,
-			"variant_name": f"{variant.product.name} / {variant.name}",
-			"velocity": round(velocity, 2),
-		}
-		if velocity >= 10:
-			high_demand.append(entry)
-		elif velocity < 2:
-			low_velocity.append(entry)
-	
-	return {"high_demand": high_demand, "low_velocity": low_velocity}
+	return {
+		"forecast_id": forecast.id,
+		"generated_at": forecast.result.get("generated_at"),
+		"horizon_days": forecast.horizon_days,
+		"high_demand": high_demand,
+		"low_velocity": low_velocity,
+		"forecasts": entries,
+	}
 
 
-def suggest_next_best_actions(organization_id: int) -> list[dict[str, object]]:
+@versioned("next-best-actions", versioning.PIPELINE, daily=True)
+def suggest_next_best_actions(
+	organization_id: int, *, offset: int = 0, limit: int = next_best_actions.DEFAULT_PAGE_SIZE
+) -> list[dict[str, object]]:
 	"""Propose next best actions for opportunities based on deal signals."""
 	
-	upcoming_actions: list[dict[str, object]] = []
-	cutoff = timezone.now() - timedelta(days=5)
+	return next_best_actions.suggest_next_best_actions(organization_id, offset=offset, limit=limit)
+
+
+def list_churn_risks(
+	organization_id: int, *, min_probability: float = 0.5, offset: int = 0, limit: int = 50
+) -> list[dict[str, object]]:
+	"""Return at-risk customers ordered by the revenue at risk."""
 	
-	opportunities = (
-		Opportunity.objects.filter(organization_id=organization_id)
-		.select_related("owner", "stage", "pipeline")
-		.order_by("-amount")[:50]
-	)
-	for opp in opportunities:
-		recent_activity = opp.activities.filter(completed_at__gte=cutoff).first()
-		next_due = opp.activities.filter(completed_at__isnull=True).order_by("due_at").first()
-		if not next_due:
-			upcoming_actions.append(
-				{
-					"opportunity_id": opp.id,
-					"summary": f"Schedule follow-up for {opp.name}",
-					"reason": "No upcoming activity is scheduled.",
-				}
-			)
-		elif next_due.due_at and next_due.due_at < timezone.now():
-			upcoming_actions.append(
-				{
-					"opportunity_id": opp.id,
-					"summary": f"Complete overdue task '{next_due.subject}'",
-					"reason": "Next best action is overdue; completing it keeps pipeline velocity healthy.",
-				}
-			)
-		elif not recent_activity:
-			upcoming_actions.append(
-				{
-					"opportunity_id": opp.id,
-					"summary": f"Engage {opp.name} with a touchpoint",
-					"reason": "No recent activity in the past 5 days.",
-				}
-			)
+	scores = churn.at_risk_contacts(organization_id, min_probability=min_probability)[offset : offset + limit]
+	return [
+		{
+			"contact_id": score.contact_id,
+			"name": str(score.contact).strip(),
+			"email": score.contact.email,
+			"churn_probability": score.churn_probability,
+			"value_at_risk": score.value_at_risk,
+			"average_order_value": score.average_order_value,
+			"orders_count": score.orders_count,
+			"mean_interval_days": score.mean_interval_days,
+			"days_since_last_order": score.days_since_last_order,
+			"last_order_at": score.last_order_at,
+		}
+		for score in scores
+	]
+
+
+@versioned("cohorts", versioning.SALES, versioning.CONTACTS, versioning.PIPELINE)
+def build_cohort_matrix(organization_id: int, **options) -> dict[str, object]:
+	"""Return cohort retention and revenue matrices for the organization."""
 	
-	dormant_leads = (
-		DealActivity.objects.filter(
-			opportunity__organization_id=organization_id,
-			completed_at__isnull=True,
-			due_at__lt=timezone.now(),
-		)
-		.select_related("opportunity")
-		.order_by("due_at")[:20]
-	)
-	for activity in dormant_leads:
-		upcoming_actions.append(
-			{
-				"opportunity_id": activity.opportunity_id,
-				"summary": f"Re-engage on '{activity.subject}'",
-				"reason": "Task is overdue and may jeopardize the deal.",
-			}
-		)
+	return cohorts.cohort_matrix(organization_id, **options, use_cache=False)
+
+
+@versioned("funnel", versioning.PIPELINE, daily=True)
+def pipeline_funnels(organization_id: int, **options) -> list[dict[str, object]]:
+	"""Return stage conversion, time-in-stage and velocity for each pipeline."""
+	
+	return funnel.pipeline_funnels(organization_id, **options)
+
+
+@versioned("pipeline-forecast", versioning.PIPELINE, versioning.SETTINGS)
+def pipeline_revenue_forecast(organization_id: int, **filters) -> dict[str, object]:
+	"""Return the probability-weighted pipeline by close month, pipeline, owner and category."""
+	
+	return pipeline_forecast.pipeline_forecast(organization_id, **filters)
+
+
+@versioned("forecast-drift", versioning.FORECASTS, daily=True)
+def pipeline_forecast_drift(organization_id: int, **options) -> list[dict[str, object]]:
+	"""Return how the weekly forecast snapshots of each close month moved."""
 	
-	return upcoming_actions
+	return pipeline_forecast.forecast_drift(organization_id, **options)
@@ -0,0 +1,149 @@
+"""Signal receivers that keep analytics data versions, contact change stamps and snapshot dirty days in sync with writes."""
+from __future__ import annotations
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from simplycrm.analytics import models, snapshots
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import versioning
+from simplycrm.sales import models as sales_models
+
+
+TRACKED_MODELS = (
+	(sales_models.Order, versioning.SALES, lambda instance: instance.organization_id),
+	(sales_models.OrderLine, versioning.SALES, lambda instance: instance.order.organization_id),
+	(sales_models.Company, versioning.CONTACTS, lambda instance: instance.organization_id),
+	(sales_models.Contact, versioning.CONTACTS, lambda instance: instance.organization_id),
+	(sales_models.Lead, versioning.PIPELINE, lambda instance: instance.organization_id),
+	(sales_models.Opportunity, versioning.PIPELINE, lambda instance: instance.organization_id),
+	(sales_models.DealStage, versioning.PIPELINE, lambda instance: instance.pipeline.organization_id),
+	(sales_models.DealActivity, versioning.PIPELINE, lambda instance: instance.opportunity.organization_id),
+	(catalog_models.Product, versioning.CATALOG, lambda instance: instance.organization_id),
+	(catalog_models.ProductVariant, versioning.CATALOG, lambda instance: instance.product.organization_id),
+	(catalog_models.PriceHistory, versioning.CATALOG, lambda instance: instance.variant.product.organization_id),
+	(models.AnalyticsSettings, versioning.SETTINGS, lambda instance: instance.organization_id),
+	(models.Forecast, versioning.FORECASTS, lambda instance: instance.organization_id),
+)
+
+# Segment refreshes re-evaluate contacts whose ``updated_at`` moved, so
+# changes to a contact's orders and leads touch the contact as well. Company
+# edits touch the company's contacts and an order moved to another contact
+# touches the previous one (see the receivers below).
+CONTACT_SOURCES = (
+	(sales_models.Order, lambda instance: instance.contact_id),
+	(sales_models.OrderLine, lambda instance: instance.order.contact_id),
+	(sales_models.Lead, lambda instance: instance.contact_id),
+)
+
+# Parquet snapshots re-export only the order days marked here: the day of a
+# written order or line, and the days of orders whose contact or opportunity
+# is detached (SET NULL) or whose opportunity moves to another pipeline.
+SNAPSHOT_SOURCES = (
+	(sales_models.Order, lambda instance: (instance.organization_id, instance.ordered_at)),
+	(sales_models.OrderLine, lambda instance: (instance.order.organization_id, instance.order.ordered_at)),
+)
+
+
+def _make_receiver(scope, resolve_organization):
+	def receiver(sender, instance, **kwargs):
+		try:
+			organization_id = resolve_organization(instance)
+		except ObjectDoesNotExist:  # pragma: no cover - parent removed in the same cascade
+			return
+		versioning.bump_data_version(organization_id, scope)
+	
+	return receiver
+
+
+def _make_contact_receiver(resolve_contact):
+	def receiver(sender, instance, **kwargs):
+		try:
+			contact_id = resolve_contact(instance)
+		except ObjectDoesNotExist:  # pragma: no cover - parent removed in the same cascade
+			return
+		if contact_id is not None:
+			sales_models.Contact.objects.filter(pk=contact_id).update(updated_at=timezone.now())
+	
+	return receiver
+
+
+def _touch_company_contacts(sender, instance, **kwargs):
+	"""Company name and industry are contact segment fields; re-evaluate its contacts."""
+	
+	sales_models.Contact.objects.filter(company_id=instance.pk).update(updated_at=timezone.now())
+
+
+def _track_moved_order(sender, instance, raw=False, update_fields=None, **kwargs):
+	"""An order moved to another contact or day changes the previous contact and snapshot day too."""
+	
+	if raw or instance.pk is None or (update_fields is not None and not {"contact", "ordered_at"} & set(update_fields)):
+		return
+	previous = sales_models.Order.objects.filter(pk=instance.pk).values_list("contact_id", "ordered_at").first()
+	if previous is None:
+		return
+	contact_id, ordered_at = previous
+	if contact_id is not None and contact_id != instance.contact_id:
+		sales_models.Contact.objects.filter(pk=contact_id).update(updated_at=timezone.now())
+	if ordered_at != instance.ordered_at:
+		snapshots.mark_days_dirty(instance.organization_id, [ordered_at])
+
+
+def _make_snapshot_receiver(resolve_day):
+	def receiver(sender, instance, **kwargs):
+		try:
+			organization_id, ordered_at = resolve_day(instance)
+		except ObjectDoesNotExist:  # pragma: no cover - parent removed in the same cascade
+			return
+		snapshots.mark_days_dirty(organization_id, [ordered_at])
+	
+	return receiver
+
+
+def _mark_detached_order_days(sender, instance, **kwargs):
+	"""Orders keep their rows when a contact or opportunity is deleted, but lose its id."""
+	
+	orders = instance.orders.all()
+	snapshots.mark_days_dirty(instance.organization_id, orders.values_list("ordered_at", flat=True))
+
+
+def _mark_repipelined_order_days(sender, instance, raw=False, **kwargs):
+	if raw or instance.pk is None:
+		return
+	previous = sales_models.Opportunity.objects.filter(pk=instance.pk).values_list("pipeline_id", flat=True).first()
+	if previous is not None and previous != instance.pipeline_id:
+		_mark_detached_order_days(sender, instance)
+
+
+def _bump_contact_deletions(sender, instance, **kwargs):
+	versioning.bump_data_version(instance.organization_id, versioning.CONTACT_DELETIONS)
+
+
+def connect() -> None:
+	for model, scope, resolve_organization in TRACKED_MODELS:
+		receiver = _make_receiver(scope, resolve_organization)
+		uid = f"analytics-version-{model._meta.label_lower}"
+		post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-save")
+		post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-delete")
+	for model, resolve_contact in CONTACT_SOURCES:
+		receiver = _make_contact_receiver(resolve_contact)
+		uid = f"analytics-contact-{model._meta.label_lower}"
+		post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-save")
+		post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-delete")
+	for model, resolve_day in SNAPSHOT_SOURCES:
+		receiver = _make_snapshot_receiver(resolve_day)
+		uid = f"analytics-snapshot-{model._meta.label_lower}"
+		post_save.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-save")
+		post_delete.connect(receiver, sender=model, weak=False, dispatch_uid=f"{uid}-delete")
+	for signal, model, receiver, name in (
+		(post_save, sales_models.Company, _touch_company_contacts, "contact-company-save"),
+		# Before the delete, while the contacts still reference the company (they are detached with SET NULL).
+		(pre_delete, sales_models.Company, _touch_company_contacts, "contact-company-delete"),
+		(pre_save, sales_models.Order, _track_moved_order, "order-move"),
+		(post_delete, sales_models.Contact, _bump_contact_deletions, "contact-delete"),
+		(pre_delete, sales_models.Contact, _mark_detached_order_days, "snapshot-contact-delete"),
+		(pre_delete, sales_models.Opportunity, _mark_detached_order_days, "snapshot-opportunity-delete"),
+		(pre_save, sales_models.Opportunity, _mark_repipelined_order_days, "snapshot-opportunity-move"),
+	):
+		signal.connect(receiver, sender=model, dispatch_uid=f"analytics-{name}")
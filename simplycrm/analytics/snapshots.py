@@ -0,0 +1,294 @@
+"""Columnar Parquet snapshots of tenant sales data.
+
+Order lines of an organization are exported as a fact table partitioned by
+order day (``order_date=YYYY-MM-DD``) under ``ANALYTICS_SNAPSHOT_ROOT``.
+Exports are incremental: writes to orders, order lines and the contacts and
+opportunities they reference mark their order days in
+:class:`~simplycrm.analytics.models.SnapshotDirtyDay` (see
+``analytics.signals``), and an export fingerprints only those days. Days
+whose fingerprint differs from the manifest are rewritten and partitions of
+days that no longer have lines are removed. The first export and
+``full=True`` fingerprint every day; writes that bypass model signals, such
+as ``QuerySet.update``, are only picked up by a full export. Variant,
+contact and pipeline dimensions are small and rewritten on every export.
+Readers memory-map the files and join the dimensions in pandas, so heavy
+analysis can run off the OLTP database.
+
+``pyarrow`` is an optional dependency; :func:`require_pyarrow` raises
+:class:`~django.core.exceptions.ImproperlyConfigured` when it is missing.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import reduce
+from operator import or_
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from simplycrm.analytics import models
+from simplycrm.catalog.models import ProductVariant
+from simplycrm.sales.models import Contact, OrderLine, Pipeline
+
+try:  # pragma: no cover - optional dependency
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+	pa = pq = None
+
+
+FACT_TABLE = "order_lines"
+PARTITION_KEY = "order_date"
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+FINGERPRINT_CHUNK_SIZE = 5000
+
+FACT_FIELDS = {
+	"line_id": "id",
+	"order_id": "order_id",
+	"ordered_at": "order__ordered_at",
+	"order_status": "order__status",
+	"currency": "order__currency",
+	"contact_id": "order__contact_id",
+	"opportunity_id": "order__opportunity_id",
+	"pipeline_id": "order__opportunity__pipeline_id",
+	"variant_id": "product_variant_id",
+	"quantity": "quantity",
+	"unit_price": "unit_price",
+	"discount_amount": "discount_amount",
+}
+MONEY_COLUMNS = ("unit_price", "discount_amount")
+DIMENSIONS: dict[str, dict[str, str]] = {
+	"variants": {
+		"variant_id": "id",
+		"variant_name": "name",
+		"variant_sku": "sku",
+		"product_id": "product_id",
+		"product_name": "product__name",
+		"category_id": "product__category_id",
+		"category_name": "product__category__name",
+	},
+	"contacts": {
+		"contact_id": "id",
+		"contact_email": "email",
+		"company_name": "company__name",
+		"industry": "company__industry",
+	},
+	"pipelines": {"pipeline_id": "id", "pipeline_name": "name"},
+}
+JOIN_KEYS = {"variants": "variant_id", "contacts": "contact_id", "pipelines": "pipeline_id"}
+
+
+def require_pyarrow() -> None:
+	if pq is None:
+		raise ImproperlyConfigured("Для снимков Parquet требуется пакет pyarrow.")
+
+
+def snapshot_root(organization_id: int) -> Path:
+	return Path(settings.ANALYTICS_SNAPSHOT_ROOT) / str(organization_id)
+
+
+def read_manifest(organization_id: int) -> dict[str, Any]:
+	path = snapshot_root(organization_id) / MANIFEST_NAME
+	if not path.exists():
+		return {"version": MANIFEST_VERSION, "partitions": {}, "dimensions": {}}
+	return json.loads(path.read_text())
+
+
+def _write_manifest(organization_id: int, manifest: dict[str, Any]) -> None:
+	path = snapshot_root(organization_id) / MANIFEST_NAME
+	temporary = path.with_suffix(".tmp")
+	temporary.write_text(json.dumps(manifest, indent=2, sort_keys=True, default=str))
+	temporary.replace(path)
+
+
+def _write_table(frame: pd.DataFrame, path: Path) -> None:
+	path.parent.mkdir(parents=True, exist_ok=True)
+	temporary = path.with_suffix(".tmp")
+	pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), temporary, compression="zstd")
+	temporary.replace(path)
+
+
+def mark_days_dirty(organization_id: int, moments: Iterable[datetime | None]) -> None:
+	"""Record that the order days of ``moments`` need to be fingerprinted by the next export."""
+
+	days = {timezone.localdate(moment) for moment in moments if moment is not None}
+	if not days:
+		return
+	now = timezone.now()
+	models.SnapshotDirtyDay.objects.bulk_create(
+		[models.SnapshotDirtyDay(organization_id=organization_id, day=day, marked_at=now) for day in sorted(days)],
+		update_conflicts=True,
+		unique_fields=["organization", "day"],
+		update_fields=["marked_at"],
+	)
+
+
+def _on_days(days: Iterable[str]) -> Q:
+	"""Lines of orders placed on the given local days, as index-friendly ranges."""
+
+	ranges = []
+	for day in sorted(set(days)):
+		start = timezone.make_aware(datetime.combine(date.fromisoformat(day), time.min))
+		ranges.append(Q(order__ordered_at__gte=start, order__ordered_at__lt=start + timedelta(days=1)))
+	return reduce(or_, ranges, Q(pk__in=[]))
+
+
+def day_fingerprints(organization_id: int, days: Iterable[str] | None = None) -> dict[str, str]:
+	"""Fingerprint the order lines of every order day (or only ``days``) in one ordered query.
+
+	Each day's hash covers every exported column of its lines in id order, so
+	any edit of an exported value (including ones that keep sums or lengths
+	unchanged, such as swapping contacts between lines) changes it.
+	"""
+
+	rows = OrderLine.objects.filter(order__organization_id=organization_id)
+	if days is not None:
+		rows = rows.filter(_on_days(days))
+	rows = rows.annotate(day=TruncDate("order__ordered_at")).order_by("day", "id").values_list("day", *FACT_FIELDS.values())
+	hashes: dict[str, Any] = {}
+	for day, *values in rows.iterator(chunk_size=FINGERPRINT_CHUNK_SIZE):
+		key = day.isoformat()
+		digest = hashes.get(key)
+		if digest is None:
+			digest = hashes[key] = hashlib.sha1()
+		digest.update(json.dumps(values, default=str).encode())
+		digest.update(b"\n")
+	return {day: digest.hexdigest() for day, digest in hashes.items()}
+
+
+def _fact_frame(organization_id: int, days: Sequence[str]) -> pd.DataFrame:
+	queryset = OrderLine.objects.filter(_on_days(days), order__organization_id=organization_id).order_by(
+		"order__ordered_at", "id"
+	)
+	frame = pd.DataFrame.from_records(
+		list(queryset.values_list(*FACT_FIELDS.values()).iterator()), columns=list(FACT_FIELDS)
+	)
+	for column in MONEY_COLUMNS:
+		frame[column] = frame[column].astype(float)
+	frame["net_amount"] = (frame["unit_price"] * frame["quantity"] - frame["discount_amount"]).clip(lower=0.0)
+	for column in ("contact_id", "opportunity_id", "pipeline_id"):
+		frame[column] = frame[column].astype("Int64")
+	frame["ordered_at"] = pd.to_datetime(frame["ordered_at"], utc=True)
+	frame[PARTITION_KEY] = frame["ordered_at"].dt.tz_convert(timezone.get_current_timezone_name()).dt.date.astype(str)
+	return frame
+
+
+def _dimension_frames(organization_id: int) -> dict[str, pd.DataFrame]:
+	querysets = {
+		"variants": ProductVariant.objects.filter(product__organization_id=organization_id),
+		"contacts": Contact.objects.filter(organization_id=organization_id),
+		"pipelines": Pipeline.objects.filter(organization_id=organization_id),
+	}
+	return {
+		name: pd.DataFrame.from_records(
+			list(querysets[name].order_by("id").values_list(*fields.values())), columns=list(fields)
+		)
+		for name, fields in DIMENSIONS.items()
+	}
+
+
+@dataclass
+class ExportResult:
+	days_written: int = 0
+	days_removed: int = 0
+	days_unchanged: int = 0
+	rows_written: int = 0
+
+
+def export_organization(organization_id: int, *, full: bool = False) -> ExportResult:
+	"""Bring the organization's snapshot up to date and return what changed."""
+
+	require_pyarrow()
+	root = snapshot_root(organization_id)
+	manifest = {"version": MANIFEST_VERSION, "partitions": {}, "dimensions": {}} if full else read_manifest(organization_id)
+	if full and (root / FACT_TABLE).exists():
+		shutil.rmtree(root / FACT_TABLE)
+
+	dirty = list(models.SnapshotDirtyDay.objects.filter(organization_id=organization_id).values_list("id", "day", "marked_at"))
+	partitions: dict[str, Any] = manifest["partitions"]
+	if "exported_at" in manifest:
+		candidates = {day.isoformat() for _, day, _ in dirty}
+		fingerprints = day_fingerprints(organization_id, candidates) if candidates else {}
+		removed = sorted(candidates.intersection(partitions) - set(fingerprints))
+	else:
+		fingerprints = day_fingerprints(organization_id)
+		removed = sorted(set(partitions) - set(fingerprints))
+	changed = [day for day, fingerprint in fingerprints.items() if partitions.get(day, {}).get("fingerprint") != fingerprint]
+	result = ExportResult()
+	now = timezone.now().isoformat()
+
+	if changed:
+		facts = _fact_frame(organization_id, changed)
+		for day, frame in facts.groupby(PARTITION_KEY, sort=True):
+			relative = f"{FACT_TABLE}/{PARTITION_KEY}={day}/part-0.parquet"
+			_write_table(frame.drop(columns=[PARTITION_KEY]), root / relative)
+			partitions[day] = {"fingerprint": fingerprints[day], "rows": len(frame), "file": relative, "written_at": now}
+			result.days_written += 1
+			result.rows_written += len(frame)
+	for day in removed:
+		shutil.rmtree(root / FACT_TABLE / f"{PARTITION_KEY}={day}", ignore_errors=True)
+		del partitions[day]
+		result.days_removed += 1
+
+	for name, frame in _dimension_frames(organization_id).items():
+		_write_table(frame, root / f"{name}.parquet")
+		manifest["dimensions"][name] = {"rows": len(frame), "file": f"{name}.parquet", "written_at": now}
+	manifest["exported_at"] = now
+	manifest["rows"] = sum(partition["rows"] for partition in partitions.values())
+	_write_manifest(organization_id, manifest)
+	result.days_unchanged = len(partitions) - result.days_written
+	# Days marked again while exporting keep their newer mark for the next run.
+	for pk, _, marked_at in dirty:
+		models.SnapshotDirtyDay.objects.filter(pk=pk, marked_at=marked_at).delete()
+	return result
+
+
+def read_order_lines(
+	organization_id: int,
+	*,
+	start: date | None = None,
+	end: date | None = None,
+	columns: Sequence[str] | None = None,
+	dimensions: Sequence[str] = tuple(DIMENSIONS),
+) -> pd.DataFrame:
+	"""Load the order line snapshot (optionally limited to order days) joined with dimensions."""
+
+	require_pyarrow()
+	root = snapshot_root(organization_id)
+	facts_path = root / FACT_TABLE
+	if not facts_path.exists():
+		return pd.DataFrame(columns=[*FACT_FIELDS, "net_amount"])
+	filters = []
+	if start is not None:
+		filters.append((PARTITION_KEY, ">=", start.isoformat()))
+	if end is not None:
+		filters.append((PARTITION_KEY, "<=", end.isoformat()))
+	if columns is not None:
+		columns = list(dict.fromkeys([*columns, *(JOIN_KEYS[name] for name in dimensions)]))
+	table = pq.read_table(
+		facts_path,
+		columns=columns,
+		filters=filters or None,
+		memory_map=True,
+		partitioning="hive",
+	)
+	frame = table.to_pandas()
+	if PARTITION_KEY in frame.columns:
+		frame[PARTITION_KEY] = frame[PARTITION_KEY].astype(str)
+	for name in dimensions:
+		path = root / f"{name}.parquet"
+		if path.exists():
+			dimension = pq.read_table(path, memory_map=True).to_pandas()
+			frame = frame.merge(dimension, how="left", on=JOIN_KEYS[name])
+	return frame
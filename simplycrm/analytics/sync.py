@@ -0,0 +1,283 @@
+"""Incremental synchronisation of external data sources.
+
+Every :class:`DataSource` type is served by a registered :class:`SourceReader`
+that yields record batches starting after the source's stored watermark.
+Each batch is upserted into :class:`SyncedRecord` with
+``bulk_create(update_conflicts=True)`` and the watermark advances in the same
+transaction, so an interrupted sync resumes after the last committed batch.
+Progress, throughput and lag statistics are written to the run's
+:class:`DataSyncLog`.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from simplycrm.analytics import models
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+UPSERT_CHUNK_SIZE = 1000
+UPDATE_FIELDS = ["data", "source_updated_at", "synced_at"]
+
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class Record:
+	external_id: str
+	data: dict[str, Any]
+	updated_at: datetime | None = None
+
+
+@dataclass
+class Batch:
+	records: list[Record]
+	# Reader position after this batch; stored once the batch is committed.
+	watermark: dict[str, Any] = field(default_factory=dict)
+
+
+class SourceReader:
+	"""Base class of source readers; subclasses are registered per ``source_type``."""
+
+	source_type: str = ""
+
+	def __init__(self, source: models.DataSource):
+		self.source = source
+		self.config = self.validate_config(source.config or {})
+
+	@classmethod
+	def validate_config(cls, config: dict[str, Any]) -> dict[str, Any]:
+		return config
+
+	def read(self, watermark: dict[str, Any], batch_size: int) -> Iterator[Batch]:
+		raise NotImplementedError
+
+
+READERS: dict[str, type[SourceReader]] = {}
+
+
+def register(reader: type[SourceReader]) -> type[SourceReader]:
+	READERS[reader.source_type] = reader
+	return reader
+
+
+def get_reader(source: models.DataSource) -> SourceReader:
+	try:
+		reader = READERS[source.source_type]
+	except KeyError:
+		raise ValidationError(f"Тип источника данных не поддерживается: {source.source_type}.") from None
+	return reader(source)
+
+
+def validate_config(source_type: str, config: dict[str, Any]) -> dict[str, Any]:
+	"""Validate the configuration of a registered source type; other types are stored as-is."""
+
+	reader = READERS.get(source_type)
+	return reader.validate_config(config or {}) if reader else config
+
+
+def _parse_timestamp(value: Any) -> datetime | None:
+	if isinstance(value, datetime):
+		moment = value
+	elif isinstance(value, str) and value:
+		moment = parse_datetime(value)
+		if moment is None:
+			return None
+	else:
+		return None
+	return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def organization_file_root(organization_id: int) -> Path:
+	"""Directory holding the file sources of one organization."""
+
+	return (Path(settings.DATA_SOURCE_FILE_ROOT) / str(organization_id)).resolve()
+
+
+def _inside(root: Path, path: str) -> Path:
+	directory = (root / path).resolve()
+	if not directory.is_relative_to(root):
+		raise ValidationError("Каталог источника должен находиться внутри каталога организации.")
+	return directory
+
+
+@register
+class LocalFileReader(SourceReader):
+	"""CSV and JSON Lines files in a directory under ``DATA_SOURCE_FILE_ROOT/<organization_id>/``.
+
+	Files are read in name order and treated as append-only; the watermark is
+	the current file and the number of its rows already synced. ``pattern``
+	matches file names inside the directory only.
+	"""
+
+	source_type = "local_files"
+	FORMATS = {".csv", ".jsonl"}
+
+	def __init__(self, source: models.DataSource):
+		super().__init__(source)
+		# Checked again against the real organization directory, which may contain symlinks.
+		self.directory = _inside(organization_file_root(source.organization_id), self.config["path"])
+
+	@classmethod
+	def validate_config(cls, config: dict[str, Any]) -> dict[str, Any]:
+		path = str(config.get("path", ""))
+		if Path(path).is_absolute():
+			raise ValidationError("Каталог источника должен находиться внутри каталога организации.")
+		# Relative paths must not climb out of whatever organization directory they are joined to.
+		placeholder = Path(settings.DATA_SOURCE_FILE_ROOT).resolve() / "_"
+		_inside(placeholder, path)
+		pattern = str(config.get("pattern", "*"))
+		if any(part in pattern for part in ("/", "\\", "..", "**")):
+			raise ValidationError("Шаблон файлов не может содержать '/', '..' или '**'.")
+		return {
+			"path": path,
+			"pattern": pattern,
+			"id_field": str(config.get("id_field", "id")),
+			"updated_field": str(config.get("updated_field", "updated_at")),
+		}
+
+	def files(self) -> list[Path]:
+		if not self.directory.is_dir():
+			raise ValidationError(f"Каталог источника не найден: {self.config['path']}.")
+		return sorted(
+			path
+			for path in self.directory.glob(self.config["pattern"])
+			if path.is_file() and path.suffix in self.FORMATS and path.resolve().is_relative_to(self.directory)
+		)
+
+	def rows(self, path: Path) -> Iterator[dict[str, Any]]:
+		with path.open(newline="", encoding="utf-8") as handle:
+			if path.suffix == ".csv":
+				yield from csv.DictReader(handle)
+			else:
+				for line in handle:
+					if line.strip():
+						yield json.loads(line)
+
+	def read(self, watermark: dict[str, Any], batch_size: int) -> Iterator[Batch]:
+		start_file, start_row = watermark.get("file", ""), int(watermark.get("row", 0))
+		id_field, updated_field = self.config["id_field"], self.config["updated_field"]
+		for path in self.files():
+			if path.name < start_file:
+				continue
+			skip = start_row if path.name == start_file else 0
+			records: list[Record] = []
+			position = skip
+			for index, row in enumerate(self.rows(path)):
+				if index < skip:
+					continue
+				external_id = row.get(id_field)
+				if external_id in (None, ""):
+					raise ValidationError(f"{path.name}:{index + 1}: нет поля {id_field}.")
+				records.append(Record(str(external_id), row, _parse_timestamp(row.get(updated_field))))
+				position = index + 1
+				if len(records) >= batch_size:
+					yield Batch(records, {"file": path.name, "row": position})
+					records = []
+			if records:
+				yield Batch(records, {"file": path.name, "row": position})
+
+
+def _upsert(source: models.DataSource, records: list[Record], synced_at: datetime) -> int:
+	# The last version of a record wins when a batch contains it more than once.
+	latest = {record.external_id: record for record in records}
+	models.SyncedRecord.objects.bulk_create(
+		[
+			models.SyncedRecord(
+				organization_id=source.organization_id,
+				data_source=source,
+				external_id=record.external_id,
+				data=record.data,
+				source_updated_at=record.updated_at,
+				synced_at=synced_at,
+			)
+			for record in latest.values()
+		],
+		batch_size=UPSERT_CHUNK_SIZE,
+		update_conflicts=True,
+		unique_fields=["data_source", "external_id"],
+		update_fields=UPDATE_FIELDS,
+	)
+	return len(latest)
+
+
+def sync_source(
+	source: models.DataSource,
+	*,
+	batch_size: int = DEFAULT_BATCH_SIZE,
+	max_batches: int | None = None,
+) -> models.DataSyncLog:
+	"""Pull new records of ``source`` since its watermark and record the run."""
+
+	log = models.DataSyncLog.objects.create(data_source=source, status=STATUS_RUNNING)
+	stats: dict[str, Any] = {
+		"batches": 0,
+		"records_read": 0,
+		"records_upserted": 0,
+		"watermark_start": source.watermark,
+	}
+	started = time.perf_counter()
+	newest: datetime | None = None
+	try:
+		reader = get_reader(source)
+		for batch in reader.read(dict(source.watermark or {}), batch_size):
+			now = timezone.now()
+			with transaction.atomic():
+				upserted = _upsert(source, batch.records, now)
+				source.watermark = batch.watermark
+				source.last_synced_at = now
+				source.save(update_fields=["watermark", "last_synced_at"])
+			stats["batches"] += 1
+			stats["records_read"] += len(batch.records)
+			stats["records_upserted"] += upserted
+			timestamps = [record.updated_at for record in batch.records if record.updated_at]
+			if timestamps:
+				newest = max([newest, *timestamps]) if newest else max(timestamps)
+			if max_batches and stats["batches"] >= max_batches:
+				break
+		status = STATUS_SUCCEEDED
+	except Exception as exc:  # noqa: BLE001 - the failure is recorded on the log
+		logger.exception("Sync of data source %s failed", source.pk)
+		message = "; ".join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+		stats["error"] = message[:2000]
+		status = STATUS_FAILED
+
+	elapsed = time.perf_counter() - started
+	completed_at = timezone.now()
+	stats.update(
+		{
+			"watermark_end": source.watermark,
+			"duration_seconds": round(elapsed, 3),
+			"records_per_second": round(stats["records_read"] / elapsed, 1) if elapsed else None,
+			"newest_record_at": newest.isoformat() if newest else None,
+			# How far the local copy trails the newest change seen in the source.
+			"lag_seconds": round((completed_at - newest).total_seconds(), 1) if newest else None,
+		}
+	)
+	log.status = status
+	log.stats = stats
+	log.completed_at = completed_at
+	log.save(update_fields=["status", "stats", "completed_at"])
+	return log
+
+
+def reset_watermark(source: models.DataSource) -> None:
+	source.watermark = {}
+	source.save(update_fields=["watermark"])
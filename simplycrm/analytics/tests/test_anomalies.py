@@ -0,0 +1,96 @@
+"""Tests for streaming anomaly detection."""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import anomalies, models
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class BaselineStateTests(SimpleTestCase):
+    """Score and update exponentially weighted state without touching history."""
+
+    def test_spike_is_flagged_after_warmup(self):
+        configuration = dict(anomalies.DEFAULT_CONFIGURATION)
+        baseline = anomalies._new_baseline(1, anomalies.REVENUE)
+        start = date(2024, 1, 1)
+        for offset in range(28):
+            value = 100.0 + (offset % 3) * 5
+            day = start + timedelta(days=offset)
+            self.assertIsNone(anomalies.score(baseline, value, day, configuration))
+            anomalies.update(baseline, value, day, configuration)
+
+        finding = anomalies.score(baseline, 400.0, start + timedelta(days=28), configuration)
+
+        self.assertEqual(finding["direction"], "spike")
+        self.assertEqual(finding["severity"], "critical")
+        self.assertIsNotNone(finding["seasonal_z_score"])
+        self.assertEqual(baseline.observations, 28)
+
+
+class AnomalyDetectionTests(TenantTestMixin, APITestCase):
+    """Close days incrementally and record anomalies as insights."""
+
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "watcher"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        self.today = timezone.localdate()
+        for days_ago in range(30, 1, -1):
+            self._order(self.today - timedelta(days=days_ago), 100 + (days_ago % 3) * 5)
+        self._order(self.today - timedelta(days=1), 900)
+
+    def _order(self, day, amount):
+        order = sales_models.Order.objects.create(organization=self.organization)
+        sales_models.OrderLine.objects.create(
+            order=order, product_variant=self.variant, quantity=1, unit_price=amount
+        )
+        moment = timezone.make_aware(datetime.combine(day, time(12)))
+        sales_models.Order.objects.filter(pk=order.pk).update(ordered_at=moment)
+
+    def test_close_days_records_spike_once(self):
+        insights = anomalies.close_days(self.organization.id)
+
+        metrics = {insight.data["metric"] for insight in insights}
+        self.assertIn(anomalies.REVENUE, metrics)
+        self.assertIn(anomalies.AOV, metrics)
+        self.assertNotIn(anomalies.ORDERS, metrics)
+        revenue = models.MetricBaseline.objects.get(organization=self.organization, metric=anomalies.REVENUE)
+        self.assertEqual(revenue.last_day, self.today - timedelta(days=1))
+        self.assertEqual(revenue.observations, 30)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(anomalies.close_days(self.organization.id), [])
+        self.assertEqual(models.Insight.objects.filter(organization=self.organization).count(), len(insights))
+
+    def test_next_day_is_processed_incrementally(self):
+        anomalies.close_days(self.organization.id)
+        self._order(self.today, 105)
+
+        anomalies.close_days(self.organization.id, until=self.today)
+
+        revenue = models.MetricBaseline.objects.get(organization=self.organization, metric=anomalies.REVENUE)
+        self.assertEqual(revenue.observations, 31)
+        self.assertEqual(revenue.last_value, 105)
+
+    def test_endpoint_lists_recent_anomalies(self):
+        response = self.client.get(reverse("analytics:insight-analytics-anomalies"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        types = {row["type"] for row in response.data}
+        self.assertIn("revenue_spike", types)
+        self.assertEqual(response.data[0]["day"], (self.today - timedelta(days=1)).isoformat())
@@ -0,0 +1,121 @@
+"""Tests for the versioned stale-while-revalidate analytics cache."""
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from simplycrm.analytics import cache as analytics_cache
+from simplycrm.analytics import services
+from simplycrm.analytics.tests.utils import DeferredExecutor
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.core import versioning
+from simplycrm.sales import models as sales_models
+
+
+class VersionedResultTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        analytics_cache.reset_stats()
+        self.executor = DeferredExecutor()
+        self.addCleanup(analytics_cache.set_executor, analytics_cache.set_executor(self.executor))
+        self.calls: list[tuple[int, int]] = []
+        self.value = 1
+
+        @analytics_cache.versioned("test-total", versioning.SALES)
+        def total(organization_id, *, factor=1):
+            self.calls.append((organization_id, factor))
+            if self.value is None:
+                raise RuntimeError("source unavailable")
+            return self.value * factor
+
+        self.total = total
+
+    def _bump(self, organization_id=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            versioning.bump_data_version(organization_id, versioning.SALES)
+
+    def test_results_are_keyed_by_organization_and_parameters(self):
+        self.assertEqual(self.total(1), 1)
+        self.assertEqual(self.total(1), 1)
+        self.assertEqual(self.total(1, factor=3), 3)
+        self.assertEqual(self.total(2), 1)
+
+        self.assertEqual(self.calls, [(1, 1), (1, 3), (2, 1)])
+        stats = analytics_cache.stats()["test-total"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["stale_hits"]), (1, 3, 0))
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        self.total(1)
+        self.value = 2
+        self._bump()
+
+        self.assertEqual(self.total(1), 1)
+        self.assertEqual(self.total(1), 1)
+        self.assertEqual(len(self.executor.pending), 1)
+        self.assertEqual(self.total(2), 2)
+
+        self.executor.run_all()
+        self.assertEqual(self.total(1), 2)
+        stats = analytics_cache.stats()["test-total"]
+        self.assertEqual(stats["stale_hits"], 2)
+        self.assertEqual(stats["refreshes"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreaterEqual(stats["compute_seconds_max"], 0)
+
+    @override_settings(ANALYTICS_RESULT_CACHE={"TIMEOUT": 0})
+    def test_expired_results_are_refreshed_in_the_background(self):
+        self.total(1)
+        self.value = 5
+
+        self.assertEqual(self.total(1), 1)
+        self.executor.run_all()
+        self.assertEqual(self.total(1), 5)
+
+    def test_failed_refresh_keeps_serving_the_stale_value(self):
+        self.total(1)
+        self.value = None
+        self._bump()
+
+        self.assertEqual(self.total(1), 1)
+        with self.assertLogs("simplycrm.analytics.cache", level="ERROR"):
+            self.executor.run_all()
+        self.assertEqual(self.total(1), 1)
+        self.assertEqual(len(self.executor.pending), 1)
+        self.assertEqual(analytics_cache.stats()["test-total"]["errors"], 1)
+
+
+class CustomerRfmTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        contact = sales_models.Contact.objects.create(organization=self.organization, first_name="Ann")
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        now = timezone.now()
+        for days in (3, 10):
+            order = sales_models.Order.objects.create(organization=self.organization, contact=contact)
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=variant, quantity=2, unit_price=Decimal("5.00")
+            )
+            sales_models.Order.objects.filter(pk=order.pk).update(ordered_at=now - timedelta(days=days))
+        sales_models.Order.objects.create(organization=self.organization)
+
+    def test_matches_per_order_scores_with_constant_queries(self):
+        orders = sales_models.Order.objects.filter(organization=self.organization)
+        expected = services.calculate_rfm_scores(orders)
+
+        with self.assertNumQueries(2):
+            scores = services.customer_rfm_scores.function(self.organization.id)
+        self.assertCountEqual(scores, expected)
+        self.assertEqual(services.customer_rfm_scores(self.organization.id), scores)
@@ -0,0 +1,91 @@
+"""Tests for churn risk scoring."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import churn, models, segments
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class ChurnScoringTests(TenantTestMixin, APITestCase):
+    username = "success"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        self.now = timezone.now()
+        # Weekly buyer on schedule, weekly buyer gone quiet, big monthly buyer gone quiet.
+        self.steady = self._contact("Steady", [35, 28, 21, 14, 7, 2], quantity=5)
+        self.lapsed = self._contact("Lapsed", [120, 113, 106, 99, 92], quantity=5)
+        self.whale = self._contact("Whale", [240, 210, 180, 150], quantity=100)
+        self.single = self._contact("Single", [3], quantity=1)
+
+    def _contact(self, name, days_ago, quantity):
+        contact = sales_models.Contact.objects.create(organization=self.organization, first_name=name)
+        for days in days_ago:
+            order = sales_models.Order.objects.create(organization=self.organization, contact=contact)
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=self.variant, quantity=quantity, unit_price="10.00"
+            )
+            sales_models.Order.objects.filter(pk=order.pk).update(ordered_at=self.now - timedelta(days=days))
+        return contact
+
+    def test_scores_follow_order_cadence(self):
+        with self.assertNumQueries(5):
+            scored = churn.score_contacts(self.organization.id, now=self.now)
+        self.assertEqual(scored, 4)
+        scores = {score.contact_id: score for score in models.ContactChurnScore.objects.all()}
+        self.assertLess(scores[self.steady.id].churn_probability, 0.5)
+        self.assertGreater(scores[self.lapsed.id].churn_probability, 0.99)
+        self.assertGreater(scores[self.whale.id].churn_probability, 0.9)
+        self.assertEqual(scores[self.steady.id].mean_interval_days, 6.6)
+        self.assertIsNone(scores[self.single.id].mean_interval_days)
+        self.assertGreater(scores[self.whale.id].value_at_risk, scores[self.lapsed.id].value_at_risk)
+
+        # Rescoring updates in place and drops contacts without orders.
+        sales_models.Order.objects.filter(contact=self.single).delete()
+        self.assertEqual(churn.score_contacts(self.organization.id, now=self.now + timedelta(hours=1)), 3)
+        self.assertFalse(models.ContactChurnScore.objects.filter(contact=self.single).exists())
+
+        segment = models.CustomerSegment.objects.create(
+            organization=self.organization,
+            name="At risk",
+            filter_definition={"field": "churn_probability", "op": "gte", "value": 0.9},
+        )
+        self.assertEqual(set(segments.refresh_segment(segment)), {self.lapsed.id, self.whale.id})
+
+        # Rescoring later without any order change still reaches the incremental refresh, but only
+        # contacts that crossed the segment's threshold are touched.
+        stamps = dict(sales_models.Contact.objects.values_list("id", "updated_at"))
+        churn.score_contacts(self.organization.id, now=self.now + timedelta(days=120))
+        touched = {
+            contact_id
+            for contact_id, updated_at in sales_models.Contact.objects.values_list("id", "updated_at")
+            if updated_at != stamps[contact_id]
+        }
+        self.assertEqual(touched, {self.steady.id})
+        self.assertEqual(set(segments.refresh_segment(segment)), {self.steady.id, self.lapsed.id, self.whale.id})
+
+        stamps = dict(sales_models.Contact.objects.values_list("id", "updated_at"))
+        churn.score_contacts(self.organization.id, now=self.now + timedelta(days=121))
+        self.assertEqual(dict(sales_models.Contact.objects.values_list("id", "updated_at")), stamps)
+
+    def test_endpoint_orders_by_value_at_risk(self):
+        churn.score_contacts(self.organization.id, now=self.now)
+        response = self.client.get(
+            reverse("insight-analytics-churn-risk"), {"min_probability": 0.9, "limit": 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        body = response.json()
+        self.assertEqual([row["contact_id"] for row in body], [self.whale.id, self.lapsed.id])
+        self.assertEqual(body[0]["name"], "Whale")
@@ -0,0 +1,131 @@
+"""Tests for the cohort retention engine."""
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import cache as analytics_cache
+from simplycrm.analytics import cohorts, services
+from simplycrm.analytics.tests.utils import DeferredExecutor
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class CohortTests(TenantTestMixin, APITestCase):
+    username = "growth"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        retail = sales_models.Company.objects.create(organization=self.organization, name="Shop", industry="Retail")
+        self.first = self._contact("First", retail, "ads", [(1, 5), (1, 20), (2, 3), (3, 9)])
+        self.second = self._contact("Second", retail, "ads", [(1, 11)])
+        self.third = self._contact("Third", None, "web", [(2, 14), (3, 1)])
+
+    def _contact(self, name, company, source, orders):
+        contact = sales_models.Contact.objects.create(organization=self.organization, first_name=name, company=company)
+        sales_models.Lead.objects.create(organization=self.organization, contact=contact, source=source)
+        for month, day in orders:
+            self._order(contact, month, day)
+        return contact
+
+    def _order(self, contact, month, day):
+        order = sales_models.Order.objects.create(organization=self.organization, contact=contact)
+        sales_models.OrderLine.objects.create(order=order, product_variant=self.variant, quantity=1, unit_price="10.00")
+        sales_models.Order.objects.filter(pk=order.pk).update(
+            ordered_at=timezone.make_aware(datetime(2026, month, day, 12))
+        )
+
+    def test_first_order_cohorts_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = cohorts.build_cohorts(self.organization.id, periods=3)
+        self.assertEqual(
+            result["cohorts"],
+            [
+                {
+                    "cohort": "2026-01",
+                    "size": 2,
+                    "customers": [2, 1, 1],
+                    "retention": [1.0, 0.5, 0.5],
+                    "revenue": [30.0, 10.0, 10.0],
+                },
+                {
+                    "cohort": "2026-02",
+                    "size": 1,
+                    "customers": [1, 1, 0],
+                    "retention": [1.0, 1.0, 0.0],
+                    "revenue": [10.0, 10.0, 0.0],
+                },
+            ],
+        )
+        bounded = cohorts.build_cohorts(self.organization.id, periods=3, start=date(2026, 2, 1))
+        self.assertEqual([row["cohort"] for row in bounded["cohorts"]], ["2026-02"])
+
+    def test_lead_source_and_industry_cohorts(self):
+        by_source = cohorts.build_cohorts(self.organization.id, cohort_by=cohorts.LEAD_SOURCE, periods=2)
+        self.assertEqual(
+            {row["cohort"]: row["customers"] for row in by_source["cohorts"]}, {"ads": [2, 1], "web": [1, 1]}
+        )
+        by_industry = cohorts.build_cohorts(self.organization.id, cohort_by=cohorts.INDUSTRY, periods=2)
+        self.assertEqual(
+            {row["cohort"]: row["size"] for row in by_industry["cohorts"]}, {"Retail": 2, cohorts.UNKNOWN: 1}
+        )
+
+    def test_cached_until_sales_data_changes(self):
+        url = reverse("insight-analytics-cohorts")
+        first = self.client.get(url, {"periods": 3})
+        self.assertEqual(first.status_code, status.HTTP_200_OK, first.content)
+        self.assertEqual(first.json()["cohorts"][0]["customers"], [2, 1, 1])
+
+        with self.assertNumQueries(0):
+            cached = services.build_cohort_matrix(self.organization.id, cohort_by=cohorts.FIRST_ORDER, periods=3)
+        self.assertEqual(cached["cohorts"][0]["customers"], [2, 1, 1])
+
+        executor = DeferredExecutor()
+        self.addCleanup(analytics_cache.set_executor, analytics_cache.set_executor(executor))
+        with self.captureOnCommitCallbacks(execute=True):
+            self._order(self.second, 3, 15)
+        stale = self.client.get(url, {"periods": 3})
+        self.assertEqual(stale.json()["cohorts"][0]["customers"], [2, 1, 1])
+        executor.run_all()
+        refreshed = self.client.get(url, {"periods": 3})
+        self.assertEqual(refreshed.json()["cohorts"][0]["customers"], [2, 1, 2])
+
+    def test_industry_cohorts_follow_company_and_contact_edits(self):
+        def sizes(matrix):
+            return {row["cohort"]: row["size"] for row in matrix["cohorts"]}
+
+        def refreshed():
+            services.build_cohort_matrix(self.organization.id, cohort_by=cohorts.INDUSTRY, periods=2)
+            executor.run_all()
+            matrix = services.build_cohort_matrix(self.organization.id, cohort_by=cohorts.INDUSTRY, periods=2)
+            direct = cohorts.cohort_matrix(self.organization.id, cohort_by=cohorts.INDUSTRY, periods=2)
+            self.assertEqual(sizes(matrix), sizes(direct))
+            return sizes(matrix)
+
+        executor = DeferredExecutor()
+        self.addCleanup(analytics_cache.set_executor, analytics_cache.set_executor(executor))
+        self.assertEqual(refreshed(), {"Retail": 2, cohorts.UNKNOWN: 1})
+
+        retail = sales_models.Company.objects.get(name="Shop")
+        with self.captureOnCommitCallbacks(execute=True):
+            retail.industry = "Wholesale"
+            retail.save()
+        self.assertEqual(refreshed(), {"Wholesale": 2, cohorts.UNKNOWN: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.third.company = retail
+            self.third.save()
+        self.assertEqual(refreshed(), {"Wholesale": 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.delete()
+        self.assertEqual(refreshed(), {"Wholesale": 2})
@@ -0,0 +1,168 @@
+"""Tests for batched dashboard rendering."""
+from __future__ import annotations
+
+import json
+from concurrent.futures import Executor, Future
+from datetime import date, datetime, time
+from unittest import mock
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import dashboards, metric_dsl, models
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+REVENUE = {"source": "order_lines", "measure": {"aggregate": "sum", "field": "revenue"}}
+UNITS = {"source": "order_lines", "measure": {"aggregate": "sum", "field": "quantity"}}
+ORDERS_BY_STATUS = {"source": "orders", "measure": {"aggregate": "count"}, "dimensions": ["status"]}
+DEALS = {"source": "opportunities", "measure": {"aggregate": "sum", "field": "amount"}}
+
+
+class InlineExecutor(Executor):
+    """Executor running work immediately in the calling thread, counting submissions."""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class DashboardRenderTests(TenantTestMixin, APITestCase):
+    username = "analyst"
+
+    def setUp(self):
+        super().setUp()
+        metric_dsl.plan_cache.clear()
+        self.executor = InlineExecutor()
+        self.addCleanup(dashboards.set_executor, dashboards.set_executor(self.executor))
+
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Tea", sku="TEA-1", price="10.00", cost="4.00"
+        )
+        self._order("paid", 2)
+        self._order("draft", 1)
+        pipeline = sales_models.Pipeline.objects.create(organization=self.organization, name="Sales")
+        stage = sales_models.DealStage.objects.create(pipeline=pipeline, name="Lead")
+        sales_models.Opportunity.objects.create(
+            organization=self.organization, name="Deal", pipeline=pipeline, stage=stage, amount="500.00"
+        )
+        models.MetricDefinition.objects.create(
+            organization=self.organization, code="revenue", name="Revenue", query=json.dumps(REVENUE)
+        )
+        self.dashboard = models.Dashboard.objects.create(
+            organization=self.organization,
+            name="Overview",
+            filters={"start": "2026-01-01", "end": "2026-12-31"},
+            layout={
+                "widgets": [
+                    {"id": "revenue", "code": "revenue", "type": "kpi"},
+                    {"id": "units", "definition": UNITS},
+                    {"id": "revenue-copy", "definition": REVENUE},
+                    {"id": "by-status", "definition": ORDERS_BY_STATUS},
+                    {"id": "deals", "definition": {**DEALS, "time_range": {"last_days": 30}}},
+                    {"id": "missing", "code": "nope"},
+                ]
+            },
+        )
+
+    def _order(self, status_value, quantity):
+        order = sales_models.Order.objects.create(organization=self.organization, status=status_value)
+        sales_models.OrderLine.objects.create(
+            order=order, product_variant=self.variant, quantity=quantity, unit_price="10.00"
+        )
+        sales_models.Order.objects.filter(pk=order.pk).update(
+            ordered_at=timezone.make_aware(datetime.combine(date(2026, 3, 2), time(12)))
+        )
+
+    def test_widgets_share_queries_and_are_cached_per_widget(self):
+        # Saved codes, then one query per distinct base: order lines, orders and opportunities.
+        with self.assertNumQueries(4):
+            first = dashboards.render_dashboard(self.dashboard)
+
+        widgets = {widget["id"]: widget for widget in first["widgets"]}
+        self.assertEqual(widgets["revenue"], {"id": "revenue", "value": 30.0, "cached": False})
+        self.assertEqual(widgets["revenue-copy"]["value"], 30.0)
+        self.assertEqual(widgets["units"]["value"], 3.0)
+        self.assertEqual(
+            widgets["by-status"]["rows"], [{"status": "draft", "value": 1}, {"status": "paid", "value": 1}]
+        )
+        self.assertEqual(widgets["missing"], {"id": "missing", "error": "Метрика не найдена."})
+        self.assertEqual(first["stats"], {"widgets": 6, "cached": 0, "computed": 4, "queries": 3})
+        self.assertEqual(self.executor.submitted, 3)
+
+        with self.assertNumQueries(1):
+            second = dashboards.render_dashboard(self.dashboard)
+        self.assertEqual(second["stats"], {"widgets": 6, "cached": 5, "computed": 0, "queries": 0})
+        self.assertTrue(all(widget.get("cached", True) for widget in second["widgets"]))
+
+        # Sales writes invalidate order widgets only; the opportunity widget stays cached.
+        with self.captureOnCommitCallbacks(execute=True):
+            self._order("paid", 4)
+        third = dashboards.render_dashboard(self.dashboard)
+        self.assertEqual(third["stats"], {"widgets": 6, "cached": 1, "computed": 3, "queries": 2})
+        widgets = {widget["id"]: widget for widget in third["widgets"]}
+        self.assertEqual(widgets["revenue"]["value"], 70.0)
+        self.assertTrue(widgets["deals"]["cached"])
+
+        # A request period overrides the dashboard filters.
+        empty = dashboards.render_dashboard(self.dashboard, start=date(2025, 1, 1), end=date(2025, 1, 31))
+        self.assertIsNone({widget["id"]: widget for widget in empty["widgets"]}["revenue"]["value"])
+
+    def test_a_failing_widget_group_does_not_break_the_dashboard(self):
+        evaluate_group = metric_dsl.evaluate_group
+
+        def failing_for_opportunities(organization_id, members, bounds):
+            if members[0][1].source == "opportunities":
+                raise ValueError("boom")
+            return evaluate_group(organization_id, members, bounds)
+
+        # Saved before filter values were validated.
+        bad_filter = {"field": "unit_price", "op": "gt", "value": "abc"}
+        self.dashboard.layout["widgets"].append({"id": "bad-filter", "definition": {**UNITS, "filters": [bad_filter]}})
+        self.dashboard.save()
+        with mock.patch.object(metric_dsl, "evaluate_group", side_effect=failing_for_opportunities), self.assertLogs(
+            "simplycrm.analytics.dashboards", level="WARNING"
+        ):
+            first = dashboards.render_dashboard(self.dashboard)
+
+        widgets = {widget["id"]: widget for widget in first["widgets"]}
+        self.assertEqual(widgets["deals"], {"id": "deals", "error": dashboards.FAILED_MESSAGE})
+        self.assertIn("error", widgets["bad-filter"])
+        self.assertEqual(widgets["revenue"]["value"], 30.0)
+
+        # The failed group is not cached and is computed again on the next render.
+        second = dashboards.render_dashboard(self.dashboard)
+        widgets = {widget["id"]: widget for widget in second["widgets"]}
+        self.assertEqual(widgets["deals"]["cached"], False)
+        self.assertTrue(widgets["revenue"]["cached"])
+
+    def test_render_endpoint_and_layout_validation(self):
+        url = reverse("dashboard-render", args=[self.dashboard.pk])
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, status.HTTP_200_OK, result.content)
+        self.assertEqual([widget["id"] for widget in result.data["widgets"]][:2], ["revenue", "units"])
+
+        invalid = self.client.post(
+            reverse("dashboard-list"),
+            {"name": "Broken", "layout": {"widgets": [{"id": "x", "definition": {"source": "auth_user"}}]}},
+            format="json",
+        )
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("layout", invalid.data)
+
+        duplicate = self.client.post(
+            reverse("dashboard-list"),
+            {"name": "Twice", "layout": {"widgets": [{"id": "x", "code": "a"}, {"id": "x", "code": "b"}]}},
+            format="json",
+        )
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,151 @@
+"""Tests for the demand forecasting engine."""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from io import StringIO
+
+import numpy as np
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import forecasting, models
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class ForecastModelTests(SimpleTestCase):
+    """Vectorized model fitting over a demand matrix."""
+
+    def _matrix(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        return forecasting.DemandMatrix(
+            variant_ids=np.arange(1, len(values) + 1),
+            week_starts=[date(2024, 1, 1) + timedelta(weeks=index) for index in range(values.shape[1])],
+            values=values,
+        )
+
+    def test_smooth_and_intermittent_series_use_different_models(self):
+        steady = [10.0] * 20
+        growing = [float(index) for index in range(20)]
+        sporadic = [0, 0, 6, 0, 0, 0, 6, 0, 0, 6, 0, 0, 0, 6, 0, 0, 6, 0, 0, 0]
+        configuration = forecasting.get_configuration()
+        result = forecasting.forecast_matrix(self._matrix([steady, growing, sporadic]), 4, configuration)
+
+        self.assertEqual(list(result.methods), [forecasting.HOLT, forecasting.HOLT, forecasting.CROSTON_SBA])
+        np.testing.assert_allclose(result.weekly[0], 10.0, atol=1e-6)
+        self.assertGreater(result.weekly[1][0], 17)
+        self.assertTrue(np.all(np.diff(result.weekly[1]) > 0))
+        self.assertAlmostEqual(result.weekly[2][0], 6 / 3.5, delta=0.6)
+        self.assertTrue(np.all(result.lower <= result.weekly))
+        self.assertTrue(np.all(result.upper >= result.weekly))
+
+    def test_seasonal_component_requires_two_seasons(self):
+        pattern = [5.0, 15.0, 5.0, 15.0]
+        configuration = forecasting.get_configuration({"season_length": 4, "gamma": 0.3})
+        result = forecasting.forecast_matrix(
+            self._matrix([pattern * 3, [0.0] * 6 + pattern + [5.0, 15.0]]), 4, configuration
+        )
+
+        self.assertEqual(result.methods[0], forecasting.HOLT_WINTERS)
+        self.assertEqual(result.methods[1], forecasting.HOLT)
+        self.assertLess(result.weekly[0][0], result.weekly[0][1])
+
+    def test_default_history_covers_two_seasons(self):
+        configuration = forecasting.get_configuration()
+        weeks = int(configuration["history_weeks"])
+        season = np.sin(np.arange(weeks) * 2 * np.pi / configuration["season_length"])
+        result = forecasting.forecast_matrix(self._matrix([20.0 + 10.0 * season]), 4, configuration)
+
+        self.assertEqual(result.methods[0], forecasting.HOLT_WINTERS)
+        # The next weeks continue the yearly cycle instead of flattening it out.
+        np.testing.assert_allclose(result.weekly[0], 20.0 + 10.0 * np.sin(np.arange(weeks, weeks + 4) * 2 * np.pi / 52), atol=1.5)
+
+
+class DemandForecastTests(TenantTestMixin, APITestCase):
+    """Persist forecasts and serve them from the API."""
+
+    username = "planner"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        for weeks_ago in range(12):
+            order = sales_models.Order.objects.create(organization=self.organization)
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=self.variant, quantity=12, unit_price="10.00"
+            )
+            sales_models.Order.objects.filter(pk=order.pk).update(
+                ordered_at=timezone.now() - timedelta(weeks=weeks_ago)
+            )
+
+    def test_generate_persists_interval_forecast(self):
+        forecast = forecasting.generate_demand_forecast(self.organization.id, horizon_days=10)
+
+        self.assertEqual(forecast.target, forecasting.TARGET)
+        self.assertEqual(len(forecast.result["weeks"]), 2)
+        entry = forecast.result["variants"][0]
+        self.assertEqual(entry["variant_id"], self.variant.id)
+        self.assertEqual(entry["method"], forecasting.HOLT)
+        self.assertAlmostEqual(entry["velocity"], 12, delta=1)
+        self.assertAlmostEqual(entry["total"], 12 * 10 / 7, delta=2)
+        self.assertLessEqual(entry["lower"], entry["total"])
+        self.assertGreaterEqual(entry["upper"], entry["total"])
+
+    def test_api_reads_precomputed_forecast(self):
+        stdout = StringIO()
+        call_command("generate_forecasts", organizations=[self.organization.id], stdout=stdout)
+        self.assertIn("acme: 1 variants", stdout.getvalue())
+        stored = models.Forecast.objects.get(organization=self.organization)
+
+        response = self.client.get(reverse("analytics:insight-analytics-demand-forecast"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["forecast_id"], stored.id)
+        self.assertEqual(response.data["high_demand"][0]["variant_id"], self.variant.id)
+        self.assertEqual(models.Forecast.objects.filter(organization=self.organization).count(), 1)
+
+    def test_history_ends_with_the_last_complete_week(self):
+        wednesday = timezone.make_aware(datetime(2024, 1, 17, 12, 0))
+        monday = wednesday - timedelta(days=2, hours=12)
+        for ordered_at, quantity in ((monday + timedelta(hours=1), 3), (monday - timedelta(days=3), 12)):
+            order = sales_models.Order.objects.create(organization=self.organization)
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=self.variant, quantity=quantity, unit_price="10.00"
+            )
+            sales_models.Order.objects.filter(pk=order.pk).update(ordered_at=ordered_at)
+
+        matrix = forecasting.build_demand_matrix(self.organization.id, history_weeks=4, now=wednesday)
+
+        self.assertEqual(matrix.week_starts[-1], date(2024, 1, 8))
+        # The three units ordered this Monday belong to the running week and are left out.
+        self.assertEqual(matrix.values.sum(), 12)
+        self.assertEqual(matrix.values[0, -1], 12)
+
+    def test_reruns_merge_stored_overrides_over_current_defaults(self):
+        legacy = models.Forecast.objects.create(
+            organization=self.organization,
+            name="Legacy",
+            target=forecasting.TARGET,
+            configuration={**forecasting.DEFAULT_CONFIGURATION, "history_weeks": 52, "alpha": 0.5},
+            result={"variants": []},
+        )
+        migration = import_module("simplycrm.analytics.migrations.0009_forecast_configuration_overrides")
+        migration.keep_overrides_only(django_apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.configuration, {"alpha": 0.5})
+
+        call_command("generate_forecasts", organizations=[self.organization.id], stdout=StringIO())
+        forecast = forecasting.latest_demand_forecast(self.organization.id)
+        self.assertNotEqual(forecast.pk, legacy.pk)
+        self.assertEqual(forecast.configuration, {"alpha": 0.5})
+        self.assertEqual(forecasting.get_configuration(forecast.configuration)["history_weeks"], 104)
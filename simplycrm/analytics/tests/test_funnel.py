@@ -0,0 +1,89 @@
+"""Tests for pipeline funnel analytics."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import cache as analytics_cache
+from simplycrm.analytics import funnel
+from simplycrm.analytics.tests.utils import DeferredExecutor
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class PipelineFunnelTests(TenantTestMixin, APITestCase):
+    username = "sales"
+
+    def setUp(self):
+        super().setUp()
+        self.pipeline = sales_models.Pipeline.objects.create(organization=self.organization, name="Sales")
+        self.lead, self.proposal, self.won = [
+            sales_models.DealStage.objects.create(
+                pipeline=self.pipeline, name=name, position=position, win_probability=probability
+            )
+            for position, name, probability in [(0, "Lead", 10), (1, "Proposal", 50), (2, "Won", 100)]
+        ]
+        self.start = timezone.now() - timedelta(days=10)
+        # A: Lead -> Proposal after 2 days -> Won after 4 more; B: Lead -> Proposal after 4 days; C stays in Lead.
+        self._opportunity("A", 100, [(self.lead, 0), (self.proposal, 2), (self.won, 6)])
+        self._opportunity("B", 200, [(self.lead, 0), (self.proposal, 4)])
+        self._opportunity("C", 300, [(self.lead, 1)])
+
+    def _opportunity(self, name, amount, path):
+        opportunity = sales_models.Opportunity.objects.create(
+            organization=self.organization, name=name, pipeline=self.pipeline, stage=path[0][0], amount=amount
+        )
+        for stage, _ in path[1:]:
+            opportunity.stage = stage
+            opportunity.save()
+        for change, (_, day) in zip(opportunity.stage_changes.order_by("id"), path):
+            sales_models.OpportunityStageChange.objects.filter(pk=change.pk).update(
+                changed_at=self.start + timedelta(days=day)
+            )
+        return opportunity
+
+    def test_conversion_time_in_stage_and_velocity(self):
+        (result,) = funnel.pipeline_funnels(self.organization.id)
+
+        stages = {row["name"]: row for row in result["stages"]}
+        self.assertEqual([stages[name]["reached"] for name in ("Lead", "Proposal", "Won")], [3, 2, 1])
+        self.assertEqual(stages["Lead"]["conversion_to_next"], 0.6667)
+        self.assertEqual(stages["Proposal"]["conversion_to_next"], 0.5)
+        self.assertIsNone(stages["Won"]["conversion_to_next"])
+        self.assertEqual(stages["Lead"]["median_days_in_stage"], 3.0)
+        self.assertEqual(stages["Proposal"]["median_days_in_stage"], 4.0)
+        self.assertEqual([stages[name]["current"] for name in ("Lead", "Proposal", "Won")], [1, 1, 1])
+        self.assertEqual((result["opportunities"], result["open"], result["won"]), (3, 2, 1))
+        self.assertEqual(result["win_rate"], 0.3333)
+        self.assertEqual(result["average_cycle_days"], 6.0)
+        self.assertEqual(result["velocity_per_day"], 11.11)
+        self.assertCountEqual(
+            result["transitions"],
+            [
+                {"from_stage_id": self.lead.id, "to_stage_id": self.proposal.id, "count": 2},
+                {"from_stage_id": self.proposal.id, "to_stage_id": self.won.id, "count": 1},
+            ],
+        )
+
+        (recent,) = funnel.pipeline_funnels(self.organization.id, since=(self.start + timedelta(days=1)).date())
+        self.assertEqual(recent["opportunities"], 1)
+
+    def test_endpoint_is_cached_until_the_pipeline_changes(self):
+        url = reverse("insight-analytics-funnel")
+        first = self.client.get(url, {"pipeline_id": self.pipeline.id})
+        self.assertEqual(first.status_code, status.HTTP_200_OK, first.content)
+        self.assertEqual(first.data[0]["won"], 1)
+
+        executor = DeferredExecutor()
+        self.addCleanup(analytics_cache.set_executor, analytics_cache.set_executor(executor))
+        with self.captureOnCommitCallbacks(execute=True):
+            sales_models.Opportunity.objects.filter(name="B").update(stage=self.won)
+        stale = self.client.get(url, {"pipeline_id": self.pipeline.id})
+        self.assertEqual(stale.data[0]["won"], 1)
+        executor.run_all()
+        refreshed = self.client.get(url, {"pipeline_id": self.pipeline.id})
+        self.assertEqual(refreshed.data[0]["won"], 2)
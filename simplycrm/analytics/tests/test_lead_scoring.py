@@ -0,0 +1,95 @@
+"""Tests for lead scoring training and batch scoring."""
+from __future__ import annotations
+
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import lead_scoring
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+def _leads(organization, count=40):
+    """Referral leads with a budget convert, ad leads are lost."""
+
+    for index in range(count):
+        converted = index % 2 == 0
+        sales_models.Lead.objects.create(
+            organization=organization,
+            source="referral" if converted else "ads",
+            status="converted" if converted else "lost",
+            metadata={"budget": 5000 if converted else 100, "campaign": "spring"},
+        )
+    hot = sales_models.Lead.objects.create(
+        organization=organization, source="referral", status="new", metadata={"budget": 4000}
+    )
+    cold = sales_models.Lead.objects.create(organization=organization, source="ads", status="new", metadata={"budget": 50})
+    return hot, cold
+
+
+class LeadScoringTests(TestCase):
+    def setUp(self):
+        artifacts = tempfile.TemporaryDirectory()
+        self.addCleanup(artifacts.cleanup)
+        override = override_settings(MODEL_ARTIFACT_ROOT=artifacts.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.first = core_models.Organization.objects.create(name="First", slug="first")
+        self.second = core_models.Organization.objects.create(name="Second", slug="second")
+
+    def test_trains_each_organization_in_a_process_pool(self):
+        hot, cold = _leads(self.first)
+        _leads(self.second)
+        sparse = core_models.Organization.objects.create(name="Sparse", slug="sparse")
+        _leads(sparse, count=6)
+
+        runs = lead_scoring.train_organizations([self.first.id, self.second.id, sparse.id], max_workers=2)
+
+        statuses = {run.organization_id: run.status for run in runs}
+        self.assertEqual(statuses[self.first.id], lead_scoring.STATUS_SUCCEEDED)
+        self.assertEqual(statuses[self.second.id], lead_scoring.STATUS_SUCCEEDED)
+        self.assertEqual(statuses[sparse.id], lead_scoring.STATUS_SKIPPED)
+        metrics = runs[0].metrics
+        self.assertEqual(metrics["evaluation"], "holdout")
+        self.assertEqual(metrics["samples"], 40)
+        self.assertGreaterEqual(metrics["roc_auc"], 0.9)
+        self.assertTrue(lead_scoring.artifact_path(self.first.id).exists())
+        self.assertIsNone(lead_scoring.load_artifact(sparse.id))
+
+        changed = lead_scoring.score_leads(self.first.id, chunk_size=7)
+        self.assertEqual(changed, 42)
+        hot.refresh_from_db()
+        cold.refresh_from_db()
+        self.assertGreater(hot.score, 50)
+        self.assertLess(cold.score, 50)
+        self.assertEqual(lead_scoring.score_leads(self.first.id, chunk_size=7), 0)
+        self.assertFalse(sales_models.Lead.objects.filter(organization=self.second, score__gt=0).exists())
+
+
+class LeadScoringApiTests(TenantTestMixin, APITestCase):
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "ops"
+
+    def setUp(self):
+        super().setUp()
+        artifacts = tempfile.TemporaryDirectory()
+        self.addCleanup(artifacts.cleanup)
+        override = override_settings(MODEL_ARTIFACT_ROOT=artifacts.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_endpoint_trains_and_scores(self):
+        hot, _ = _leads(self.organization)
+        response = self.client.post(reverse("model-training-run-lead-scoring"), {"C": 0.5}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        body = response.json()
+        self.assertEqual(body["run"]["status"], lead_scoring.STATUS_SUCCEEDED)
+        self.assertEqual(body["run"]["parameters"], {"C": 0.5, "max_iter": 1000})
+        self.assertEqual(body["scored_leads"], 42)
+        hot.refresh_from_db()
+        self.assertGreater(hot.score, 50)
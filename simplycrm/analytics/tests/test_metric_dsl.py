@@ -0,0 +1,159 @@
+"""Tests for the compiled metric DSL."""
+from __future__ import annotations
+
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import metric_dsl, models
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+REVENUE = {"source": "order_lines", "measure": {"aggregate": "sum", "field": "revenue"}}
+UNITS = {"source": "order_lines", "measure": {"aggregate": "sum", "field": "quantity"}}
+ORDERS = {"source": "orders", "measure": {"aggregate": "count"}}
+
+
+class MetricDslTests(TenantTestMixin, APITestCase):
+    """Compile definitions once and evaluate metrics sharing a base together."""
+
+    username = "analyst"
+
+    def setUp(self):
+        super().setUp()
+        metric_dsl.plan_cache.clear()
+        self.today = timezone.localdate()
+        self.variant = self._variant(self.organization, "TEA")
+        self._order(self.organization, self.variant, self.today, "paid", [(2, "10.00", "1.00")])
+        self._order(self.organization, self.variant, self.today - timedelta(days=1), "draft", [(1, "30.00", "0.00")])
+        self._order(self.organization, self.variant, self.today - timedelta(days=40), "paid", [(5, "10.00", "0.00")])
+
+        other = core_models.Organization.objects.create(name="Other", slug="other")
+        self._order(other, self._variant(other, "OTHER"), self.today, "paid", [(100, "10.00", "0.00")])
+
+    def _variant(self, organization, sku):
+        product = catalog_models.Product.objects.create(organization=organization, name=sku, sku=sku)
+        return catalog_models.ProductVariant.objects.create(
+            product=product, name=sku, sku=f"{sku}-1", price="10.00", cost="4.00"
+        )
+
+    def _order(self, organization, variant, day, status_value, lines):
+        order = sales_models.Order.objects.create(organization=organization, status=status_value)
+        for quantity, price, discount in lines:
+            sales_models.OrderLine.objects.create(
+                order=order,
+                product_variant=variant,
+                quantity=quantity,
+                unit_price=price,
+                discount_amount=discount,
+            )
+        sales_models.Order.objects.filter(pk=order.pk).update(
+            ordered_at=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+
+    def test_rejects_unknown_sources_fields_and_operators(self):
+        invalid = [
+            {"source": "auth_user", "measure": {"aggregate": "count"}},
+            {"source": "orders", "measure": {"aggregate": "sum", "field": "password"}},
+            {"source": "orders", "measure": {"aggregate": "count"}, "filters": [{"field": "status", "op": "regex"}]},
+            {"source": "orders", "measure": {"aggregate": "count"}, "time_range": {"last_days": -1}},
+            {**ORDERS, "filters": [{"field": "status", "op": "in", "value": [{"a": 1}]}]},
+            {**UNITS, "filters": [{"field": "unit_price", "op": "gt", "value": "abc"}]},
+            {**ORDERS, "filters": [{"field": "status", "op": "contains", "value": 1}]},
+            {**ORDERS, "dimensions": [["status"]]},
+            {**ORDERS, "source": ["orders"]},
+            "SELECT 1",
+        ]
+        for definition in invalid:
+            with self.subTest(definition=definition), self.assertRaises(ValidationError):
+                metric_dsl.compile_metric(definition)
+
+    def test_filter_values_are_converted_to_the_field_type(self):
+        definition = {**UNITS, "filters": [{"field": "unit_price", "op": "gt", "value": "15"}]}
+        plan = metric_dsl.compile_metric(definition)
+        self.assertEqual(plan.filters, (("unit_price", "gt", Decimal("15")),))
+        self.assertEqual(metric_dsl.evaluate_metrics(self.organization.id, [("big", definition)]), {"big": {"value": 1}})
+
+        response = self.client.post(
+            reverse("metric-definition-evaluate"),
+            {"metrics": {"broken": {**UNITS, "filters": [{"field": "status", "op": "in", "value": [{"a": 1}]}]}}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertIn("error", response.json()["broken"])
+
+    def test_compiled_plans_are_cached_by_definition_hash(self):
+        first = metric_dsl.compile_metric(json.dumps(REVENUE))
+        second = metric_dsl.compile_metric(json.dumps(dict(reversed(list(REVENUE.items())))))
+        self.assertIs(first, second)
+        self.assertEqual(metric_dsl.plan_cache.hits, 1)
+        self.assertEqual(metric_dsl.plan_cache.misses, 1)
+
+    def test_metrics_sharing_a_base_run_in_one_query(self):
+        with self.assertNumQueries(1):
+            results = metric_dsl.evaluate_metrics(self.organization.id, [("revenue", REVENUE), ("units", UNITS)])
+        self.assertEqual(results["revenue"], {"value": 99.0})
+        self.assertEqual(results["units"], {"value": 8})
+
+    def test_dimensions_filters_and_time_grain(self):
+        definition = {
+            **REVENUE,
+            "dimensions": ["status"],
+            "filters": [{"field": "status", "op": "ne", "value": "draft"}],
+            "time_grain": "day",
+            "time_range": {"last_days": 7},
+        }
+        results = metric_dsl.evaluate_metrics(self.organization.id, [("paid", definition)])
+        self.assertEqual(
+            results["paid"]["rows"],
+            [{"status": "paid", "period": self.today.isoformat(), "value": 19.0}],
+        )
+
+    def test_evaluate_endpoint_combines_saved_and_inline_metrics(self):
+        create = self.client.post(
+            reverse("metric-definition-list"),
+            {
+                "organization": self.organization.pk,
+                "code": "revenue",
+                "name": "Revenue",
+                "query": json.dumps(REVENUE),
+            },
+            format="json",
+        )
+        self.assertEqual(create.status_code, status.HTTP_201_CREATED, create.content)
+        rejected = self.client.post(
+            reverse("metric-definition-list"),
+            {
+                "organization": self.organization.pk,
+                "code": "raw",
+                "name": "Raw",
+                "query": "SELECT * FROM sales_order",
+            },
+            format="json",
+        )
+        self.assertEqual(rejected.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            reverse("metric-definition-evaluate"),
+            {
+                "codes": ["revenue"],
+                "metrics": {"orders": {"source": "orders", "measure": {"aggregate": "count"}}},
+                "start": (self.today - timedelta(days=7)).isoformat(),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(response.json(), {"revenue": {"value": 49.0}, "orders": {"value": 2}})
+
+        definition = models.MetricDefinition.objects.get(code="revenue")
+        detail = self.client.get(reverse("metric-definition-value", args=[definition.pk]))
+        self.assertEqual(detail.json(), {"value": 99.0})
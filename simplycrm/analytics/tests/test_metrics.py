@@ -0,0 +1,91 @@
+"""Tests for single-pass sales KPI aggregation."""
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import metrics
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class SalesKpiTests(TenantTestMixin, APITestCase):
+    """Compute KPIs for a period and its comparison window in one query."""
+
+    username = "finance"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        self.today = timezone.localdate()
+        self._order(self.today, [(2, "10.00", "1.00"), (1, "30.00", "0.00")])
+        self._order(self.today - timedelta(days=3), [(1, "10.00", "0.00")])
+        self._order(self.today - timedelta(days=10), [(4, "10.00", "0.00")])
+        self.period = metrics.Period(self.today - timedelta(days=6), self.today)
+
+    def _order(self, day, lines):
+        order = sales_models.Order.objects.create(organization=self.organization)
+        for quantity, price, discount in lines:
+            sales_models.OrderLine.objects.create(
+                order=order,
+                product_variant=self.variant,
+                quantity=quantity,
+                unit_price=price,
+                discount_amount=discount,
+            )
+        sales_models.Order.objects.filter(pk=order.pk).update(
+            ordered_at=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+        return order
+
+    def test_period_and_comparison_in_one_query(self):
+        with self.assertNumQueries(1):
+            result = metrics.sales_kpis(self.organization.id, self.period, compare=metrics.PREVIOUS_PERIOD)
+
+        self.assertEqual(result["total_revenue"], Decimal("60.00"))
+        self.assertEqual(result["net_revenue"], Decimal("59.00"))
+        self.assertEqual(result["orders_count"], 2)
+        self.assertEqual(result["line_count"], 3)
+        self.assertEqual(result["average_order_value"], Decimal("30.00"))
+        self.assertEqual(result["comparison"]["total_revenue"], Decimal("40.00"))
+        self.assertEqual(result["comparison"]["period_end"], self.today - timedelta(days=7))
+        self.assertEqual(result["change"]["total_revenue"], 50.0)
+        self.assertEqual(result["change"]["orders_count"], 100.0)
+
+    def test_results_are_memoized_per_data_version(self):
+        metrics.sales_kpis(self.organization.id)
+        with self.assertNumQueries(0):
+            cached = metrics.sales_kpis(self.organization.id)
+        self.assertEqual(cached["orders_count"], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._order(self.today, [(1, "5.00", "0.00")])
+
+        self.assertEqual(metrics.sales_kpis(self.organization.id)["orders_count"], 4)
+
+    def test_endpoint_accepts_period_and_comparison(self):
+        url = reverse("analytics:insight-analytics-sales-metrics")
+        response = self.client.get(
+            url,
+            {
+                "start": self.period.start.isoformat(),
+                "end": self.period.end.isoformat(),
+                "compare": metrics.PREVIOUS_PERIOD,
+            },
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["average_order_value"], "30.00")
+        self.assertEqual(response.data["comparison"]["orders_count"], 1)
+
+        invalid = self.client.get(url, {"compare": metrics.PREVIOUS_YEAR})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
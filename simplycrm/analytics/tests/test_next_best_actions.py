@@ -0,0 +1,87 @@
+"""Tests for the next best actions rules engine."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import models, next_best_actions
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class NextBestActionTests(TenantTestMixin, APITestCase):
+    """Evaluate rules over an annotated opportunity queryset."""
+
+    username = "seller"
+
+    def setUp(self):
+        super().setUp()
+        pipeline = sales_models.Pipeline.objects.create(organization=self.organization, name="Sales")
+        self.stage = sales_models.DealStage.objects.create(pipeline=pipeline, name="Qualify")
+        self.pipeline = pipeline
+        now = timezone.now()
+        self.idle = self._opportunity("Idle", 900)
+        self.overdue = self._opportunity("Overdue", 800)
+        self._activity(self.overdue, "Send proposal", due_at=now - timedelta(days=1))
+        self.quiet = self._opportunity("Quiet", 700)
+        self._activity(self.quiet, "Demo", due_at=now + timedelta(days=3))
+        self.healthy = self._opportunity("Healthy", 600)
+        self._activity(self.healthy, "Call", due_at=now + timedelta(days=1))
+        self._activity(self.healthy, "Intro", completed_at=now - timedelta(days=1))
+
+    def _opportunity(self, name, amount):
+        return sales_models.Opportunity.objects.create(
+            organization=self.organization,
+            name=name,
+            pipeline=self.pipeline,
+            stage=self.stage,
+            amount=amount,
+        )
+
+    def _activity(self, opportunity, subject, *, due_at=None, completed_at=None):
+        return sales_models.DealActivity.objects.create(
+            opportunity=opportunity, type="task", subject=subject, due_at=due_at, completed_at=completed_at
+        )
+
+    def test_rules_run_over_single_annotated_query(self):
+        for index in range(20):
+            self._opportunity(f"Extra {index}", 10 + index)
+
+        with self.assertNumQueries(3):
+            actions = next_best_actions.suggest_next_best_actions(self.organization.id)
+
+        by_opportunity = {(action["opportunity_id"], action["rule"]) for action in actions}
+        self.assertIn((self.idle.id, "no_upcoming_activity"), by_opportunity)
+        self.assertIn((self.overdue.id, "overdue_activity"), by_opportunity)
+        self.assertIn((self.overdue.id, "overdue_task"), by_opportunity)
+        self.assertIn((self.quiet.id, "no_recent_activity"), by_opportunity)
+        self.assertNotIn(self.healthy.id, {opportunity for opportunity, _ in by_opportunity})
+
+    def test_rules_are_configurable_per_organization(self):
+        models.AnalyticsSettings.objects.create(
+            organization=self.organization,
+            config={"next_best_actions": {"rules": ["no_recent_activity"], "overdue_tasks_limit": 0}},
+        )
+
+        actions = next_best_actions.suggest_next_best_actions(self.organization.id)
+
+        self.assertEqual({action["rule"] for action in actions}, {"no_recent_activity"})
+        self.assertEqual(
+            [action["opportunity_id"] for action in actions],
+            [self.idle.id, self.overdue.id, self.quiet.id],
+        )
+
+    def test_endpoint_pages_beyond_first_page(self):
+        url = reverse("analytics:insight-analytics-next-best-actions")
+        response = self.client.get(url, {"offset": 2, "limit": 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row["opportunity_id"], row["rule"]) for row in response.data],
+            [(self.quiet.id, "no_recent_activity")],
+        )
+        self.assertEqual(self.client.get(url, {"limit": 0}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,109 @@
+"""Tests for the weighted pipeline forecast and its weekly snapshots."""
+from __future__ import annotations
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import models, pipeline_forecast
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class PipelineForecastTests(TenantTestMixin, APITestCase):
+    username = "ann"
+
+    def setUp(self):
+        super().setUp()
+        self.ann = self.user
+        self.bob = self.create_member("bob")
+        self.pipeline = sales_models.Pipeline.objects.create(organization=self.organization, name="Sales")
+        lead, negotiation, won = [
+            sales_models.DealStage.objects.create(
+                pipeline=self.pipeline, name=name, position=position, win_probability=probability
+            )
+            for position, name, probability in [(0, "Lead", 10), (1, "Negotiation", 60), (2, "Won", 100)]
+        ]
+        self._opportunity("A", won, "1000.00", date(2026, 3, 10), self.ann)
+        self._opportunity("B", negotiation, "500.00", date(2026, 3, 20), self.ann, probability="80.00")
+        self.small = self._opportunity("C", negotiation, "200.00", date(2026, 3, 5), self.bob)
+        self._opportunity("D", lead, "300.00", date(2026, 4, 1), None)
+
+    def _opportunity(self, name, stage, amount, close_date, owner, probability="0.00"):
+        return sales_models.Opportunity.objects.create(
+            organization=self.organization,
+            name=name,
+            pipeline=self.pipeline,
+            stage=stage,
+            amount=amount,
+            close_date=close_date,
+            owner=owner,
+            probability=probability,
+        )
+
+    def test_weighted_forecast_by_month_owner_and_category(self):
+        with self.assertNumQueries(2):
+            forecast = pipeline_forecast.pipeline_forecast(self.organization.id)
+
+        categories = {row["category"]: row for row in forecast["rows"]}
+        self.assertEqual(set(categories), set(pipeline_forecast.CATEGORIES))
+        self.assertEqual(categories["commit"]["weighted_amount"], Decimal("400.00"))
+        self.assertEqual(categories["best_case"]["weighted_amount"], Decimal("120.00"))
+        self.assertEqual(categories["best_case"]["owner"], "bob")
+        self.assertIsNone(categories["pipeline"]["owner_id"])
+
+        march, april = forecast["months"]
+        self.assertEqual(march["close_month"], date(2026, 3, 1))
+        self.assertEqual(
+            [march[key] for key in ("deals", "weighted_amount", "closed_won", "commit", "best_case")],
+            [3, Decimal("1520.00"), Decimal("1000.00"), Decimal("1500.00"), Decimal("1700.00")],
+        )
+        self.assertEqual((april["weighted_amount"], april["best_case"]), (Decimal("30.00"), Decimal("0.00")))
+        self.assertEqual(forecast["totals"]["amount"], Decimal("2000.00"))
+
+        models.AnalyticsSettings.objects.create(
+            organization=self.organization, config={"pipeline_forecast": {"commit_probability": 50}}
+        )
+        rows = pipeline_forecast.forecast_rows(self.organization.id, owner_id=self.bob.id)
+        self.assertEqual([row["category"] for row in rows], ["commit"])
+
+    def test_weekly_snapshots_chart_forecast_drift(self):
+        first_week = timezone.make_aware(datetime(2026, 3, 2, 9))
+        pipeline_forecast.snapshot_forecast(self.organization.id, now=first_week)
+        sales_models.Opportunity.objects.filter(pk=self.small.pk).update(amount="400.00")
+        second_week = timezone.make_aware(datetime(2026, 3, 11, 9))
+        pipeline_forecast.snapshot_forecast(self.organization.id, now=second_week)
+        # Re-running within a week replaces that week's snapshot.
+        self.assertEqual(pipeline_forecast.snapshot_forecast(self.organization.id, now=second_week), 4)
+        self.assertEqual(models.PipelineForecastSnapshot.objects.count(), 8)
+
+        with self.assertNumQueries(1):
+            drift = pipeline_forecast.forecast_drift(self.organization.id, weeks=4, today=date(2026, 3, 12))
+
+        march, april = drift
+        self.assertEqual([point["week_start"] for point in march["points"]], [date(2026, 3, 2), date(2026, 3, 9)])
+        self.assertEqual(march["change"]["weighted_amount"], Decimal("120.00"))
+        self.assertEqual(march["change"]["best_case"], Decimal("200.00"))
+        self.assertEqual(march["change"]["commit"], Decimal("0.00"))
+        self.assertEqual(april["change"]["weighted_amount"], Decimal("0.00"))
+
+        recent = pipeline_forecast.forecast_drift(self.organization.id, weeks=1, today=date(2026, 3, 12))
+        self.assertEqual([len(series["points"]) for series in recent], [1, 1])
+
+    def test_forecast_endpoint(self):
+        url = reverse("insight-analytics-pipeline-forecast")
+        response = self.client.get(url, {"start": "2026-03-01", "end": "2026-03-31"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(response.data["totals"]["weighted_amount"], "1520.00")
+        self.assertEqual(len(response.data["months"]), 1)
+
+        invalid = self.client.get(url, {"start": "2026-04-01", "end": "2026-03-01"})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        drift = self.client.get(reverse("insight-analytics-forecast-drift"))
+        self.assertEqual(drift.status_code, status.HTTP_200_OK, drift.content)
+        self.assertEqual(drift.data, [])
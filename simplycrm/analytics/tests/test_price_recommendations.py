@@ -0,0 +1,92 @@
+"""Tests for the vectorized price recommendation engine."""
+from __future__ import annotations
+
+from datetime import date
+
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import models, pricing
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class PriceRecommendationTests(TenantTestMixin, APITestCase):
+    """Evaluate price rules for the whole catalog and cache by data version."""
+
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "analyst"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.fast = self._variant(product, "Green", "10.00", "4.00", stock=2)
+        self.idle = self._variant(product, "Black", "10.00", "4.00", stock=20)
+        self.thin = self._variant(product, "White", "10.00", "9.50", stock=100)
+        order = sales_models.Order.objects.create(organization=self.organization)
+        for variant in (self.fast, self.thin):
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=variant, quantity=10, unit_price="10.00"
+            )
+
+    def _variant(self, product, name, price, cost, *, stock):
+        variant = catalog_models.ProductVariant.objects.create(
+            product=product, name=name, sku=f"TEA-{name}", price=price, cost=cost
+        )
+        catalog_models.InventoryLot.objects.create(
+            variant=variant, quantity=stock, received_at=date.today(), location="MAIN"
+        )
+        return variant
+
+    def _actions(self, result):
+        return {row["variant_id"]: row["action"] for row in result["recommendations"]}
+
+    def test_rules_are_evaluated_for_all_variants(self):
+        result = pricing.recommend_price_actions(self.organization.id)
+
+        self.assertEqual(
+            self._actions(result),
+            {
+                self.fast.id: "raise_price",
+                self.idle.id: "consider_discount",
+                self.thin.id: "review_costs",
+            },
+        )
+        idle = next(row for row in result["recommendations"] if row["variant_id"] == self.idle.id)
+        self.assertIsNone(idle["coverage_weeks"])
+        self.assertEqual(idle["trend_label"], "low")
+
+    def test_results_are_cached_until_thresholds_change(self):
+        pricing.recommend_price_actions(self.organization.id)
+        with self.assertNumQueries(0):
+            pricing.recommend_price_actions(self.organization.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.AnalyticsSettings.objects.create(
+                organization=self.organization,
+                config={"price_recommendations": {"raise_coverage_weeks": 0.5, "min_margin": 0.1}},
+            )
+        result = pricing.recommend_price_actions(self.organization.id)
+
+        self.assertEqual(self._actions(result)[self.fast.id], "monitor")
+        self.assertEqual(self._actions(result)[self.thin.id], "monitor")
+        self.assertEqual(result["thresholds"]["raise_coverage_weeks"], 0.5)
+
+    def test_settings_endpoint_validates_thresholds(self):
+        url = reverse("analytics:analytics-settings-list")
+        invalid = self.client.post(
+            url, {"config": {"price_recommendations": {"unknown": 1}}}, format="json"
+        )
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        created = self.client.post(
+            url, {"config": {"price_recommendations": {"min_margin": 2}}}, format="json"
+        )
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(pricing.get_thresholds(self.organization.id)["min_margin"], 2)
+
+        duplicate = self.client.post(url, {"config": {}}, format="json")
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,122 @@
+"""Tests for the cron report scheduler."""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from simplycrm.analytics import models, scheduler
+from simplycrm.analytics.tests.utils import DeferredExecutor
+from simplycrm.core import models as core_models
+
+
+def _at(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class CronParserTests(TestCase):
+    def test_next_run_skips_to_matching_minute(self):
+        schedule = scheduler.parse_cron("*/15 9-17 * * 1-5")
+        # Saturday evening -> Monday 09:00.
+        self.assertEqual(schedule.next_after(_at(2026, 10, 17, 18, 5)), _at(2026, 10, 19, 9, 0))
+        self.assertEqual(schedule.next_after(_at(2026, 10, 19, 9, 0)), _at(2026, 10, 19, 9, 15))
+
+    def test_day_of_month_and_weekday_are_alternatives(self):
+        schedule = scheduler.parse_cron("0 6 1 * 7")
+        # Sunday the 4th comes before the 1st of next month.
+        self.assertEqual(schedule.next_after(_at(2026, 10, 2, 0, 0)), _at(2026, 10, 4, 6, 0))
+        self.assertEqual(scheduler.parse_cron("@monthly").next_after(_at(2026, 12, 15)), _at(2027, 1, 1))
+
+    def test_invalid_expressions_are_rejected(self):
+        for expression in ["* * *", "61 * * * *", "*/0 * * * *", "a b c d e", "0 0 31 2 *"]:
+            with self.subTest(expression=expression), self.assertRaises(ValidationError):
+                scheduler.parse_cron(expression).next_after(_at(2026, 1, 1))
+
+
+@override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}})
+class ReportSchedulerTests(TestCase):
+    def setUp(self):
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        core_models.Subscription.objects.create(
+            organization=self.organization,
+            plan=core_models.SubscriptionPlan.objects.get(key=core_models.SubscriptionPlan.ENTERPRISE),
+            started_at=date.today(),
+        )
+        self.now = _at(2026, 10, 19, 8, 59, 30)
+        self.executor = DeferredExecutor()
+        self.scheduler = scheduler.ReportScheduler(per_organization=2, executor=self.executor)
+
+    def _report(self, name, cron="0 9 * * *", **definition):
+        return models.Report.objects.create(
+            organization=self.organization,
+            name=name,
+            schedule_cron=cron,
+            definition=definition or {"metrics": {"leads": {"source": "leads", "measure": {"aggregate": "count"}}}},
+        )
+
+    def test_due_reports_are_rendered_to_storage(self):
+        report = self._report("Daily leads")
+        self._report("Unscheduled", cron="")
+        self.scheduler.refresh(self.now)
+        self.assertEqual(len(self.scheduler), 1)
+        report.refresh_from_db()
+        self.assertEqual(report.next_run_at, _at(2026, 10, 19, 9, 0))
+
+        self.assertEqual(self.scheduler.run_pending(self.now), [])
+        self.assertEqual(self.scheduler.run_pending(self.now + timedelta(minutes=1)), [report.pk])
+        self.executor.run_all()
+
+        report.refresh_from_db()
+        self.assertEqual(report.last_run_status, scheduler.STATUS_SUCCEEDED)
+        self.assertEqual(report.next_run_at, _at(2026, 10, 20, 9, 0))
+        with default_storage.open(report.last_output) as output:
+            self.assertEqual(json.load(output)["metrics"], {"leads": {"value": 0}})
+
+    def test_per_organization_limit_queues_extra_runs(self):
+        reports = [self._report(f"Report {index}") for index in range(3)]
+        self.scheduler.refresh(self.now)
+        due = self.scheduler.run_pending(self.now + timedelta(minutes=1))
+        self.assertCountEqual(due, [report.pk for report in reports])
+        self.assertEqual(len(self.executor.pending), 2)
+
+        self.executor.run_next()
+        self.assertEqual(len(self.executor.pending), 2)
+        self.executor.run_all()
+        statuses = models.Report.objects.values_list("last_run_status", flat=True)
+        self.assertEqual(set(statuses), {scheduler.STATUS_SUCCEEDED})
+
+    def test_refresh_only_reads_changed_reports(self):
+        report = self._report("Daily leads")
+        self.scheduler.refresh(self.now)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.scheduler.refresh(self.now), 0)
+
+        report.schedule_cron = "30 8 * * *"
+        report.save()
+        self.assertEqual(self.scheduler.refresh(self.now), 1)
+        self.assertEqual(self.scheduler.run_pending(self.now + timedelta(minutes=1)), [])
+        report.refresh_from_db()
+        self.assertEqual(report.next_run_at, _at(2026, 10, 20, 8, 30))
+
+        report.delete()
+        self.scheduler.refresh(self.now)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_failures_are_recorded(self):
+        report = self._report("Broken", metrics={"bad": "not json"}, codes=["missing"], format="csv")
+        self.assertEqual(scheduler.run_report(report.pk, now=self.now), scheduler.STATUS_SUCCEEDED)
+        report.refresh_from_db()
+        with default_storage.open(report.last_output) as output:
+            content = output.read().decode()
+        self.assertIn("missing", content)
+        self.assertIn("bad", content)
+
+        models.Report.objects.filter(pk=report.pk).update(definition={"metrics": ["not", "a", "mapping"]})
+        self.assertEqual(scheduler.run_report(report.pk, now=self.now), scheduler.STATUS_FAILED)
+        report.refresh_from_db()
+        self.assertEqual(report.last_run_status, scheduler.STATUS_FAILED)
+        self.assertTrue(report.last_run_error)
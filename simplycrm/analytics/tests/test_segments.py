@@ -0,0 +1,225 @@
+"""Tests for bitmap-backed customer segments."""
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import models, segments
+from simplycrm.automation import models as automation_models
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import models as sales_models
+
+
+class BitmapTests(TestCase):
+    def test_round_trip_and_set_operations(self):
+        left = segments.Bitmap.from_ids([1, 5, 64, 100_000])
+        right = segments.Bitmap.from_ids([5, 7, 100_000])
+        restored = segments.Bitmap.from_bytes(left.to_bytes())
+        self.assertEqual(restored, left)
+        self.assertEqual(list(left & right), [5, 100_000])
+        self.assertEqual(list(left | right), [1, 5, 7, 64, 100_000])
+        self.assertEqual(list(left - right), [1, 64])
+        self.assertEqual(len(left), 4)
+        self.assertIn(64, left)
+        self.assertNotIn(7, left)
+        self.assertLess(len(left.to_bytes()), 100)
+        self.assertFalse(segments.Bitmap.from_bytes(b""))
+
+
+class SegmentEngineMixin:
+    def _setup_data(self):
+        retail = sales_models.Company.objects.create(organization=self.organization, name="Shop", industry="Retail")
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Tea", sku="TEA")
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        self.vip = self._contact("Vip", company=retail, tags=["vip"])
+        self.regular = self._contact("Regular")
+        self.lapsed = self._contact("Lapsed", tags=["churned"])
+        self.retailer = self._contact("Retailer", company=retail)
+        self._order(self.vip, 60, days_ago=2)
+        self._order(self.regular, 10, days_ago=5)
+        self._order(self.lapsed, 30, days_ago=200)
+
+    def _contact(self, name, **fields):
+        return sales_models.Contact.objects.create(organization=self.organization, first_name=name, **fields)
+
+    def _order(self, contact, quantity, days_ago=0):
+        order = sales_models.Order.objects.create(organization=self.organization, contact=contact)
+        sales_models.OrderLine.objects.create(
+            order=order, product_variant=self.variant, quantity=quantity, unit_price="10.00"
+        )
+        sales_models.Order.objects.filter(pk=order.pk).update(ordered_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def _segment(self, definition, name="Segment"):
+        return models.CustomerSegment.objects.create(
+            organization=self.organization, name=name, filter_definition=definition
+        )
+
+
+class SegmentEngineTests(SegmentEngineMixin, TestCase):
+    def setUp(self):
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        self._setup_data()
+
+    def test_nested_definition_is_combined_with_bitwise_operations(self):
+        segment = self._segment(
+            {
+                "any": [
+                    {
+                        "all": [
+                            {"field": "total_spent", "op": "gte", "value": 200},
+                            {"not": {"field": "tag", "op": "has", "value": "churned"}},
+                        ]
+                    },
+                    {"field": "industry", "op": "eq", "value": "Retail"},
+                ]
+            }
+        )
+        members = segments.refresh_segment(segment)
+        self.assertEqual(set(members), {self.vip.id, self.retailer.id})
+        segment.refresh_from_db()
+        self.assertEqual(segment.size, 2)
+        self.assertEqual(str(segment.ltv), "300.00")
+        self.assertEqual(str(segment.churn_rate), "0.00")
+
+    def test_relative_days_and_negation(self):
+        recent = self._segment({"field": "last_order_days", "op": "lte", "value": 30})
+        lapsed = self._segment({"field": "last_order_days", "op": "gt", "value": 90})
+        others = self._segment({"field": "industry", "op": "ne", "value": "Retail"})
+        self.assertEqual(set(segments.refresh_segment(recent)), {self.vip.id, self.regular.id})
+        self.assertEqual(set(segments.refresh_segment(lapsed)), {self.lapsed.id, self.retailer.id})
+        self.assertEqual(set(segments.refresh_segment(others)), {self.regular.id, self.lapsed.id})
+        lapsed.refresh_from_db()
+        self.assertEqual(str(lapsed.churn_rate), "50.00")
+
+    def test_incremental_refresh_only_reevaluates_changed_contacts(self):
+        segment = self._segment({"field": "total_spent", "op": "gte", "value": 500})
+        self.assertEqual(set(segments.refresh_segment(segment)), {self.vip.id})
+
+        # An order touches its contact, so the next refresh picks it up.
+        self._order(self.regular, 50)
+        # Edits that bypass signals are invisible until a full refresh.
+        sales_models.OrderLine.objects.filter(order__contact=self.lapsed).update(quantity=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            sales_models.Contact.objects.filter(pk=self.vip.pk).delete()
+
+        members = segments.refresh_segment(segment)
+        self.assertEqual(set(members), {self.regular.id})
+        self.assertEqual(set(segments.refresh_segment(segment, full=True)), {self.regular.id, self.lapsed.id})
+
+    def test_incremental_refresh_reads_only_changed_contacts_and_member_orders(self):
+        segment = self._segment({"field": "total_spent", "op": "gte", "value": 500})
+        segments.refresh_segment(segment)
+        self._order(self.regular, 50)
+
+        # Changed contacts, their leaf query, the members' orders and the save; no scan of all contacts.
+        with self.assertNumQueries(4):
+            members = segments.refresh_segment(segment)
+        self.assertEqual(set(members), {self.vip.id, self.regular.id})
+        segment.refresh_from_db()
+        self.assertEqual(str(segment.ltv), "600.00")
+        self.assertEqual(str(segment.churn_rate), "0.00")
+
+        with mock.patch.object(segments, "MEMBER_CHUNK_SIZE", 1):
+            self.assertEqual(set(segments.refresh_segment(segment, full=True)), {self.vip.id, self.regular.id})
+        segment.refresh_from_db()
+        self.assertEqual(str(segment.ltv), "600.00")
+
+    def test_company_edits_and_moved_orders_reach_incremental_refresh(self):
+        retail = self._segment({"field": "industry", "op": "eq", "value": "Retail"}, name="Retail")
+        buyers = self._segment({"field": "orders_count", "op": "gte", "value": 1}, name="Buyers")
+        self.assertEqual(set(segments.refresh_segment(retail)), {self.vip.id, self.retailer.id})
+        self.assertEqual(set(segments.refresh_segment(buyers)), {self.vip.id, self.regular.id, self.lapsed.id})
+
+        self.vip.company.industry = "Wholesale"
+        self.vip.company.save()
+        order = sales_models.Order.objects.get(contact=self.regular)
+        order.contact = self.retailer
+        order.save()
+
+        self.assertEqual(set(segments.refresh_segment(retail)), set())
+        self.assertEqual(set(segments.refresh_segment(buyers)), {self.vip.id, self.retailer.id, self.lapsed.id})
+
+        self.regular.company = sales_models.Company.objects.create(
+            organization=self.organization, name="Outlet", industry="Retail"
+        )
+        self.regular.save()
+        self.assertEqual(set(segments.refresh_segment(retail)), {self.regular.id})
+        self.regular.company.delete()
+        self.assertEqual(set(segments.refresh_segment(retail)), set())
+
+    def test_overlap_and_audience_use_stored_bitmaps(self):
+        buyers = self._segment({"field": "orders_count", "op": "gte", "value": 1}, name="Buyers")
+        retail = self._segment({"field": "industry", "op": "eq", "value": "Retail"}, name="Retail")
+        segments.refresh_segment(buyers)
+        segments.refresh_segment(retail)
+        with self.assertNumQueries(0):
+            result = segments.overlap([buyers, retail])
+        self.assertEqual(result["sizes"], {buyers.id: 3, retail.id: 2})
+        self.assertEqual(result["pairs"][0]["intersection"], 1)
+        self.assertEqual(result["union"], 4)
+
+        audience = segments.resolve_audience(
+            self.organization.id, {"include_segments": [buyers.id], "exclude_segments": [retail.id]}
+        )
+        self.assertEqual(set(audience), {self.regular.id, self.lapsed.id})
+
+
+class SegmentApiTests(SegmentEngineMixin, TenantTestMixin, APITestCase):
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "marketer"
+
+    def setUp(self):
+        super().setUp()
+        self._setup_data()
+
+    def test_segment_endpoints_and_campaign_audience(self):
+        invalid = self.client.post(
+            reverse("customer-segment-list"),
+            {"organization": self.organization.pk, "name": "Bad", "filter_definition": {"field": "password"}},
+            format="json",
+        )
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        created = self.client.post(
+            reverse("customer-segment-list"),
+            {
+                "organization": self.organization.pk,
+                "name": "Vip",
+                "filter_definition": {"field": "tag", "op": "has", "value": "vip"},
+            },
+            format="json",
+        )
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED, created.content)
+        segment_id = created.json()["id"]
+        refreshed = self.client.post(reverse("customer-segment-refresh", args=[segment_id]), {}, format="json")
+        self.assertEqual(refreshed.json()["size"], 1)
+        members = self.client.get(reverse("customer-segment-members", args=[segment_id]))
+        self.assertEqual(members.json(), {"size": 1, "contact_ids": [self.vip.id]})
+
+        buyers = self._segment({"field": "orders_count", "op": "gte", "value": 1})
+        segments.refresh_segment(buyers)
+        overlap = self.client.post(
+            reverse("customer-segment-overlap"), {"segments": [segment_id, buyers.id]}, format="json"
+        )
+        self.assertEqual(overlap.status_code, status.HTTP_200_OK, overlap.content)
+        self.assertEqual(overlap.json()["intersection"], 1)
+
+        campaign = automation_models.Campaign.objects.create(
+            organization=self.organization,
+            name="Win back",
+            audience_definition={"include_segments": [buyers.id], "exclude_segments": [segment_id]},
+        )
+        audience = self.client.get(reverse("campaign-audience", args=[campaign.pk]), {"limit": 1})
+        self.assertEqual(audience.status_code, status.HTTP_200_OK, audience.content)
+        self.assertEqual(audience.json(), {"size": 2, "contact_ids": [self.regular.id]})
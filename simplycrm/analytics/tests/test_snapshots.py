@@ -0,0 +1,142 @@
+"""Tests for Parquet sales snapshots."""
+from __future__ import annotations
+
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from simplycrm.analytics import models, snapshots
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core import models as core_models
+from simplycrm.sales import models as sales_models
+
+
+@unittest.skipIf(snapshots.pq is None, "pyarrow is not installed")
+class SalesSnapshotTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ANALYTICS_SNAPSHOT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        category = catalog_models.Category.objects.create(organization=self.organization, name="Drinks")
+        product = catalog_models.Product.objects.create(
+            organization=self.organization, name="Tea", sku="TEA", category=category
+        )
+        self.variant = catalog_models.ProductVariant.objects.create(
+            product=product, name="Green", sku="TEA-G", price="10.00", cost="4.00"
+        )
+        company = sales_models.Company.objects.create(organization=self.organization, name="Shop", industry="Retail")
+        self.contact = sales_models.Contact.objects.create(
+            organization=self.organization, first_name="Ann", company=company
+        )
+        pipeline = sales_models.Pipeline.objects.create(organization=self.organization, name="Wholesale")
+        stage = sales_models.DealStage.objects.create(pipeline=pipeline, name="Won")
+        self.opportunity = sales_models.Opportunity.objects.create(
+            organization=self.organization, name="Deal", pipeline=pipeline, stage=stage, amount="100.00"
+        )
+        self.monday = timezone.make_aware(datetime(2026, 3, 2, 12))
+        self.first = self._order(self.monday, [(2, "10.00"), (1, "4.00")], opportunity=self.opportunity)
+        self.second = self._order(self.monday + timedelta(days=1), [(3, "10.00")])
+
+    def _order(self, moment, lines, **extra):
+        order = sales_models.Order.objects.create(organization=self.organization, contact=self.contact, **extra)
+        for quantity, price in lines:
+            sales_models.OrderLine.objects.create(
+                order=order, product_variant=self.variant, quantity=quantity, unit_price=price
+            )
+        order.ordered_at = moment
+        order.save(update_fields=["ordered_at"])
+        return order
+
+    def test_exports_only_changed_days(self):
+        first = snapshots.export_organization(self.organization.id)
+        self.assertEqual((first.days_written, first.rows_written), (2, 3))
+        manifest = snapshots.read_manifest(self.organization.id)
+        self.assertEqual(manifest["rows"], 3)
+        self.assertEqual(sorted(manifest["partitions"]), ["2026-03-02", "2026-03-03"])
+
+        unchanged = snapshots.export_organization(self.organization.id)
+        self.assertEqual((unchanged.days_written, unchanged.days_unchanged), (0, 2))
+
+        self.second.status = "paid"
+        self.second.save()
+        self._order(self.monday + timedelta(days=2), [(1, "10.00")])
+        self.first.delete()
+        changed = snapshots.export_organization(self.organization.id)
+        self.assertEqual((changed.days_written, changed.days_removed, changed.days_unchanged), (2, 1, 0))
+
+        frame = snapshots.read_order_lines(self.organization.id)
+        self.assertEqual(sorted(frame["order_date"].unique()), ["2026-03-03", "2026-03-04"])
+        self.assertEqual(frame.loc[frame["order_id"] == self.second.id, "order_status"].tolist(), ["paid"])
+
+    def test_edits_that_keep_sums_and_lengths_change_the_fingerprint(self):
+        sales_models.Order.objects.filter(pk=self.second.pk).update(status="open", currency="USD")
+        before = snapshots.day_fingerprints(self.organization.id)
+
+        sales_models.Order.objects.filter(pk=self.second.pk).update(status="paid", currency="EUR")
+        status_edit = snapshots.day_fingerprints(self.organization.id)
+        self.assertNotEqual(status_edit["2026-03-03"], before["2026-03-03"])
+        self.assertEqual(status_edit["2026-03-02"], before["2026-03-02"])
+
+        # Swapping quantities and prices between lines of a day keeps every per-day sum.
+        big, small = self.first.lines.order_by("id")
+        sales_models.OrderLine.objects.filter(pk=big.pk).update(quantity=small.quantity, unit_price=small.unit_price)
+        sales_models.OrderLine.objects.filter(pk=small.pk).update(quantity=big.quantity, unit_price=big.unit_price)
+        swapped = snapshots.day_fingerprints(self.organization.id)
+        self.assertNotEqual(swapped["2026-03-02"], before["2026-03-02"])
+
+    def test_incremental_exports_fingerprint_only_marked_days(self):
+        snapshots.export_organization(self.organization.id)
+        self.assertFalse(models.SnapshotDirtyDay.objects.exists())
+
+        # Bulk updates bypass the signals that mark days, so only a full export sees them.
+        self.first.lines.update(quantity=7)
+        with mock.patch.object(snapshots, "day_fingerprints", wraps=snapshots.day_fingerprints) as fingerprints:
+            skipped = snapshots.export_organization(self.organization.id)
+        self.assertEqual((skipped.days_written, skipped.days_unchanged), (0, 2))
+        fingerprints.assert_not_called()
+        self.assertEqual(snapshots.export_organization(self.organization.id, full=True).days_written, 2)
+
+        line = self.second.lines.get()
+        line.quantity = 4
+        line.save()
+        with mock.patch.object(snapshots, "day_fingerprints", wraps=snapshots.day_fingerprints) as fingerprints:
+            result = snapshots.export_organization(self.organization.id)
+        self.assertEqual((result.days_written, result.days_unchanged), (1, 1))
+        self.assertEqual(set(fingerprints.call_args.args[1]), {"2026-03-03"})
+
+        # Deleting the contact detaches its orders, which changes the exported contact_id of both days.
+        self.contact.delete()
+        self.assertEqual(snapshots.export_organization(self.organization.id).days_written, 2)
+        frame = snapshots.read_order_lines(self.organization.id, dimensions=[])
+        self.assertTrue(frame["contact_id"].isna().all())
+        self.assertFalse(models.SnapshotDirtyDay.objects.exists())
+
+        # Receivers that mark days while an organization is deleted do not break the cascade.
+        other = core_models.Organization.objects.create(name="Other", slug="other")
+        contact = sales_models.Contact.objects.create(organization=other, first_name="Bo")
+        sales_models.Order.objects.create(organization=other, contact=contact)
+        other.delete()
+        self.assertFalse(sales_models.Order.objects.filter(organization_id=other.id).exists())
+
+    def test_reader_filters_days_and_joins_dimensions(self):
+        snapshots.export_organization(self.organization.id)
+
+        frame = snapshots.read_order_lines(
+            self.organization.id, start=self.monday.date(), end=self.monday.date(), columns=["net_amount"]
+        )
+
+        self.assertEqual(len(frame), 2)
+        self.assertAlmostEqual(frame["net_amount"].sum(), 24.0)
+        self.assertEqual(set(frame["category_name"]), {"Drinks"})
+        self.assertEqual(set(frame["industry"]), {"Retail"})
+        self.assertEqual(set(frame["pipeline_name"]), {"Wholesale"})
+        self.assertTrue(snapshots.read_order_lines(self.organization.id + 1).empty)
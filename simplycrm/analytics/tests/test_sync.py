@@ -0,0 +1,139 @@
+"""Tests for the incremental data source sync engine."""
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.analytics import models, sync
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+
+
+class DataSyncTests(TenantTestMixin, APITestCase):
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "owner"
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings_override = override_settings(DATA_SOURCE_FILE_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = self.root / str(self.organization.id) / "shop"
+        self.directory.mkdir(parents=True)
+        self.source = models.DataSource.objects.create(
+            organization=self.organization,
+            name="Shop export",
+            source_type=sync.LocalFileReader.source_type,
+            config={"path": "shop"},
+        )
+
+    def _write(self, name, rows, mode="w"):
+        with (self.directory / name).open(mode) as handle:
+            for row in rows:
+                handle.write(json.dumps(row) + "\n")
+
+    def _records(self):
+        return dict(models.SyncedRecord.objects.filter(data_source=self.source).values_list("external_id", "data"))
+
+    def test_syncs_incrementally_from_the_watermark(self):
+        self._write(
+            "2026-01.jsonl",
+            [{"id": index, "total": index * 10, "updated_at": "2026-01-0%dT10:00:00Z" % index} for index in (1, 2, 3)],
+        )
+        first = sync.sync_source(self.source, batch_size=2)
+
+        self.assertEqual(first.status, sync.STATUS_SUCCEEDED)
+        self.assertEqual((first.stats["batches"], first.stats["records_upserted"]), (2, 3))
+        self.assertEqual(first.stats["newest_record_at"], "2026-01-03T10:00:00+00:00")
+        self.assertGreater(first.stats["lag_seconds"], 0)
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.watermark, {"file": "2026-01.jsonl", "row": 3})
+
+        self._write("2026-01.jsonl", [{"id": 2, "total": 25}], mode="a")
+        self._write("2026-02.jsonl", [{"id": 4, "total": 40}])
+        second = sync.sync_source(self.source, batch_size=2)
+
+        self.assertEqual(second.stats["records_read"], 2)
+        self.assertEqual(second.stats["watermark_start"], {"file": "2026-01.jsonl", "row": 3})
+        records = self._records()
+        self.assertEqual(sorted(records), ["1", "2", "3", "4"])
+        self.assertEqual(records["2"]["total"], 25)
+
+        self.assertEqual(sync.sync_source(self.source).stats["records_read"], 0)
+
+    def test_csv_batches_keep_the_last_copy_of_duplicates(self):
+        self.source.config = {"path": "shop", "id_field": "sku", "updated_field": "changed"}
+        self.source.save()
+        (self.directory / "products.csv").write_text("sku,price,changed\nA,10,2026-03-01 09:00\nA,12,\nB,7,\n")
+
+        log = sync.sync_source(self.source)
+
+        self.assertEqual((log.stats["records_read"], log.stats["records_upserted"]), (3, 2))
+        self.assertEqual(self._records()["A"]["price"], "12")
+
+    def test_failed_batches_keep_committed_progress(self):
+        self._write("2026-01.jsonl", [{"id": 1}, {"id": 2}, {"total": 3}])
+
+        with self.assertLogs("simplycrm.analytics.sync", level="ERROR"):
+            log = sync.sync_source(self.source, batch_size=2)
+
+        self.assertEqual(log.status, sync.STATUS_FAILED)
+        self.assertEqual(log.stats["error"], "2026-01.jsonl:3: нет поля id.")
+        self.assertEqual(sorted(self._records()), ["1", "2"])
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.watermark, {"file": "2026-01.jsonl", "row": 2})
+
+    def test_sync_endpoint_and_config_validation(self):
+        self._write("2026-01.jsonl", [{"id": 1}])
+
+        url = reverse("data-source-sync", args=[self.source.id])
+        response = self.client.post(url, {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(response.data["stats"]["records_upserted"], 1)
+
+        again = self.client.post(url, {"full": True}, format="json")
+        self.assertEqual(again.data["stats"]["records_read"], 1)
+
+        invalid = self.client.post(
+            reverse("data-source-list"),
+            {
+                "organization": self.organization.id,
+                "name": "Escape",
+                "source_type": sync.LocalFileReader.source_type,
+                "config": {"path": "../../etc"},
+            },
+            format="json",
+        )
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("config", invalid.data)
+
+    def test_sources_cannot_read_outside_their_organization_directory(self):
+        other = core_models.Organization.objects.create(name="Rival", slug="rival")
+        (self.root / str(other.id) / "shop").mkdir(parents=True)
+        (self.root / str(other.id) / "shop" / "secret.jsonl").write_text('{"id": "leak"}\n')
+        self._write("2026-01.jsonl", [{"id": 1}])
+
+        for config in ({"path": "shop", "pattern": "../../*/shop/*"}, {"path": "shop", "pattern": "**/*.jsonl"}):
+            with self.assertRaises(ValidationError):
+                sync.validate_config(sync.LocalFileReader.source_type, config)
+        with self.assertRaises(ValidationError):
+            sync.validate_config(sync.LocalFileReader.source_type, {"path": f"../{other.id}/shop"})
+
+        # The same relative path resolves to each organization's own directory.
+        self.assertEqual(sync.sync_source(self.source).stats["records_upserted"], 1)
+        self.assertEqual(sorted(self._records()), ["1"])
+
+        # Symlinks escaping the directory are skipped.
+        (self.directory / "linked.jsonl").symlink_to(self.root / str(other.id) / "shop" / "secret.jsonl")
+        sync.sync_source(self.source)
+        self.assertNotIn("leak", self._records())
@@ -0,0 +1,24 @@
+"""Helpers shared by the analytics tests."""
+from __future__ import annotations
+
+from concurrent.futures import Executor, Future
+
+
+class DeferredExecutor(Executor):
+    """Executor that runs submitted work only when the test asks it to."""
+
+    def __init__(self):
+        self.pending: list[tuple[Future, object]] = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.pending.append((future, lambda: fn(*args, **kwargs)))
+        return future
+
+    def run_next(self):
+        future, call = self.pending.pop(0)
+        future.set_result(call())
+
+    def run_all(self):
+        while self.pending:
+            self.run_next()
@@ -15,6 +15,7 @@ router.register(r"customer-segments", viewsets.CustomerSegmentViewSet, basename=
 router.register(r"model-training-runs", viewsets.ModelTrainingRunViewSet, basename="model-training-run")
 router.register(r"data-sources", viewsets.DataSourceViewSet, basename="data-source")
 router.register(r"data-sync-logs", viewsets.DataSyncLogViewSet, basename="data-sync-log")
+router.register(r"settings", viewsets.AnalyticsSettingsViewSet, basename="analytics-settings")
 router.register(r"insight-analytics", viewsets.InsightAnalyticsViewSet, basename="insight-analytics")
 
 
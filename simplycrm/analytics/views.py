@@ -14,7 +14,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from simplycrm.analytics import services
-from simplycrm.core import tenant
+from simplycrm.core import coalescing, tenant
 from simplycrm.core.permissions import HasFeaturePermission
 from simplycrm.sales import models as sales_models
 
@@ -32,13 +32,21 @@ class AnalyticsOverviewView(APIView):
                                 {"detail": "Активная организация не выбрана."},
                                 status=status.HTTP_400_BAD_REQUEST,
                         )
+                # Identical concurrent requests of one tenant share one computation.
+                payload = coalescing.coalesce(
+                        "analytics-overview", organization.id, lambda: self.build_payload(organization)
+                )
+                return Response(payload)
+
+        @staticmethod
+        def build_payload(organization) -> dict:
                 organization_id = organization.id
 
                 orders_qs = sales_models.Order.objects.filter(
                         organization=organization
                 ).prefetch_related("lines", "opportunity__pipeline")
 
-                rfm_scores = services.calculate_rfm_scores(orders_qs)
+                rfm_scores = services.customer_rfm_scores(organization_id)
                 price_recommendations = services.recommend_price_actions(organization_id)[
                         "recommendations"
                 ]
@@ -105,7 +113,7 @@ class AnalyticsOverviewView(APIView):
                         "performance": performance,
                         "channelBreakdown": channel_breakdown,
                 }
-                return Response(payload)
+                return payload
 
 
 class AnalyticsDashboardView(LoginRequiredMixin, TemplateView):
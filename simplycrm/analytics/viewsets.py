@@ -1,10 +1,11 @@
 """ViewSets exposing analytics data."""
 from __future__ import annotations
 
+from django.core.exceptions import ValidationError as DjangoValidationError
 from drf_spectacular.utils import extend_schema
 from rest_framework import decorators, permissions, response, status, viewsets
 from rest_framework.exceptions import ValidationError
-from simplycrm.analytics import models, serializers, services
+from simplycrm.analytics import dashboards, lead_scoring, metric_dsl, metrics, models, segments, serializers, services, sync
 from simplycrm.core import tenant
 from simplycrm.core.permissions import HasFeaturePermission
 from simplycrm.core.serializers import EmptySerializer
@@ -32,10 +33,75 @@ class MetricDefinitionViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.MetricDefinitionSerializer
     feature_code = "analytics.custom_metrics"
 
+    @extend_schema(
+        request=serializers.MetricEvaluationQuerySerializer,
+        responses=serializers.MetricEvaluationSerializer(many=True),
+    )
+    @decorators.action(detail=False, methods=["post"], url_path="evaluate")
+    def evaluate(self, request):
+        """Evaluate saved metrics by code and/or inline definitions for a dashboard."""
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.MetricEvaluationQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        codes = query.validated_data.get("codes", [])
+        definitions = dict(
+            self.get_queryset().filter(code__in=codes, is_active=True).values_list("code", "query")
+        )
+        missing = sorted(set(codes) - set(definitions))
+        if missing:
+            raise ValidationError(f"Метрики не найдены: {', '.join(missing)}.")
+        definitions.update(query.validated_data.get("metrics", {}))
+        data = metric_dsl.evaluate_metrics(
+            organization_id,
+            definitions.items(),
+            start=query.validated_data.get("start"),
+            end=query.validated_data.get("end"),
+        )
+        return response.Response(data)
+
+    @extend_schema(
+        parameters=[serializers.MetricPeriodSerializer],
+        responses=serializers.MetricEvaluationSerializer,
+    )
+    @decorators.action(detail=True, methods=["get"], url_path="value")
+    def value(self, request, pk=None):
+        definition = self.get_object()
+        query = serializers.MetricPeriodSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = metric_dsl.evaluate_metrics(
+            definition.organization_id,
+            [(definition.code, definition.query)],
+            start=query.validated_data.get("start"),
+            end=query.validated_data.get("end"),
+        )
+        return response.Response(data[definition.code])
+
 
 class DashboardViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.DashboardSerializer
 
+    @extend_schema(
+        parameters=[serializers.MetricPeriodSerializer],
+        responses=serializers.DashboardRenderSerializer,
+    )
+    @decorators.action(detail=True, methods=["get"], url_path="render", url_name="render")
+    def render_widgets(self, request, pk=None):
+        """Return the data of all widgets of the dashboard in one response."""
+        dashboard = self.get_object()
+        query = serializers.MetricPeriodSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        try:
+            data = dashboards.render_dashboard(
+                dashboard,
+                start=query.validated_data.get("start"),
+                end=query.validated_data.get("end"),
+            )
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages) from None
+        return response.Response(data)
+
 
 class ReportViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.ReportSerializer
@@ -55,16 +121,105 @@ class CustomerSegmentViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.CustomerSegmentSerializer
     feature_code = "analytics.customer_segments"
 
+    @extend_schema(request=serializers.SegmentRefreshSerializer, responses=serializers.CustomerSegmentSerializer)
+    @decorators.action(detail=True, methods=["post"], url_path="refresh")
+    def refresh(self, request, pk=None):
+        segment = self.get_object()
+        options = serializers.SegmentRefreshSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        segments.refresh_segment(segment, full=options.validated_data["full"])
+        return response.Response(self.get_serializer(segment).data)
+
+    @extend_schema(
+        parameters=[serializers.SegmentMembersQuerySerializer],
+        responses=serializers.SegmentMembersSerializer,
+    )
+    @decorators.action(detail=True, methods=["get"], url_path="members")
+    def members(self, request, pk=None):
+        segment = self.get_object()
+        page = serializers.SegmentMembersQuerySerializer(data=request.query_params)
+        page.is_valid(raise_exception=True)
+        offset, limit = page.validated_data["offset"], page.validated_data["limit"]
+        contact_ids = segments.membership(segment).ids()
+        data = {"size": len(contact_ids), "contact_ids": contact_ids[offset : offset + limit].tolist()}
+        return response.Response(serializers.SegmentMembersSerializer(data).data)
+
+    @extend_schema(
+        request=serializers.SegmentOverlapQuerySerializer,
+        responses=serializers.SegmentOverlapSerializer,
+    )
+    @decorators.action(detail=False, methods=["post"], url_path="overlap")
+    def overlap(self, request):
+        query = serializers.SegmentOverlapQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        requested = query.validated_data["segments"]
+        found = list(self.get_queryset().filter(id__in=requested))
+        missing = sorted(set(requested) - {segment.id for segment in found})
+        if missing:
+            raise ValidationError(f"Сегменты не найдены: {', '.join(map(str, missing))}.")
+        return response.Response(serializers.SegmentOverlapSerializer(segments.overlap(found)).data)
+
 
 class ModelTrainingRunViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.ModelTrainingRunSerializer
     feature_code = "analytics.mlops"
 
+    @extend_schema(
+        request=serializers.LeadScoringTrainingSerializer,
+        responses=serializers.LeadScoringResultSerializer,
+    )
+    @decorators.action(detail=False, methods=["post"], url_path="lead-scoring", url_name="lead-scoring")
+    def train_lead_scoring(self, request):
+        """Train the organization's lead scoring model and optionally rescore its leads."""
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        options = serializers.LeadScoringTrainingSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        parameters = {key: options.validated_data[key] for key in lead_scoring.DEFAULT_PARAMETERS}
+        (run,) = lead_scoring.train_organizations([organization_id], parameters=parameters)
+        scored = 0
+        if options.validated_data["score"] and run.status == lead_scoring.STATUS_SUCCEEDED:
+            scored = lead_scoring.score_leads(organization_id)
+        data = {"run": run, "scored_leads": scored}
+        status_code = status.HTTP_201_CREATED if run.status == lead_scoring.STATUS_SUCCEEDED else status.HTTP_200_OK
+        return response.Response(serializers.LeadScoringResultSerializer(data).data, status=status_code)
+
 
 class DataSourceViewSet(BaseAnalyticsViewSet):
     serializer_class = serializers.DataSourceSerializer
     feature_code = "analytics.integrations"
 
+    @extend_schema(request=serializers.DataSyncRequestSerializer, responses=serializers.DataSyncLogSerializer)
+    @decorators.action(detail=True, methods=["post"], url_path="sync")
+    def sync(self, request, pk=None):
+        """Pull new records of the source since its watermark."""
+        source = self.get_object()
+        options = serializers.DataSyncRequestSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        if options.validated_data["full"]:
+            sync.reset_watermark(source)
+        log = sync.sync_source(
+            source,
+            batch_size=options.validated_data["batch_size"],
+            max_batches=options.validated_data.get("max_batches"),
+        )
+        status_code = status.HTTP_201_CREATED if log.status == sync.STATUS_SUCCEEDED else status.HTTP_200_OK
+        return response.Response(serializers.DataSyncLogSerializer(log).data, status=status_code)
+
+
+class AnalyticsSettingsViewSet(BaseAnalyticsViewSet):
+    serializer_class = serializers.AnalyticsSettingsSerializer
+    feature_code = "analytics.insights"
+
+    def perform_create(self, serializer):  # type: ignore[override]
+        organization = tenant.get_request_organization(self.request)
+        if not organization:
+            raise ValidationError("Активная организация не выбрана.")
+        if models.AnalyticsSettings.objects.filter(organization=organization).exists():
+            raise ValidationError("Настройки аналитики для организации уже созданы.")
+        serializer.save(organization=organization)
+
 
 class DataSyncLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.DataSyncLogSerializer
@@ -85,6 +240,11 @@ class InsightAnalyticsViewSet(viewsets.ViewSet):
     feature_code = "analytics.insights"
     feature_code_map = {
         "rfm": "analytics.customer_segments",
+        "churn_risk": "analytics.customer_segments",
+        "cohorts": "analytics.customer_segments",
+        "funnel": "analytics.forecasting",
+        "pipeline_forecast": "analytics.forecasting",
+        "forecast_drift": "analytics.forecasting",
         "sales_metrics": "analytics.standard",
         "anomalies": "analytics.insights",
         "price_recommendations": "analytics.insights",
@@ -96,21 +256,28 @@ class InsightAnalyticsViewSet(viewsets.ViewSet):
     @extend_schema(responses=serializers.RfmScoreSerializer(many=True))
     @decorators.action(detail=False, methods=["get"], url_path="rfm")
     def rfm(self, request):
-        organization = tenant.get_request_organization(request)
-        if not organization:
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
             raise ValidationError("Активная организация не выбрана.")
-        orders = organization.orders.all()
-        data = services.calculate_rfm_scores(orders)
+        data = services.customer_rfm_scores(organization_id)
         return response.Response(data)
     
-    @extend_schema(responses=serializers.SalesMetricsSerializer)
+    @extend_schema(
+        parameters=[serializers.SalesMetricsQuerySerializer],
+        responses=serializers.SalesMetricsSerializer,
+    )
     @decorators.action(detail=False, methods=["get"], url_path="sales-metrics")
     def sales_metrics(self, request):
         organization_id = tenant.get_request_organization_id(request)
         if organization_id is None:
             raise ValidationError("Активная организация не выбрана.")
-        metrics = services.aggregate_sales_metrics(organization_id)
-        return response.Response(metrics)
+        query = serializers.SalesMetricsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        period = metrics.Period(query.validated_data.get("start"), query.validated_data.get("end"))
+        data = services.aggregate_sales_metrics(
+            organization_id, period, compare=query.validated_data.get("compare")
+        )
+        return response.Response(serializers.SalesMetricsSerializer(data).data)
     
     @extend_schema(responses=serializers.AnalyticsAnomalySerializer(many=True))
     @decorators.action(detail=False, methods=["get"], url_path="anomalies")
@@ -139,11 +306,86 @@ class InsightAnalyticsViewSet(viewsets.ViewSet):
         forecast = services.forecast_product_demand(organization_id)
         return response.Response(forecast)
     
-    @extend_schema(responses=serializers.NextBestActionSerializer(many=True))
+    @extend_schema(
+        parameters=[serializers.NextBestActionPageSerializer],
+        responses=serializers.NextBestActionSerializer(many=True),
+    )
     @decorators.action(detail=False, methods=["get"], url_path="next-best-actions")
     def next_best_actions(self, request):
         organization_id = tenant.get_request_organization_id(request)
         if organization_id is None:
             raise ValidationError("Активная организация не выбрана.")
-        actions = services.suggest_next_best_actions(organization_id)
+        page = serializers.NextBestActionPageSerializer(data=request.query_params)
+        page.is_valid(raise_exception=True)
+        actions = services.suggest_next_best_actions(organization_id, **page.validated_data)
         return response.Response(actions)
+    
+    @extend_schema(
+        parameters=[serializers.ChurnRiskQuerySerializer],
+        responses=serializers.ChurnRiskSerializer(many=True),
+    )
+    @decorators.action(detail=False, methods=["get"], url_path="churn-risk")
+    def churn_risk(self, request):
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.ChurnRiskQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        risks = services.list_churn_risks(organization_id, **query.validated_data)
+        return response.Response(serializers.ChurnRiskSerializer(risks, many=True).data)
+    
+    @extend_schema(
+        parameters=[serializers.CohortQuerySerializer],
+        responses=serializers.CohortMatrixSerializer,
+    )
+    @decorators.action(detail=False, methods=["get"], url_path="cohorts")
+    def cohorts(self, request):
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.CohortQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = services.build_cohort_matrix(organization_id, **query.validated_data)
+        return response.Response(serializers.CohortMatrixSerializer(data).data)
+    
+    @extend_schema(
+        parameters=[serializers.FunnelQuerySerializer],
+        responses=serializers.PipelineFunnelSerializer(many=True),
+    )
+    @decorators.action(detail=False, methods=["get"], url_path="funnel")
+    def funnel(self, request):
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.FunnelQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        funnels = services.pipeline_funnels(organization_id, **query.validated_data)
+        return response.Response(serializers.PipelineFunnelSerializer(funnels, many=True).data)
+    
+    @extend_schema(
+        parameters=[serializers.PipelineForecastQuerySerializer],
+        responses=serializers.PipelineForecastSerializer,
+    )
+    @decorators.action(detail=False, methods=["get"], url_path="pipeline-forecast")
+    def pipeline_forecast(self, request):
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.PipelineForecastQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        forecast = services.pipeline_revenue_forecast(organization_id, **query.validated_data)
+        return response.Response(serializers.PipelineForecastSerializer(forecast).data)
+    
+    @extend_schema(
+        parameters=[serializers.ForecastDriftQuerySerializer],
+        responses=serializers.ForecastDriftSerializer(many=True),
+    )
+    @decorators.action(detail=False, methods=["get"], url_path="forecast-drift")
+    def forecast_drift(self, request):
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.ForecastDriftQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        drift = services.pipeline_forecast_drift(organization_id, **query.validated_data)
+        return response.Response(serializers.ForecastDriftSerializer(drift, many=True).data)
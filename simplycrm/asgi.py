@@ -9,3 +9,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "simplycrm.settings")
 
 application = get_asgi_application()
+
+# Imported after setup: the middleware module loads assistant models.
+from simplycrm.assistant.streaming import CancelOnDisconnectMiddleware  # noqa: E402
+
+# Cancel assistant reply streams when the client goes away.
+application = CancelOnDisconnectMiddleware(application)
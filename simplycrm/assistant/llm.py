@@ -0,0 +1,226 @@
+"""Process-wide OpenAI clients for the assistant.
+
+Building an ``OpenAI`` client creates a new HTTP connection pool, so the
+clients are kept for the lifetime of the process and reused by every request:
+one sync client shared by all threads and one async client per event loop
+(an async connection pool is bound to the loop it was opened on). Clients are
+rebuilt when the ``ASSISTANT_LLM`` settings they were made from change.
+
+Every call goes through :func:`create_completion` or
+:func:`acreate_completion`, which
+
+* hold one of ``MAX_CONCURRENCY`` process-wide slots for the whole call,
+  streams included, waiting at most ``QUEUE_TIMEOUT`` seconds for one before
+  raising :class:`LLMBusy`. Sync and async callers share the same slots, so a
+  burst of questions cannot tie up every worker waiting on the model;
+* retry connection errors, timeouts, rate limits and 5xx responses up to
+  ``MAX_RETRIES`` times with exponential backoff (``RETRY_BACKOFF`` doubled
+  per attempt, capped at ``RETRY_BACKOFF_MAX``, with jitter). A
+  ``Retry-After`` header takes precedence. Only opening a stream is retried;
+  once tokens flow, errors go to the caller.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator
+
+from django.conf import settings
+
+try:  # pragma: no cover - optional dependency during tests
+	import openai
+	from openai import AsyncOpenAI, OpenAI
+except Exception:  # pragma: no cover - keep runtime resilient without openai package
+	openai = None  # type: ignore
+	AsyncOpenAI = OpenAI = None  # type: ignore
+
+
+DEFAULTS: dict[str, Any] = {
+	"API_KEY": "",
+	"BASE_URL": None,
+	"TIMEOUT": 60.0,
+	"CONNECT_TIMEOUT": 5.0,
+	"MAX_RETRIES": 2,
+	"RETRY_BACKOFF": 0.5,
+	"RETRY_BACKOFF_MAX": 8.0,
+	"MAX_CONCURRENCY": 8,
+	"QUEUE_TIMEOUT": 10.0,
+}
+_QUEUE_POLL_SECONDS = 0.05
+
+
+class LLMBusy(Exception):
+	"""No concurrency slot became free within ``QUEUE_TIMEOUT``."""
+
+
+def get_config() -> dict[str, Any]:
+	return {**DEFAULTS, **getattr(settings, "ASSISTANT_LLM", {})}
+
+
+def is_available() -> bool:
+	return OpenAI is not None
+
+
+def _client_options(config: dict[str, Any]) -> dict[str, Any]:
+	return {
+		"api_key": config["API_KEY"],
+		"base_url": config["BASE_URL"],
+		"timeout": openai.Timeout(float(config["TIMEOUT"]), connect=float(config["CONNECT_TIMEOUT"])),
+		# Retries are ours, so they share the backoff settings and the sync and async paths behave alike.
+		"max_retries": 0,
+	}
+
+
+def _fingerprint(config: dict[str, Any]) -> tuple:
+	return tuple(config[key] for key in ("API_KEY", "BASE_URL", "TIMEOUT", "CONNECT_TIMEOUT"))
+
+
+_lock = threading.Lock()
+_client: tuple[tuple, Any] | None = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[tuple, Any]]" = weakref.WeakKeyDictionary()
+_limiter: tuple[int, threading.BoundedSemaphore] | None = None
+
+
+def get_client() -> Any:
+	"""Return the shared sync client, building it on first use or after a settings change."""
+
+	global _client
+	config = get_config()
+	fingerprint = _fingerprint(config)
+	with _lock:
+		if _client is None or _client[0] != fingerprint:
+			_client = (fingerprint, OpenAI(**_client_options(config)))
+		return _client[1]
+
+
+def get_async_client() -> Any:
+	"""Return the async client of the running event loop."""
+
+	config = get_config()
+	fingerprint = _fingerprint(config)
+	loop = asyncio.get_running_loop()
+	with _lock:
+		for stale in [other for other in _async_clients if other.is_closed()]:
+			del _async_clients[stale]
+		entry = _async_clients.get(loop)
+		if entry is None or entry[0] != fingerprint:
+			entry = _async_clients[loop] = (fingerprint, AsyncOpenAI(**_client_options(config)))
+		return entry[1]
+
+
+def reset() -> None:
+	"""Drop the shared clients and limiter; they are rebuilt on next use."""
+
+	global _client, _limiter
+	with _lock:
+		client, _client, _limiter = _client, None, None
+		_async_clients.clear()
+	if client is not None:
+		client[1].close()
+
+
+def _semaphore() -> threading.BoundedSemaphore:
+	global _limiter
+	size = max(int(get_config()["MAX_CONCURRENCY"]), 1)
+	with _lock:
+		if _limiter is None or _limiter[0] != size:
+			_limiter = (size, threading.BoundedSemaphore(size))
+		return _limiter[1]
+
+
+@contextmanager
+def slot() -> Iterator[None]:
+	"""Hold a concurrency slot, blocking the thread up to ``QUEUE_TIMEOUT``."""
+
+	semaphore = _semaphore()
+	if not semaphore.acquire(timeout=max(float(get_config()["QUEUE_TIMEOUT"]), 0)):
+		raise LLMBusy("Assistant is busy, please retry shortly.")
+	try:
+		yield
+	finally:
+		semaphore.release()
+
+
+@asynccontextmanager
+async def aslot() -> AsyncIterator[None]:
+	"""Hold a concurrency slot without blocking the event loop."""
+
+	semaphore = _semaphore()
+	deadline = time.monotonic() + float(get_config()["QUEUE_TIMEOUT"])
+	# The slots are shared with sync callers, so poll rather than wait on an asyncio primitive.
+	while not semaphore.acquire(blocking=False):
+		remaining = deadline - time.monotonic()
+		if remaining <= 0:
+			raise LLMBusy("Assistant is busy, please retry shortly.")
+		await asyncio.sleep(min(_QUEUE_POLL_SECONDS, remaining))
+	try:
+		yield
+	finally:
+		semaphore.release()
+
+
+def _retry_delay(exc: Exception, attempt: int, config: dict[str, Any]) -> float | None:
+	"""Seconds to wait before retrying after ``exc``, or ``None`` when it should not be retried."""
+
+	if attempt >= int(config["MAX_RETRIES"]):
+		return None
+	if not isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+		return None
+	ceiling = float(config["RETRY_BACKOFF_MAX"])
+	response = getattr(exc, "response", None)
+	retry_after = response.headers.get("retry-after") if response is not None else None
+	if retry_after:
+		try:
+			return min(max(float(retry_after), 0.0), ceiling)
+		except ValueError:
+			pass
+	return min(float(config["RETRY_BACKOFF"]) * 2 ** attempt, ceiling) * random.uniform(0.5, 1.0)
+
+
+def create_completion(**options) -> Any:
+	"""``chat.completions.create`` on the shared client, inside a slot and with retries."""
+
+	config = get_config()
+	with slot():
+		attempt = 0
+		while True:
+			try:
+				return get_client().chat.completions.create(**options)
+			except Exception as exc:
+				delay = _retry_delay(exc, attempt, config)
+				if delay is None:
+					raise
+			attempt += 1
+			time.sleep(delay)
+
+
+@asynccontextmanager
+async def acreate_completion(**options) -> AsyncIterator[Any]:
+	"""Async ``chat.completions.create``; the slot is held until the block exits.
+
+	Used as ``async with acreate_completion(...) as completion`` so that a
+	streamed completion keeps its slot while it is being consumed.
+	"""
+
+	config = get_config()
+	async with aslot():
+		attempt = 0
+		while True:
+			try:
+				completion = await get_async_client().chat.completions.create(**options)
+				break
+			except Exception as exc:
+				delay = _retry_delay(exc, attempt, config)
+				if delay is None:
+					raise
+			attempt += 1
+			await asyncio.sleep(delay)
+		try:
+			yield completion
+		finally:
+			if options.get("stream"):
+				await completion.close()
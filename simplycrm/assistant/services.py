@@ -3,32 +3,87 @@ from __future__ import annotations
 
 import json
 import logging
-import os
-from typing import Any, Iterable
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, AsyncIterator, Iterable
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from simplycrm.analytics import services as analytics_services
+from simplycrm.assistant import llm
+from simplycrm.core import versioning
 
 
-try:  # pragma: no cover - optional dependency during tests
-	from openai import OpenAI
-except Exception:  # pragma: no cover - keep runtime resilient without openai package
-	OpenAI = None  # type: ignore
-
 LOGGER = logging.getLogger(__name__)
 
 
-def build_operational_context(organization_id: int) -> dict[str, Any]:
-	"""Gather key metrics that the assistant can reason about."""
-	
-	context = {
-		"generated_at": timezone.now().isoformat(),
-		"sales_metrics": analytics_services.aggregate_sales_metrics(organization_id),
-		"anomalies": analytics_services.detect_sales_anomalies(organization_id),
-		"price_recommendations": analytics_services.recommend_price_actions(organization_id),
-		"demand_forecast": analytics_services.forecast_product_demand(organization_id),
-		"next_best_actions": analytics_services.suggest_next_best_actions(organization_id),
+CONTEXT_KEY_PREFIX = "simplycrm:assistant:context"
+CONTEXT_DEFAULTS: dict[str, int] = {"TIMEOUT": 10 * 60}
+# Section name -> versioned analytics service producing it.
+CONTEXT_SECTIONS = {
+	"sales_metrics": analytics_services.aggregate_sales_metrics,
+	"anomalies": analytics_services.detect_sales_anomalies,
+	"price_recommendations": analytics_services.recommend_price_actions,
+	"demand_forecast": analytics_services.forecast_product_demand,
+	"next_best_actions": analytics_services.suggest_next_best_actions,
+}
+
+
+def _context_config() -> dict[str, int]:
+	return {**CONTEXT_DEFAULTS, **getattr(settings, "ASSISTANT_CONTEXT", {})}
+
+
+def _section_versions(organization_id: int) -> dict[str, str]:
+	scopes = sorted({scope for section in CONTEXT_SECTIONS.values() for scope in section.scopes})
+	token = versioning.get_data_version(organization_id, *scopes)
+	current = dict(zip(scopes, token.split("|")))
+	today = timezone.localdate().isoformat()
+	return {
+		name: "|".join([*(current[scope] for scope in section.scopes), *([today] if section.daily else [])])
+		for name, section in CONTEXT_SECTIONS.items()
 	}
+
+
+def _isoformat(timestamp: float) -> str:
+	return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat()
+
+
+def build_operational_context(organization_id: int) -> dict[str, Any]:
+	"""Gather key metrics that the assistant can reason about.
+	
+	Sections are cached per organization together with the data version they
+	were built from; only sections whose inputs changed, or that are older
+	than ``ASSISTANT_CONTEXT["TIMEOUT"]``, are recomputed. Build times per
+	section are reported under ``build``.
+	"""
+	
+	timeout = _context_config()["TIMEOUT"]
+	key = f"{CONTEXT_KEY_PREFIX}:{organization_id}"
+	entries: dict[str, tuple] = cache.get(key) or {}
+	versions = _section_versions(organization_id)
+	started = time.perf_counter()
+	now = time.time()
+	context: dict[str, Any] = {"generated_at": timezone.now().isoformat()}
+	build: dict[str, dict[str, Any]] = {}
+	changed = False
+	for name, section in CONTEXT_SECTIONS.items():
+		entry = entries.get(name)
+		if entry is not None and entry[0] == versions[name] and now - entry[1] < timeout:
+			context[name] = entry[3]
+			build[name] = {"cached": True, "seconds": 0.0, "computed_at": _isoformat(entry[1])}
+			continue
+		section_started = time.perf_counter()
+		value = section.fresh(organization_id)
+		seconds = round(time.perf_counter() - section_started, 4)
+		entries[name] = (versions[name], now, seconds, value)
+		context[name] = value
+		build[name] = {"cached": False, "seconds": seconds, "computed_at": _isoformat(now)}
+		changed = True
+		LOGGER.debug("Built assistant context section %s for organization %s in %.3fs", name, organization_id, seconds)
+	if changed:
+		cache.set(key, entries, timeout=timeout)
+	context["build"] = {"seconds": round(time.perf_counter() - started, 4), "sections": build}
 	return context
 
 
@@ -77,44 +132,100 @@ def render_context_as_markdown(context: dict[str, Any]) -> str:
 			sections.append(f"- {anomaly['type']}: {anomaly['message']}")
 	
 	sections.append("\n### Raw Context JSON")
-	sections.append(f"```json\n{json.dumps(context, default=str, indent=2)}\n```")
+	payload = {key: value for key, value in context.items() if key != "build"}
+	sections.append(f"```json\n{json.dumps(payload, default=str, indent=2)}\n```")
 	return "\n".join(sections)
 
 
-def call_chat_completion(system_prompt: str, messages: Iterable[dict[str, str]]) -> dict[str, Any]:
-	"""Send a chat completion request to OpenAI, if configured."""
+def llm_config() -> dict[str, Any]:
+	return llm.get_config()
+
+
+def _unavailable_reply() -> str | None:
+	"""Explain why no LLM can be reached, or return ``None`` when it is configured."""
 	
-	if OpenAI is None:
+	if not llm.is_available():
 		LOGGER.warning("openai package is unavailable; returning stubbed response")
-		return {
-			"content": "OpenAI client is not installed. Provide OPENAI_API_KEY and install openai to enable replies.",
-			"usage": {"total_tokens": 0},
-		}
-	
-	api_key = os.getenv("OPENAI_API_KEY")
-	if not api_key:
+		return "OpenAI client is not installed. Provide OPENAI_API_KEY and install openai to enable replies."
+	if not llm_config()["API_KEY"]:
 		LOGGER.warning("OPENAI_API_KEY missing; returning stubbed response")
-		return {
-			"content": "OPENAI_API_KEY is not configured on the server; unable to reach OpenAI.",
-			"usage": {"total_tokens": 0},
-		}
-	
-	client = OpenAI(api_key=api_key)
-	completion = client.chat.completions.create(
-		model="gpt-4o-mini",
-		messages=[{"role": "system", "content": system_prompt}, *messages],
-		temperature=0.3,
-		max_tokens=800,
-	)
-	choice = completion.choices[0]
+		return "OPENAI_API_KEY is not configured on the server; unable to reach OpenAI."
+	return None
+
+
+def _usage(usage: Any) -> dict[str, Any]:
+	if usage is None:
+		return {"total_tokens": 0}
+	return usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+
+
+def _completion_options(system_prompt: str, messages: Iterable[dict[str, str]]) -> dict[str, Any]:
+	config = llm_config()
 	return {
-		"content": choice.message.content or "",
-		"usage": completion.usage or {"total_tokens": 0},
+		"model": config["MODEL"],
+		"messages": [{"role": "system", "content": system_prompt}, *messages],
+		"temperature": config["TEMPERATURE"],
+		"max_tokens": config["MAX_TOKENS"],
 	}
 
 
-def run_ai_analysis(system_prompt: str, user_prompt: str, organization_id: int) -> dict[str, Any]:
-	"""Execute an AI analysis using operational context and a user question."""
+def _completion_result(completion: Any) -> dict[str, Any]:
+	return {
+		"content": completion.choices[0].message.content or "",
+		"usage": _usage(completion.usage),
+	}
+
+
+def call_chat_completion(system_prompt: str, messages: Iterable[dict[str, str]]) -> dict[str, Any]:
+	"""Send a chat completion request to OpenAI, if configured."""
+	
+	unavailable = _unavailable_reply()
+	if unavailable is not None:
+		return {"content": unavailable, "usage": {"total_tokens": 0}}
+	
+	completion = llm.create_completion(**_completion_options(system_prompt, messages))
+	return _completion_result(completion)
+
+
+async def acall_chat_completion(system_prompt: str, messages: Iterable[dict[str, str]]) -> dict[str, Any]:
+	"""Async counterpart of :func:`call_chat_completion` for async views."""
+	
+	unavailable = _unavailable_reply()
+	if unavailable is not None:
+		return {"content": unavailable, "usage": {"total_tokens": 0}}
+	
+	async with llm.acreate_completion(**_completion_options(system_prompt, messages)) as completion:
+		return _completion_result(completion)
+
+
+async def stream_chat_completion(
+	system_prompt: str, messages: Iterable[dict[str, str]]
+) -> AsyncIterator[tuple[str, Any]]:
+	"""Yield ``("token", text)`` pieces of the completion followed by one ``("usage", dict)``."""
+	
+	unavailable = _unavailable_reply()
+	if unavailable is not None:
+		yield "token", unavailable
+		yield "usage", {"total_tokens": 0}
+		return
+	
+	usage = None
+	async with llm.acreate_completion(
+		**_completion_options(system_prompt, messages),
+		stream=True,
+		stream_options={"include_usage": True},
+	) as stream:
+		async for chunk in stream:
+			if chunk.usage is not None:
+				usage = chunk.usage
+			for choice in chunk.choices:
+				if choice.delta.content:
+					yield "token", choice.delta.content
+	yield "usage", _usage(usage)
+
+
+def build_messages(user_prompt: str, organization_id: int) -> tuple[list[dict[str, str]], dict[str, Any]]:
+	"""Return the chat messages for a question together with the operational context they embed."""
 	
 	context = build_operational_context(organization_id)
 	context_markdown = render_context_as_markdown(context)
@@ -127,6 +238,13 @@ def run_ai_analysis(system_prompt: str, user_prompt: str, organization_id: int)
 			),
 		}
 	]
+	return messages, context
+
+
+def run_ai_analysis(system_prompt: str, user_prompt: str, organization_id: int) -> dict[str, Any]:
+	"""Execute an AI analysis using operational context and a user question."""
+	
+	messages, context = build_messages(user_prompt, organization_id)
 	result = call_chat_completion(system_prompt, messages)
 	result["context"] = context
 	return result
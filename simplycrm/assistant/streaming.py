@@ -0,0 +1,178 @@
+"""Server-sent event streaming of assistant replies.
+
+``relay`` turns the token stream of :func:`services.stream_chat_completion`
+into SSE frames (``start``, ``token``, then ``done``, ``cancelled`` or
+``error``) for an async :class:`~django.http.StreamingHttpResponse`, so under
+ASGI tokens reach the client as they are generated without holding a worker
+thread. The assistant :class:`AIMessage` is stored once the stream ends; a
+reply cut short by a cancellation or a client disconnect is stored with the
+text received so far and marked accordingly in ``metadata["stream"]``.
+
+A stream is cancelled either explicitly, by flagging its ``stream_id`` in the
+cache (checked between tokens, so it works across processes), or by the
+client going away. Django 4.2 stops reading ``receive`` once the request body
+is in, so :class:`CancelOnDisconnectMiddleware` wraps the ASGI application and
+cancels the response task when ``http.disconnect`` arrives.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Iterable
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from simplycrm.assistant import models, services
+
+
+LOGGER = logging.getLogger(__name__)
+
+STREAM_KEY_PREFIX = "simplycrm:assistant:stream"
+CANCEL_POLL_SECONDS = 0.2
+
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_DISCONNECTED = "disconnected"
+STATUS_FAILED = "failed"
+
+
+def sse(event: str, data: dict[str, Any]) -> bytes:
+	return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+def _stream_key(stream_id: str) -> str:
+	return f"{STREAM_KEY_PREFIX}:{stream_id}"
+
+
+def register_stream(conversation_id: int) -> str:
+	stream_id = uuid.uuid4().hex
+	cache.set(_stream_key(stream_id), conversation_id, timeout=services.llm_config()["STREAM_TIMEOUT"])
+	return stream_id
+
+
+def request_cancel(conversation_id: int, stream_id: str) -> bool:
+	"""Ask a running stream of the conversation to stop; ``False`` if there is no such stream."""
+
+	if cache.get(_stream_key(stream_id)) != conversation_id:
+		return False
+	cache.set(f"{_stream_key(stream_id)}:cancel", True, timeout=services.llm_config()["STREAM_TIMEOUT"])
+	return True
+
+
+def _save_reply(
+	conversation_id: int,
+	content: str,
+	usage: dict[str, Any],
+	context: dict[str, Any],
+	stream_id: str,
+	status: str,
+) -> models.AIMessage:
+	return models.AIMessage.objects.create(
+		conversation_id=conversation_id,
+		role=models.AIMessage.ROLE_ASSISTANT,
+		content=content,
+		token_usage=usage.get("total_tokens") or 0,
+		# The context carries decimals and dates; store it the way it was sent to the model.
+		metadata={"context": json.loads(json.dumps(context, cls=DjangoJSONEncoder)), "stream": {"id": stream_id, "status": status}},
+	)
+
+
+async def relay(
+	conversation_id: int,
+	system_prompt: str,
+	messages: Iterable[dict[str, str]],
+	context: dict[str, Any],
+	*,
+	user_message_id: int,
+) -> AsyncIterator[bytes]:
+	"""Relay the completion as SSE frames and store the assistant message when it ends."""
+
+	stream_id = await sync_to_async(register_stream)(conversation_id)
+	yield sse("start", {"stream_id": stream_id, "user_message_id": user_message_id})
+	parts: list[str] = []
+	usage: dict[str, Any] = {"total_tokens": 0}
+	status = STATUS_DISCONNECTED
+	next_poll = time.monotonic() + CANCEL_POLL_SECONDS
+	try:
+		try:
+			async with aclosing(services.stream_chat_completion(system_prompt, messages)) as tokens:
+				async for kind, value in tokens:
+					if kind == "usage":
+						usage = value
+						continue
+					parts.append(value)
+					yield sse("token", {"content": value})
+					if time.monotonic() >= next_poll:
+						next_poll = time.monotonic() + CANCEL_POLL_SECONDS
+						if await cache.aget(f"{_stream_key(stream_id)}:cancel"):
+							status = STATUS_CANCELLED
+							break
+				else:
+					status = STATUS_COMPLETED
+		except Exception as exc:  # noqa: BLE001 - reported to the client as an SSE error
+			LOGGER.exception("Assistant stream %s failed", stream_id)
+			status = STATUS_FAILED
+			yield sse("error", {"detail": str(exc) or exc.__class__.__name__})
+			return
+		message = await sync_to_async(_save_reply)(
+			conversation_id, "".join(parts), usage, context, stream_id, status
+		)
+		event = "done" if status == STATUS_COMPLETED else "cancelled"
+		yield sse(event, {"assistant_message_id": message.id, "usage": usage})
+	finally:
+		if status == STATUS_DISCONNECTED and parts:
+			# The client went away mid-stream; keep what was generated so far.
+			await sync_to_async(_save_reply)(conversation_id, "".join(parts), usage, context, stream_id, status)
+		await cache.adelete_many([_stream_key(stream_id), f"{_stream_key(stream_id)}:cancel"])
+
+
+class CancelOnDisconnectMiddleware:
+	"""ASGI middleware cancelling streaming responses when the client disconnects.
+
+	Only requests whose path ends with one of ``path_suffixes`` are watched.
+	Once the application has read the whole request body, ``receive`` is
+	polled for ``http.disconnect`` and the application task is cancelled when
+	it arrives.
+	"""
+
+	def __init__(self, app, path_suffixes: tuple[str, ...] = ("/stream/",)):
+		self.app = app
+		self.path_suffixes = path_suffixes
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http" or not scope["path"].endswith(self.path_suffixes):
+			return await self.app(scope, receive, send)
+
+		body_received = asyncio.Event()
+
+		async def receive_body():
+			message = await receive()
+			if message["type"] == "http.disconnect" or not message.get("more_body", False):
+				body_received.set()
+			return message
+
+		application = asyncio.ensure_future(self.app(scope, receive_body, send))
+
+		async def watch():
+			await body_received.wait()
+			while True:
+				message = await receive()
+				if message["type"] == "http.disconnect":
+					application.cancel()
+					return
+
+		watcher = asyncio.ensure_future(watch())
+		try:
+			await application
+		except asyncio.CancelledError:
+			if not (watcher.done() and not watcher.cancelled()):
+				raise
+			LOGGER.info("Client disconnected from %s; response cancelled", scope["path"])
+		finally:
+			watcher.cancel()
@@ -0,0 +1,189 @@
+"""Local fake of the OpenAI chat completions API for tests and development.
+
+:class:`FakeLLMServer` serves ``POST /v1/chat/completions`` on a loopback port
+from a background thread, both as a single JSON completion and as an SSE
+stream of ``chat.completion.chunk`` objects, so the real ``openai`` client can
+be pointed at it through ``ASSISTANT_LLM["BASE_URL"]``::
+
+	with FakeLLMServer(tokens=["Hello", " world"]) as server:
+		with override_settings(ASSISTANT_LLM={**settings.ASSISTANT_LLM, "API_KEY": "test", "BASE_URL": server.base_url}):
+			...
+"""
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Sequence
+
+
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	server: "_Server"
+
+	def log_message(self, format, *args):  # noqa: A002 - keep test output quiet
+		pass
+
+	def do_POST(self):
+		fake = self.server.fake
+		with fake.lock:
+			fake.active += 1
+			fake.max_active = max(fake.max_active, fake.active)
+		try:
+			self._respond(fake)
+		finally:
+			with fake.lock:
+				fake.active -= 1
+
+	def _respond(self, fake: "FakeLLMServer") -> None:
+		body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+		with fake.lock:
+			fake.requests.append(
+				{"path": self.path, "headers": dict(self.headers), "body": body, "client_port": self.client_address[1]}
+			)
+			failures_left = fake.failures
+			fake.failures = max(fake.failures - 1, 0)
+		if not self.path.endswith("/chat/completions"):
+			return self._json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+		if failures_left:
+			return self._json(fake.failure_status, {"error": {"message": "Simulated failure", "type": "server_error"}})
+		if fake.delay:
+			time.sleep(fake.delay)
+		if body.get("stream"):
+			return self._stream(fake, body)
+		return self._json(
+			200,
+			{
+				"id": "chatcmpl-fake",
+				"object": "chat.completion",
+				"created": int(time.time()),
+				"model": body.get("model", "fake"),
+				"choices": [
+					{"index": 0, "message": {"role": "assistant", "content": "".join(fake.tokens)}, "finish_reason": "stop"}
+				],
+				"usage": fake.usage(),
+			},
+		)
+
+	def _json(self, status: int, payload: dict[str, Any]) -> None:
+		data = json.dumps(payload).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		try:
+			self.wfile.write(data)
+		except (BrokenPipeError, ConnectionResetError):
+			self.close_connection = True
+			with self.server.fake.lock:
+				self.server.fake.disconnects += 1
+
+	def _stream(self, fake: "FakeLLMServer", body: dict[str, Any]) -> None:
+		self.send_response(200)
+		self.send_header("Content-Type", "text/event-stream")
+		self.send_header("Connection", "close")
+		self.end_headers()
+		self.close_connection = True
+
+		def chunk(choices, usage=None):
+			payload = {
+				"id": "chatcmpl-fake",
+				"object": "chat.completion.chunk",
+				"created": int(time.time()),
+				"model": body.get("model", "fake"),
+				"choices": choices,
+			}
+			if usage is not None:
+				payload["usage"] = usage
+			self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+			self.wfile.flush()
+
+		try:
+			for token in fake.tokens:
+				chunk([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+				if fake.token_delay:
+					time.sleep(fake.token_delay)
+			chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+			if (body.get("stream_options") or {}).get("include_usage"):
+				chunk([], fake.usage())
+			self.wfile.write(b"data: [DONE]\n\n")
+			self.wfile.flush()
+		except (BrokenPipeError, ConnectionResetError):
+			with fake.lock:
+				fake.disconnects += 1
+
+
+class _Server(ThreadingHTTPServer):
+	daemon_threads = True
+	fake: "FakeLLMServer"
+
+	def handle_error(self, request, client_address):
+		# Clients that time out or cancel close the socket mid-response; that is
+		# expected in tests and must not dump tracebacks into their output.
+		if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+			with self.fake.lock:
+				self.fake.disconnects += 1
+			return
+		super().handle_error(request, client_address)
+
+
+class FakeLLMServer:
+	"""Serve canned completions; ``requests`` records every request body received.
+
+	``max_active`` is the highest number of requests handled at once and each
+	recorded request carries the ``client_port`` it arrived on, so tests can
+	check concurrency limits and connection reuse.
+	"""
+
+	def __init__(
+		self,
+		tokens: Sequence[str] = ("Hello", " from", " the", " fake", " model."),
+		*,
+		delay: float = 0.0,
+		token_delay: float = 0.0,
+		failures: int = 0,
+		failure_status: int = 500,
+	):
+		self.tokens = list(tokens)
+		self.delay = delay
+		self.token_delay = token_delay
+		self.failures = failures
+		self.failure_status = failure_status
+		self.requests: list[dict[str, Any]] = []
+		self.disconnects = 0
+		self.active = 0
+		self.max_active = 0
+		self.lock = threading.Lock()
+		self._server: _Server | None = None
+		self._thread: threading.Thread | None = None
+
+	@property
+	def base_url(self) -> str:
+		assert self._server is not None, "server is not running"
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}/v1"
+
+	def usage(self) -> dict[str, int]:
+		completion_tokens = len(self.tokens)
+		return {"prompt_tokens": 10, "completion_tokens": completion_tokens, "total_tokens": 10 + completion_tokens}
+
+	def start(self) -> "FakeLLMServer":
+		self._server = _Server(("127.0.0.1", 0), _Handler)
+		self._server.fake = self
+		self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+	def __enter__(self) -> "FakeLLMServer":
+		return self.start()
+
+	def __exit__(self, *exc_info) -> None:
+		self.stop()
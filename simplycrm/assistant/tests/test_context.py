@@ -0,0 +1,41 @@
+"""Tests for the cached assistant operational context."""
+from __future__ import annotations
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from simplycrm.assistant import services
+from simplycrm.core import models as core_models
+from simplycrm.sales import models as sales_models
+
+
+class OperationalContextTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+
+    def test_only_sections_with_changed_inputs_are_rebuilt(self):
+        first = services.build_operational_context(self.organization.id)
+        self.assertEqual(set(first["build"]["sections"]), set(services.CONTEXT_SECTIONS))
+        self.assertFalse(any(section["cached"] for section in first["build"]["sections"].values()))
+
+        with self.assertNumQueries(0):
+            follow_up = services.build_operational_context(self.organization.id)
+        self.assertTrue(all(section["cached"] for section in follow_up["build"]["sections"].values()))
+        self.assertEqual(follow_up["sales_metrics"], first["sales_metrics"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sales_models.Order.objects.create(organization=self.organization, status="paid")
+        rebuilt = services.build_operational_context(self.organization.id)
+        cached = {name for name, section in rebuilt["build"]["sections"].items() if section["cached"]}
+        self.assertEqual(cached, {"demand_forecast", "next_best_actions"})
+        self.assertEqual(rebuilt["sales_metrics"]["orders_count"], 1)
+
+    def test_sections_expire_after_the_timeout(self):
+        services.build_operational_context(self.organization.id)
+        with self.settings(ASSISTANT_CONTEXT={"TIMEOUT": 0}):
+            context = services.build_operational_context(self.organization.id)
+        self.assertFalse(any(section["cached"] for section in context["build"]["sections"].values()))
+        self.assertNotIn('"build"', services.render_context_as_markdown(context))
@@ -0,0 +1,92 @@
+"""Tests for the shared assistant LLM clients."""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from simplycrm.assistant import llm, services
+from simplycrm.assistant.testing import FakeLLMServer
+
+
+MESSAGES = [{"role": "user", "content": "How are sales?"}]
+
+
+class LLMClientTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        llm.reset()
+        self.addCleanup(llm.reset)
+
+    def llm_settings(self, server, **overrides):
+        return self.settings(
+            ASSISTANT_LLM={
+                **settings.ASSISTANT_LLM,
+                "API_KEY": "test",
+                "BASE_URL": server.base_url,
+                "RETRY_BACKOFF": 0.01,
+                **overrides,
+            }
+        )
+
+    def test_clients_are_shared_and_keep_connections_open(self):
+        with FakeLLMServer() as server, self.llm_settings(server):
+            first = services.call_chat_completion("system", MESSAGES)
+            client = llm.get_client()
+            services.call_chat_completion("system", MESSAGES)
+            self.assertIs(llm.get_client(), client)
+
+            async def ask_twice():
+                replies = [await services.acall_chat_completion("system", MESSAGES) for _ in range(2)]
+                return replies, llm.get_async_client()
+
+            replies, async_client = asyncio.run(ask_twice())
+
+        self.assertEqual(first, {"content": "Hello from the fake model.", "usage": first["usage"]})
+        self.assertEqual(first["usage"]["total_tokens"], 15)
+        self.assertEqual(replies[1]["content"], "Hello from the fake model.")
+        self.assertIsNot(async_client, client)
+        ports = [request["client_port"] for request in server.requests]
+        self.assertEqual(len(ports), 4)
+        # One connection for the sync client and one for the async client of the loop.
+        self.assertEqual(ports[0], ports[1])
+        self.assertEqual(ports[2], ports[3])
+
+    def test_transient_failures_are_retried_with_backoff(self):
+        with FakeLLMServer(failures=2) as server, self.llm_settings(server):
+            result = services.call_chat_completion("system", MESSAGES)
+        self.assertEqual(result["content"], "Hello from the fake model.")
+        self.assertEqual(len(server.requests), 3)
+
+        with FakeLLMServer(failures=2) as server, self.llm_settings(server, MAX_RETRIES=1):
+            with self.assertRaises(openai.InternalServerError):
+                services.call_chat_completion("system", MESSAGES)
+        self.assertEqual(len(server.requests), 2)
+
+        with FakeLLMServer(failures=1, failure_status=400) as server, self.llm_settings(server):
+            with self.assertRaises(openai.BadRequestError):
+                asyncio.run(services.acall_chat_completion("system", MESSAGES))
+        self.assertEqual(len(server.requests), 1)
+
+        with FakeLLMServer(delay=1) as server, self.llm_settings(server, TIMEOUT=0.1, MAX_RETRIES=0):
+            with self.assertRaises(openai.APITimeoutError):
+                services.call_chat_completion("system", MESSAGES)
+
+    def test_concurrent_calls_are_limited_across_sync_and_async_callers(self):
+        with FakeLLMServer(delay=0.1) as server, self.llm_settings(server, MAX_CONCURRENCY=2):
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                results = list(pool.map(lambda _: services.call_chat_completion("system", MESSAGES), range(6)))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(server.max_active, 2)
+
+        with FakeLLMServer() as server, self.llm_settings(server, MAX_CONCURRENCY=1, QUEUE_TIMEOUT=0.1):
+            with llm.slot():
+                with self.assertRaises(llm.LLMBusy):
+                    services.call_chat_completion("system", MESSAGES)
+                with self.assertRaises(llm.LLMBusy):
+                    asyncio.run(services.acall_chat_completion("system", MESSAGES))
+            self.assertEqual(services.call_chat_completion("system", MESSAGES)["content"], "Hello from the fake model.")
+        self.assertEqual(len(server.requests), 1)
@@ -0,0 +1,149 @@
+"""Tests for streamed assistant replies."""
+from __future__ import annotations
+
+import asyncio
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from simplycrm.assistant import models, streaming
+from simplycrm.assistant.testing import FakeLLMServer
+from simplycrm.core.tests.utils import TenantTestMixin
+
+
+def parse_events(chunks):
+    events = []
+    for frame in b"".join(chunks).decode().split("\n\n"):
+        if not frame:
+            continue
+        fields = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class AskStreamTests(TenantTestMixin, TestCase):
+    username = "analyst"
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = models.AIConversation.objects.create(
+            organization=self.organization, owner=self.user, title="Sales"
+        )
+        self.url = reverse("assistant:ai-conversation-ask-stream", args=[self.conversation.pk])
+
+    def authenticate(self, user):
+        self.async_client.force_login(user)
+
+    def llm(self, server):
+        return self.settings(ASSISTANT_LLM={**settings.ASSISTANT_LLM, "API_KEY": "test", "BASE_URL": server.base_url})
+
+    async def test_tokens_are_streamed_and_the_reply_is_stored(self):
+        with FakeLLMServer() as server, self.llm(server):
+            response = await self.async_client.post(
+                self.url, {"prompt": "How are sales?"}, content_type="application/json", HTTP_ACCEPT="text/event-stream"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            self.assertTrue(response.is_async)
+            events = parse_events([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual([name for name, _ in events], ["start", *["token"] * 5, "done"])
+        self.assertEqual("".join(data["content"] for name, data in events if name == "token"), "Hello from the fake model.")
+        self.assertEqual(events[-1][1]["usage"]["total_tokens"], 15)
+        request = server.requests[0]["body"]
+        self.assertTrue(request["stream"])
+        self.assertEqual(request["messages"][-1]["role"], "user")
+        self.assertIn("How are sales?", request["messages"][-1]["content"])
+
+        reply = await models.AIMessage.objects.aget(role=models.AIMessage.ROLE_ASSISTANT)
+        self.assertEqual(reply.id, events[-1][1]["assistant_message_id"])
+        self.assertEqual(reply.content, "Hello from the fake model.")
+        self.assertEqual(reply.token_usage, 15)
+        self.assertEqual(reply.metadata["stream"], {"id": events[0][1]["stream_id"], "status": "completed"})
+        self.assertIsNone(await cache.aget(f"{streaming.STREAM_KEY_PREFIX}:{events[0][1]['stream_id']}"))
+
+    async def test_cancel_stops_the_stream_and_keeps_the_partial_reply(self):
+        tokens = [f"t{index} " for index in range(40)]
+        with FakeLLMServer(tokens=tokens, token_delay=0.02) as server, self.llm(server), mock.patch.object(
+            streaming, "CANCEL_POLL_SECONDS", 0
+        ):
+            response = await self.async_client.post(self.url, {"prompt": "Summarize"}, content_type="application/json")
+            chunks = aiter(response.streaming_content)
+            start = parse_events([await anext(chunks)])[0][1]
+            await anext(chunks)
+
+            cancel_url = reverse("assistant:ai-conversation-ask-cancel", args=[self.conversation.pk])
+            missing = await self.async_client.post(cancel_url, {"stream_id": "nope"}, content_type="application/json")
+            self.assertEqual(missing.status_code, 404)
+            accepted = await self.async_client.post(
+                cancel_url, {"stream_id": start["stream_id"]}, content_type="application/json"
+            )
+            self.assertEqual(accepted.status_code, 202)
+            events = parse_events([chunk async for chunk in chunks])
+
+        self.assertEqual(events[-1][0], "cancelled")
+        reply = await models.AIMessage.objects.aget(role=models.AIMessage.ROLE_ASSISTANT)
+        self.assertEqual(reply.metadata["stream"]["status"], "cancelled")
+        self.assertTrue(reply.content.startswith("t0 "))
+        self.assertLess(len(reply.content), len("".join(tokens)))
+
+    async def test_upstream_errors_are_reported_as_an_error_event(self):
+        with FakeLLMServer(failures=1, failure_status=400) as server, self.llm(server):
+            response = await self.async_client.post(self.url, {"prompt": "Hi"}, content_type="application/json")
+            events = parse_events([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual([name for name, _ in events], ["start", "error"])
+        self.assertFalse(await models.AIMessage.objects.filter(role=models.AIMessage.ROLE_ASSISTANT).aexists())
+        self.assertTrue(await models.AIMessage.objects.filter(role=models.AIMessage.ROLE_USER).aexists())
+
+    async def test_prompt_is_required(self):
+        response = await self.async_client.post(
+            self.url, {"prompt": " "}, content_type="application/json", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await models.AIMessage.objects.aexists())
+
+
+class CancelOnDisconnectMiddlewareTests(SimpleTestCase):
+    def run_app(self, path, messages):
+        state = {"sent": 0, "cancelled": False}
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                while True:
+                    await send({"type": "http.response.body", "body": b"data\n\n", "more_body": True})
+                    state["sent"] += 1
+                    await asyncio.sleep(0.01)
+                    if state["sent"] >= 20:
+                        return
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        middleware = streaming.CancelOnDisconnectMiddleware(app)
+        asyncio.run(middleware({"type": "http", "path": path}, receive, send))
+        return state
+
+    def test_streams_are_cancelled_when_the_client_disconnects(self):
+        state = self.run_app("/api/assistant/ai/conversations/1/ask/stream/", [{"type": "http.request", "body": b""}])
+        self.assertTrue(state["cancelled"])
+        self.assertLess(state["sent"], 20)
+
+    def test_other_paths_are_passed_through(self):
+        state = self.run_app("/api/assistant/ai/conversations/1/ask/", [{"type": "http.request", "body": b""}])
+        self.assertFalse(state["cancelled"])
+        self.assertEqual(state["sent"], 20)
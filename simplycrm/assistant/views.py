@@ -1,13 +1,25 @@
 """ViewSets exposing the AI assistant."""
 from __future__ import annotations
 
-from rest_framework import decorators, permissions, response, status, viewsets
+from django.http import StreamingHttpResponse
+from rest_framework import decorators, permissions, renderers, response, status, viewsets
 from rest_framework.exceptions import ValidationError
-from simplycrm.assistant import models, serializers, services
+from simplycrm.assistant import llm, models, serializers, services, streaming
 from simplycrm.core import tenant
 from simplycrm.core.permissions import HasFeaturePermission
 
 
+class EventStreamRenderer(renderers.BaseRenderer):
+    """Lets clients negotiate ``text/event-stream``; errors are rendered as an SSE ``error`` frame."""
+    
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = None
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return streaming.sse("error", data if isinstance(data, dict) else {"detail": data})
+
+
 class AIConversationViewSet(viewsets.ModelViewSet):
     """Manage AI assistant conversations."""
     
@@ -27,6 +39,16 @@ class AIConversationViewSet(viewsets.ModelViewSet):
             raise ValidationError("Активная организация не выбрана.")
         serializer.save(organization=organization, owner=self.request.user)
     
+    def _question_settings(self, request, conversation) -> tuple[str, int]:
+        system_prompt = (
+                conversation.system_prompt
+                or "You are SimplyCRM's AI co-pilot. Provide concise, actionable analytics recommendations."
+        )
+        organization_id = tenant.get_request_organization_id(request)
+        if organization_id is None:
+            raise ValidationError("Активная организация не выбрана.")
+        return system_prompt, organization_id
+    
     @decorators.action(detail=True, methods=["post"], url_path="ask")
     def ask(self, request, pk: str | None = None):
         """Submit a question to the assistant and persist the exchange."""
@@ -38,15 +60,16 @@ class AIConversationViewSet(viewsets.ModelViewSet):
                 {"detail": "Prompt is required."}, status=status.HTTP_400_BAD_REQUEST
             )
         
-        system_prompt = (
-                conversation.system_prompt
-                or "You are SimplyCRM's AI co-pilot. Provide concise, actionable analytics recommendations."
-        )
-        organization_id = tenant.get_request_organization_id(request)
-        if organization_id is None:
-            raise ValidationError("Активная организация не выбрана.")
+        system_prompt, organization_id = self._question_settings(request, conversation)
 
-        result = services.run_ai_analysis(system_prompt, prompt, organization_id)
+        try:
+            result = services.run_ai_analysis(system_prompt, prompt, organization_id)
+        except llm.LLMBusy as exc:
+            return response.Response(
+                {"detail": str(exc)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "5"},
+            )
         
         user_message = models.AIMessage.objects.create(
             conversation=conversation,
@@ -70,3 +93,45 @@ class AIConversationViewSet(viewsets.ModelViewSet):
                 "usage": result.get("usage", {}),
             }
         )
+    
+    @decorators.action(
+        detail=True,
+        methods=["post"],
+        url_path="ask/stream",
+        url_name="ask-stream",
+        renderer_classes=[EventStreamRenderer, renderers.JSONRenderer],
+    )
+    def ask_stream(self, request, pk: str | None = None):
+        """Stream the assistant's reply as server-sent events and persist it when the stream ends."""
+        
+        conversation = self.get_object()
+        prompt = request.data.get("prompt", "").strip()
+        if not prompt:
+            return response.Response(
+                {"detail": "Prompt is required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        system_prompt, organization_id = self._question_settings(request, conversation)
+        
+        messages, context = services.build_messages(prompt, organization_id)
+        user_message = models.AIMessage.objects.create(
+            conversation=conversation,
+            role=models.AIMessage.ROLE_USER,
+            content=prompt,
+        )
+        stream = StreamingHttpResponse(
+            streaming.relay(conversation.pk, system_prompt, messages, context, user_message_id=user_message.id),
+            content_type="text/event-stream",
+        )
+        stream["Cache-Control"] = "no-cache"
+        stream["X-Accel-Buffering"] = "no"
+        return stream
+    
+    @decorators.action(detail=True, methods=["post"], url_path="ask/cancel", url_name="ask-cancel")
+    def cancel_stream(self, request, pk: str | None = None):
+        """Stop a running reply stream of the conversation."""
+        
+        conversation = self.get_object()
+        stream_id = str(request.data.get("stream_id", ""))
+        if not streaming.request_cancel(conversation.pk, stream_id):
+            return response.Response({"detail": "Stream not found."}, status=status.HTTP_404_NOT_FOUND)
+        return response.Response({"stream_id": stream_id, "cancelled": True}, status=status.HTTP_202_ACCEPTED)
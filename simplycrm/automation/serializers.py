@@ -49,6 +49,17 @@ class CampaignSerializer(serializers.ModelSerializer):
 			"steps",
 		]
 		read_only_fields = ["id"]
+	
+	def validate_audience_definition(self, value):
+		for key in ("include_segments", "exclude_segments"):
+			segment_ids = value.get(key, [])
+			if not isinstance(segment_ids, list) or not all(
+				isinstance(segment_id, int) and not isinstance(segment_id, bool) for segment_id in segment_ids
+			):
+				raise serializers.ValidationError(f"{key} должен быть списком идентификаторов сегментов.")
+		if value.get("match", "any") not in ("any", "all"):
+			raise serializers.ValidationError("match принимает значения any или all.")
+		return value
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -1,8 +1,12 @@
 """ViewSets for automation and campaign features."""
 from __future__ import annotations
 
-from rest_framework import permissions, viewsets
+from django.core.exceptions import ValidationError as DjangoValidationError
+from drf_spectacular.utils import extend_schema
+from rest_framework import decorators, permissions, response, viewsets
 from rest_framework.exceptions import ValidationError
+from simplycrm.analytics import segments
+from simplycrm.analytics import serializers as analytics_serializers
 from simplycrm.automation import models, serializers
 from simplycrm.core import tenant
 from simplycrm.core.permissions import HasFeaturePermission
@@ -35,6 +39,25 @@ class CampaignViewSet(BaseAutomationViewSet):
     serializer_class = serializers.CampaignSerializer
     feature_code = "automation.campaigns"
 
+    @extend_schema(
+        parameters=[analytics_serializers.SegmentMembersQuerySerializer],
+        responses=analytics_serializers.SegmentMembersSerializer,
+    )
+    @decorators.action(detail=True, methods=["get"], url_path="audience")
+    def audience(self, request, pk=None):
+        """Resolve the campaign audience from stored segment bitmaps."""
+        campaign = self.get_object()
+        page = analytics_serializers.SegmentMembersQuerySerializer(data=request.query_params)
+        page.is_valid(raise_exception=True)
+        try:
+            audience = segments.resolve_audience(campaign.organization_id, campaign.audience_definition or {})
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages) from None
+        offset, limit = page.validated_data["offset"], page.validated_data["limit"]
+        contact_ids = audience.ids()
+        data = {"size": len(contact_ids), "contact_ids": contact_ids[offset : offset + limit].tolist()}
+        return response.Response(analytics_serializers.SegmentMembersSerializer(data).data)
+
 
 class CampaignStepViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.CampaignStepSerializer
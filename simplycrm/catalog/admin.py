@@ -66,6 +66,21 @@ class InventoryLotAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at")
 
 
+@admin.register(models.StockLevel)
+class StockLevelAdmin(admin.ModelAdmin):
+    list_display = ("variant", "location", "quantity", "last_movement_at")
+    search_fields = ("variant__name", "variant__sku", "location")
+    readonly_fields = ("variant", "location", "quantity", "last_movement_at", "updated_at")
+
+
+@admin.register(models.StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ("variant", "movement_type", "quantity", "location", "occurred_at", "reference")
+    list_filter = ("movement_type", "occurred_at")
+    search_fields = ("variant__name", "variant__sku", "reference")
+    readonly_fields = ("created_at", "updated_at")
+
+
 @admin.register(models.PriceHistory)
 class PriceHistoryAdmin(admin.ModelAdmin):
     list_display = ("variant", "price", "currency", "recorded_at", "recorded_by")
@@ -73,3 +73,26 @@ class PriceHistoryFilterSet(django_filters.FilterSet):
     class Meta:
         model = models.PriceHistory
         fields = ["variant", "product", "recorded_from", "recorded_to"]
+
+
+class StockLevelFilterSet(django_filters.FilterSet):
+    variant = django_filters.NumberFilter(field_name="variant_id")
+    product = django_filters.NumberFilter(field_name="variant__product_id")
+    location = django_filters.CharFilter(field_name="location", lookup_expr="iexact")
+
+    class Meta:
+        model = models.StockLevel
+        fields = ["variant", "product", "location"]
+
+
+class StockMovementFilterSet(django_filters.FilterSet):
+    variant = django_filters.NumberFilter(field_name="variant_id")
+    lot = django_filters.NumberFilter(field_name="lot_id")
+    location = django_filters.CharFilter(field_name="location", lookup_expr="iexact")
+    movement_type = django_filters.MultipleChoiceFilter(choices=models.StockMovement.MovementType.choices)
+    occurred_from = django_filters.DateTimeFilter(field_name="occurred_at", lookup_expr="gte")
+    occurred_to = django_filters.DateTimeFilter(field_name="occurred_at", lookup_expr="lt")
+
+    class Meta:
+        model = models.StockMovement
+        fields = ["variant", "lot", "location", "movement_type", "occurred_from", "occurred_to"]
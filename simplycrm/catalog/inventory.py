@@ -0,0 +1,253 @@
+"""Stock ledger services backed by :class:`StockMovement` and :class:`StockLevel`.
+
+Every change of stock on hand is appended to the movement ledger and folded into
+the materialized ``StockLevel`` row of the affected variant/location inside the
+same transaction. Stock reads therefore never aggregate lots or movements.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, QuerySet, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from simplycrm.catalog import models
+from simplycrm.core import versioning
+
+
+MovementType = models.StockMovement.MovementType
+
+
+def record_movement(
+    *,
+    variant: models.ProductVariant,
+    quantity: int,
+    movement_type: str,
+    location: str = "",
+    lot: models.InventoryLot | None = None,
+    reference: str = "",
+    recorded_by=None,
+    occurred_at: datetime | None = None,
+) -> models.StockMovement:
+    """Append a single movement to the ledger and update the stock level."""
+
+    movement = models.StockMovement(
+        variant=variant,
+        quantity=quantity,
+        movement_type=movement_type,
+        location=location,
+        lot=lot,
+        reference=reference,
+        recorded_by=recorded_by,
+        occurred_at=occurred_at or timezone.now(),
+    )
+    record_movements([movement])
+    return movement
+
+
+def record_lot_movement(
+    *,
+    lot: models.InventoryLot,
+    quantity: int,
+    movement_type: str,
+    reference: str = "",
+    recorded_by=None,
+    occurred_at: datetime | None = None,
+) -> models.StockMovement:
+    """Apply a manual movement to ``lot`` and append it to the ledger.
+
+    The lot quantity and the stock level change in the same transaction, so the
+    lots of a variant always add up to its stock on hand.
+    """
+
+    with transaction.atomic():
+        updated = models.InventoryLot.objects.filter(pk=lot.pk, quantity__gte=-quantity).update(
+            quantity=F("quantity") + quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            raise ValidationError("В партии недостаточно остатка для списания.")
+        lot.refresh_from_db(fields=["quantity", "location", "updated_at"])
+        return record_movement(
+            variant=lot.variant,
+            quantity=quantity,
+            movement_type=movement_type,
+            location=lot.location,
+            lot=lot,
+            reference=reference,
+            recorded_by=recorded_by,
+            occurred_at=occurred_at,
+        )
+
+
+def record_movements(movements: Iterable[models.StockMovement]) -> list[models.StockMovement]:
+    """Append movements in bulk and apply their net effect to stock levels.
+
+    Movements touching the same variant/location are collapsed into a single
+    ``UPDATE ... SET quantity = quantity + delta`` so concurrent writers never
+    lose updates and the number of statements depends on the distinct
+    variant/location pairs rather than on the number of movements.
+    """
+
+    movements = [movement for movement in movements if movement.quantity]
+    if not movements:
+        return []
+
+    deltas: dict[tuple[int, str], int] = defaultdict(int)
+    latest: dict[tuple[int, str], datetime] = {}
+    for movement in movements:
+        if movement.occurred_at is None:
+            movement.occurred_at = timezone.now()
+        key = (movement.variant_id, movement.location)
+        deltas[key] += movement.quantity
+        if key not in latest or movement.occurred_at > latest[key]:
+            latest[key] = movement.occurred_at
+
+    with transaction.atomic():
+        models.StockMovement.objects.bulk_create(movements)
+        models.StockLevel.objects.bulk_create(
+            [
+                models.StockLevel(variant_id=variant_id, location=location)
+                for variant_id, location in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        now = timezone.now()
+        for (variant_id, location), delta in deltas.items():
+            occurred_at = latest[(variant_id, location)]
+            models.StockLevel.objects.filter(variant_id=variant_id, location=location).update(
+                quantity=F("quantity") + delta,
+                last_movement_at=Greatest(Coalesce("last_movement_at", Value(occurred_at)), Value(occurred_at)),
+                updated_at=now,
+            )
+        organization_ids = models.Product.objects.filter(
+            variants__id__in={variant_id for variant_id, _ in deltas}
+        ).values_list("organization_id", flat=True)
+        versioning.bump_data_version(list(organization_ids), versioning.CATALOG)
+    return movements
+
+
+def record_lot_change(lot: models.InventoryLot, previous: dict | None, *, recorded_by=None) -> None:
+    """Translate a lot create/update into receipt or adjustment movements."""
+
+    reference = f"lot:{lot.pk}"
+    if previous is None:
+        if lot.quantity:
+            record_movements(
+                [
+                    models.StockMovement(
+                        variant_id=lot.variant_id,
+                        lot=lot,
+                        location=lot.location,
+                        movement_type=MovementType.RECEIPT,
+                        quantity=lot.quantity,
+                        reference=reference,
+                        recorded_by=recorded_by,
+                        occurred_at=_received_at(lot),
+                    )
+                ]
+            )
+        return
+
+    unchanged_slot = (
+        previous["variant_id"] == lot.variant_id and previous["location"] == lot.location
+    )
+    if unchanged_slot:
+        delta = lot.quantity - previous["quantity"]
+        movements = [
+            models.StockMovement(
+                variant_id=lot.variant_id,
+                lot=lot,
+                location=lot.location,
+                movement_type=MovementType.ADJUSTMENT,
+                quantity=delta,
+                reference=reference,
+                recorded_by=recorded_by,
+            )
+        ]
+    else:
+        movements = [
+            models.StockMovement(
+                variant_id=previous["variant_id"],
+                lot=lot,
+                location=previous["location"],
+                movement_type=MovementType.ADJUSTMENT,
+                quantity=-previous["quantity"],
+                reference=reference,
+                recorded_by=recorded_by,
+            ),
+            models.StockMovement(
+                variant_id=lot.variant_id,
+                lot=lot,
+                location=lot.location,
+                movement_type=MovementType.ADJUSTMENT,
+                quantity=lot.quantity,
+                reference=reference,
+                recorded_by=recorded_by,
+            ),
+        ]
+    record_movements(movements)
+
+
+def stock_on_hand(variant_id: int, location: str | None = None) -> int:
+    """Return stock for a variant at one location (single row) or across locations."""
+
+    levels = models.StockLevel.objects.filter(variant_id=variant_id)
+    if location is not None:
+        return levels.filter(location=location).values_list("quantity", flat=True).first() or 0
+    return levels.aggregate(total=Coalesce(Sum("quantity"), 0))["total"]
+
+
+def stock_by_variant(organization_id: int) -> dict[int, int]:
+    """Return stock on hand per variant for an organization."""
+
+    rows = (
+        models.StockLevel.objects.filter(variant__product__organization_id=organization_id)
+        .values("variant_id")
+        .annotate(total=Coalesce(Sum("quantity"), 0))
+    )
+    return {row["variant_id"]: row["total"] for row in rows}
+
+
+def organization_stock_total(organization_id: int) -> int:
+    """Return total stock on hand across all variants and locations."""
+
+    return (
+        models.StockLevel.objects.filter(variant__product__organization_id=organization_id)
+        .aggregate(total=Coalesce(Sum("quantity"), 0))["total"]
+    )
+
+
+def movement_history(
+    variant_id: int,
+    *,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    location: str | None = None,
+) -> QuerySet:
+    """Return ledger entries for a variant within an optional time range."""
+
+    movements = models.StockMovement.objects.filter(variant_id=variant_id)
+    if start is not None:
+        movements = movements.filter(occurred_at__gte=start)
+    if end is not None:
+        movements = movements.filter(occurred_at__lt=end)
+    if location is not None:
+        movements = movements.filter(location=location)
+    return movements.order_by("occurred_at", "id")
+
+
+def _received_at(lot: models.InventoryLot) -> datetime:
+    received = lot.received_at
+    if isinstance(received, str):
+        received = parse_date(received)
+    if isinstance(received, datetime):
+        return received
+    if received is None:
+        return timezone.now()
+    return timezone.make_aware(datetime.combine(received, datetime.min.time()))
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:48
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_stock_ledger(apps, schema_editor):
+    InventoryLot = apps.get_model("catalog", "InventoryLot")
+    StockMovement = apps.get_model("catalog", "StockMovement")
+    StockLevel = apps.get_model("catalog", "StockLevel")
+
+    levels = {}
+    movements = []
+    for lot in InventoryLot.objects.filter(quantity__gt=0).iterator():
+        occurred_at = django.utils.timezone.make_aware(
+            datetime.datetime.combine(lot.received_at, datetime.time.min)
+        )
+        movements.append(
+            StockMovement(
+                variant_id=lot.variant_id,
+                lot_id=lot.pk,
+                location=lot.location,
+                movement_type="receipt",
+                quantity=lot.quantity,
+                occurred_at=occurred_at,
+                reference=f"lot:{lot.pk}",
+            )
+        )
+        key = (lot.variant_id, lot.location)
+        quantity, last_at = levels.get(key, (0, occurred_at))
+        levels[key] = (quantity + lot.quantity, max(last_at, occurred_at))
+    StockMovement.objects.bulk_create(movements, batch_size=1000)
+    StockLevel.objects.bulk_create(
+        [
+            StockLevel(variant_id=variant_id, location=location, quantity=quantity, last_movement_at=last_at)
+            for (variant_id, location), (quantity, last_at) in levels.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def clear_stock_ledger(apps, schema_editor):
+    apps.get_model("catalog", "StockLevel").objects.all().delete()
+    apps.get_model("catalog", "StockMovement").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0003_alter_inventorylot_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('quantity', models.IntegerField(default=0)),
+                ('last_movement_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_levels', to='catalog.productvariant')),
+            ],
+            options={
+                'ordering': ['variant_id', 'location'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('movement_type', models.CharField(choices=[('receipt', 'Поступление'), ('allocation', 'Резервирование'), ('adjustment', 'Корректировка'), ('return', 'Возврат')], max_length=16)),
+                ('quantity', models.IntegerField()),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reference', models.CharField(blank=True, max_length=128)),
+                ('lot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='catalog.inventorylot')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='catalog.productvariant')),
+            ],
+            options={
+                'ordering': ['-occurred_at', '-id'],
+                'indexes': [models.Index(fields=['variant', 'occurred_at'], name='catalog_move_variant_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stocklevel',
+            constraint=models.UniqueConstraint(fields=('variant', 'location'), name='catalog_stocklevel_unique_variant_location'),
+        ),
+        migrations.RunPython(backfill_stock_ledger, clear_stock_ledger),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['variant', 'recorded_at'], name='catalog_price_variant_time_idx'),
+        ),
+    ]
@@ -5,7 +5,8 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import ProtectedError
 from django.utils import timezone
 from django.utils.text import slugify
 
@@ -313,6 +314,114 @@ class InventoryLot(TimeStampedModel):
     def __str__(self) -> str:  # pragma: no cover
         return f"Lot for {self.variant}"
 
+    def save(self, *args, recorded_by=None, **kwargs):
+        from simplycrm.catalog import inventory  # Local import to avoid circular dependency.
+
+        previous = None
+        creating = self._state.adding
+        if not creating and self.pk:
+            previous = (
+                InventoryLot.objects.filter(pk=self.pk)
+                .values("variant_id", "quantity", "location")
+                .first()
+            )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            inventory.record_lot_change(self, previous, recorded_by=recorded_by)
+
+    def delete(self, *args, recorded_by=None, **kwargs):
+        from simplycrm.catalog import inventory  # Local import to avoid circular dependency.
+
+        allocations = self.allocations.all()
+        if allocations.exists():
+            # LotAllocation.lot is PROTECT; refuse before anything reaches the ledger.
+            raise ProtectedError("Lot has order allocations.", set(allocations))
+        with transaction.atomic():
+            if self.quantity:
+                inventory.record_movement(
+                    variant=self.variant,
+                    quantity=-self.quantity,
+                    movement_type=StockMovement.MovementType.ADJUSTMENT,
+                    location=self.location,
+                    reference=f"lot:{self.pk}:deleted",
+                    recorded_by=recorded_by,
+                )
+            return super().delete(*args, **kwargs)
+
+
+class StockMovement(TimeStampedModel):
+    """Append-only ledger entry describing a signed change of stock on hand."""
+
+    class MovementType(models.TextChoices):
+        RECEIPT = "receipt", "Поступление"
+        ALLOCATION = "allocation", "Резервирование"
+        ADJUSTMENT = "adjustment", "Корректировка"
+        RETURN = "return", "Возврат"
+
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name="stock_movements",
+    )
+    lot = models.ForeignKey(
+        InventoryLot,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="movements",
+    )
+    location = models.CharField(max_length=255, blank=True)
+    movement_type = models.CharField(max_length=16, choices=MovementType.choices)
+    quantity = models.IntegerField()
+    occurred_at = models.DateTimeField(default=timezone.now)
+    reference = models.CharField(max_length=128, blank=True)
+    recorded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+
+    class Meta:
+        ordering = ["-occurred_at", "-id"]
+        indexes = [
+            models.Index(fields=["variant", "occurred_at"], name="catalog_move_variant_time_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.movement_type} {self.quantity:+d} for {self.variant}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Движения склада нельзя изменять после записи.")
+        super().save(*args, **kwargs)
+
+
+class StockLevel(models.Model):
+    """Materialized stock on hand per variant and location."""
+
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name="stock_levels",
+    )
+    location = models.CharField(max_length=255, blank=True)
+    quantity = models.IntegerField(default=0)
+    last_movement_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["variant_id", "location"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["variant", "location"],
+                name="catalog_stocklevel_unique_variant_location",
+            )
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.variant} @ {self.location or '-'}: {self.quantity}"
+
 
 class PriceHistory(TimeStampedModel):
     variant = models.ForeignKey(
@@ -332,6 +441,9 @@ class PriceHistory(TimeStampedModel):
 
     class Meta:
         ordering = ["-recorded_at"]
+        indexes = [
+            models.Index(fields=["variant", "recorded_at"], name="catalog_price_variant_time_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.variant} @ {self.price}"
@@ -0,0 +1,215 @@
+"""Point-in-time price lookups over :class:`PriceHistory`.
+
+A price recorded at ``recorded_at`` stays in effect until the next history row
+of the same variant. Lookups are answered in batches: on PostgreSQL a single
+``LATERAL`` query walks the ``(variant, recorded_at)`` index once per requested
+pair, other backends load the history of the requested variants in one query.
+Resolved intervals are kept in a :class:`PriceIntervalCache` so repeated lookups
+during an analytics run do not hit the database again.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable
+
+from django.db import connection
+
+from simplycrm.catalog import models
+
+
+PriceKey = tuple[int, datetime]
+
+
+@dataclass(frozen=True)
+class PricePoint:
+    """Price of a variant valid in ``[valid_from, valid_until)``.
+
+    ``valid_until`` is ``None`` while the price is still current.
+    """
+
+    variant_id: int
+    price: Decimal
+    currency: str
+    valid_from: datetime
+    valid_until: datetime | None
+
+    def covers(self, moment: datetime) -> bool:
+        return self.valid_from <= moment and (self.valid_until is None or moment < self.valid_until)
+
+
+class PriceIntervalCache:
+    """In-memory store of resolved price intervals per variant.
+
+    Besides price intervals the cache remembers the earliest known history row
+    of a variant, so lookups before the first recorded price resolve to
+    ``None`` without a query.
+    """
+
+    def __init__(self) -> None:
+        self._starts: dict[int, list[datetime]] = defaultdict(list)
+        self._points: dict[int, list[PricePoint]] = defaultdict(list)
+        self._first_recorded: dict[int, datetime | None] = {}
+
+    def __len__(self) -> int:
+        return sum(len(points) for points in self._points.values())
+
+    def add(self, point: PricePoint) -> None:
+        starts = self._starts[point.variant_id]
+        points = self._points[point.variant_id]
+        index = bisect_right(starts, point.valid_from)
+        if index and starts[index - 1] == point.valid_from:
+            points[index - 1] = point
+            return
+        starts.insert(index, point.valid_from)
+        points.insert(index, point)
+
+    def mark_first_recorded(self, variant_id: int, recorded_at: datetime | None) -> None:
+        """Remember when the history of ``variant_id`` starts (``None`` if empty)."""
+
+        self._first_recorded[variant_id] = recorded_at
+
+    def lookup(self, variant_id: int, moment: datetime) -> tuple[bool, PricePoint | None]:
+        """Return ``(hit, point)``; ``hit`` is false when the database must be asked."""
+
+        if variant_id in self._first_recorded:
+            first = self._first_recorded[variant_id]
+            if first is None or moment < first:
+                return True, None
+        starts = self._starts.get(variant_id)
+        if not starts:
+            return False, None
+        index = bisect_right(starts, moment) - 1
+        if index < 0:
+            return False, None
+        point = self._points[variant_id][index]
+        if point.covers(moment):
+            return True, point
+        return False, None
+
+    def invalidate(self, variant_id: int | None = None) -> None:
+        """Drop cached intervals, e.g. after a new price has been recorded."""
+
+        if variant_id is None:
+            self._starts.clear()
+            self._points.clear()
+            self._first_recorded.clear()
+            return
+        self._starts.pop(variant_id, None)
+        self._points.pop(variant_id, None)
+        self._first_recorded.pop(variant_id, None)
+
+
+class PriceLookup:
+    """Resolve ``(variant_id, moment)`` pairs to the price in effect at that moment."""
+
+    def __init__(self, *, organization_id: int | None = None, cache: PriceIntervalCache | None = None) -> None:
+        self.organization_id = organization_id
+        self.cache = cache if cache is not None else PriceIntervalCache()
+
+    def price_at(self, variant_id: int, moment: datetime) -> PricePoint | None:
+        return self.prices_at([(variant_id, moment)])[(variant_id, moment)]
+
+    def prices_at(self, pairs: Iterable[PriceKey]) -> dict[PriceKey, PricePoint | None]:
+        """Return the price point for every pair; ``None`` when no price was recorded yet."""
+
+        results: dict[PriceKey, PricePoint | None] = {}
+        missing: list[PriceKey] = []
+        for key in dict.fromkeys(pairs):
+            hit, point = self.cache.lookup(*key)
+            if hit:
+                results[key] = point
+            else:
+                missing.append(key)
+
+        if missing:
+            if connection.vendor == "postgresql":
+                fetched = self._fetch_lateral(missing)
+            else:
+                fetched = self._fetch_history(missing)
+            results.update(fetched)
+        return results
+
+    def _fetch_lateral(self, pairs: list[PriceKey]) -> dict[PriceKey, PricePoint | None]:
+        history = models.PriceHistory._meta.db_table
+        scope = ""
+        params: list = [[variant_id for variant_id, _ in pairs], [moment for _, moment in pairs]]
+        if self.organization_id is not None:
+            variant_table = models.ProductVariant._meta.db_table
+            product_table = models.Product._meta.db_table
+            scope = (
+                f"JOIN {variant_table} v ON v.id = q.variant_id "
+                f"JOIN {product_table} p ON p.id = v.product_id AND p.organization_id = %s"
+            )
+            params.append(self.organization_id)
+        sql = f"""
+            SELECT q.variant_id, q.moment, cur.price, cur.currency, cur.recorded_at, nxt.recorded_at
+            FROM unnest(%s::bigint[], %s::timestamptz[]) AS q(variant_id, moment)
+            {scope}
+            LEFT JOIN LATERAL (
+                SELECT h.price, h.currency, h.recorded_at
+                FROM {history} h
+                WHERE h.variant_id = q.variant_id AND h.recorded_at <= q.moment
+                ORDER BY h.recorded_at DESC, h.id DESC
+                LIMIT 1
+            ) cur ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT h.recorded_at
+                FROM {history} h
+                WHERE h.variant_id = q.variant_id AND h.recorded_at > q.moment
+                ORDER BY h.recorded_at ASC
+                LIMIT 1
+            ) nxt ON TRUE
+        """
+        results: dict[PriceKey, PricePoint | None] = dict.fromkeys(pairs)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        for variant_id, moment, price, currency, valid_from, valid_until in rows:
+            if valid_from is None:
+                # Only the absence before the first row is known here, not its start.
+                continue
+            point = PricePoint(variant_id, price, currency, valid_from, valid_until)
+            self.cache.add(point)
+            results[(variant_id, moment)] = point
+        return results
+
+    def _fetch_history(self, pairs: list[PriceKey]) -> dict[PriceKey, PricePoint | None]:
+        variant_ids = {variant_id for variant_id, _ in pairs}
+        history = models.PriceHistory.objects.filter(variant_id__in=variant_ids)
+        if self.organization_id is not None:
+            history = history.filter(variant__product__organization_id=self.organization_id)
+        rows = history.order_by("variant_id", "recorded_at", "id").values_list(
+            "variant_id", "price", "currency", "recorded_at"
+        )
+
+        by_variant: dict[int, list[tuple[Decimal, str, datetime]]] = defaultdict(list)
+        for variant_id, price, currency, recorded_at in rows:
+            entries = by_variant[variant_id]
+            if entries and entries[-1][2] == recorded_at:
+                entries[-1] = (price, currency, recorded_at)
+            else:
+                entries.append((price, currency, recorded_at))
+
+        for variant_id in variant_ids:
+            entries = by_variant.get(variant_id, [])
+            self.cache.invalidate(variant_id)
+            self.cache.mark_first_recorded(variant_id, entries[0][2] if entries else None)
+            for index, (price, currency, recorded_at) in enumerate(entries):
+                valid_until = entries[index + 1][2] if index + 1 < len(entries) else None
+                self.cache.add(PricePoint(variant_id, price, currency, recorded_at, valid_until))
+
+        return {key: self.cache.lookup(*key)[1] for key in pairs}
+
+
+def prices_at(
+    pairs: Iterable[PriceKey],
+    *,
+    organization_id: int | None = None,
+) -> dict[PriceKey, PricePoint | None]:
+    """Resolve a batch of price-as-of lookups without keeping a cache around."""
+
+    return PriceLookup(organization_id=organization_id).prices_at(pairs)
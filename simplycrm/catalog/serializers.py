@@ -5,11 +5,12 @@ import secrets
 import string
 from typing import Any
 
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
-from simplycrm.catalog import models
+from simplycrm.catalog import inventory, models, services
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -109,6 +110,8 @@ class ProductVariantSerializer(serializers.ModelSerializer):
 
 
 class NestedProductVariantSerializer(ProductVariantSerializer):
+    id = serializers.IntegerField(required=False)
+
     class Meta(ProductVariantSerializer.Meta):
         fields = [
             "id",
@@ -196,7 +199,7 @@ class ProductSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             product = super().create(validated_data)
             if variants_data:
-                self._sync_variants(product, variants_data)
+                self._sync_variants(product, variants_data, created=True)
         return product
 
     def update(self, instance, validated_data):  # type: ignore[override]
@@ -218,61 +221,29 @@ class ProductSerializer(serializers.ModelSerializer):
                 self._sync_variants(product, variants_data)
         return product
 
-    def _sync_variants(self, product: models.Product, variants_data: list[dict[str, Any]]):
-        existing_variants = {variant.id: variant for variant in product.variants.all()}
-        seen_ids: set[int] = set()
-        request = self.context.get("request") if hasattr(self, "context") else None
-        recorded_by = None
-        if request is not None:
-            user = getattr(request, "user", None)
-            if getattr(user, "is_authenticated", False):
-                recorded_by = user
-
-        default_requested = False
-        for payload in variants_data:
-            variant_id = payload.get("id")
-            payload = dict(payload)
-            payload.pop("product", None)
-            if payload.get("is_default"):
-                if default_requested:
-                    raise serializers.ValidationError(
-                        {"variants": _("Укажите только один вариант по умолчанию.")}
-                    )
-                default_requested = True
-
-            if variant_id is None:
-                serializer = NestedProductVariantSerializer(data=payload, context=self.context)
-                serializer.is_valid(raise_exception=True)
-                variant = serializer.save(product=product, recorded_by=recorded_by)
-                seen_ids.add(variant.id)
-                continue
-
-            variant = existing_variants.get(variant_id)
-            if not variant:
-                raise serializers.ValidationError(
-                    {"variants": _("Вариант с указанным идентификатором не найден.")}
-                )
-            serializer = NestedProductVariantSerializer(
-                variant, data=payload, partial=True, context=self.context
+    def _sync_variants(
+        self,
+        product: models.Product,
+        variants_data: list[dict[str, Any]],
+        *,
+        created: bool = False,
+    ) -> None:
+        try:
+            services.sync_product_variants(
+                product,
+                variants_data,
+                recorded_by=self._get_recorded_by(),
+                existing=[] if created else None,
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recorded_by=recorded_by)
-            seen_ids.add(variant_id)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({"variants": exc.messages}) from exc
 
-        to_delete = [pk for pk in existing_variants if pk not in seen_ids]
-        if to_delete:
-            models.ProductVariant.objects.filter(pk__in=to_delete).delete()
-
-        if not variants_data:
-            return
-
-        if not default_requested and not product.variants.filter(is_default=True).exists():
-            fallback = product.variants.order_by("id").first()
-            if fallback:
-                product.variants.exclude(pk=fallback.pk).update(is_default=False)
-                if not fallback.is_default:
-                    fallback.is_default = True
-                    fallback.save(update_fields=["is_default", "updated_at"])
+    def _get_recorded_by(self):
+        request = self.context.get("request") if hasattr(self, "context") else None
+        user = getattr(request, "user", None)
+        if getattr(user, "is_authenticated", False):
+            return user
+        return None
 
     @staticmethod
     def _generate_unique_sku(organization, length: int = 10, attempts: int = 20) -> str:
@@ -330,3 +301,83 @@ class PriceHistorySerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
+
+
+class PriceAsOfQuerySerializer(serializers.Serializer):
+    variant = serializers.IntegerField(min_value=1)
+    at = serializers.DateTimeField()
+
+
+class PriceAsOfRequestSerializer(serializers.Serializer):
+    lookups = PriceAsOfQuerySerializer(many=True, allow_empty=False, max_length=5000)
+
+
+class PriceAsOfSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    at = serializers.DateTimeField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True)
+    currency = serializers.CharField(allow_null=True)
+    valid_from = serializers.DateTimeField(allow_null=True)
+    valid_until = serializers.DateTimeField(allow_null=True)
+
+
+class StockLevelSerializer(serializers.ModelSerializer):
+    variant_sku = serializers.CharField(source="variant.sku", read_only=True)
+
+    class Meta:
+        model = models.StockLevel
+        fields = [
+            "id",
+            "variant",
+            "variant_sku",
+            "location",
+            "quantity",
+            "last_movement_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.StockMovement
+        fields = [
+            "id",
+            "variant",
+            "lot",
+            "location",
+            "movement_type",
+            "quantity",
+            "occurred_at",
+            "reference",
+            "recorded_by",
+            "created_at",
+        ]
+        read_only_fields = ["id", "recorded_by", "created_at"]
+        extra_kwargs = {"occurred_at": {"required": False}}
+
+    def validate(self, attrs):  # type: ignore[override]
+        attrs = super().validate(attrs)
+        if attrs.get("movement_type") == models.StockMovement.MovementType.ALLOCATION:
+            raise serializers.ValidationError(
+                {"movement_type": _("Резервирование выполняется только через размещение заказа.")}
+            )
+        if not attrs.get("quantity"):
+            raise serializers.ValidationError({"quantity": _("Количество не может быть нулевым.")})
+        lot = attrs.get("lot")
+        if lot is None:
+            # Stock on hand is the sum of the lots; a movement outside any lot would drift from them.
+            raise serializers.ValidationError({"lot": _("Укажите партию, к которой относится движение.")})
+        if lot.variant_id != attrs["variant"].id:
+            raise serializers.ValidationError({"lot": _("Партия относится к другому варианту.")})
+        if attrs.get("location", lot.location) != lot.location:
+            raise serializers.ValidationError({"location": _("Партия хранится в другом месте.")})
+        return attrs
+
+    def create(self, validated_data):  # type: ignore[override]
+        validated_data.pop("variant")
+        validated_data.pop("location", None)
+        try:
+            return inventory.record_lot_movement(**validated_data)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({"quantity": exc.messages}) from exc
@@ -0,0 +1,174 @@
+"""Domain services for the product catalog."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from simplycrm.catalog import models
+from simplycrm.core import versioning
+
+
+@dataclass
+class VariantSyncPlan:
+    """Diff between the persisted variants of a product and a submitted payload."""
+
+    to_create: list[models.ProductVariant] = field(default_factory=list)
+    to_update: list[models.ProductVariant] = field(default_factory=list)
+    to_delete: list[int] = field(default_factory=list)
+    update_fields: set[str] = field(default_factory=set)
+    price_changes: list[models.ProductVariant] = field(default_factory=list)
+    organization_id: int | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.to_create or self.to_update or self.to_delete)
+
+
+def plan_variant_sync(
+    product: models.Product,
+    payloads: Iterable[dict[str, Any]],
+    existing: Iterable[models.ProductVariant],
+) -> VariantSyncPlan:
+    """Compare validated variant payloads with persisted variants in a single pass.
+
+    Payloads carrying an ``id`` update the matching variant, payloads without one
+    create a new variant and persisted variants missing from the payload are
+    scheduled for deletion. No queries are issued; ``existing`` must already be
+    loaded by the caller.
+    """
+
+    existing_by_id = {variant.pk: variant for variant in existing}
+    plan = VariantSyncPlan(organization_id=product.organization_id)
+    seen_ids: set[int] = set()
+    requested_default: models.ProductVariant | None = None
+    final_variants: list[models.ProductVariant] = []
+    submitted = False
+
+    for raw_payload in payloads:
+        submitted = True
+        payload = dict(raw_payload)
+        variant_id = payload.pop("id", None)
+        payload.pop("product", None)
+
+        if variant_id is None:
+            variant = models.ProductVariant(product=product, **payload)
+            plan.to_create.append(variant)
+            plan.price_changes.append(variant)
+        else:
+            variant = existing_by_id.get(variant_id)
+            if variant is None:
+                raise ValidationError("Вариант с указанным идентификатором не найден.")
+            if variant_id in seen_ids:
+                raise ValidationError("Вариант указан в запросе несколько раз.")
+            seen_ids.add(variant_id)
+            changed = _apply_changes(variant, payload)
+            if changed:
+                plan.to_update.append(variant)
+                plan.update_fields.update(changed)
+            if changed & {"price", "currency"}:
+                plan.price_changes.append(variant)
+
+        if payload.get("is_default"):
+            if requested_default is not None:
+                raise ValidationError("Укажите только один вариант по умолчанию.")
+            requested_default = variant
+        final_variants.append(variant)
+
+    plan.to_delete = [pk for pk in existing_by_id if pk not in seen_ids]
+
+    skus = [variant.sku for variant in final_variants]
+    if len(skus) != len(set(skus)):
+        raise ValidationError("Артикулы вариантов должны быть уникальными в рамках продукта.")
+
+    if submitted:
+        _resolve_default(plan, final_variants, requested_default)
+    return plan
+
+
+def apply_variant_sync(plan: VariantSyncPlan, *, recorded_by=None) -> None:
+    """Persist a :class:`VariantSyncPlan` with a constant number of queries."""
+
+    if plan.is_empty:
+        return
+    with transaction.atomic():
+        if plan.to_delete:
+            models.ProductVariant.objects.filter(pk__in=plan.to_delete).delete()
+        if plan.to_update:
+            now = timezone.now()
+            for variant in plan.to_update:
+                variant.updated_at = now
+            models.ProductVariant.objects.bulk_update(
+                plan.to_update, sorted(plan.update_fields | {"updated_at"})
+            )
+        if plan.to_create:
+            models.ProductVariant.objects.bulk_create(plan.to_create)
+        if plan.price_changes:
+            models.PriceHistory.objects.bulk_create(
+                [
+                    models.PriceHistory(
+                        variant=variant,
+                        price=variant.price,
+                        currency=variant.currency,
+                        recorded_by=recorded_by,
+                    )
+                    for variant in plan.price_changes
+                ]
+            )
+        versioning.bump_data_version(plan.organization_id, versioning.CATALOG)
+
+
+def sync_product_variants(
+    product: models.Product,
+    payloads: Iterable[dict[str, Any]],
+    *,
+    recorded_by=None,
+    existing: Iterable[models.ProductVariant] | None = None,
+) -> VariantSyncPlan:
+    """Diff ``payloads`` against the product's variants and apply the result."""
+
+    if existing is None:
+        existing = list(product.variants.all())
+    plan = plan_variant_sync(product, payloads, existing)
+    apply_variant_sync(plan, recorded_by=recorded_by)
+    prefetched = getattr(product, "_prefetched_objects_cache", None)
+    if prefetched:
+        prefetched.pop("variants", None)
+    return plan
+
+
+def _apply_changes(variant: models.ProductVariant, payload: dict[str, Any]) -> set[str]:
+    changed: set[str] = set()
+    for attr, value in payload.items():
+        if getattr(variant, attr) != value:
+            setattr(variant, attr, value)
+            changed.add(attr)
+    return changed
+
+
+def _resolve_default(
+    plan: VariantSyncPlan,
+    final_variants: list[models.ProductVariant],
+    requested_default: models.ProductVariant | None,
+) -> None:
+    """Guarantee exactly one default variant without extra fix-up queries."""
+
+    default = requested_default
+    if default is None:
+        default = next((variant for variant in final_variants if variant.is_default), None)
+    if default is None and final_variants:
+        persisted = [variant for variant in final_variants if variant.pk is not None]
+        default = min(persisted, key=lambda variant: variant.pk) if persisted else final_variants[0]
+
+    for variant in final_variants:
+        should_be_default = variant is default
+        if variant.is_default == should_be_default:
+            continue
+        variant.is_default = should_be_default
+        if variant.pk is not None:
+            plan.update_fields.add("is_default")
+            if variant not in plan.to_update:
+                plan.to_update.append(variant)
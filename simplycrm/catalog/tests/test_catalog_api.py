@@ -1,6 +1,8 @@
 """Integration tests for the catalog API."""
 from __future__ import annotations
 
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework import status
@@ -102,3 +104,88 @@ class CatalogApiTests(APITestCase):
         self.assertEqual(product.status, models.Product.Status.ACTIVE)
         self.assertTrue(product.is_active)
         self.assertIsNotNone(product.published_at)
+
+    def _create_product_with_variants(self, count: int) -> models.Product:
+        product = models.Product.objects.create(
+            organization=self.organization,
+            name=f"Bulk {count}",
+            sku=f"BULK-{count}",
+        )
+        models.ProductVariant.objects.bulk_create(
+            [
+                models.ProductVariant(
+                    product=product,
+                    name=f"Variant {index}",
+                    sku=f"BULK-{count}-{index}",
+                    price="10.00",
+                    cost="5.00",
+                    is_default=index == 0,
+                )
+                for index in range(count)
+            ]
+        )
+        return product
+
+    def _sync_payload(self, product: models.Product) -> list[dict]:
+        variants = list(product.variants.order_by("id"))
+        payload = [
+            {
+                "id": variant.id,
+                "name": variant.name,
+                "sku": variant.sku,
+                "price": "12.50",
+                "cost": "5.00",
+            }
+            for variant in variants[1:]
+        ]
+        payload.append({"name": "Fresh", "sku": f"{product.sku}-NEW", "price": "7.00", "cost": "3.00"})
+        return payload
+
+    def test_update_product_diffs_variants(self):
+        product = self._create_product_with_variants(3)
+        payload = self._sync_payload(product)
+
+        url = reverse("catalog:product-detail", args=[product.pk])
+        response = self.client.patch(url, {"variants": payload}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        variants = list(product.variants.order_by("id"))
+        self.assertEqual([variant.sku for variant in variants], ["BULK-3-1", "BULK-3-2", "BULK-3-NEW"])
+        self.assertEqual(sum(variant.is_default for variant in variants), 1)
+        self.assertTrue(variants[0].is_default)
+        self.assertEqual(str(variants[0].price), "12.50")
+        self.assertEqual(models.PriceHistory.objects.filter(variant__product=product).count(), 3)
+        self.assertEqual(len(response.data["variants"]), 3)
+
+    def test_variant_sync_issues_constant_number_of_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from simplycrm.catalog import services
+
+        counts = []
+        for size in (3, 40):
+            product = self._create_product_with_variants(size)
+            payload = self._sync_payload(product)
+            for entry in payload:
+                entry["price"] = Decimal(entry["price"])
+                entry["cost"] = Decimal(entry["cost"])
+            with CaptureQueriesContext(connection) as ctx:
+                services.sync_product_variants(product, payload)
+            counts.append(len(ctx.captured_queries))
+            self.assertEqual(product.variants.count(), size)
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_variant_sync_rejects_unknown_variant(self):
+        product = self._create_product_with_variants(1)
+        url = reverse("catalog:product-detail", args=[product.pk])
+
+        response = self.client.patch(
+            url,
+            {"variants": [{"id": 999999, "name": "Ghost", "sku": "GHOST", "price": "1.00", "cost": "1.00"}]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("variants", response.data)
@@ -0,0 +1,205 @@
+"""Tests for the stock ledger and materialized stock levels."""
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.catalog import inventory, models
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import fulfillment
+from simplycrm.sales import models as sales_models
+
+
+class StockLedgerTests(TenantTestMixin, APITestCase):
+    """Keep stock levels consistent with the movement ledger."""
+
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "stocker"
+
+    def setUp(self):
+        super().setUp()
+        product = models.Product.objects.create(
+            organization=self.organization,
+            name="Widget",
+            sku="WGT",
+        )
+        self.variant = models.ProductVariant.objects.create(
+            product=product,
+            name="Default",
+            sku="WGT-1",
+            price="10.00",
+            cost="4.00",
+        )
+
+    def test_lot_lifecycle_is_recorded_in_ledger(self):
+        lot = models.InventoryLot.objects.create(
+            variant=self.variant,
+            quantity=30,
+            received_at=date.today(),
+            location="A1",
+        )
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 30)
+
+        lot.quantity = 25
+        lot.save()
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 25)
+
+        lot.location = "B2"
+        lot.save()
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 0)
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "B2"), 25)
+
+        lot.delete()
+        self.assertEqual(inventory.stock_on_hand(self.variant.id), 0)
+        movement_types = list(
+            inventory.movement_history(self.variant.id).values_list("movement_type", flat=True)
+        )
+        self.assertEqual(movement_types[0], models.StockMovement.MovementType.RECEIPT)
+        self.assertEqual(len(movement_types), 5)
+
+    def test_bulk_movements_collapse_into_stock_levels(self):
+        inventory.record_movements(
+            [
+                models.StockMovement(
+                    variant=self.variant,
+                    location="A1",
+                    movement_type=models.StockMovement.MovementType.RECEIPT,
+                    quantity=10,
+                ),
+                models.StockMovement(
+                    variant=self.variant,
+                    location="A1",
+                    movement_type=models.StockMovement.MovementType.RETURN,
+                    quantity=2,
+                ),
+                models.StockMovement(
+                    variant=self.variant,
+                    location="A1",
+                    movement_type=models.StockMovement.MovementType.ADJUSTMENT,
+                    quantity=-5,
+                ),
+            ]
+        )
+
+        level = models.StockLevel.objects.get(variant=self.variant, location="A1")
+        self.assertEqual(level.quantity, 7)
+        self.assertEqual(inventory.stock_by_variant(self.organization.id), {self.variant.id: 7})
+        self.assertEqual(inventory.organization_stock_total(self.organization.id), 7)
+
+    def test_movement_api_records_adjustments_and_filters_by_time(self):
+        lot = models.InventoryLot.objects.create(
+            variant=self.variant, quantity=0, received_at=date.today(), location="A1"
+        )
+        url = reverse("catalog:stock-movement-list")
+        old = timezone.now() - timedelta(days=10)
+        response = self.client.post(
+            url,
+            {
+                "variant": self.variant.id,
+                "lot": lot.id,
+                "location": "A1",
+                "movement_type": "adjustment",
+                "quantity": 4,
+                "occurred_at": old.isoformat(),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(
+            url,
+            {"variant": self.variant.id, "lot": lot.id, "movement_type": "return", "quantity": 1},
+            format="json",
+        )
+
+        recent = self.client.get(url, {"occurred_from": (timezone.now() - timedelta(days=1)).isoformat()})
+        self.assertEqual(recent.status_code, status.HTTP_200_OK)
+        self.assertEqual(recent.data["count"], 1)
+
+        levels = self.client.get(reverse("catalog:stock-level-list"), {"variant": self.variant.id})
+        self.assertEqual(levels.data["results"][0]["quantity"], 5)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity, 5)
+
+    def test_movement_api_keeps_lots_and_stock_levels_in_step(self):
+        lot = models.InventoryLot.objects.create(
+            variant=self.variant, quantity=10, received_at=date.today(), location="A1"
+        )
+        url = reverse("catalog:stock-movement-list")
+
+        response = self.client.post(
+            url,
+            {"variant": self.variant.id, "location": "A1", "movement_type": "receipt", "quantity": 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("lot", response.data)
+
+        response = self.client.post(
+            url,
+            {"variant": self.variant.id, "lot": lot.id, "location": "B2", "movement_type": "receipt", "quantity": 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("location", response.data)
+
+        response = self.client.post(
+            url,
+            {"variant": self.variant.id, "lot": lot.id, "movement_type": "receipt", "quantity": 3},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["location"], "A1")
+
+        response = self.client.post(
+            url,
+            {"variant": self.variant.id, "lot": lot.id, "movement_type": "adjustment", "quantity": -20},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantity, 13)
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 13)
+
+    def test_deleting_an_allocated_lot_is_a_conflict(self):
+        lot = models.InventoryLot.objects.create(
+            variant=self.variant, quantity=10, received_at=date.today(), location="A1"
+        )
+        order = sales_models.Order.objects.create(organization=self.organization)
+        sales_models.OrderLine.objects.create(
+            order=order, product_variant=self.variant, quantity=4, unit_price="10.00"
+        )
+        fulfillment.allocate_order(order)
+
+        response = self.client.delete(reverse("catalog:inventory-lot-detail", args=[lot.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(models.InventoryLot.objects.filter(pk=lot.pk).exists())
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 6)
+        self.assertFalse(
+            models.StockMovement.objects.filter(reference=f"lot:{lot.pk}:deleted").exists()
+        )
+
+        spare = models.InventoryLot.objects.create(
+            variant=self.variant, quantity=2, received_at=date.today(), location="A1"
+        )
+        response = self.client.delete(reverse("catalog:inventory-lot-detail", args=[spare.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(inventory.stock_on_hand(self.variant.id, "A1"), 6)
+        self.assertEqual(
+            models.StockMovement.objects.get(reference=f"lot:{spare.pk}:deleted").recorded_by, self.user
+        )
+
+    def test_movement_api_rejects_manual_allocations(self):
+        response = self.client.post(
+            reverse("catalog:stock-movement-list"),
+            {"variant": self.variant.id, "movement_type": "allocation", "quantity": -1},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,88 @@
+"""Tests for point-in-time price lookups."""
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.catalog import models, pricing
+from simplycrm.core import models as core_models
+from simplycrm.core.tests.utils import TenantTestMixin
+
+
+class PriceAsOfTests(TenantTestMixin, APITestCase):
+    """Resolve historical prices in batches."""
+
+    subscription_plan = core_models.SubscriptionPlan.ENTERPRISE
+    username = "pricer"
+
+    def setUp(self):
+        super().setUp()
+        product = models.Product.objects.create(organization=self.organization, name="Widget", sku="WGT")
+        self.variant = models.ProductVariant.objects.create(
+            product=product,
+            name="Default",
+            sku="WGT-1",
+            price="12.00",
+            cost="5.00",
+        )
+        self.now = timezone.now()
+        self.history = [
+            self._record("10.00", self.now - timedelta(days=30)),
+            self._record("11.00", self.now - timedelta(days=10)),
+            self._record("12.00", self.now - timedelta(days=1)),
+        ]
+
+    def _record(self, price: str, recorded_at):
+        entry = models.PriceHistory.objects.create(variant=self.variant, price=price)
+        models.PriceHistory.objects.filter(pk=entry.pk).update(recorded_at=recorded_at)
+        return recorded_at
+
+    def test_batch_lookup_resolves_intervals(self):
+        lookup = pricing.PriceLookup(organization_id=self.organization.id)
+        before = self.now - timedelta(days=40)
+        middle = self.now - timedelta(days=5)
+        with self.assertNumQueries(1):
+            points = lookup.prices_at(
+                [(self.variant.id, before), (self.variant.id, middle), (self.variant.id, self.now)]
+            )
+
+        self.assertIsNone(points[(self.variant.id, before)])
+        self.assertEqual(points[(self.variant.id, middle)].price, Decimal("11.00"))
+        self.assertEqual(points[(self.variant.id, middle)].valid_from, self.history[1])
+        self.assertEqual(points[(self.variant.id, middle)].valid_until, self.history[2])
+        self.assertIsNone(points[(self.variant.id, self.now)].valid_until)
+
+        with self.assertNumQueries(0):
+            repeated = lookup.prices_at(
+                [(self.variant.id, self.now - timedelta(days=20)), (self.variant.id, before)]
+            )
+        self.assertEqual(repeated[(self.variant.id, self.now - timedelta(days=20))].price, Decimal("10.00"))
+
+    def test_lookup_is_scoped_to_organization(self):
+        other = core_models.Organization.objects.create(name="Other", slug="other")
+        points = pricing.prices_at([(self.variant.id, self.now)], organization_id=other.id)
+
+        self.assertIsNone(points[(self.variant.id, self.now)])
+
+    def test_as_of_endpoint(self):
+        response = self.client.post(
+            reverse("catalog:price-history-as-of"),
+            {
+                "lookups": [
+                    {"variant": self.variant.id, "at": (self.now - timedelta(days=15)).isoformat()},
+                    {"variant": self.variant.id, "at": (self.now - timedelta(days=60)).isoformat()},
+                ]
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, second = response.data["results"]
+        self.assertEqual(first["price"], "10.00")
+        self.assertIsNotNone(first["valid_until"])
+        self.assertIsNone(second["price"])
@@ -11,6 +11,8 @@ router.register(r"suppliers", viewsets.SupplierViewSet, basename="supplier")
 router.register(r"products", viewsets.ProductViewSet, basename="product")
 router.register(r"product-variants", viewsets.ProductVariantViewSet, basename="product-variant")
 router.register(r"inventory-lots", viewsets.InventoryLotViewSet, basename="inventory-lot")
+router.register(r"stock-levels", viewsets.StockLevelViewSet, basename="stock-level")
+router.register(r"stock-movements", viewsets.StockMovementViewSet, basename="stock-movement")
 router.register(r"price-history", viewsets.PriceHistoryViewSet, basename="price-history")
 
 
@@ -1,15 +1,15 @@
 """ViewSets for catalog resources."""
 from __future__ import annotations
 
-from django.db.models import Prefetch
+from django.db.models import Prefetch, ProtectedError
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import decorators, permissions, response, status, viewsets
+from rest_framework import decorators, mixins, permissions, response, status, viewsets
 from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 
 from simplycrm.catalog import filters as catalog_filters
-from simplycrm.catalog import models, serializers
+from simplycrm.catalog import models, pricing, serializers
 from simplycrm.core import tenant
 from simplycrm.core.permissions import HasFeaturePermission
 
@@ -200,6 +200,69 @@ class InventoryLotViewSet(viewsets.ModelViewSet):
             raise ValidationError("Поставщик принадлежит другой организации.")
         serializer.save()
 
+    def destroy(self, request, *args, **kwargs):  # type: ignore[override]
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError:
+            return response.Response(
+                {"detail": "Партию нельзя удалить: по ней есть резервы заказов."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+    def perform_destroy(self, instance):  # type: ignore[override]
+        user = getattr(self.request, "user", None)
+        instance.delete(recorded_by=user if getattr(user, "is_authenticated", False) else None)
+
+
+class StockLevelViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = serializers.StockLevelSerializer
+    permission_classes = [permissions.IsAuthenticated, HasFeaturePermission]
+    feature_code = "inventory.advanced_tracking"
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = catalog_filters.StockLevelFilterSet
+    ordering_fields = ("quantity", "last_movement_at", "location")
+    ordering = ("variant_id", "location")
+
+    def get_queryset(self):  # type: ignore[override]
+        organization = tenant.get_request_organization(self.request)
+        if not organization:
+            return models.StockLevel.objects.none()
+        return models.StockLevel.objects.filter(
+            variant__product__organization=organization
+        ).select_related("variant")
+
+
+class StockMovementViewSet(
+    mixins.CreateModelMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
+    """Append-only access to the stock ledger."""
+
+    serializer_class = serializers.StockMovementSerializer
+    permission_classes = [permissions.IsAuthenticated, HasFeaturePermission]
+    feature_code = "inventory.advanced_tracking"
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = catalog_filters.StockMovementFilterSet
+    ordering_fields = ("occurred_at", "quantity")
+    ordering = ("-occurred_at", "-id")
+
+    def get_queryset(self):  # type: ignore[override]
+        organization = tenant.get_request_organization(self.request)
+        if not organization:
+            return models.StockMovement.objects.none()
+        return models.StockMovement.objects.filter(variant__product__organization=organization)
+
+    def perform_create(self, serializer):  # type: ignore[override]
+        organization = tenant.get_request_organization(self.request)
+        if not organization:
+            raise ValidationError("Активная организация не выбрана.")
+        variant = serializer.validated_data["variant"]
+        if variant.product.organization_id != organization.id:
+            raise ValidationError("Нельзя изменять остатки чужой организации.")
+        user = getattr(self.request, "user", None)
+        recorded_by = user if getattr(user, "is_authenticated", False) else None
+        serializer.save(recorded_by=recorded_by)
+
 
 class PriceHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.PriceHistorySerializer
@@ -215,3 +278,27 @@ class PriceHistoryViewSet(viewsets.ReadOnlyModelViewSet):
         if not organization:
             return models.PriceHistory.objects.none()
         return models.PriceHistory.objects.filter(variant__product__organization=organization)
+
+    @decorators.action(detail=False, methods=["post"], url_path="as-of")
+    def as_of(self, request):
+        organization = tenant.get_request_organization(request)
+        if not organization:
+            raise ValidationError("Активная организация не выбрана.")
+        query = serializers.PriceAsOfRequestSerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        pairs = [(item["variant"], item["at"]) for item in query.validated_data["lookups"]]
+        points = pricing.prices_at(pairs, organization_id=organization.id)
+        results = []
+        for variant_id, moment in pairs:
+            point = points[(variant_id, moment)]
+            results.append(
+                {
+                    "variant": variant_id,
+                    "at": moment,
+                    "price": point.price if point else None,
+                    "currency": point.currency if point else None,
+                    "valid_from": point.valid_from if point else None,
+                    "valid_until": point.valid_until if point else None,
+                }
+            )
+        return response.Response({"results": serializers.PriceAsOfSerializer(results, many=True).data})
@@ -0,0 +1,128 @@
+"""Single-flight coalescing of identical expensive computations.
+
+The first caller for a key computes the result while concurrent callers with
+the same key wait for it and share it. Within a process waiters block on an
+event; across processes the leader holds a cache lock whose value is a flight
+token, and publishes the result under that token for waiters in other
+processes to pick up. Waiters that give up after ``WAIT_SECONDS``, or whose
+leader died without publishing, compute the result themselves.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+KEY_PREFIX = "simplycrm:coalesce"
+DEFAULTS: dict[str, float] = {
+    "ENABLED": True,
+    "WAIT_SECONDS": 30,
+    "LOCK_SECONDS": 60,
+    "RESULT_SECONDS": 10,
+    "POLL_INTERVAL": 0.05,
+}
+
+_MISSING = object()
+
+
+def get_config() -> dict[str, Any]:
+    return {**DEFAULTS, **getattr(settings, "REQUEST_COALESCING", {})}
+
+
+def lock_key(key: str) -> str:
+    return f"{KEY_PREFIX}:{key}:lock"
+
+
+def result_key(key: str, token: str) -> str:
+    return f"{KEY_PREFIX}:{key}:result:{token}"
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent computations that share a key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+
+    def do(self, key: str, compute: Callable[[], Any]) -> Any:
+        config = get_config()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not flight.done.wait(config["WAIT_SECONDS"]):
+                return compute()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self._across_processes(key, compute, config)
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def _across_processes(self, key: str, compute: Callable[[], Any], config: dict[str, Any]) -> Any:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + config["WAIT_SECONDS"]
+        while True:
+            if cache.add(lock_key(key), token, timeout=config["LOCK_SECONDS"]):
+                try:
+                    value = compute()
+                    # Wrapped so that a ``None`` result is distinguishable from a miss.
+                    cache.set(result_key(key, token), (value,), timeout=config["RESULT_SECONDS"])
+                    return value
+                finally:
+                    if cache.get(lock_key(key)) == token:
+                        cache.delete(lock_key(key))
+
+            holder = cache.get(lock_key(key))
+            while holder is not None and time.monotonic() < deadline:
+                published = cache.get(result_key(key, holder), _MISSING)
+                if published is not _MISSING:
+                    return published[0]
+                time.sleep(config["POLL_INTERVAL"])
+                current = cache.get(lock_key(key))
+                if current != holder:
+                    published = cache.get(result_key(key, holder), _MISSING)
+                    if published is not _MISSING:
+                        return published[0]
+                    holder = current
+            if time.monotonic() >= deadline:
+                return compute()
+
+
+single_flight = SingleFlight()
+
+
+def coalesce(name: str, organization_id: int, compute: Callable[[], Any], params: dict | None = None) -> Any:
+    """Run ``compute`` once for concurrent identical ``(name, organization, params)`` requests."""
+
+    if not get_config()["ENABLED"]:
+        return compute()
+    key = f"{name}:{organization_id}"
+    if params:
+        payload = json.dumps(params, sort_keys=True, default=str)
+        key = f"{key}:{hashlib.sha1(payload.encode()).hexdigest()[:20]}"
+    return single_flight.do(key, compute)
@@ -0,0 +1,102 @@
+"""Tests for single-flight request coalescing."""
+from __future__ import annotations
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from simplycrm.core import coalescing
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.flight = coalescing.SingleFlight()
+
+    def test_concurrent_callers_share_one_computation(self):
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(threading.get_ident())
+            release.wait(5)
+            return {"total": 42}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.flight.do("overview:1", compute))) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.01)
+        # Give the followers time to queue behind the leader before it finishes.
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"total": 42}] * 8)
+        self.assertIsNone(cache.get(coalescing.lock_key("overview:1")))
+        self.assertEqual(self.flight.do("overview:1", lambda: {"total": 43}), {"total": 43})
+
+    def test_leader_errors_are_shared_with_waiters(self):
+        started = threading.Event()
+        errors = []
+
+        def compute():
+            started.set()
+            time.sleep(0.05)
+            raise RuntimeError("database unavailable")
+
+        def call():
+            try:
+                self.flight.do("overview:1", compute)
+            except RuntimeError as exc:
+                errors.append(str(exc))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(errors, ["database unavailable"] * 2)
+        self.assertIsNone(cache.get(coalescing.lock_key("overview:1")))
+
+    def test_result_published_by_another_process_is_reused(self):
+        cache.set(coalescing.lock_key("overview:1"), "other-process")
+
+        def publish():
+            time.sleep(0.05)
+            cache.set(coalescing.result_key("overview:1", "other-process"), ({"total": 7},))
+            cache.delete(coalescing.lock_key("overview:1"))
+
+        threading.Thread(target=publish).start()
+        result = self.flight.do("overview:1", lambda: self.fail("must not compute"))
+
+        self.assertEqual(result, {"total": 7})
+
+    @override_settings(REQUEST_COALESCING={"WAIT_SECONDS": 0.1})
+    def test_waiters_compute_themselves_when_the_lock_holder_stalls(self):
+        cache.set(coalescing.lock_key("overview:1"), "stalled-process")
+
+        self.assertEqual(self.flight.do("overview:1", lambda: "computed"), "computed")
+
+    def test_keys_include_parameters_and_can_be_disabled(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(coalescing.coalesce("overview", 1, compute, {"days": 7}), 1)
+        with override_settings(REQUEST_COALESCING={"ENABLED": False}):
+            self.assertEqual(coalescing.coalesce("overview", 1, compute), 2)
@@ -0,0 +1,65 @@
+"""Helpers shared by the API tests of every app."""
+from __future__ import annotations
+
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
+
+from simplycrm.core import models as core_models
+
+
+def api_test_settings() -> dict:
+    """Settings that keep the DDoS shield and the throttles out of API tests."""
+
+    return {
+        "DDOS_SHIELD": {"ENABLED": False},
+        "REST_FRAMEWORK": {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {
+                **settings.REST_FRAMEWORK.get("DEFAULT_THROTTLE_RATES", {}),
+                "user": "1000/min",
+                "anon": "1000/min",
+            },
+        },
+    }
+
+
+class TenantTestMixin:
+    """Set up the "Acme" organization on ``subscription_plan`` with an authenticated member.
+
+    ``setUp`` clears the cache, applies :func:`api_test_settings` and leaves
+    ``self.organization`` and ``self.user`` (named ``username``) in place.
+    """
+
+    subscription_plan = core_models.SubscriptionPlan.PRO
+    username = "member"
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        override = override_settings(**api_test_settings())
+        override.enable()
+        self.addCleanup(override.disable)
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        core_models.Subscription.objects.create(
+            organization=self.organization,
+            plan=core_models.SubscriptionPlan.objects.get(key=self.subscription_plan),
+            started_at=date.today(),
+        )
+        self.user = self.create_member(self.username)
+        self.authenticate(self.user)
+
+    def create_member(self, username):
+        return get_user_model().objects.create_user(
+            username=username,
+            password="password123",
+            email=f"{username}@example.com",
+            organization=self.organization,
+        )
+
+    def authenticate(self, user):
+        self.client.force_authenticate(user)
@@ -0,0 +1,68 @@
+"""Per-organization data versions used to key derived caches.
+
+Writers bump the version of the scope they touched (``sales``, ``catalog``,
+``pipeline`` ...) and readers embed the current versions into their cache keys,
+so cached analytics are invalidated by data changes instead of by TTL alone.
+"""
+from __future__ import annotations
+
+import time
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+SALES = "sales"
+CATALOG = "catalog"
+PIPELINE = "pipeline"
+SETTINGS = "settings"
+FORECASTS = "forecasts"
+# Contact and company records themselves (names, industries, deletions).
+CONTACTS = "contacts"
+# Bumped when contacts are deleted; incremental segment refreshes drop them only then.
+CONTACT_DELETIONS = "contact-deletions"
+
+_KEY_TEMPLATE = "simplycrm:data-version:{scope}:{organization_id}"
+
+
+def _key(organization_id: int, scope: str) -> str:
+    return _KEY_TEMPLATE.format(scope=scope, organization_id=organization_id)
+
+
+def _seed() -> int:
+    # Seed from the clock so an evicted counter never repeats an old version.
+    return int(time.time() * 1000)
+
+
+def get_data_version(organization_id: int, *scopes: str) -> str:
+    """Return a combined version token for the requested scopes."""
+
+    keys = {scope: _key(organization_id, scope) for scope in scopes}
+    current = cache.get_many(list(keys.values()))
+    parts = []
+    for scope, key in keys.items():
+        version = current.get(key)
+        if version is None:
+            cache.add(key, _seed(), timeout=None)
+            version = cache.get(key, 0)
+        parts.append(f"{scope}:{version}")
+    return "|".join(parts)
+
+
+def bump_data_version(organization_ids: int | Iterable[int], scope: str) -> None:
+    """Invalidate cached results of ``scope`` once the current transaction commits."""
+
+    if isinstance(organization_ids, int):
+        organization_ids = [organization_ids]
+    keys = [_key(organization_id, scope) for organization_id in set(organization_ids) if organization_id]
+    if keys:
+        transaction.on_commit(lambda: _increment(keys))
+
+
+def _increment(keys: list[str]) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
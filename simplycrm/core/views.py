@@ -21,8 +21,8 @@ from rest_framework.views import APIView
 
 import pandas as pd
 
-from simplycrm.catalog import models as catalog_models
-from simplycrm.core import models as core_models, tenant
+from simplycrm.catalog import inventory, models as catalog_models
+from simplycrm.core import coalescing, models as core_models, tenant
 from simplycrm.core.security import LoginAttemptTracker
 from simplycrm.core.serializers import (
     AuthTokenSerializer,
@@ -404,6 +404,14 @@ class DashboardOverviewView(APIView):
         organization = tenant.get_request_organization(request)
         if organization is None:
             raise ValidationError({"detail": "Активная организация не выбрана."})
+        # Dashboards of one tenant open together; identical concurrent requests share one computation.
+        payload = coalescing.coalesce(
+            "dashboard-overview", organization.id, lambda: self.build_payload(organization)
+        )
+        return Response(payload, status=status.HTTP_200_OK)
+    
+    @staticmethod
+    def build_payload(organization) -> dict:
         now = timezone.now()
         start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         seven_days_ago = now - timedelta(days=7)
@@ -616,12 +624,7 @@ class DashboardOverviewView(APIView):
         suppliers_count = catalog_models.Supplier.objects.filter(
             organization=organization
         ).count()
-        inventory_on_hand = (
-                catalog_models.InventoryLot.objects.filter(
-                    variant__product__organization=organization
-                ).aggregate(total=Coalesce(Sum("quantity"), 0))["total"]
-                or 0
-        )
+        inventory_on_hand = inventory.organization_stock_total(organization.id)
         
         summary = {
             "open_opportunities": opportunities_qs.count(),
@@ -651,7 +654,7 @@ class DashboardOverviewView(APIView):
             "recent_notes": recent_notes,
             "upcoming_activities": upcoming_activities,
         }
-        return Response(payload, status=status.HTTP_200_OK)
+        return payload
 
 
 class RegisterView(APIView):
@@ -39,6 +39,12 @@ class OpportunityAdmin(admin.ModelAdmin):
 	list_filter = ("organization", "stage")
 
 
+@admin.register(models.OpportunityStageChange)
+class OpportunityStageChangeAdmin(admin.ModelAdmin):
+	list_display = ("opportunity", "pipeline", "from_stage", "to_stage", "changed_at")
+	list_filter = ("organization", "pipeline")
+
+
 @admin.register(models.DealActivity)
 class DealActivityAdmin(admin.ModelAdmin):
 	list_display = ("subject", "type", "due_at", "completed_at")
@@ -80,3 +86,9 @@ class NoteAdmin(admin.ModelAdmin):
 @admin.register(models.Attachment)
 class AttachmentAdmin(admin.ModelAdmin):
 	list_display = ("organization", "file_name", "related_object_type", "uploaded_at")
+
+
+@admin.register(models.LotAllocation)
+class LotAllocationAdmin(admin.ModelAdmin):
+	list_display = ("order_line", "lot", "quantity", "allocated_at", "released_at")
+	list_filter = ("released_at",)
@@ -7,3 +7,8 @@ class SalesConfig(AppConfig):
 	default_auto_field = "django.db.models.BigAutoField"
 	name = "simplycrm.sales"
 	verbose_name = "SimplyCRM Sales"
+	
+	def ready(self) -> None:
+		from simplycrm.sales import signals
+		
+		signals.connect()
@@ -0,0 +1,214 @@
+"""First-expiry-first-out stock allocation for order fulfillment."""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from simplycrm.catalog import inventory
+from simplycrm.catalog.models import InventoryLot, StockMovement
+from simplycrm.sales.models import LotAllocation, Order, OrderLine
+
+
+class InsufficientStockError(Exception):
+	"""Raised when lots cannot cover the requested quantities."""
+	
+	def __init__(self, shortages: dict[int, int]):
+		self.shortages = shortages
+		super().__init__(f"Insufficient stock for variants: {sorted(shortages)}")
+
+
+@dataclass
+class AllocationResult:
+	"""Outcome of an allocation run."""
+	
+	allocations: list[LotAllocation]
+	shortages: dict[int, int]
+	
+	@property
+	def is_complete(self) -> bool:
+		return not self.shortages
+
+
+def outstanding_quantities(lines: Iterable[OrderLine]) -> dict[int, int]:
+	"""Return the quantity per line that is not yet covered by active allocations."""
+	
+	lines = list(lines)
+	allocated = dict(
+		LotAllocation.objects.filter(order_line__in=lines, released_at__isnull=True)
+		.values("order_line")
+		.annotate(total=Sum("quantity"))
+		.values_list("order_line", "total")
+	)
+	return {line.id: line.quantity - allocated.get(line.id, 0) for line in lines}
+
+
+def _candidate_lots(
+		variant_ids: Iterable[int],
+		today: date,
+		*,
+		skip_locked: bool,
+		exclude: Iterable[int],
+) -> dict[int, list[InventoryLot]]:
+	"""Lock the usable lots of ``variant_ids`` in FEFO order, grouped by variant."""
+	
+	lots = (
+		InventoryLot.objects.filter(variant_id__in=list(variant_ids), quantity__gt=0)
+		.filter(Q(expires_at__isnull=True) | Q(expires_at__gte=today))
+		.exclude(id__in=list(exclude))
+		.select_for_update(skip_locked=skip_locked)
+		.order_by("variant_id", F("expires_at").asc(nulls_last=True), "received_at", "id")
+	)
+	lots_by_variant: dict[int, list[InventoryLot]] = defaultdict(list)
+	for lot in lots:
+		lots_by_variant[lot.variant_id].append(lot)
+	return lots_by_variant
+
+
+def allocate_order_lines(
+		lines: Iterable[OrderLine],
+		*,
+		recorded_by=None,
+		allow_partial: bool = False,
+) -> AllocationResult:
+	"""Reserve stock for many order lines at once in FEFO order.
+	
+	Candidate lots for every requested variant are fetched in one query with
+	``SELECT ... FOR UPDATE SKIP LOCKED``: lots already locked by a concurrent
+	allocation are skipped instead of waited on, so parallel orders drain
+	different lots rather than queueing behind a single hot row, and a locked
+	lot can never be handed out twice. Only when the unlocked lots fall short
+	are the skipped ones locked again, this time waiting for them, so lock
+	contention alone never causes an :class:`InsufficientStockError`. Lots
+	are consumed by earliest expiry (undated lots last), then by receipt
+	date. Expired lots are never used.
+	
+	The order lines themselves are locked (and re-read) before their
+	outstanding quantities are computed, so concurrent allocations of the
+	same lines run one after the other and the second one only reserves what
+	the first left uncovered.
+	"""
+	
+	line_ids = [line.id for line in lines]
+	today = timezone.localdate()
+	with transaction.atomic():
+		lines = list(OrderLine.objects.select_for_update().filter(id__in=line_ids).order_by("id"))
+		outstanding = {line_id: qty for line_id, qty in outstanding_quantities(lines).items() if qty > 0}
+		if not outstanding:
+			return AllocationResult(allocations=[], shortages={})
+		
+		demand_lines: dict[int, list[OrderLine]] = defaultdict(list)
+		for line in lines:
+			if line.id in outstanding:
+				demand_lines[line.product_variant_id].append(line)
+		
+		remaining = dict(outstanding)
+		seen: set[int] = set()
+		allocations: list[LotAllocation] = []
+		touched: dict[int, InventoryLot] = {}
+		for skip_locked in (True, False):
+			short = [
+				variant_id for variant_id, variant_lines in demand_lines.items()
+				if any(remaining[line.id] for line in variant_lines)
+			]
+			if not short:
+				break
+			# The second pass waits for the lots the first one skipped, so a lot that
+			# is only locked by a concurrent allocation is not reported as a shortage.
+			lots_by_variant = _candidate_lots(short, today, skip_locked=skip_locked, exclude=seen)
+			for variant_id in short:
+				available = lots_by_variant.get(variant_id, [])
+				seen.update(lot.id for lot in available)
+				for line in demand_lines[variant_id]:
+					for lot in available:
+						if remaining[line.id] == 0:
+							break
+						if lot.quantity == 0:
+							continue
+						taken = min(lot.quantity, remaining[line.id])
+						lot.quantity -= taken
+						remaining[line.id] -= taken
+						touched[lot.id] = lot
+						allocations.append(LotAllocation(order_line=line, lot=lot, quantity=taken))
+		
+		shortages: dict[int, int] = {}
+		for variant_id, variant_lines in demand_lines.items():
+			missing = sum(remaining[line.id] for line in variant_lines)
+			if missing:
+				shortages[variant_id] = missing
+		
+		if shortages and not allow_partial:
+			raise InsufficientStockError(shortages)
+		
+		if touched:
+			now = timezone.now()
+			for lot in touched.values():
+				lot.updated_at = now
+			InventoryLot.objects.bulk_update(list(touched.values()), ["quantity", "updated_at"])
+			LotAllocation.objects.bulk_create(allocations)
+			inventory.record_movements(
+				StockMovement(
+					variant_id=allocation.lot.variant_id,
+					lot=allocation.lot,
+					location=allocation.lot.location,
+					movement_type=StockMovement.MovementType.ALLOCATION,
+					quantity=-allocation.quantity,
+					reference=f"order-line:{allocation.order_line_id}",
+					recorded_by=recorded_by,
+				)
+				for allocation in allocations
+			)
+	return AllocationResult(allocations=allocations, shortages=shortages)
+
+
+def allocate_order(order: Order, **kwargs) -> AllocationResult:
+	"""Reserve stock for every line of ``order``."""
+	
+	return allocate_order_lines(order.lines.all(), **kwargs)
+
+
+def release_order_allocations(order: Order, *, recorded_by=None) -> list[LotAllocation]:
+	"""Return reserved stock of ``order`` to its lots."""
+	
+	return _release(LotAllocation.objects.filter(order_line__order=order), recorded_by=recorded_by)
+
+
+def release_line_allocations(lines: Iterable[OrderLine], *, recorded_by=None) -> list[LotAllocation]:
+	"""Return reserved stock of ``lines`` to their lots."""
+	
+	return _release(LotAllocation.objects.filter(order_line__in=list(lines)), recorded_by=recorded_by)
+
+
+def _release(allocations, *, recorded_by=None) -> list[LotAllocation]:
+	with transaction.atomic():
+		allocations = list(allocations.filter(released_at__isnull=True).select_related("lot").select_for_update())
+		if not allocations:
+			return []
+		per_lot: dict[int, int] = defaultdict(int)
+		for allocation in allocations:
+			per_lot[allocation.lot_id] += allocation.quantity
+		for lot_id, quantity in per_lot.items():
+			InventoryLot.objects.filter(pk=lot_id).update(
+				quantity=F("quantity") + quantity, updated_at=timezone.now()
+			)
+		now = timezone.now()
+		LotAllocation.objects.filter(pk__in=[allocation.pk for allocation in allocations]).update(released_at=now)
+		inventory.record_movements(
+			StockMovement(
+				variant_id=allocation.lot.variant_id,
+				lot=allocation.lot,
+				location=allocation.lot.location,
+				movement_type=StockMovement.MovementType.RETURN,
+				quantity=allocation.quantity,
+				reference=f"order-line:{allocation.order_line_id}:released",
+				recorded_by=recorded_by,
+			)
+			for allocation in allocations
+		)
+		for allocation in allocations:
+			allocation.released_at = now
+	return allocations
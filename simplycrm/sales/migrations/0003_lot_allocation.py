@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_stock_ledger'),
+        ('sales', '0002_alter_contact_last_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('allocated_at', models.DateTimeField(auto_now_add=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='allocations', to='catalog.inventorylot')),
+                ('order_line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lot_allocations', to='sales.orderline')),
+            ],
+            options={
+                'ordering': ['allocated_at', 'id'],
+                'indexes': [models.Index(fields=['order_line', 'released_at'], name='sales_alloc_line_idx')],
+            },
+        ),
+    ]
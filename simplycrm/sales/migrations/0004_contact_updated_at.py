@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_lot_allocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def record_current_stages(apps, schema_editor):
+    """Seed the history with each existing opportunity's current stage."""
+    Opportunity = apps.get_model("sales", "Opportunity")
+    OpportunityStageChange = apps.get_model("sales", "OpportunityStageChange")
+    now = django.utils.timezone.now()
+    OpportunityStageChange.objects.bulk_create(
+        [
+            OpportunityStageChange(
+                organization_id=organization_id,
+                opportunity_id=opportunity_id,
+                pipeline_id=pipeline_id,
+                to_stage_id=stage_id,
+                changed_at=now,
+            )
+            for opportunity_id, organization_id, pipeline_id, stage_id in Opportunity.objects.values_list(
+                "id", "organization_id", "pipeline_id", "stage_id"
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_subscription_plan_alter_user_organization_and_more'),
+        ('sales', '0004_contact_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpportunityStageChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('from_stage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sales.dealstage')),
+                ('opportunity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_changes', to='sales.opportunity')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_changes', to='core.organization')),
+                ('pipeline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_changes', to='sales.pipeline')),
+                ('to_stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_changes', to='sales.dealstage')),
+            ],
+            options={
+                'ordering': ['changed_at', 'id'],
+                'indexes': [models.Index(fields=['organization', 'pipeline', 'changed_at'], name='sales_stage_change_pipe_idx'), models.Index(fields=['opportunity', 'changed_at'], name='sales_stage_change_opp_idx')],
+            },
+        ),
+        migrations.RunPython(record_current_stages, migrations.RunPython.noop),
+    ]
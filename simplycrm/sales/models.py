@@ -4,7 +4,10 @@ from __future__ import annotations
 from decimal import Decimal
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from simplycrm.core import versioning
 
 
 class Company(models.Model):
@@ -27,6 +30,7 @@ class Contact(models.Model):
 	email = models.EmailField(blank=True)
 	phone_number = models.CharField(max_length=32, blank=True)
 	tags = models.JSONField(default=list, blank=True)
+	updated_at = models.DateTimeField(auto_now=True, db_index=True)
 	
 	def __str__(self) -> str:  # pragma: no cover
 		return f"{self.first_name} {self.last_name}"
@@ -71,6 +75,34 @@ class Lead(models.Model):
 		return f"Lead {self.id}"
 
 
+class OpportunityQuerySet(models.QuerySet):
+	"""Records stage history for stage changes made with ``update()`` and ``bulk_update()``."""
+	
+	def update(self, **kwargs):
+		if "stage" not in kwargs and "stage_id" not in kwargs:
+			return super().update(**kwargs)
+		with transaction.atomic(using=self.db):
+			before = dict(self.values_list("id", "stage_id"))
+			updated = super().update(**kwargs)
+			changes = [
+				OpportunityStageChange(
+					organization_id=organization_id,
+					opportunity_id=opportunity_id,
+					pipeline_id=pipeline_id,
+					from_stage_id=before[opportunity_id],
+					to_stage_id=stage_id,
+				)
+				for opportunity_id, organization_id, pipeline_id, stage_id in Opportunity.objects.using(self.db)
+				.filter(id__in=before)
+				.values_list("id", "organization_id", "pipeline_id", "stage_id")
+				if before[opportunity_id] != stage_id
+			]
+			OpportunityStageChange.objects.using(self.db).bulk_create(changes)
+		if changes:
+			versioning.bump_data_version({change.organization_id for change in changes}, versioning.PIPELINE)
+		return updated
+
+
 class Opportunity(models.Model):
 	organization = models.ForeignKey("core.Organization", on_delete=models.CASCADE, related_name="opportunities")
 	lead = models.ForeignKey(Lead, null=True, blank=True, on_delete=models.SET_NULL, related_name="opportunities")
@@ -82,8 +114,50 @@ class Opportunity(models.Model):
 	probability = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal("0.0"))
 	owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
 	
+	objects = OpportunityQuerySet.as_manager()
+	
 	def __str__(self) -> str:  # pragma: no cover
 		return self.name
+	
+	def save(self, *args, **kwargs):
+		creating = self._state.adding
+		previous_stage_id = None
+		if not creating and self.pk:
+			previous_stage_id = Opportunity.objects.filter(pk=self.pk).values_list("stage_id", flat=True).first()
+		super().save(*args, **kwargs)
+		if creating or previous_stage_id != self.stage_id:
+			OpportunityStageChange.objects.create(
+				organization_id=self.organization_id,
+				opportunity=self,
+				pipeline_id=self.pipeline_id,
+				from_stage_id=previous_stage_id,
+				to_stage_id=self.stage_id,
+			)
+
+
+class OpportunityStageChange(models.Model):
+	"""One entry per stage an opportunity moved into; the first one has no ``from_stage``."""
+	
+	organization = models.ForeignKey("core.Organization", on_delete=models.CASCADE, related_name="stage_changes")
+	opportunity = models.ForeignKey(Opportunity, on_delete=models.CASCADE, related_name="stage_changes")
+	pipeline = models.ForeignKey(Pipeline, on_delete=models.CASCADE, related_name="stage_changes")
+	from_stage = models.ForeignKey(
+		DealStage, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+	)
+	to_stage = models.ForeignKey(DealStage, on_delete=models.CASCADE, related_name="stage_changes")
+	changed_at = models.DateTimeField(default=timezone.now)
+	
+	
+	class Meta:
+		ordering = ["changed_at", "id"]
+		indexes = [
+			models.Index(fields=["organization", "pipeline", "changed_at"], name="sales_stage_change_pipe_idx"),
+			models.Index(fields=["opportunity", "changed_at"], name="sales_stage_change_opp_idx"),
+		]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.opportunity_id}: {self.from_stage_id} -> {self.to_stage_id}"
 
 
 class DealActivity(models.Model):
@@ -129,6 +203,25 @@ class OrderLine(models.Model):
 		return max(Decimal("0.00"), self.unit_price * self.quantity - self.discount_amount)
 
 
+class LotAllocation(models.Model):
+	"""Stock reserved for an order line from a specific inventory lot."""
+	
+	order_line = models.ForeignKey(OrderLine, on_delete=models.CASCADE, related_name="lot_allocations")
+	lot = models.ForeignKey("catalog.InventoryLot", on_delete=models.PROTECT, related_name="allocations")
+	quantity = models.PositiveIntegerField()
+	allocated_at = models.DateTimeField(auto_now_add=True)
+	released_at = models.DateTimeField(null=True, blank=True)
+	
+	
+	class Meta:
+		ordering = ["allocated_at", "id"]
+		indexes = [models.Index(fields=["order_line", "released_at"], name="sales_alloc_line_idx")]
+	
+	
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.quantity} × lot {self.lot_id} → line {self.order_line_id}"
+
+
 class Invoice(models.Model):
 	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="invoices")
 	issued_at = models.DateTimeField(auto_now_add=True)
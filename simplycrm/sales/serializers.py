@@ -111,6 +111,28 @@ class OrderLineSerializer(serializers.ModelSerializer):
 		read_only_fields = ["id", "total_price"]
 
 
+class LotAllocationSerializer(serializers.ModelSerializer):
+	variant = serializers.IntegerField(source="lot.variant_id", read_only=True)
+	location = serializers.CharField(source="lot.location", read_only=True)
+	expires_at = serializers.DateField(source="lot.expires_at", read_only=True)
+	
+	
+	class Meta:
+		model = models.LotAllocation
+		fields = [
+			"id",
+			"order_line",
+			"lot",
+			"variant",
+			"location",
+			"expires_at",
+			"quantity",
+			"allocated_at",
+			"released_at",
+		]
+		read_only_fields = fields
+
+
 class OrderSerializer(serializers.ModelSerializer):
 	lines = OrderLineSerializer(many=True, read_only=True)
 	total_amount = serializers.SerializerMethodField()
@@ -0,0 +1,20 @@
+"""Signal receivers that keep reserved stock consistent with order deletes."""
+from __future__ import annotations
+
+from django.db.models.signals import pre_delete
+
+from simplycrm.sales import fulfillment, models
+
+
+def _release_deleted_line(sender, instance, **kwargs):
+	"""Deleting a line (directly or with its order) returns its reserved stock to the lots.
+	
+	Allocations cascade with the line, so without this the reserved quantity
+	would never be credited back to the lot or the stock ledger.
+	"""
+	
+	fulfillment.release_line_allocations([instance])
+
+
+def connect() -> None:
+	pre_delete.connect(_release_deleted_line, sender=models.OrderLine, dispatch_uid="sales-release-deleted-line")
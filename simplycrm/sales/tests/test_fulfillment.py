@@ -0,0 +1,171 @@
+"""Tests for FEFO lot allocation."""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.db.models import Sum
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from simplycrm.catalog import inventory
+from simplycrm.catalog import models as catalog_models
+from simplycrm.core.tests.utils import TenantTestMixin
+from simplycrm.sales import fulfillment, models
+
+
+class LotAllocationTests(TenantTestMixin, APITestCase):
+    """Allocate order lines from lots in first-expiry-first-out order."""
+
+    username = "picker"
+
+    def setUp(self):
+        super().setUp()
+        product = catalog_models.Product.objects.create(organization=self.organization, name="Milk", sku="MLK")
+        self.milk = catalog_models.ProductVariant.objects.create(
+            product=product, name="1L", sku="MLK-1", price="2.00", cost="1.00"
+        )
+        self.cream = catalog_models.ProductVariant.objects.create(
+            product=product, name="Cream", sku="MLK-C", price="3.00", cost="1.50"
+        )
+        today = date.today()
+        self.undated = self._lot(self.milk, 10, received=today - timedelta(days=9), expires=None)
+        self.late = self._lot(self.milk, 5, received=today - timedelta(days=5), expires=today + timedelta(days=20))
+        self.early = self._lot(self.milk, 4, received=today - timedelta(days=1), expires=today + timedelta(days=3))
+        self.expired = self._lot(self.milk, 50, received=today - timedelta(days=30), expires=today - timedelta(days=1))
+        self.cream_lot = self._lot(self.cream, 3, received=today, expires=today + timedelta(days=7))
+        self.order = models.Order.objects.create(organization=self.organization)
+
+    def _lot(self, variant, quantity, *, received, expires):
+        return catalog_models.InventoryLot.objects.create(
+            variant=variant,
+            quantity=quantity,
+            received_at=received,
+            expires_at=expires,
+            location="MAIN",
+        )
+
+    def _line(self, variant, quantity):
+        return models.OrderLine.objects.create(
+            order=self.order, product_variant=variant, quantity=quantity, unit_price="2.00"
+        )
+
+    def test_allocates_many_lines_in_fefo_order(self):
+        milk_line = self._line(self.milk, 12)
+        cream_line = self._line(self.cream, 2)
+
+        result = fulfillment.allocate_order(self.order)
+
+        self.assertTrue(result.is_complete)
+        consumed = [(allocation.lot_id, allocation.quantity) for allocation in result.allocations
+                    if allocation.order_line_id == milk_line.id]
+        self.assertEqual(consumed, [(self.early.id, 4), (self.late.id, 5), (self.undated.id, 3)])
+        self.expired.refresh_from_db()
+        self.assertEqual(self.expired.quantity, 50)
+        self.undated.refresh_from_db()
+        self.assertEqual(self.undated.quantity, 7)
+        self.assertEqual(cream_line.lot_allocations.get().lot_id, self.cream_lot.id)
+        self.assertEqual(inventory.stock_on_hand(self.milk.id, "MAIN"), 19 + 50 - 12)
+
+    def test_allocating_the_same_lines_twice_reserves_them_once(self):
+        lines = [self._line(self.milk, 6), self._line(self.cream, 2)]
+        atomic = transaction.atomic
+        competitor = {}
+
+        def atomic_after_competitor(*args, **kwargs):
+            # Let another allocation of the same lines commit just before ours opens its transaction.
+            if not competitor:
+                competitor["started"] = True
+                lines_again = models.OrderLine.objects.filter(order=self.order)
+                competitor["result"] = fulfillment.allocate_order_lines(lines_again)
+            return atomic(*args, **kwargs)
+
+        with mock.patch.object(fulfillment.transaction, "atomic", side_effect=atomic_after_competitor):
+            result = fulfillment.allocate_order_lines(lines)
+
+        self.assertEqual(sum(allocation.quantity for allocation in competitor["result"].allocations), 8)
+        self.assertEqual(result.allocations, [])
+        self.assertEqual(models.LotAllocation.objects.aggregate(total=Sum("quantity"))["total"], 8)
+        self.assertEqual(inventory.stock_on_hand(self.milk.id, "MAIN"), 19 + 50 - 6)
+
+        self.assertEqual(fulfillment.allocate_order_lines(lines).allocations, [])
+        self.assertEqual(models.LotAllocation.objects.count(), len(competitor["result"].allocations))
+
+    def test_lots_locked_by_another_allocation_are_waited_for_before_reporting_a_shortage(self):
+        line = self._line(self.milk, 18)
+        candidate_lots = fulfillment._candidate_lots
+        passes = []
+
+        def early_lot_locked_elsewhere(variant_ids, today, *, skip_locked, exclude):
+            passes.append(skip_locked)
+            # SKIP LOCKED leaves out the lot a concurrent allocation holds.
+            exclude = {*exclude, self.early.id} if skip_locked else exclude
+            return candidate_lots(variant_ids, today, skip_locked=skip_locked, exclude=exclude)
+
+        with mock.patch.object(fulfillment, "_candidate_lots", side_effect=early_lot_locked_elsewhere):
+            result = fulfillment.allocate_order(self.order)
+
+        self.assertTrue(result.is_complete)
+        self.assertEqual(passes, [True, False])
+        consumed = [(allocation.lot_id, allocation.quantity) for allocation in line.lot_allocations.all()]
+        self.assertEqual(consumed, [(self.late.id, 5), (self.undated.id, 10), (self.early.id, 3)])
+
+        with mock.patch.object(fulfillment, "_candidate_lots", side_effect=early_lot_locked_elsewhere):
+            fulfillment.allocate_order(self.order)
+        self.assertEqual(passes, [True, False], "nothing left to allocate, no lots are locked")
+
+    def test_deleting_allocated_orders_and_lines_returns_their_stock(self):
+        self._line(self.milk, 6)
+        cream_line = self._line(self.cream, 2)
+        fulfillment.allocate_order(self.order)
+        self.assertEqual(inventory.stock_on_hand(self.milk.id, "MAIN"), 69 - 6)
+
+        response = self.client.delete(reverse("sales:order-line-detail", args=[cream_line.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.cream_lot.refresh_from_db()
+        self.assertEqual(self.cream_lot.quantity, 3)
+        self.assertEqual(inventory.stock_on_hand(self.cream.id, "MAIN"), 3)
+
+        response = self.client.delete(reverse("sales:order-detail", args=[self.order.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(models.LotAllocation.objects.exists())
+        for lot, quantity in ((self.early, 4), (self.late, 5), (self.undated, 10)):
+            lot.refresh_from_db()
+            self.assertEqual(lot.quantity, quantity)
+        self.assertEqual(inventory.stock_on_hand(self.milk.id, "MAIN"), 69)
+        returns = catalog_models.StockMovement.objects.filter(movement_type=catalog_models.StockMovement.MovementType.RETURN)
+        self.assertEqual(returns.aggregate(total=Sum("quantity"))["total"], 8)
+
+    def test_shortage_rolls_back_and_partial_mode_reserves_what_exists(self):
+        self._line(self.cream, 5)
+
+        with self.assertRaises(fulfillment.InsufficientStockError) as ctx:
+            fulfillment.allocate_order(self.order)
+        self.assertEqual(ctx.exception.shortages, {self.cream.id: 2})
+        self.assertFalse(models.LotAllocation.objects.exists())
+
+        result = fulfillment.allocate_order(self.order, allow_partial=True)
+        self.assertEqual(result.shortages, {self.cream.id: 2})
+        self.assertEqual(sum(allocation.quantity for allocation in result.allocations), 3)
+
+        again = fulfillment.allocate_order(self.order, allow_partial=True)
+        self.assertEqual(again.allocations, [])
+
+    def test_allocate_and_release_endpoints(self):
+        self._line(self.milk, 6)
+
+        response = self.client.post(reverse("sales:order-allocate", args=[self.order.pk]), {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["allocations"]), 2)
+
+        response = self.client.post(reverse("sales:order-release", args=[self.order.pk]), {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.early.refresh_from_db()
+        self.assertEqual(self.early.quantity, 4)
+        self.assertEqual(inventory.stock_on_hand(self.milk.id, "MAIN"), 69)
+
+        self._line(self.cream, 10)
+        response = self.client.post(reverse("sales:order-allocate", args=[self.order.pk]), {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
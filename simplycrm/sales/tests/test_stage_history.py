@@ -0,0 +1,53 @@
+"""Tests for opportunity stage history capture."""
+from __future__ import annotations
+
+from django.test import TestCase
+
+from simplycrm.core import models as core_models
+from simplycrm.sales import models
+
+
+class StageHistoryTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.organization = core_models.Organization.objects.create(name="Acme", slug="acme")
+        self.pipeline = models.Pipeline.objects.create(organization=self.organization, name="Sales")
+        self.lead, self.proposal, self.won = [
+            models.DealStage.objects.create(pipeline=self.pipeline, name=name, position=position)
+            for position, name in enumerate(["Lead", "Proposal", "Won"])
+        ]
+
+    def _opportunity(self, name):
+        return models.Opportunity.objects.create(
+            organization=self.organization, name=name, pipeline=self.pipeline, stage=self.lead, amount="100.00"
+        )
+
+    def _history(self, opportunity):
+        return list(opportunity.stage_changes.values_list("from_stage_id", "to_stage_id"))
+
+    def test_creation_and_stage_saves_are_recorded(self):
+        opportunity = self._opportunity("Deal")
+        opportunity.amount = "150.00"
+        opportunity.save()
+        opportunity.stage = self.proposal
+        opportunity.save()
+
+        self.assertEqual(self._history(opportunity), [(None, self.lead.id), (self.lead.id, self.proposal.id)])
+
+    def test_bulk_updates_are_recorded(self):
+        first, second = self._opportunity("First"), self._opportunity("Second")
+        second.stage = self.proposal
+        second.save()
+
+        updated = models.Opportunity.objects.filter(id__in=[first.id, second.id]).update(stage=self.proposal)
+        self.assertEqual(updated, 2)
+        self.assertEqual(self._history(first), [(None, self.lead.id), (self.lead.id, self.proposal.id)])
+        self.assertEqual(len(self._history(second)), 2)
+
+        first.stage, second.stage = self.won, self.lead
+        models.Opportunity.objects.bulk_update([first, second], ["stage"])
+        self.assertEqual(self._history(first)[-1], (self.proposal.id, self.won.id))
+        self.assertEqual(self._history(second)[-1], (self.proposal.id, self.lead.id))
+
+        models.Opportunity.objects.filter(id=first.id).update(name="Renamed")
+        self.assertEqual(len(self._history(first)), 3)
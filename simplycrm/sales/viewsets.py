@@ -1,11 +1,11 @@
 """ViewSets for sales and order management."""
 from __future__ import annotations
 
-from rest_framework import permissions, viewsets
+from rest_framework import decorators, permissions, response, status, viewsets
 from rest_framework.exceptions import ValidationError
 from simplycrm.core.permissions import HasFeaturePermission
 from simplycrm.core import tenant
-from simplycrm.sales import models, serializers
+from simplycrm.sales import fulfillment, models, serializers
 
 
 class BaseOrgViewSet(viewsets.ModelViewSet):
@@ -81,6 +81,41 @@ class OrderViewSet(BaseOrgViewSet):
     permission_classes = [permissions.IsAuthenticated, HasFeaturePermission]
     feature_code = "sales.order_management"
 
+    @decorators.action(detail=True, methods=["post"], url_path="allocate")
+    def allocate(self, request, pk=None):
+        """Reserve stock for the order lines from lots in FEFO order."""
+
+        order = self.get_object()
+        allow_partial = str(request.data.get("allow_partial", "")).lower() in {"1", "true", "yes"}
+        try:
+            result = fulfillment.allocate_order(
+                order, recorded_by=request.user, allow_partial=allow_partial
+            )
+        except fulfillment.InsufficientStockError as exc:
+            return response.Response(
+                {
+                    "detail": "Недостаточно остатков для резервирования заказа.",
+                    "shortages": exc.shortages,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        payload = {
+            "allocations": serializers.LotAllocationSerializer(result.allocations, many=True).data,
+            "shortages": result.shortages,
+        }
+        return response.Response(payload, status=status.HTTP_200_OK)
+
+    @decorators.action(detail=True, methods=["post"], url_path="release")
+    def release(self, request, pk=None):
+        """Return reserved stock of the order to its lots."""
+
+        order = self.get_object()
+        released = fulfillment.release_order_allocations(order, recorded_by=request.user)
+        return response.Response(
+            {"allocations": serializers.LotAllocationSerializer(released, many=True).data},
+            status=status.HTTP_200_OK,
+        )
+
 
 class OrderLineViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.OrderLineSerializer
@@ -144,6 +144,47 @@ SPECTACULAR_SETTINGS = {
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 
+MODEL_ARTIFACT_ROOT = Path(os.getenv("DJANGO_MODEL_ARTIFACT_ROOT", BASE_DIR / "var" / "models"))
+DATA_SOURCE_FILE_ROOT = Path(os.getenv("DJANGO_DATA_SOURCE_FILE_ROOT", BASE_DIR / "var" / "data-sources"))
+ANALYTICS_SNAPSHOT_ROOT = Path(os.getenv("DJANGO_ANALYTICS_SNAPSHOT_ROOT", BASE_DIR / "var" / "snapshots"))
+
+ANALYTICS_RESULT_CACHE = {
+	"TIMEOUT": int(os.getenv("ANALYTICS_RESULT_CACHE_TIMEOUT", "900")),
+	"STALE_TIMEOUT": int(os.getenv("ANALYTICS_RESULT_CACHE_STALE_TIMEOUT", "86400")),
+	"LOCK_SECONDS": int(os.getenv("ANALYTICS_RESULT_CACHE_LOCK_SECONDS", "300")),
+	"REFRESH_WORKERS": int(os.getenv("ANALYTICS_RESULT_CACHE_REFRESH_WORKERS", "2")),
+}
+
+DASHBOARD_RENDER = {
+	"WIDGET_TIMEOUT": int(os.getenv("DASHBOARD_WIDGET_CACHE_TIMEOUT", "3600")),
+	"MAX_WORKERS": int(os.getenv("DASHBOARD_RENDER_WORKERS", "4")),
+}
+
+ASSISTANT_LLM = {
+	"API_KEY": os.getenv("OPENAI_API_KEY", ""),
+	"BASE_URL": os.getenv("OPENAI_BASE_URL") or None,
+	"MODEL": os.getenv("ASSISTANT_LLM_MODEL", "gpt-4o-mini"),
+	"MAX_TOKENS": int(os.getenv("ASSISTANT_LLM_MAX_TOKENS", "800")),
+	"TEMPERATURE": float(os.getenv("ASSISTANT_LLM_TEMPERATURE", "0.3")),
+	"STREAM_TIMEOUT": int(os.getenv("ASSISTANT_STREAM_TIMEOUT", "300")),
+	"TIMEOUT": float(os.getenv("ASSISTANT_LLM_TIMEOUT", "60")),
+	"CONNECT_TIMEOUT": float(os.getenv("ASSISTANT_LLM_CONNECT_TIMEOUT", "5")),
+	"MAX_RETRIES": int(os.getenv("ASSISTANT_LLM_MAX_RETRIES", "2")),
+	"RETRY_BACKOFF": float(os.getenv("ASSISTANT_LLM_RETRY_BACKOFF", "0.5")),
+	"RETRY_BACKOFF_MAX": float(os.getenv("ASSISTANT_LLM_RETRY_BACKOFF_MAX", "8")),
+	"MAX_CONCURRENCY": int(os.getenv("ASSISTANT_LLM_MAX_CONCURRENCY", "8")),
+	"QUEUE_TIMEOUT": float(os.getenv("ASSISTANT_LLM_QUEUE_TIMEOUT", "10")),
+}
+
+ASSISTANT_CONTEXT = {
+	"TIMEOUT": int(os.getenv("ASSISTANT_CONTEXT_TIMEOUT", "600")),
+}
+
+REQUEST_COALESCING = {
+	"ENABLED": os.getenv("DJANGO_REQUEST_COALESCING", "1") == "1",
+	"WAIT_SECONDS": float(os.getenv("DJANGO_REQUEST_COALESCING_WAIT_SECONDS", "30")),
+}
+
 CACHES = {
 	"default": {
 		"BACKEND": "django.core.cache.backends.locmem.LocMemCache",